@@ -5,8 +5,10 @@ from .system import (
     LLMSettings,
     HallucinationEvaluation,
     detect_hallucination,
+    async_detect_hallucination,
+    detect_hallucinations,
+    async_detect_hallucinations,
 )
-from .api import app, create_app
 
 __all__ = [
     "LLMInput",
@@ -14,6 +16,18 @@ __all__ = [
     "LLMSettings",
     "HallucinationEvaluation",
     "detect_hallucination",
+    "async_detect_hallucination",
+    "detect_hallucinations",
+    "async_detect_hallucinations",
     "app",
     "create_app",
 ]
+
+
+def __getattr__(name: str):
+    # The API pulls in FastAPI; only import it when the service is used.
+    if name in ("app", "create_app"):
+        from . import api
+
+        return getattr(api, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
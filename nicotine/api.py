@@ -1,27 +1,73 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket
+from fastapi import WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import TypeVar
+import asyncio
 import logging
-import uvicorn
+from .cache import CacheStats, get_verdict_cache
+from .cascade import CascadeStats, get_cascade
+from .coalescer import CoalescerStats, get_coalescer
+from .jobs import Job, JobQueue, JobQueueStats, JobRequest, get_job_queue
+from .config import get_setting
+from .metrics import get_metrics, instrument_app, mark_worker_exited
+from .live import GenerationDelta, LiveSession
+from .ndjson import iter_lines, stream_evaluations
+from .resilience import DeadlineMiddleware
+from .semantic import SemanticCacheStats, get_semantic_cache
+from .serialization import FastJSONRoute, ModelResponse
+from .tracing import TracingMiddleware, get_tracer
+from .serving import warm_up
+from .prescreen import TieredDetectorStats, get_tiered_detector
+from .providers import ProviderAllowlistMiddleware
 from .system import (
     LLMOutput,
     HallucinationEvaluation,
-    detect_hallucination,
+    async_detect_hallucination,
+    async_detect_hallucinations,
+    DEFAULT_BATCH_CONCURRENCY,
 )
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Configure logging, warm the worker up and start the job workers when the
+    service starts rather than on import.
+    """
+    logging.basicConfig(
+        level=get_setting("logging.level", "INFO"),
+        format=get_setting("logging.format", logging.BASIC_FORMAT),
+    )
+    if get_setting("server.warmup", True):
+        warm_up()
+    jobs = get_job_queue()
+    if jobs is not None:
+        jobs.start()
+    yield
+    if jobs is not None:
+        await jobs.stop()
+    mark_worker_exited()
+
+
 app = FastAPI(
     title="Nicotine API",
     description="AI Hallucination Detection Service",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
+# Parse request bodies with orjson and skip re-validating detection results.
+FAST_JSON = bool(get_setting("api.fast_json", True))
+if FAST_JSON:
+    app.router.route_class = FastJSONRoute
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -31,6 +77,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Honor a per-request time budget sent as X-Request-Timeout (seconds).
+app.add_middleware(DeadlineMiddleware)
+
+# Only accept the backends in providers.api_allowed in request bodies.
+app.add_middleware(ProviderAllowlistMiddleware)
+
+metrics = get_metrics()
+if metrics is not None:
+    instrument_app(
+        app,
+        metrics,
+        endpoint=get_setting("metrics.endpoint", "/metrics"),
+        include_request_metrics=bool(
+            get_setting("metrics.include_request_metrics", True)
+        ),
+    )
+
+
+# Trace requests outermost, so their spans cover every other middleware.
+tracer = get_tracer()
+if tracer is not None:
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+
 
 class HealthResponse(BaseModel):
     status: str
@@ -42,6 +111,45 @@ class ErrorResponse(BaseModel):
     detail: str
 
 
+# Upper bound on items accepted by the batch endpoint in one request.
+MAX_BATCH_SIZE = 1000
+
+
+class BatchDetectionRequest(BaseModel):
+    outputs: list[LLMOutput] = Field(max_length=MAX_BATCH_SIZE)
+    concurrency: int = Field(default=DEFAULT_BATCH_CONCURRENCY, ge=1, le=64)
+    pack_size: int = Field(default=1, ge=1, le=20)
+
+
+class BatchDetectionResponse(BaseModel):
+    results: list[HallucinationEvaluation]
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    Streaming response that may read the request body while it streams.
+
+    ``StreamingResponse`` listens for ``http.disconnect`` on ASGI servers
+    older than spec 2.4, which would swallow request body messages. The body
+    reader already surfaces disconnects, so only stream the response here.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+M = TypeVar("M", bound=BaseModel)
+
+
+def _respond(result: M) -> M | Response:
+    """
+    Serialize an already validated result directly with ``api.fast_json``.
+    """
+    return ModelResponse(result) if FAST_JSON else result
+
+
 @app.get("/", response_model=HealthResponse)
 async def root() -> HealthResponse:
     """Root endpoint providing basic service information."""
@@ -59,7 +167,7 @@ async def health_check() -> HealthResponse:
 @app.post("/api/v1/detect-hallucination", response_model=HallucinationEvaluation)
 async def detect_hallucination_endpoint(
     llm_output: LLMOutput,
-) -> HallucinationEvaluation:
+) -> HallucinationEvaluation | Response:
     """
     Detect hallucinations in LLM output.
 
@@ -74,9 +182,13 @@ async def detect_hallucination_endpoint(
     """
     try:
         logger.info(f"Processing hallucination detection for ID: {llm_output.id}.")
-        result = detect_hallucination(llm_output)
+        coalescer = get_coalescer()
+        if coalescer is not None:
+            result = await coalescer.submit(llm_output)
+        else:
+            result = await async_detect_hallucination(llm_output)
         logger.info(f"Completed analysis for ID: {llm_output.id}.")
-        return result
+        return _respond(result)
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}.")
         raise HTTPException(
@@ -85,6 +197,262 @@ async def detect_hallucination_endpoint(
         )
 
 
+@app.post("/api/v1/detect-hallucination/batch", response_model=BatchDetectionResponse)
+async def detect_hallucination_batch_endpoint(
+    request: BatchDetectionRequest,
+) -> BatchDetectionResponse | Response:
+    """
+    Detect hallucinations in a batch of LLM outputs.
+
+    Args:
+        request: The outputs to analyze and the batch execution options
+
+    Returns:
+        BatchDetectionResponse: One evaluation per output, in request order
+
+    Raises:
+        HTTPException: If there's an error processing the batch
+    """
+    try:
+        logger.info(f"Processing batch of {len(request.outputs)} outputs.")
+        results = await async_detect_hallucinations(
+            request.outputs,
+            concurrency=request.concurrency,
+            pack_size=request.pack_size,
+        )
+        logger.info(f"Completed batch of {len(request.outputs)} outputs.")
+        return _respond(BatchDetectionResponse(results=results))
+    except Exception as e:
+        logger.error(f"Error processing batch request: {str(e)}.")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing batch hallucination detection: {str(e)}.",
+        )
+
+
+@app.post("/api/v1/detect-hallucination/stream")
+async def detect_hallucination_stream_endpoint(
+    request: Request,
+    concurrency: int = Query(default=DEFAULT_BATCH_CONCURRENCY, ge=1, le=64),
+) -> StreamingResponse:
+    """
+    Detect hallucinations in an NDJSON stream of LLM outputs.
+
+    The request body is read incrementally, one ``LLMOutput`` per line, and
+    each evaluation is streamed back as an NDJSON line tagged with the
+    record's ``id`` and ``line`` as soon as it completes. At most
+    ``concurrency`` records are buffered, so memory stays constant and a
+    slow reader throttles how fast the body is consumed.
+    """
+
+    async def body():
+        try:
+            async for evaluation in stream_evaluations(
+                request.stream(), concurrency=concurrency
+            ):
+                yield evaluation.model_dump_json() + "\n"
+        except Exception as e:
+            logger.error(f"Error processing stream: {str(e)}.")
+            yield ErrorResponse(
+                error="Stream aborted", detail=str(e)
+            ).model_dump_json() + "\n"
+
+    return DuplexStreamingResponse(body(), media_type="application/x-ndjson")
+
+
+def _live_session() -> LiveSession:
+    return LiveSession(
+        max_streams=int(get_setting("live.max_streams", 64)),
+        max_pending=int(get_setting("live.max_pending", 64)),
+        min_chars=int(get_setting("live.min_chars", 0)),
+        context_sentences=int(get_setting("live.context_sentences", 1)),
+        concurrency=int(get_setting("live.concurrency", 4)),
+    )
+
+
+@app.websocket("/api/v1/detect-hallucination/live")
+async def detect_hallucination_live_endpoint(websocket: WebSocket) -> None:
+    """
+    Evaluate generations while they are being produced.
+
+    The client sends ``GenerationDelta`` JSON messages (the first for an id
+    carries its ``prompt``, the last sets ``done``) and receives a
+    ``PartialEvaluation`` each time a completed sentence has been
+    evaluated, then a final one per generation. Invalid messages are
+    answered with an ``ErrorResponse`` and otherwise ignored. Messages are
+    not read while ``live.max_pending`` evaluations await delivery.
+    """
+    await websocket.accept()
+    session = _live_session()
+
+    async def push() -> None:
+        async for update in session.updates():
+            await websocket.send_text(update.model_dump_json())
+
+    pusher = asyncio.create_task(push())
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                session.handle(GenerationDelta.model_validate_json(raw))
+            except ValueError as e:  # ValidationError included
+                await websocket.send_text(
+                    ErrorResponse(
+                        error="Invalid message", detail=str(e)
+                    ).model_dump_json()
+                )
+            await session.drain()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.cancel()
+        pusher.cancel()
+
+
+@app.post("/api/v1/detect-hallucination/live/sse")
+async def detect_hallucination_live_sse_endpoint(request: Request) -> StreamingResponse:
+    """
+    Server-sent events variant of the live endpoint, for clients without
+    WebSocket support.
+
+    The request body is an NDJSON stream of ``GenerationDelta`` messages,
+    read as it arrives. Every ``PartialEvaluation`` is sent as an ``update``
+    event; the response ends once the body is complete and every
+    generation has its final verdict.
+    """
+    session = _live_session()
+
+    async def read() -> None:
+        try:
+            async for line in iter_lines(request.stream()):
+                session.handle(GenerationDelta.model_validate_json(line))
+                await session.drain()
+            session.close()
+        except Exception as e:
+            session.cancel()
+            raise e
+
+    async def body():
+        reader = asyncio.create_task(read())
+        try:
+            async for update in session.updates():
+                yield f"event: update\ndata: {update.model_dump_json()}\n\n"
+            await reader
+        except Exception as e:
+            logger.error(f"Error processing live stream: {str(e)}.")
+            error = ErrorResponse(error="Stream aborted", detail=str(e))
+            yield f"event: error\ndata: {error.model_dump_json()}\n\n"
+        finally:
+            reader.cancel()
+            session.cancel()
+
+    return DuplexStreamingResponse(body(), media_type="text/event-stream")
+
+
+def _job_queue() -> JobQueue:
+    queue = get_job_queue()
+    if queue is None:
+        raise HTTPException(status_code=503, detail="Jobs are disabled.")
+    return queue
+
+
+@app.post("/api/v1/jobs", response_model=Job, status_code=202)
+async def submit_job(request: JobRequest) -> Job:
+    """
+    Queue a detection and return its job at once.
+
+    The job runs on the background workers; poll ``GET /api/v1/jobs/{id}``
+    for its result, or pass a ``callback_url`` to receive the finished job.
+    """
+    callback_url = None if request.callback_url is None else str(request.callback_url)
+    try:
+        job = await _job_queue().submit(
+            request.output, priority=request.priority, callback_url=callback_url
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    logger.info(f"Queued job {job.id} for ID: {request.output.id}.")
+    return job
+
+
+@app.get("/api/v1/jobs/stats", response_model=JobQueueStats)
+async def job_stats() -> JobQueueStats:
+    """Jobs per status and queueing delay of the job queue."""
+    queue = get_job_queue()
+    if queue is None:
+        return JobQueueStats(enabled=False)
+    return await queue.stats()
+
+
+@app.get("/api/v1/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str) -> Job:
+    """Status of a job, with its evaluation once it has finished."""
+    job = await _job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job
+
+
+@app.delete("/api/v1/jobs/{job_id}", response_model=Job)
+async def cancel_job(job_id: str) -> Job:
+    """
+    Cancel a queued or running job.
+
+    Jobs that already finished are left as they are and answered with 409.
+    """
+    job = await _job_queue().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    if job.status != "cancelled":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status}.")
+    return job
+
+
+@app.get("/api/v1/cache/stats", response_model=CacheStats)
+async def cache_stats() -> CacheStats:
+    """Verdict cache hit/miss counters."""
+    cache = get_verdict_cache()
+    if cache is None:
+        return CacheStats(enabled=False)
+    return cache.stats()
+
+
+@app.get("/api/v1/semantic-cache/stats", response_model=SemanticCacheStats)
+async def semantic_cache_stats() -> SemanticCacheStats:
+    """Near-duplicate reuse counters of the semantic cache."""
+    semantic = get_semantic_cache()
+    if semantic is None:
+        return SemanticCacheStats(enabled=False)
+    return semantic.stats()
+
+
+@app.get("/api/v1/prescreen/stats", response_model=TieredDetectorStats)
+async def prescreen_stats() -> TieredDetectorStats:
+    """Share of traffic and latency percentiles per detection tier."""
+    tiered = get_tiered_detector()
+    if tiered is None:
+        return TieredDetectorStats(enabled=False)
+    return tiered.stats()
+
+
+@app.get("/api/v1/cascade/stats", response_model=CascadeStats)
+async def cascade_stats() -> CascadeStats:
+    """Verdicts, escalations, latency and cost per model cascade tier."""
+    cascade = get_cascade()
+    if cascade is None:
+        return CascadeStats(enabled=False)
+    return cascade.stats()
+
+
+@app.get("/api/v1/coalescer/stats", response_model=CoalescerStats)
+async def coalescer_stats() -> CoalescerStats:
+    """Queue depth and batch-size distribution of the request coalescer."""
+    coalescer = get_coalescer()
+    if coalescer is None:
+        return CoalescerStats(enabled=False)
+    return coalescer.stats()
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc: Exception):
     """Global exception handler for unhandled errors."""
@@ -103,6 +471,8 @@ def create_app() -> FastAPI:
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(
         "nicotine.api:app", host="0.0.0.0", port=8000, reload=True, log_level="info"
     )
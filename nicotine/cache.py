@@ -0,0 +1,403 @@
+"""
+Content-addressed verdict cache for hallucination detection.
+
+Verdicts are keyed on a stable hash of the ``LLMOutput`` content and its
+``LLMSettings``, so identical (prompt, output, settings) triples are only
+evaluated once. Concurrent identical requests are deduplicated in flight.
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Protocol, TypeVar
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from pydantic import BaseModel
+
+from .config import get_setting, shared_state
+from .metrics import record_cache
+from .models import HallucinationEvaluation, LLMOutput
+from .prompts import template_version
+
+# Bump when the detection prompt or verdict format changes so stale entries
+# are never reused.
+CACHE_KEY_VERSION = 2
+
+R = TypeVar("R")
+
+
+def cache_key(output: LLMOutput) -> str:
+    """
+    Stable content hash of an output and its settings.
+
+    The output ``id`` is deliberately excluded: two records with the same
+    content share one verdict. The prompt template version is resolved, so
+    changing ``prompts.version`` does not serve verdicts of the old prompt.
+    """
+    payload = json.dumps(
+        {
+            "version": CACHE_KEY_VERSION,
+            "prompt": output.prompt,
+            "output": output.output,
+            "settings": output.settings.model_dump(exclude_none=True),
+            "template": template_version(output.settings),
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheBackend(Protocol):
+    """
+    Storage for cached verdicts.
+    """
+
+    blocking: bool  # reads and writes may wait on disk or other processes
+
+    def get(self, key: str) -> HallucinationEvaluation | None:
+        """Return the stored verdict, or None when missing or expired."""
+
+    def set(self, key: str, value: HallucinationEvaluation) -> None:
+        """Store a verdict."""
+
+    def clear(self) -> None:
+        """Remove every stored verdict."""
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU cache with TTL eviction.
+    """
+
+    blocking = False
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, HallucinationEvaluation]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> HallucinationEvaluation | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: HallucinationEvaluation) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    On-disk cache that survives restarts.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str | Path, ttl: float = 3600.0):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> HallucinationEvaluation | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= time.time():
+                self._conn.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+                return None
+        return HallucinationEvaluation.model_validate_json(row[0])
+
+    def set(self, key: str, value: HallucinationEvaluation) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verdicts (key, value, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, value.model_dump_json(), time.time() + self.ttl),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM verdicts")
+
+    def purge_expired(self) -> int:
+        """
+        Delete expired rows and return how many were removed.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM verdicts WHERE expires_at <= ?", (time.time(),)
+            )
+            return cursor.rowcount
+
+
+class CacheStats(BaseModel):
+    """
+    Hit/miss counters for the verdict cache.
+    """
+
+    enabled: bool
+    hits: int = 0
+    misses: int = 0
+    deduplicated: int = 0
+    hit_ratio: float = 0.0
+
+
+class _Flight:
+    """
+    A computation in progress that identical requests can wait on.
+    """
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: HallucinationEvaluation | None = None
+
+
+class VerdictCache:
+    """
+    Verdict cache with single-flight deduplication.
+
+    Evaluations carrying an ``error`` are never stored, so transient
+    upstream failures are retried on the next request.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+        self._flights: dict[str, _Flight] = {}
+        self._async_flights: dict[str, asyncio.Future] = {}
+
+    def _store(self, key: str, value: HallucinationEvaluation) -> None:
+        if value.error is None:
+            self.backend.set(key, value)
+
+    async def _offload(self, function: Callable[..., R], *args: Any) -> R:
+        """
+        Call ``function``, in a worker thread when the backend may block, so
+        disk reads and writes do not stall the event loop.
+        """
+        if self.backend.blocking:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    def _count(
+        self, value: HallucinationEvaluation | None
+    ) -> HallucinationEvaluation | None:
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        record_cache("miss" if value is None else "hit")
+        return value
+
+    def get(self, output: LLMOutput) -> HallucinationEvaluation | None:
+        """
+        Return the cached verdict for an output, counting the hit or miss.
+        """
+        return self._count(self.backend.get(cache_key(output)))
+
+    async def aget(self, output: LLMOutput) -> HallucinationEvaluation | None:
+        """
+        Async ``get``.
+        """
+        return self._count(await self._offload(self.backend.get, cache_key(output)))
+
+    def set(self, output: LLMOutput, value: HallucinationEvaluation) -> None:
+        """
+        Store a verdict for an output.
+        """
+        self._store(cache_key(output), value)
+
+    async def aset(self, output: LLMOutput, value: HallucinationEvaluation) -> None:
+        """
+        Async ``set``.
+        """
+        await self._offload(self._store, cache_key(output), value)
+
+    def get_or_compute(
+        self,
+        output: LLMOutput,
+        compute: Callable[[LLMOutput], HallucinationEvaluation],
+    ) -> HallucinationEvaluation:
+        """
+        Return the cached verdict or compute it, deduplicating across threads.
+        """
+        key = cache_key(output)
+        value = self.backend.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            record_cache("hit")
+            return value
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.deduplicated += 1
+        record_cache("miss" if leader else "deduplicated")
+        if not leader:
+            flight.done.wait()
+            return flight.result if flight.result is not None else compute(output)
+        try:
+            flight.result = compute(output)
+            self._store(key, flight.result)
+            return flight.result
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def aget_or_compute(
+        self,
+        output: LLMOutput,
+        compute: Callable[[LLMOutput], Awaitable[HallucinationEvaluation]],
+    ) -> HallucinationEvaluation:
+        """
+        Return the cached verdict or compute it, deduplicating across tasks.
+        """
+        key = cache_key(output)
+        value = await self._offload(self.backend.get, key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            record_cache("hit")
+            return value
+        pending = self._async_flights.get(key)
+        if pending is not None:
+            with self._lock:
+                self.deduplicated += 1
+            record_cache("deduplicated")
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                return await compute(output)
+            except Exception:
+                return await compute(output)
+        future = asyncio.get_running_loop().create_future()
+        self._async_flights[key] = future
+        with self._lock:
+            self.misses += 1
+        record_cache("miss")
+        try:
+            result = await compute(output)
+            await self._offload(self._store, key, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when nobody is waiting.
+            raise
+        finally:
+            del self._async_flights[key]
+
+    def stats(self) -> CacheStats:
+        """
+        Snapshot of the hit/miss counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return CacheStats(
+                enabled=True,
+                hits=self.hits,
+                misses=self.misses,
+                deduplicated=self.deduplicated,
+                hit_ratio=self.hits / lookups if lookups else 0.0,
+            )
+
+
+_UNSET = object()
+_verdict_cache: "VerdictCache | None | object" = _UNSET
+
+
+def build_verdict_cache() -> VerdictCache | None:
+    """
+    Build the verdict cache described by ``hallucination_detection`` config.
+    """
+    if not get_setting("hallucination_detection.enable_caching", False):
+        return None
+    ttl = float(get_setting("hallucination_detection.cache_ttl", 3600))
+    backend_name = get_setting("hallucination_detection.cache_backend", "memory")
+    if backend_name == "memory" and shared_state():
+        backend_name = "sqlite"  # one cache for every worker on the host
+    backend: CacheBackend
+    if backend_name == "sqlite":
+        backend = SQLiteCacheBackend(
+            get_setting("hallucination_detection.cache_path", ".nicotine/cache.db"),
+            ttl=ttl,
+        )
+    elif backend_name == "memory":
+        backend = MemoryCacheBackend(
+            max_entries=int(
+                get_setting("hallucination_detection.cache_max_entries", 10000)
+            ),
+            ttl=ttl,
+        )
+    else:
+        raise ValueError(f"Unknown cache backend: {backend_name}.")
+    return VerdictCache(backend)
+
+
+def get_verdict_cache() -> VerdictCache | None:
+    """
+    Get the process-wide verdict cache, or None when caching is disabled.
+    """
+    global _verdict_cache
+    if _verdict_cache is _UNSET:
+        _verdict_cache = build_verdict_cache()
+    return _verdict_cache  # type: ignore[return-value]
+
+
+def configure_verdict_cache(cache: VerdictCache | None) -> None:
+    """
+    Replace the process-wide verdict cache (None disables caching).
+    """
+    global _verdict_cache
+    _verdict_cache = cache
@@ -0,0 +1,352 @@
+"""
+Model-routing cascade: a cheaper model first, the requested one when in doubt.
+
+With ``cascade.enabled``, each upstream detection is first made with
+``cascade.model``, a cheaper and faster model, using the same prompt
+template and the request's backend (or ``cascade.provider``). Its verdict is
+returned unless it is uncertain, in which case the output is evaluated again
+with the model in ``LLMSettings.model``:
+
+- ``ambiguous``: ``delusion_percentage`` falls within ``cascade.band``
+- ``inconsistent``: ``is_hallucination`` disagrees with the percentage
+  (flagged below the band, or not flagged above it)
+- ``error``: the cheaper call failed
+
+Requests already made with ``cascade.model`` are sent as they are, and the
+pipeline strategy's stages choose their own models. Packed batch calls are
+made with the cheaper model too; only their uncertain items are escalated,
+one call each.
+
+Each tier's upstream calls, resolved verdicts, latency and tokens are
+counted, with their cost when ``cascade.prices`` lists the models. Tune the
+band against labeled data with ``scripts/benchmarks/bench_cascade.py``.
+"""
+
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator
+import asyncio
+import threading
+import time
+
+from pydantic import BaseModel
+
+from .config import get_setting
+from .metrics import cached_tokens, record_cascade
+from .models import HallucinationEvaluation, LLMOutput, LLMSettings
+from .prescreen import LATENCY_WINDOW, _percentile
+from .tracing import add_event
+
+# Tokens used by the tier call running in the current context.
+_usage: ContextVar[Counter | None] = ContextVar("_cascade_usage", default=None)
+
+
+def record_tier_usage(response: Any) -> None:
+    """
+    Count the tokens of an upstream response towards the cascade tier that
+    made it, if any.
+    """
+    tokens = _usage.get()
+    usage = getattr(response, "usage", None)
+    if tokens is None or usage is None:
+        return
+    for kind, count in (
+        ("input", getattr(usage, "input_tokens", None)),
+        ("output", getattr(usage, "output_tokens", None)),
+        ("cached", cached_tokens(usage)),
+    ):
+        if isinstance(count, int):
+            tokens[kind] += count
+
+
+@contextmanager
+def track_usage() -> Iterator[Counter]:
+    """
+    Collect the tokens (``input``, ``cached``, ``output``) of the detection
+    calls made inside the block.
+    """
+    tokens: Counter = Counter()
+    token = _usage.set(tokens)
+    try:
+        yield tokens
+    finally:
+        _usage.reset(token)
+
+
+class Price(BaseModel):
+    """
+    USD per million tokens of a model.
+    """
+
+    input: float
+    output: float
+    cached: float | None = None  # cached input; billed as input when unset
+
+    def cost(self, tokens: Counter) -> float:
+        cached = tokens["cached"]
+        uncached = tokens["input"] - cached
+        cached_price = self.input if self.cached is None else self.cached
+        input_cost = uncached * self.input + cached * cached_price
+        return (input_cost + tokens["output"] * self.output) / 1_000_000
+
+
+class CascadeTierStats(BaseModel):
+    """
+    Calls, verdicts, latency and usage of one cascade tier.
+    """
+
+    calls: int  # upstream detections made (items of packed calls included)
+    resolved: int  # verdicts this tier returned
+    share: float  # of all verdicts
+    p50_ms: float
+    p99_ms: float
+    input_tokens: int
+    cached_tokens: int
+    output_tokens: int
+    cost_usd: float | None  # None when a model used has no price
+
+
+class CascadeStats(BaseModel):
+    """
+    Per-tier statistics of the model cascade.
+    """
+
+    enabled: bool
+    total: int = 0
+    escalation_rate: float = 0.0
+    reasons: dict[str, int] = {}  # escalation reason -> escalated verdicts
+    tiers: dict[str, CascadeTierStats] = {}
+
+
+class ModelCascade:
+    """
+    Detect with a cheaper model and escalate uncertain verdicts.
+    """
+
+    TIERS = ("cheap", "strong")
+
+    def __init__(
+        self,
+        model: str,
+        band: tuple[float, float] = (20.0, 80.0),
+        provider: str | None = None,
+        prices: dict[str, Price] | None = None,
+    ):
+        low, high = band
+        if not 0.0 <= low <= high <= 100.0:
+            raise ValueError("band must satisfy 0 <= low <= high <= 100.")
+        self.model = model
+        self.band = (float(low), float(high))
+        self.provider = provider
+        self.prices = dict(prices or {})
+        self._lock = threading.Lock()
+        self._calls = {tier: 0 for tier in self.TIERS}
+        self._resolved = {tier: 0 for tier in self.TIERS}
+        self._reasons: Counter[str] = Counter()
+        self._latencies: dict[str, deque[float]] = {
+            tier: deque(maxlen=LATENCY_WINDOW) for tier in self.TIERS
+        }
+        self._tokens: dict[str, Counter[str]] = {tier: Counter() for tier in self.TIERS}
+        self._costs = {tier: 0.0 for tier in self.TIERS}
+        self._unpriced = {tier: False for tier in self.TIERS}
+
+    def applies(self, settings: LLMSettings) -> bool:
+        """
+        Whether detections with these settings go through the cascade.
+        """
+        return settings.model != self.model
+
+    def first_tier(self, output: LLMOutput) -> LLMOutput:
+        """
+        The output with its settings pointed at the cheaper model.
+        """
+        update: dict[str, Any] = {"model": self.model}
+        if self.provider is not None:
+            update["provider"] = self.provider
+        return output.model_copy(
+            update={"settings": output.settings.model_copy(update=update)}
+        )
+
+    def escalation(self, evaluation: HallucinationEvaluation) -> str | None:
+        """
+        Why a first-tier verdict must be escalated, or None to keep it.
+        """
+        if evaluation.error is not None:
+            return "error"
+        low, high = self.band
+        percentage = evaluation.delusion_percentage
+        if low <= percentage <= high:
+            return "ambiguous"
+        if evaluation.is_hallucination != (percentage > high):
+            return "inconsistent"
+        return None
+
+    @contextmanager
+    def _tier(self, tier: str, model: str, calls: int = 1) -> Iterator[None]:
+        """
+        Time the calls made inside the block and count their tokens and
+        cost towards ``tier``.
+        """
+        started = time.perf_counter()
+        with track_usage() as tokens:
+            try:
+                yield
+            finally:
+                self._record(tier, model, calls, time.perf_counter() - started, tokens)
+
+    def _record(
+        self, tier: str, model: str, calls: int, elapsed: float, tokens: Counter
+    ) -> None:
+        price = self.prices.get(model)
+        with self._lock:
+            self._calls[tier] += calls
+            self._latencies[tier].append(elapsed)
+            self._tokens[tier].update(tokens)
+            if price is None:
+                self._unpriced[tier] = True
+            else:
+                self._costs[tier] += price.cost(tokens)
+
+    def _resolve(self, tier: str, reason: str | None = None) -> None:
+        with self._lock:
+            self._resolved[tier] += 1
+            if reason is not None:
+                self._reasons[reason] += 1
+        record_cascade(tier, reason)
+        if reason is not None:
+            add_event("escalated", reason=reason)
+
+    def detect(
+        self,
+        output: LLMOutput,
+        call: Callable[[LLMOutput], HallucinationEvaluation],
+    ) -> HallucinationEvaluation:
+        """
+        Detect with the cheaper model, escalating uncertain verdicts.
+        """
+        with self._tier("cheap", self.model):
+            evaluation = call(self.first_tier(output))
+        reason = self.escalation(evaluation)
+        if reason is None:
+            self._resolve("cheap")
+            return evaluation
+        with self._tier("strong", output.settings.model):
+            evaluation = call(output)
+        self._resolve("strong", reason)
+        return evaluation
+
+    async def adetect(
+        self,
+        output: LLMOutput,
+        call: Callable[[LLMOutput], Awaitable[HallucinationEvaluation]],
+    ) -> HallucinationEvaluation:
+        """
+        Detect with the cheaper model, escalating uncertain verdicts.
+        """
+        with self._tier("cheap", self.model):
+            evaluation = await call(self.first_tier(output))
+        reason = self.escalation(evaluation)
+        if reason is None:
+            self._resolve("cheap")
+            return evaluation
+        with self._tier("strong", output.settings.model):
+            evaluation = await call(output)
+        self._resolve("strong", reason)
+        return evaluation
+
+    async def adetect_packed(
+        self,
+        outputs: list[LLMOutput],
+        call_packed: Callable[
+            [list[LLMOutput]], Awaitable[list[HallucinationEvaluation]]
+        ],
+        call: Callable[[LLMOutput], Awaitable[HallucinationEvaluation]],
+    ) -> list[HallucinationEvaluation]:
+        """
+        Detect a packed group with the cheaper model in one call, escalating
+        its uncertain items one by one.
+        """
+        with self._tier("cheap", self.model, calls=len(outputs)):
+            evaluations = await call_packed([self.first_tier(o) for o in outputs])
+
+        async def settle(
+            output: LLMOutput, evaluation: HallucinationEvaluation
+        ) -> HallucinationEvaluation:
+            reason = self.escalation(evaluation)
+            if reason is None:
+                self._resolve("cheap")
+                return evaluation
+            with self._tier("strong", output.settings.model):
+                evaluation = await call(output)
+            self._resolve("strong", reason)
+            return evaluation
+
+        return list(
+            await asyncio.gather(*(settle(o, e) for o, e in zip(outputs, evaluations)))
+        )
+
+    def stats(self) -> CascadeStats:
+        """
+        Snapshot of per-tier calls, verdicts, latency and cost.
+        """
+        with self._lock:
+            total = sum(self._resolved.values())
+            return CascadeStats(
+                enabled=True,
+                total=total,
+                escalation_rate=self._resolved["strong"] / total if total else 0.0,
+                reasons=dict(self._reasons),
+                tiers={
+                    tier: CascadeTierStats(
+                        calls=self._calls[tier],
+                        resolved=self._resolved[tier],
+                        share=self._resolved[tier] / total if total else 0.0,
+                        p50_ms=_percentile(list(self._latencies[tier]), 50) * 1000,
+                        p99_ms=_percentile(list(self._latencies[tier]), 99) * 1000,
+                        input_tokens=self._tokens[tier]["input"],
+                        cached_tokens=self._tokens[tier]["cached"],
+                        output_tokens=self._tokens[tier]["output"],
+                        cost_usd=(None if self._unpriced[tier] else self._costs[tier]),
+                    )
+                    for tier in self.TIERS
+                },
+            )
+
+
+_UNSET = object()
+_cascade: "ModelCascade | None | object" = _UNSET
+
+
+def build_cascade() -> ModelCascade | None:
+    """
+    Build the cascade described by the ``cascade`` config section.
+    """
+    if not get_setting("cascade.enabled", False):
+        return None
+    low, high = get_setting("cascade.band", [20.0, 80.0])
+    prices = get_setting("cascade.prices", {})
+    return ModelCascade(
+        model=str(get_setting("cascade.model", "gpt-4.1-mini")),
+        band=(float(low), float(high)),
+        provider=get_setting("cascade.provider"),
+        prices={model: Price(**price) for model, price in prices.items()},
+    )
+
+
+def get_cascade() -> ModelCascade | None:
+    """
+    Get the process-wide cascade, or None when ``cascade.enabled`` is off.
+    """
+    global _cascade
+    if _cascade is _UNSET:
+        _cascade = build_cascade()
+    return _cascade  # type: ignore[return-value]
+
+
+def configure_cascade(cascade: ModelCascade | None) -> None:
+    """
+    Replace the process-wide cascade (None disables it).
+    """
+    global _cascade
+    _cascade = cascade
@@ -0,0 +1,333 @@
+"""
+Chunked evaluation of long outputs.
+
+Outputs longer than ``chunking.threshold_chars`` are split on sentence
+boundaries into chunks of at most ``max_chars``. Each chunk is evaluated
+in a window that also holds the last ``overlap_sentences`` of the chunk
+before it, so claims spanning a boundary keep their context. Windows are
+evaluated concurrently and merged into one verdict: hallucinated if any
+window is, with ``delusion_percentage`` weighted by chunk length.
+
+Chunk boundaries are content-defined: a chunk ends after a sentence whose
+hash selects it as a cut point (once the chunk holds ``min_chars``), or
+when the next sentence would overflow it. An edit therefore only moves the
+boundaries around it, and since window verdicts are kept by content,
+resubmitting an edited output re-scores only the windows that changed.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, NamedTuple
+import asyncio
+import contextvars
+import hashlib
+import re
+
+from pydantic import BaseModel
+
+from .cache import MemoryCacheBackend, cache_key
+from .config import get_setting
+from .models import HallucinationEvaluation, LLMOutput
+
+# Sentence ends: terminal punctuation followed by whitespace.
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# One sentence in CUT_EVERY ends a chunk once it holds ``min_chars``.
+CUT_EVERY = 4
+
+
+class Chunk(NamedTuple):
+    """
+    A span of the output and the window it is evaluated in.
+    """
+
+    number: int  # position in the output, from 0
+    start: int
+    end: int
+    window: str
+
+
+class ChunkVerdict(BaseModel):
+    """
+    Verdict of one chunk's window.
+    """
+
+    index: int
+    start: int
+    end: int
+    evaluation: HallucinationEvaluation
+    reused: bool = False  # served from an earlier evaluation of the same window
+
+
+class ChunkedEvaluation(BaseModel):
+    """
+    Merged verdict of a chunked evaluation and its per-chunk verdicts.
+    """
+
+    evaluation: HallucinationEvaluation
+    chunks: list[ChunkVerdict]
+
+    @property
+    def rescored(self) -> int:
+        return sum(not chunk.reused for chunk in self.chunks)
+
+
+def split_sentences(text: str) -> list[tuple[int, int]]:
+    """
+    Character spans of the sentences of a text, whitespace excluded.
+    """
+    spans = []
+    start = 0
+    for boundary in _SENTENCE_END.finditer(text):
+        spans.append((start, boundary.start()))
+        start = boundary.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+    return [(start, end) for start, end in spans if end > start]
+
+
+def _is_cut_point(sentence: str) -> bool:
+    digest = hashlib.blake2b(sentence.encode(), digest_size=2).digest()
+    return int.from_bytes(digest, "big") % CUT_EVERY == 0
+
+
+def _hard_split(start: int, end: int, max_chars: int) -> list[tuple[int, int]]:
+    return [(s, min(s + max_chars, end)) for s in range(start, end, max_chars)]
+
+
+def chunk_text(
+    text: str,
+    max_chars: int = 4000,
+    min_chars: int | None = None,
+    overlap_sentences: int = 1,
+) -> list[Chunk]:
+    """
+    Split a text into content-defined chunks with overlapping windows.
+
+    Sentences longer than ``max_chars`` are cut at ``max_chars``.
+    """
+    if max_chars < 1:
+        raise ValueError("max_chars must be at least 1.")
+    min_chars = max_chars // 4 if min_chars is None else min_chars
+    sentences = []
+    for start, end in split_sentences(text):
+        sentences.extend(_hard_split(start, end, max_chars))
+
+    groups: list[list[tuple[int, int]]] = []
+    group: list[tuple[int, int]] = []
+    for start, end in sentences:
+        if group and end - group[0][0] > max_chars:
+            groups.append(group)
+            group = []
+        group.append((start, end))
+        if end - group[0][0] >= min_chars and _is_cut_point(text[start:end]):
+            groups.append(group)
+            group = []
+    if group:
+        groups.append(group)
+
+    chunks = []
+    for index, group in enumerate(groups):
+        context = groups[index - 1][-overlap_sentences:] if index else []
+        if overlap_sentences <= 0:
+            context = []
+        start, end = group[0][0], group[-1][1]
+        window_start = context[0][0] if context else start
+        chunks.append(Chunk(index, start, end, text[window_start:end]))
+    return chunks
+
+
+def merge_verdicts(verdicts: list[ChunkVerdict]) -> HallucinationEvaluation:
+    """
+    Merge per-chunk verdicts into one evaluation.
+
+    Failed chunks are left out of the percentage and reported in ``error``.
+    """
+    ok = [v for v in verdicts if v.evaluation.error is None]
+    failed = [v for v in verdicts if v.evaluation.error is not None]
+    weight = sum(v.end - v.start for v in ok)
+    percentage = (
+        sum(v.evaluation.delusion_percentage * (v.end - v.start) for v in ok) / weight
+        if weight
+        else 0.0
+    )
+    flagged = [v for v in ok if v.evaluation.is_hallucination]
+    if flagged:
+        rationale = "\n".join(
+            f"Chunk {v.index + 1} (chars {v.start}-{v.end}): {v.evaluation.rationale}"
+            for v in flagged
+        )
+    elif ok:
+        rationale = f"No hallucinations found in {len(ok)} of {len(verdicts)} chunks."
+    else:
+        rationale = "Error detecting hallucinations"
+    error = None
+    if failed:
+        error = (
+            f"{len(failed)} of {len(verdicts)} chunks failed: "
+            f"{failed[0].evaluation.error}"
+        )
+    return HallucinationEvaluation(
+        is_hallucination=bool(flagged),
+        rationale=rationale,
+        delusion_percentage=percentage,
+        error=error,
+    )
+
+
+class ChunkedDetector:
+    """
+    Evaluates long outputs window by window, reusing unchanged windows.
+
+    Window verdicts are kept in an in-process LRU keyed by the window's
+    content, the prompt and the settings, so they are reused across
+    resubmissions even when the verdict cache is off. Failed windows are
+    never kept.
+    """
+
+    def __init__(
+        self,
+        threshold_chars: int = 6000,
+        max_chars: int = 4000,
+        min_chars: int | None = None,
+        overlap_sentences: int = 1,
+        concurrency: int = 8,
+        max_entries: int = 10000,
+        ttl: float = 3600.0,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        self.threshold_chars = threshold_chars
+        self.max_chars = max_chars
+        self.min_chars = min_chars
+        self.overlap_sentences = overlap_sentences
+        self.concurrency = concurrency
+        self.verdicts = MemoryCacheBackend(max_entries=max_entries, ttl=ttl)
+
+    def applies(self, output: LLMOutput) -> bool:
+        """
+        Whether an output is long enough to be chunked.
+        """
+        return len(output.output) > self.threshold_chars
+
+    def chunks(self, output: LLMOutput) -> list[Chunk]:
+        return chunk_text(
+            output.output, self.max_chars, self.min_chars, self.overlap_sentences
+        )
+
+    def _window(self, output: LLMOutput, chunk: Chunk) -> LLMOutput:
+        return LLMOutput(
+            id=f"{output.id}#{chunk.number}",
+            prompt=output.prompt,
+            output=chunk.window,
+            settings=output.settings,
+        )
+
+    def _verdict(
+        self, chunk: Chunk, evaluation: HallucinationEvaluation, reused: bool
+    ) -> ChunkVerdict:
+        return ChunkVerdict(
+            index=chunk.number,
+            start=chunk.start,
+            end=chunk.end,
+            evaluation=evaluation,
+            reused=reused,
+        )
+
+    def _lookup(self, window: LLMOutput) -> tuple[str, HallucinationEvaluation | None]:
+        key = cache_key(window)
+        return key, self.verdicts.get(key)
+
+    def _keep(self, key: str, evaluation: HallucinationEvaluation) -> None:
+        if evaluation.error is None:
+            self.verdicts.set(key, evaluation)
+
+    def detect(
+        self,
+        output: LLMOutput,
+        evaluate: Callable[[LLMOutput], HallucinationEvaluation],
+    ) -> ChunkedEvaluation:
+        """
+        Evaluate the windows of an output on a thread pool and merge them.
+        """
+        chunks = self.chunks(output)
+
+        def run(chunk: Chunk) -> ChunkVerdict:
+            window = self._window(output, chunk)
+            key, known = self._lookup(window)
+            if known is not None:
+                return self._verdict(chunk, known, reused=True)
+            evaluation = evaluate(window)
+            self._keep(key, evaluation)
+            return self._verdict(chunk, evaluation, reused=False)
+
+        # Each window runs in a copy of the caller's context, deadline included.
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, run, chunk)
+                for chunk in chunks
+            ]
+            verdicts = [future.result() for future in futures]
+        return ChunkedEvaluation(evaluation=merge_verdicts(verdicts), chunks=verdicts)
+
+    async def adetect(
+        self,
+        output: LLMOutput,
+        evaluate: Callable[[LLMOutput], Awaitable[HallucinationEvaluation]],
+    ) -> ChunkedEvaluation:
+        """
+        Evaluate the windows of an output concurrently and merge them.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(chunk: Chunk) -> ChunkVerdict:
+            window = self._window(output, chunk)
+            key, known = self._lookup(window)
+            if known is not None:
+                return self._verdict(chunk, known, reused=True)
+            async with semaphore:
+                evaluation = await evaluate(window)
+            self._keep(key, evaluation)
+            return self._verdict(chunk, evaluation, reused=False)
+
+        verdicts = await asyncio.gather(*(run(chunk) for chunk in self.chunks(output)))
+        return ChunkedEvaluation(evaluation=merge_verdicts(verdicts), chunks=verdicts)
+
+
+_UNSET = object()
+_chunked_detector: "ChunkedDetector | None | object" = _UNSET
+
+
+def build_chunked_detector() -> ChunkedDetector | None:
+    """
+    Build the chunked detector described by the ``chunking`` config section.
+    """
+    if not get_setting("chunking.enabled", False):
+        return None
+    min_chars = get_setting("chunking.min_chars", None)
+    return ChunkedDetector(
+        threshold_chars=int(get_setting("chunking.threshold_chars", 6000)),
+        max_chars=int(get_setting("chunking.max_chars", 4000)),
+        min_chars=None if min_chars is None else int(min_chars),
+        overlap_sentences=int(get_setting("chunking.overlap_sentences", 1)),
+        concurrency=int(get_setting("chunking.concurrency", 8)),
+        max_entries=int(get_setting("chunking.cache_max_entries", 10000)),
+        ttl=float(get_setting("chunking.cache_ttl", 3600)),
+    )
+
+
+def get_chunked_detector() -> ChunkedDetector | None:
+    """
+    Get the process-wide chunked detector, or None when chunking is disabled.
+    """
+    global _chunked_detector
+    if _chunked_detector is _UNSET:
+        _chunked_detector = build_chunked_detector()
+    return _chunked_detector  # type: ignore[return-value]
+
+
+def configure_chunked_detector(detector: ChunkedDetector | None) -> None:
+    """
+    Replace the process-wide chunked detector (None disables chunking).
+    """
+    global _chunked_detector
+    _chunked_detector = detector
@@ -0,0 +1,238 @@
+"""
+Micro-batching of concurrent single-item detections.
+
+The coalescer holds incoming requests for up to ``window`` seconds, or until
+``max_batch_size`` are waiting, then evaluates them together through
+``async_detect_hallucinations``. Short outputs sharing the same settings are
+packed into one upstream call unless the pipeline strategy or chunking
+applies to them, so each request gets the verdict it would get without
+coalescing. Requests wait at most one window longer than they would on
+their own, in exchange for fewer, larger upstream calls.
+"""
+
+from collections import Counter
+from typing import NamedTuple
+import asyncio
+import contextvars
+import threading
+import time
+import weakref
+
+from pydantic import BaseModel
+
+from .config import get_setting
+from .metrics import observe_coalesced_batch, track_coalescer_queue
+from .models import HallucinationEvaluation, LLMOutput
+from .ratelimit import current_priority, request_priority
+from .resilience import DeadlineExceeded, deadline, remaining_time
+from .system import DEFAULT_PACK_MAX_CHARS, async_detect_hallucinations
+from .tracing import span
+
+
+class CoalescerStats(BaseModel):
+    """
+    Batch statistics for the request coalescer.
+    """
+
+    enabled: bool
+    requests: int = 0
+    batches: int = 0
+    queue_depth: int = 0
+    mean_batch_size: float = 0.0
+    batch_sizes: dict[int, int] = {}  # batch size -> batches dispatched
+
+
+class _Request(NamedTuple):
+    """
+    A request waiting for its batch.
+    """
+
+    output: LLMOutput
+    future: asyncio.Future
+    queued: float
+    deadline: float | None  # monotonic time
+    priority: int
+
+
+class _Queue:
+    """
+    Requests waiting on one event loop.
+    """
+
+    def __init__(self) -> None:
+        self.items: list[_Request] = []
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class RequestCoalescer:
+    """
+    Collects single-item detections into batched evaluations.
+
+    Batches run in a fresh context, under the earliest deadline and the
+    most urgent priority of their requests. Each request also stops waiting
+    at its own deadline.
+    """
+
+    def __init__(
+        self,
+        window: float = 0.005,
+        max_batch_size: int = 16,
+        pack_size: int | None = None,
+        pack_max_chars: int = DEFAULT_PACK_MAX_CHARS,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1.")
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.pack_size = max_batch_size if pack_size is None else pack_size
+        self.pack_max_chars = pack_max_chars
+        self.requests = 0
+        self.batch_sizes: Counter[int] = Counter()
+        self._queues: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _Queue]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._tasks: set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+
+    def _queue(self) -> _Queue:
+        loop = asyncio.get_running_loop()
+        queue = self._queues.get(loop)
+        if queue is None:
+            queue = self._queues[loop] = _Queue()
+        return queue
+
+    async def submit(self, output: LLMOutput) -> HallucinationEvaluation:
+        """
+        Evaluate one output as part of the next batch.
+
+        Raises ``DeadlineExceeded`` when the request deadline passes first.
+        """
+        left = remaining_time()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded("request deadline passed before coalescing")
+        loop = asyncio.get_running_loop()
+        queue = self._queue()
+        future = loop.create_future()
+        now = time.monotonic()
+        queue.items.append(
+            _Request(
+                output,
+                future,
+                now,
+                None if left is None else now + left,
+                current_priority(),
+            )
+        )
+        track_coalescer_queue(1)
+        with self._lock:
+            self.requests += 1
+        if len(queue.items) >= self.max_batch_size:
+            self._flush(queue)
+        elif queue.timer is None:
+            queue.timer = loop.call_later(
+                self.window, self._flush, queue, context=contextvars.Context()
+            )
+        with span("coalescer.submit"):
+            try:
+                return await asyncio.wait_for(future, left)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(
+                    "no verdict from the coalesced batch before the request deadline"
+                ) from None
+
+    def _flush(self, queue: _Queue) -> None:
+        """
+        Dispatch everything waiting in ``queue`` as one batch.
+        """
+        if queue.timer is not None:
+            queue.timer.cancel()
+            queue.timer = None
+        batch, queue.items = queue.items, []
+        if not batch:
+            return
+        track_coalescer_queue(-len(batch))
+        now = time.monotonic()
+        observe_coalesced_batch(len(batch), [now - r.queued for r in batch])
+        with self._lock:
+            self.batch_sizes[len(batch)] += 1
+        task = asyncio.get_running_loop().create_task(
+            self._dispatch(batch), context=contextvars.Context()
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: list[_Request]) -> None:
+        deadlines = [r.deadline for r in batch if r.deadline is not None]
+        left = min(deadlines) - time.monotonic() if deadlines else None
+        try:
+            with deadline(left), request_priority(min(r.priority for r in batch)):
+                with span("coalescer.batch", size=len(batch)):
+                    evaluations = await async_detect_hallucinations(
+                        [r.output for r in batch],
+                        concurrency=len(batch),
+                        pack_size=self.pack_size,
+                        pack_max_chars=self.pack_max_chars,
+                    )
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        for request, evaluation in zip(batch, evaluations):
+            if not request.future.done():  # The request may have been cancelled.
+                request.future.set_result(evaluation)
+
+    def stats(self) -> CoalescerStats:
+        """
+        Snapshot of the request and batch counters.
+        """
+        with self._lock:
+            batches = sum(self.batch_sizes.values())
+            batched = sum(size * count for size, count in self.batch_sizes.items())
+            return CoalescerStats(
+                enabled=True,
+                requests=self.requests,
+                batches=batches,
+                queue_depth=sum(len(q.items) for q in list(self._queues.values())),
+                mean_batch_size=batched / batches if batches else 0.0,
+                batch_sizes=dict(sorted(self.batch_sizes.items())),
+            )
+
+
+_UNSET = object()
+_coalescer: "RequestCoalescer | None | object" = _UNSET
+
+
+def build_coalescer() -> RequestCoalescer | None:
+    """
+    Build the coalescer described by the ``coalescing`` config section.
+    """
+    if not get_setting("coalescing.enabled", False):
+        return None
+    max_batch_size = int(get_setting("coalescing.max_batch_size", 16))
+    return RequestCoalescer(
+        window=float(get_setting("coalescing.window_ms", 5)) / 1000,
+        max_batch_size=max_batch_size,
+        pack_size=int(get_setting("coalescing.pack_size", max_batch_size)),
+        pack_max_chars=int(
+            get_setting("coalescing.pack_max_chars", DEFAULT_PACK_MAX_CHARS)
+        ),
+    )
+
+
+def get_coalescer() -> RequestCoalescer | None:
+    """
+    Get the process-wide coalescer, or None when coalescing is disabled.
+    """
+    global _coalescer
+    if _coalescer is _UNSET:
+        _coalescer = build_coalescer()
+    return _coalescer  # type: ignore[return-value]
+
+
+def configure_coalescer(coalescer: RequestCoalescer | None) -> None:
+    """
+    Replace the process-wide coalescer (None disables coalescing).
+    """
+    global _coalescer
+    _coalescer = coalescer
@@ -0,0 +1,57 @@
+"""
+Configuration loading for Nicotine.
+
+Settings are read from the YAML file named by ``NICOTINE_CONFIG``, falling
+back to ``config/default.yaml`` in the project root. Missing files and keys
+resolve to the defaults passed by callers.
+"""
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+import os
+
+DEFAULT_CONFIG_PATH = Path(__file__).resolve().parent.parent / "config" / "default.yaml"
+
+# Worker processes serving the app, exported by ``nicotine.serving``.
+WORKERS_ENV = "NICOTINE_WORKERS"
+
+
+@lru_cache(maxsize=None)
+def load_config(path: str | None = None) -> dict:
+    """
+    Load the configuration file as a dictionary.
+    """
+    config_path = Path(path or os.getenv("NICOTINE_CONFIG") or DEFAULT_CONFIG_PATH)
+    if not config_path.is_file():
+        return {}
+    import yaml
+
+    with open(config_path) as f:
+        return yaml.safe_load(f) or {}
+
+
+def get_setting(key: str, default: Any = None) -> Any:
+    """
+    Look up a dotted setting such as ``hallucination_detection.cache_ttl``.
+    """
+    value: Any = load_config()
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return default
+        value = value[part]
+    return default if value is None else value
+
+
+def worker_count() -> int:
+    """
+    Number of worker processes serving the app.
+    """
+    return int(os.environ.get(WORKERS_ENV, 1))
+
+
+def shared_state() -> bool:
+    """
+    Whether caches, rate limits and metrics must be shared between workers.
+    """
+    return worker_count() > 1 and bool(get_setting("server.shared_state", True))
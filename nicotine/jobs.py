@@ -0,0 +1,666 @@
+"""
+Asynchronous detection jobs.
+
+``POST /api/v1/jobs`` stores an ``LLMOutput`` in a local SQLite queue and
+answers at once with the job's id, so detections that outlast the HTTP
+timeout of a gateway need no open connection. A bounded pool of worker tasks
+in every API process evaluates queued jobs, lowest ``priority`` first and in
+submission order within a priority, at the rate limiter's bulk priority so
+interactive requests go first. Clients poll ``GET /api/v1/jobs/{id}`` for
+the ``HallucinationEvaluation``, or give a ``callback_url`` the finished job
+is POSTed to.
+
+Callbacks only go to the hosts listed in ``jobs.callback_hosts``. Without
+a list, any host but private, loopback, link-local and other non-global
+addresses is called back: literal addresses are refused on submission, and
+names are resolved and checked before the POST, which then connects to the
+checked address.
+
+Queued jobs survive restarts and every worker process on the host pulls
+from the same database. A running job records its worker's boot id,
+process id and process start time, so jobs left running by a process that
+died are queued again when the next one starts, even once its process id
+has been reused. Finished jobs are kept for ``jobs.retention`` seconds.
+
+Cancelling a queued job removes it from the queue. Cancelling a running job
+stops it in the process running it; when another process runs it, its
+result is discarded.
+"""
+
+from pathlib import Path
+from typing import Collection, Literal
+from urllib.parse import urlsplit
+import asyncio
+import contextvars
+import ipaddress
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from pydantic import BaseModel, Field, HttpUrl
+
+from .config import get_setting
+from .metrics import observe_job_wait, record_job, set_job_queue_depth
+from .models import HallucinationEvaluation, LLMOutput
+from .ratelimit import request_priority
+from .resilience import deadline
+from .system import async_detect_hallucination
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+JobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled"]
+
+STATUSES: tuple[JobStatus, ...] = (
+    "queued",
+    "running",
+    "succeeded",
+    "failed",
+    "cancelled",
+)
+
+# Columns of a ``Job``, in field order.
+_COLUMNS = (
+    "id, status, priority, created_at, started_at, finished_at, callback_url, "
+    "result, error"
+)
+
+# Shortest pause between two purges of expired jobs.
+PURGE_INTERVAL = 60.0
+
+
+class JobRequest(BaseModel):
+    """
+    A detection to run in the background.
+    """
+
+    output: LLMOutput
+    priority: int = Field(default=0, ge=-100, le=100)  # lower runs first
+    callback_url: HttpUrl | None = None  # receives the finished Job as JSON
+
+
+class Job(BaseModel):
+    """
+    State of a detection job. Times are epoch seconds.
+    """
+
+    id: str
+    status: JobStatus
+    priority: int = 0
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+    callback_url: str | None = None
+    result: HallucinationEvaluation | None = None
+    error: str | None = None
+
+
+class JobQueueStats(BaseModel):
+    """
+    Jobs per status and queueing delay, across every worker process.
+    """
+
+    enabled: bool
+    workers: int = 0  # worker tasks in this process
+    queued: int = 0
+    running: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    oldest_queued_seconds: float = 0.0
+    mean_wait_seconds: float = 0.0  # queued to started, retained jobs
+
+
+def _pid_alive(pid: int) -> bool:
+    """
+    Whether a process with this id is running on this host.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _boot_id() -> str:
+    """
+    Id of the current boot of this host ("" where unknown).
+    """
+    try:
+        return Path("/proc/sys/kernel/random/boot_id").read_text().strip()
+    except OSError:
+        return ""
+
+
+def _start_time(pid: int) -> str:
+    """
+    Start time of a process in clock ticks since boot ("" where unknown).
+    """
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return ""
+    return stat.rsplit(")", 1)[1].split()[19]  # field 22, after the name
+
+
+def worker_token(pid: int | None = None) -> str:
+    """
+    Identity of a worker process that survives neither a reboot nor the
+    reuse of its process id: ``boot_id/pid/start_time``.
+    """
+    pid = os.getpid() if pid is None else pid
+    return f"{_boot_id()}/{pid}/{_start_time(pid)}"
+
+
+def _alive(worker: str | int | None) -> bool:
+    """
+    Whether the worker process of a running job still runs.
+    """
+    if worker is None:
+        return False
+    if "/" not in str(worker):  # the process id, as stored by older versions
+        return _pid_alive(int(worker))
+    boot, pid, started = str(worker).split("/")
+    if boot != _boot_id() or not _pid_alive(int(pid)):
+        return False
+    return not started or started == _start_time(int(pid))
+
+
+def check_callback_url(url: str, hosts: Collection[str] = ()) -> None:
+    """
+    Raise ``ValueError`` unless jobs may call back ``url``: its host must be
+    one of ``hosts`` or, without any, not a non-global IP address.
+    """
+    host = (urlsplit(url).hostname or "").lower()
+    if hosts:
+        if host not in hosts:
+            raise ValueError(f"Callback host {host!r} is not allowed.")
+        return
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return  # a name, checked once resolved
+    if not address.is_global:
+        raise ValueError(f"Callback address {host} is not public.")
+
+
+class JobStore:
+    """
+    Jobs in a SQLite database shared by every process using the same file.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "callback_url TEXT, result TEXT, error TEXT, output TEXT NOT NULL, "
+            "worker TEXT)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created_at)"
+        )
+        self._lock = threading.Lock()
+        self._worker: tuple[int, str] | None = None  # (pid, token)
+
+    @property
+    def worker(self) -> str:
+        """
+        Token of this process, recorded with the jobs it runs.
+        """
+        pid = os.getpid()
+        if self._worker is None or self._worker[0] != pid:  # built before a fork
+            self._worker = (pid, worker_token(pid))
+        return self._worker[1]
+
+    @staticmethod
+    def _job(row: tuple) -> Job:
+        job_id, status, priority, created, started, finished, url, result, error = row
+        return Job(
+            id=job_id,
+            status=status,
+            priority=priority,
+            created_at=created,
+            started_at=started,
+            finished_at=finished,
+            callback_url=url,
+            result=(
+                None
+                if result is None
+                else HallucinationEvaluation.model_validate_json(result)
+            ),
+            error=error,
+        )
+
+    def add(
+        self, output: LLMOutput, priority: int = 0, callback_url: str | None = None
+    ) -> Job:
+        """
+        Queue a detection and return its job.
+        """
+        job = Job(
+            id=uuid.uuid4().hex,
+            status="queued",
+            priority=priority,
+            created_at=time.time(),
+            callback_url=callback_url,
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, priority, created_at, callback_url, "
+                "output) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    job.id,
+                    job.status,
+                    priority,
+                    job.created_at,
+                    callback_url,
+                    output.model_dump_json(),
+                ),
+            )
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        """
+        Return a job, or None when it does not exist (or has expired).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return None if row is None else self._job(row)
+
+    def claim(self) -> tuple[Job, LLMOutput] | None:
+        """
+        Mark the next queued job as running in this process and return it
+        with its output, or None when the queue is empty.
+        """
+        worker = self.worker
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, output FROM jobs WHERE status = 'queued' "
+                    "ORDER BY priority, created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ?, "
+                        "worker = ? WHERE id = ?",
+                        (time.time(), worker, row[0]),
+                    )
+                    job = self._job(
+                        self._conn.execute(
+                            f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (row[0],)
+                        ).fetchone()
+                    )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        if row is None:
+            return None
+        return job, LLMOutput.model_validate_json(row[1])
+
+    def finish(
+        self,
+        job_id: str,
+        result: HallucinationEvaluation | None,
+        error: str | None = None,
+    ) -> Job | None:
+        """
+        Store the outcome of a running job: ``failed`` with an error,
+        ``succeeded`` otherwise. Returns None when the job is no longer
+        running, e.g. because it was cancelled meanwhile.
+        """
+        status = "succeeded" if error is None else "failed"
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? "
+                "WHERE id = ? AND status = 'running'",
+                (
+                    status,
+                    time.time(),
+                    None if result is None else result.model_dump_json(),
+                    error,
+                    job_id,
+                ),
+            )
+        return self.get(job_id) if cursor.rowcount else None
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job, returning whether it was one.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? "
+                "WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id),
+            )
+            return cursor.rowcount > 0
+
+    def requeue(self, job_id: str) -> None:
+        """
+        Put a running job back in the queue, e.g. when its worker stops.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, worker = NULL "
+                "WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+
+    def recover(self) -> int:
+        """
+        Queue again the running jobs of processes that no longer exist, and
+        return how many were.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, worker FROM jobs WHERE status = 'running'"
+            ).fetchall()
+        orphans = [job_id for job_id, worker in rows if not _alive(worker)]
+        for job_id in orphans:
+            self.requeue(job_id)
+        return len(orphans)
+
+    def purge(self, before: float) -> int:
+        """
+        Delete jobs that finished before ``before`` (epoch seconds) and
+        return how many were removed.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at < ?", (before,)
+            )
+            return cursor.rowcount
+
+    def depth(self) -> int:
+        """
+        Number of queued jobs.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+            ).fetchone()[0]
+
+    def stats(self) -> JobQueueStats:
+        """
+        Jobs per status and queueing delay.
+        """
+        with self._lock:
+            counts = dict(
+                self._conn.execute(
+                    "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+                ).fetchall()
+            )
+            oldest, mean_wait = self._conn.execute(
+                "SELECT (SELECT MIN(created_at) FROM jobs WHERE status = 'queued'), "
+                "(SELECT AVG(started_at - created_at) FROM jobs "
+                "WHERE started_at IS NOT NULL)"
+            ).fetchone()
+        return JobQueueStats(
+            enabled=True,
+            **{status: counts.get(status, 0) for status in STATUSES},
+            oldest_queued_seconds=0.0 if oldest is None else time.time() - oldest,
+            mean_wait_seconds=mean_wait or 0.0,
+        )
+
+
+class JobQueue:
+    """
+    Runs the jobs of a store on a bounded pool of worker tasks.
+
+    ``start`` spawns the workers on the running event loop and ``stop``
+    cancels them, putting the jobs they were running back in the queue.
+    Jobs run in a fresh context, each as a trace of its own (``job``).
+    Store calls run in worker threads, so a process holding the database
+    does not stall the event loop.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        concurrency: int = 4,
+        poll_interval: float = 0.5,
+        timeout: float | None = None,
+        retention: float = 86400.0,
+        callback_timeout: float = 10.0,
+        callback_hosts: Collection[str] = (),
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        self.store = store
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.retention = retention
+        self.callback_timeout = callback_timeout
+        self.callback_hosts = frozenset(host.lower() for host in callback_hosts)
+        self._workers: list[asyncio.Task] = []
+        self._running: dict[str, asyncio.Task] = {}  # job id -> its evaluation
+        self._callbacks: set[asyncio.Task] = set()
+        self._wake: asyncio.Event | None = None
+        self._purged = 0.0
+
+    def start(self) -> None:
+        """
+        Start the workers on the running event loop.
+        """
+        if self._workers:
+            return
+        recovered = self.store.recover()
+        if recovered:
+            logger.info("Requeued %d jobs of stopped workers.", recovered)
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._workers = [
+            loop.create_task(self._work(), context=contextvars.Context())
+            for _ in range(self.concurrency)
+        ]
+
+    async def stop(self) -> None:
+        """
+        Stop the workers; jobs they were running are queued again.
+        """
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, *self._callbacks, return_exceptions=True)
+
+    async def submit(
+        self, output: LLMOutput, priority: int = 0, callback_url: str | None = None
+    ) -> Job:
+        """
+        Queue a detection and return its job. Raises ``ValueError`` for a
+        ``callback_url`` that may not be called back.
+        """
+        if callback_url is not None:
+            check_callback_url(callback_url, self.callback_hosts)
+        job = await asyncio.to_thread(self.store.add, output, priority, callback_url)
+        record_job("submitted")
+        await asyncio.to_thread(set_job_queue_depth, self.store.depth)
+        if self._wake is not None:
+            self._wake.set()
+        return job
+
+    async def get(self, job_id: str) -> Job | None:
+        """
+        Return a job, or None when it does not exist.
+        """
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def cancel(self, job_id: str) -> Job | None:
+        """
+        Cancel a job that has not finished, and return it as it now is, or
+        None when it does not exist. Finished jobs are returned unchanged.
+        """
+        if await asyncio.to_thread(self.store.cancel, job_id):
+            task = self._running.get(job_id)
+            if task is not None:
+                task.cancel()
+            record_job("cancelled")
+            await asyncio.to_thread(set_job_queue_depth, self.store.depth)
+        return await self.get(job_id)
+
+    async def stats(self) -> JobQueueStats:
+        """
+        Jobs per status and queueing delay, across every worker process.
+        """
+        stats = await asyncio.to_thread(self.store.stats)
+        return stats.model_copy(update={"workers": len(self._workers)})
+
+    async def _work(self) -> None:
+        assert self._wake is not None
+        while True:
+            self._wake.clear()
+            claimed = await asyncio.to_thread(self.store.claim)
+            if claimed is None:
+                await self._purge()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job, output = claimed
+            await asyncio.to_thread(set_job_queue_depth, self.store.depth)
+            if job.started_at is not None:
+                observe_job_wait(job.started_at - job.created_at)
+            await self._run(job, output)
+
+    async def _run(self, job: Job, output: LLMOutput) -> None:
+        task = asyncio.ensure_future(self._evaluate(job, output))
+        self._running[job.id] = task
+        try:
+            result = await task
+            finished = await asyncio.to_thread(
+                self.store.finish, job.id, result, result.error
+            )
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():  # type: ignore[union-attr]
+                # the worker is stopping
+                await asyncio.to_thread(self.store.requeue, job.id)
+                raise
+            return  # the job was cancelled
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            finished = await asyncio.to_thread(self.store.finish, job.id, None, error)
+        finally:
+            del self._running[job.id]
+        if finished is None:
+            return  # cancelled by another process while it ran
+        record_job(finished.status)
+        if finished.callback_url is not None:
+            callback = asyncio.ensure_future(self._notify(finished))
+            self._callbacks.add(callback)
+            callback.add_done_callback(self._callbacks.discard)
+
+    async def _evaluate(self, job: Job, output: LLMOutput) -> HallucinationEvaluation:
+        with span("job", id=job.id, priority=job.priority):
+            with deadline(self.timeout), request_priority("bulk"):
+                return await async_detect_hallucination(output)
+
+    async def _notify(self, job: Job) -> None:
+        """
+        POST a finished job to its callback URL; failures are only logged.
+        """
+        import httpx
+
+        assert job.callback_url is not None
+        url = httpx.URL(job.callback_url)
+        headers = {"content-type": "application/json"}
+        extensions: dict[str, str] = {}
+        try:
+            if not self.callback_hosts:
+                address = await self._resolve(job.callback_url)
+                if address != url.host:  # connect to the address just checked
+                    headers["host"] = url.netloc.decode("ascii")
+                    extensions["sni_hostname"] = url.host
+                    url = url.copy_with(host=address)
+            async with httpx.AsyncClient(timeout=self.callback_timeout) as client:
+                response = await client.post(
+                    url,
+                    content=job.model_dump_json(),
+                    headers=headers,
+                    extensions=extensions,
+                )
+                response.raise_for_status()
+        except (httpx.HTTPError, OSError, ValueError) as e:
+            logger.warning(f"Callback of job {job.id} failed: {str(e)}.")
+
+    @staticmethod
+    async def _resolve(url: str) -> str:
+        """
+        Resolve the host of a callback URL and return the address to call
+        back, raising ``ValueError`` when any of its addresses is not global.
+        The callback connects to that address rather than resolving the
+        name again, which a rebinding DNS server could answer differently.
+        """
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, port)
+        addresses = [str(info[4][0]).split("%")[0] for info in infos]  # no scope
+        for address in addresses:
+            if not ipaddress.ip_address(address).is_global:
+                raise ValueError(f"Callback host {parts.hostname} is not public.")
+        if not addresses:
+            raise ValueError(f"Callback host {parts.hostname} did not resolve.")
+        return addresses[0]
+
+    async def _purge(self) -> None:
+        now = time.monotonic()
+        if now - self._purged >= PURGE_INTERVAL:
+            self._purged = now
+            await asyncio.to_thread(self.store.purge, time.time() - self.retention)
+
+
+_UNSET = object()
+_job_queue: "JobQueue | None | object" = _UNSET
+
+
+def build_job_queue() -> JobQueue | None:
+    """
+    Build the job queue described by the ``jobs`` config section.
+    """
+    if not get_setting("jobs.enabled", False):
+        return None
+    timeout = get_setting("jobs.timeout")
+    return JobQueue(
+        JobStore(get_setting("jobs.path", ".nicotine/jobs.db")),
+        concurrency=int(get_setting("jobs.concurrency", 4)),
+        poll_interval=float(get_setting("jobs.poll_interval", 0.5)),
+        timeout=None if timeout is None else float(timeout),
+        retention=float(get_setting("jobs.retention", 86400)),
+        callback_timeout=float(get_setting("jobs.callback_timeout", 10)),
+        callback_hosts=get_setting("jobs.callback_hosts", []) or (),
+    )
+
+
+def get_job_queue() -> JobQueue | None:
+    """
+    Get the process-wide job queue, or None when jobs are disabled.
+    """
+    global _job_queue
+    if _job_queue is _UNSET:
+        _job_queue = build_job_queue()
+    return _job_queue  # type: ignore[return-value]
+
+
+def configure_job_queue(queue: JobQueue | None) -> None:
+    """
+    Replace the process-wide job queue (None disables jobs).
+    """
+    global _job_queue
+    _job_queue = queue
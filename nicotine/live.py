@@ -0,0 +1,374 @@
+"""
+Live evaluation of generations that are still streaming.
+
+A ``GenerationStream`` receives the token deltas of one ``LLMOutput`` as
+they are produced. Every completed sentence is added to the current segment;
+once the segment holds ``min_chars`` (by default as soon as it holds a
+sentence) it is evaluated right away, with the last ``context_sentences``
+before it as context, while generation continues. Each verdict is published
+as a ``PartialEvaluation`` carrying the segment's own verdict and the
+verdict merged over everything evaluated so far, so the first verdict
+arrives after the first sentence instead of after the whole generation.
+``close`` evaluates the unfinished tail and publishes the final verdict.
+
+``LiveSession`` multiplexes the streams of one connection by output id, for
+the WebSocket and server-sent events endpoints.
+
+Updates wait in queues of at most ``max_pending`` items, and evaluations
+publishing to a full queue wait for the consumer. Readers call ``drain``
+after each message so that a connection with ``max_pending`` evaluations
+outstanding stops reading until they are delivered.
+"""
+
+from contextlib import suppress
+from typing import AsyncIterator, Awaitable, Callable
+import asyncio
+import re
+
+from pydantic import BaseModel
+
+from .chunking import ChunkVerdict, merge_verdicts
+from .models import HallucinationEvaluation, LLMOutput, LLMSettings
+
+# Sentence ends: terminal punctuation followed by whitespace. A period at
+# the very end of the text is not final yet ("3." may become "3.14").
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+class GenerationDelta(BaseModel):
+    """
+    One message of a live generation: the next text of output ``id``.
+
+    The first message for an id opens its stream and must carry the
+    ``prompt``; ``done`` closes it.
+    """
+
+    id: str
+    delta: str = ""
+    done: bool = False
+    prompt: str | None = None
+    settings: LLMSettings | None = None
+
+
+class PartialEvaluation(BaseModel):
+    """
+    Verdict update for a generation in progress.
+    """
+
+    id: str
+    segment: ChunkVerdict | None = None  # the segment just evaluated
+    evaluation: HallucinationEvaluation  # merged over every evaluated segment
+    evaluated_chars: int  # prefix of the generation covered by ``evaluation``
+    final: bool = False
+
+
+class _Updates:
+    """
+    Bounded queue of updates, ended by ``end``.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self._queue: asyncio.Queue[PartialEvaluation | None] = asyncio.Queue(maxsize)
+        self._ended = False
+
+    async def put(self, update: PartialEvaluation) -> None:
+        await self._queue.put(update)
+
+    def end(self) -> None:
+        self._ended = True
+        with suppress(asyncio.QueueFull):  # read until empty instead
+            self._queue.put_nowait(None)
+
+    async def __aiter__(self) -> AsyncIterator[PartialEvaluation]:
+        while not (self._ended and self._queue.empty()):
+            update = await self._queue.get()
+            if update is None:
+                return
+            yield update
+
+
+async def _drain(tasks: list[asyncio.Task], limit: int) -> None:
+    """
+    Wait until fewer than ``limit`` of ``tasks`` are still running.
+    """
+    while len(pending := [t for t in tasks if not t.done()]) >= max(limit, 1):
+        await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+
+class GenerationStream:
+    """
+    Incremental evaluation of one generation.
+
+    ``feed`` and ``close`` must be called from a running event loop;
+    updates are delivered to ``listener``, or through ``updates`` by
+    default.
+    """
+
+    def __init__(
+        self,
+        id: str,
+        prompt: str,
+        settings: LLMSettings | None = None,
+        min_chars: int = 0,
+        context_sentences: int = 1,
+        concurrency: int = 4,
+        evaluate: (
+            Callable[[LLMOutput], Awaitable[HallucinationEvaluation]] | None
+        ) = None,
+        listener: Callable[[PartialEvaluation], Awaitable[None]] | None = None,
+        max_pending: int = 64,
+    ):
+        self.id = id
+        self.prompt = prompt
+        self.settings = settings or LLMSettings()
+        self.min_chars = min_chars
+        self.context_sentences = context_sentences
+        self.evaluate = evaluate
+        self.max_pending = max_pending
+        self.sentences: list[tuple[int, int]] = []
+        self.verdicts: list[ChunkVerdict] = []
+        self.closed = False
+        self._parts: list[str] = []  # generated text, joined when read
+        self._tail = ""  # the unfinished sentence
+        self._cursor = 0  # start of the unfinished sentence
+        self._segment = 0  # index in ``sentences`` of the open segment
+        self._segments = 0  # segments dispatched so far
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._updates = _Updates(max_pending)
+        self._listener = listener or self._updates.put
+        self._own_queue = listener is None
+
+    @property
+    def text(self) -> str:
+        """
+        The generation so far.
+        """
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def feed(self, delta: str) -> None:
+        """
+        Append generated text, evaluating any segment it completes.
+        """
+        if self.closed:
+            raise ValueError(f"Generation {self.id} is already closed.")
+        self._parts.append(delta)
+        tail = self._tail + delta
+        start = 0
+        for boundary in _SENTENCE_END.finditer(tail):
+            end = boundary.start()
+            self._add_sentence(self._cursor + start, tail[start:end])
+            start = boundary.end()
+        self._cursor += start
+        self._tail = tail[start:]
+        if self._segment < len(self.sentences):
+            start = self.sentences[self._segment][0]
+            if self.sentences[-1][1] - start >= self.min_chars:
+                self._dispatch()
+
+    def close(self) -> None:
+        """
+        Evaluate the rest of the generation and publish the final verdict.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._add_sentence(self._cursor, self._tail)
+        self._cursor += len(self._tail)
+        self._tail = ""
+        if self._segment < len(self.sentences):
+            self._dispatch()
+        tasks = list(self._tasks)
+        task = asyncio.get_running_loop().create_task(self._finish(tasks))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def cancel(self) -> None:
+        """
+        Abandon the generation and its evaluations in flight.
+        """
+        self.closed = True
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def drain(self) -> None:
+        """
+        Wait until fewer than ``max_pending`` evaluations are outstanding.
+        """
+        await _drain(list(self._tasks), self.max_pending)
+
+    async def updates(self) -> AsyncIterator[PartialEvaluation]:
+        """
+        Updates as segments are evaluated, ending with the final one.
+        """
+        async for update in self._updates:
+            yield update
+
+    def _add_sentence(self, start: int, sentence: str) -> None:
+        stripped = sentence.lstrip()
+        start += len(sentence) - len(stripped)
+        stripped = stripped.rstrip()
+        if stripped:
+            self.sentences.append((start, start + len(stripped)))
+
+    def _dispatch(self) -> None:
+        """
+        Evaluate the open segment: every sentence completed since the last.
+        """
+        first = self._segment
+        start, end = self.sentences[first][0], self.sentences[-1][1]
+        context = max(0, first - self.context_sentences)
+        window_start = min(start, self.sentences[context][0])
+        window = self.text[window_start:end]
+        index = self._segments
+        self._segment = len(self.sentences)
+        self._segments += 1
+        task = asyncio.get_running_loop().create_task(
+            self._evaluate(index, start, end, window)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _evaluate(self, index: int, start: int, end: int, window: str) -> None:
+        output = LLMOutput(
+            id=f"{self.id}#{index}",
+            prompt=self.prompt,
+            output=window,
+            settings=self.settings,
+        )
+        evaluate = self.evaluate
+        if evaluate is None:
+            from .system import async_detect_hallucination
+
+            evaluate = async_detect_hallucination
+        async with self._semaphore:
+            try:
+                evaluation = await evaluate(output)
+            except Exception as e:
+                evaluation = HallucinationEvaluation(
+                    is_hallucination=False,
+                    rationale="Error detecting hallucinations",
+                    delusion_percentage=0.0,
+                    error=str(e),
+                )
+        segment = ChunkVerdict(index=index, start=start, end=end, evaluation=evaluation)
+        self.verdicts.append(segment)
+        await self._listener(self._update(segment))
+
+    def _update(self, segment: ChunkVerdict | None) -> PartialEvaluation:
+        verdicts = sorted(self.verdicts, key=lambda v: v.index)
+        # Segments finish out of order; report the evaluated prefix.
+        covered = 0
+        for expected, verdict in enumerate(verdicts):
+            if verdict.index != expected:
+                break
+            covered = verdict.end
+        if verdicts:
+            evaluation = merge_verdicts(verdicts)
+        else:
+            evaluation = HallucinationEvaluation(
+                is_hallucination=False,
+                rationale="Nothing to evaluate.",
+                delusion_percentage=0.0,
+            )
+        return PartialEvaluation(
+            id=self.id,
+            segment=segment,
+            evaluation=evaluation,
+            evaluated_chars=covered,
+            final=segment is None,
+        )
+
+    async def _finish(self, tasks: list[asyncio.Task]) -> None:
+        await asyncio.gather(*tasks)
+        await self._listener(self._update(None))
+        if self._own_queue:
+            self._updates.end()
+
+
+class LiveSession:
+    """
+    Generation streams of one connection, keyed by output id.
+
+    Updates of every stream are interleaved in ``updates``, which ends once
+    the session is closed and every stream has published its final verdict.
+    """
+
+    def __init__(self, max_streams: int = 64, max_pending: int = 64, **options):
+        self.max_streams = max_streams
+        self.max_pending = max_pending
+        self.options = options
+        self.streams: dict[str, GenerationStream] = {}
+        self.closed = False
+        self._updates = _Updates(max_pending)
+
+    def handle(self, message: GenerationDelta) -> None:
+        """
+        Apply one delta message. Raises ``ValueError`` for protocol errors.
+        """
+        if self.closed:
+            raise ValueError("Session is closed.")
+        stream = self.streams.get(message.id)
+        if stream is None:
+            if message.prompt is None:
+                raise ValueError(
+                    f"The first message for generation {message.id} needs a prompt."
+                )
+            open_streams = sum(not s.closed for s in self.streams.values())
+            if open_streams >= self.max_streams:
+                raise ValueError(
+                    f"At most {self.max_streams} generations may be open at once."
+                )
+            stream = self.streams[message.id] = GenerationStream(
+                message.id,
+                message.prompt,
+                message.settings,
+                listener=self._publish,
+                **self.options,
+            )
+        if message.delta:
+            stream.feed(message.delta)
+        if message.done:
+            stream.close()
+
+    def close(self) -> None:
+        """
+        Close every open stream; ``updates`` ends after their final verdicts.
+        """
+        self.closed = True
+        for stream in self.streams.values():
+            stream.close()
+        self._check_done()
+
+    def cancel(self) -> None:
+        """
+        Abandon every stream.
+        """
+        self.closed = True
+        for stream in self.streams.values():
+            stream.cancel()
+        self._updates.end()
+
+    async def drain(self) -> None:
+        """
+        Wait until fewer than ``max_pending`` evaluations are outstanding
+        across the session's streams.
+        """
+        tasks = [task for stream in self.streams.values() for task in stream._tasks]
+        await _drain(tasks, self.max_pending)
+
+    async def updates(self) -> AsyncIterator[PartialEvaluation]:
+        async for update in self._updates:
+            yield update
+
+    async def _publish(self, update: PartialEvaluation) -> None:
+        await self._updates.put(update)
+        if update.final:
+            self.streams.pop(update.id, None)
+            self._check_done()
+
+    def _check_done(self) -> None:
+        if self.closed and not self.streams:
+            self._updates.end()
@@ -0,0 +1,483 @@
+"""
+Prometheus metrics for the detection service.
+
+Collected when ``metrics.enabled`` is set:
+
+- HTTP requests per endpoint: rate, latency, response size; requests in flight
+- Upstream model calls per model: latency, outcomes, retries, in-flight
+- Prompt/completion tokens per model, and prompt tokens served from the
+  provider's prompt cache; prompt tokens per detection prompt template
+- Verdict cache lookups (hit ratio = hits / (hits + misses))
+- Pipeline time per stage
+- Request coalescer queue depth, batch sizes and time spent waiting
+- Background jobs per status, job queue depth and time jobs spent queued
+- Model cascade verdicts per tier and escalation reason
+
+Call sites use the module-level helpers (``track_upstream``,
+``record_usage``, ``record_prompt_usage``, ``record_cache``,
+``observe_stages``, ...), which do nothing while metrics are disabled.
+With several worker processes, point ``PROMETHEUS_MULTIPROC_DIR`` at an
+empty directory before starting them (``nicotine.serving`` does); every
+worker then writes its samples there and ``/metrics`` reports the
+aggregate whichever worker answers.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+import os
+import time
+
+from .config import get_setting
+
+# Upstream model calls range from sub-second to tens of seconds.
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+# Coalescing windows are a few milliseconds.
+WAIT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+# Attempts made by the upstream call running in the current task. The call
+# policy bumps it once per attempt, retries and hedges included.
+_upstream_attempts: ContextVar[list[int] | None] = ContextVar(
+    "_upstream_attempts", default=None
+)
+
+
+def multiprocess_enabled() -> bool:
+    """
+    Whether samples are shared between worker processes.
+    """
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+class Metrics:
+    """
+    Collectors for one process, registered on their own registry.
+    """
+
+    def __init__(self, include_response_metrics: bool = True):
+        # prometheus_client is optional and only imported once metrics are on.
+        try:
+            from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+        except ImportError:
+            raise ImportError("Metrics require prometheus_client.")
+        self.registry = CollectorRegistry()
+        self.include_response_metrics = include_response_metrics
+        registry = self.registry
+        self.requests = Counter(
+            "nicotine_http_requests",
+            "HTTP requests handled.",
+            ["method", "endpoint", "status"],
+            registry=registry,
+        )
+        self.request_latency = Histogram(
+            "nicotine_http_request_duration_seconds",
+            "HTTP request latency.",
+            ["method", "endpoint"],
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        self.requests_in_flight = Gauge(
+            "nicotine_http_requests_in_flight",
+            "HTTP requests being handled.",
+            multiprocess_mode="livesum",
+            registry=registry,
+        )
+        self.response_size = Histogram(
+            "nicotine_http_response_size_bytes",
+            "HTTP response body size.",
+            ["endpoint"],
+            buckets=SIZE_BUCKETS,
+            registry=registry,
+        )
+        self.upstream_calls = Counter(
+            "nicotine_upstream_calls",
+            "Upstream model calls by outcome (ok or the exception type).",
+            ["model", "outcome"],
+            registry=registry,
+        )
+        self.upstream_latency = Histogram(
+            "nicotine_upstream_call_duration_seconds",
+            "Upstream model call latency, retries included.",
+            ["model"],
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        self.upstream_retries = Counter(
+            "nicotine_upstream_retries",
+            "Upstream attempts beyond the first (retries and hedges).",
+            ["model"],
+            registry=registry,
+        )
+        self.upstream_in_flight = Gauge(
+            "nicotine_upstream_calls_in_flight",
+            "Upstream model calls awaiting a response.",
+            ["model"],
+            multiprocess_mode="livesum",
+            registry=registry,
+        )
+        self.tokens = Counter(
+            "nicotine_tokens",
+            "Tokens reported by the upstream API.",
+            ["model", "kind"],
+            registry=registry,
+        )
+        self.prompt_tokens = Counter(
+            "nicotine_prompt_tokens",
+            "Prompt tokens of detection calls per prompt template (input, cached).",
+            ["template", "kind"],
+            registry=registry,
+        )
+        self.cache_lookups = Counter(
+            "nicotine_cache_lookups",
+            "Verdict cache lookups by result (hit, miss, deduplicated).",
+            ["result"],
+            registry=registry,
+        )
+        self.stage_latency = Histogram(
+            "nicotine_pipeline_stage_duration_seconds",
+            "Time spent in each pipeline stage per run.",
+            ["stage"],
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        self.coalescer_queue_depth = Gauge(
+            "nicotine_coalescer_queue_depth",
+            "Requests waiting for the coalescer to dispatch their batch.",
+            multiprocess_mode="livesum",
+            registry=registry,
+        )
+        self.coalescer_batch_size = Histogram(
+            "nicotine_coalescer_batch_size",
+            "Requests per batch dispatched by the coalescer.",
+            buckets=BATCH_SIZE_BUCKETS,
+            registry=registry,
+        )
+        self.coalescer_wait = Histogram(
+            "nicotine_coalescer_wait_seconds",
+            "Time requests spent waiting for their batch to be dispatched.",
+            buckets=WAIT_BUCKETS,
+            registry=registry,
+        )
+        self.jobs = Counter(
+            "nicotine_jobs",
+            "Background jobs by status (submitted, succeeded, failed, cancelled).",
+            ["status"],
+            registry=registry,
+        )
+        self.job_queue_depth = Gauge(
+            "nicotine_job_queue_depth",
+            "Background jobs waiting for a worker, across every worker process.",
+            multiprocess_mode="mostrecent",
+            registry=registry,
+        )
+        self.job_wait = Histogram(
+            "nicotine_job_wait_seconds",
+            "Time background jobs spent queued before a worker started them.",
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        self.cascade_verdicts = Counter(
+            "nicotine_cascade_verdicts",
+            "Model cascade verdicts by tier (cheap, strong) and escalation reason.",
+            ["tier", "reason"],
+            registry=registry,
+        )
+
+    @contextmanager
+    def upstream(self, model: str) -> Iterator[None]:
+        """
+        Time an upstream call and record its outcome and retries.
+        """
+        attempts = [0]
+        token = _upstream_attempts.set(attempts)
+        in_flight = self.upstream_in_flight.labels(model)
+        in_flight.inc()
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except BaseException as e:
+            outcome = type(e).__name__
+            raise
+        finally:
+            self.upstream_latency.labels(model).observe(time.perf_counter() - start)
+            in_flight.dec()
+            self.upstream_calls.labels(model, outcome).inc()
+            if attempts[0] > 1:
+                self.upstream_retries.labels(model).inc(attempts[0] - 1)
+            _upstream_attempts.reset(token)
+
+    def render(self) -> tuple[bytes, str]:
+        """
+        Exposition text and its content type, aggregated across workers in
+        multiprocess mode.
+        """
+        from prometheus_client import (
+            CONTENT_TYPE_LATEST,
+            CollectorRegistry,
+            generate_latest,
+            multiprocess,
+        )
+
+        if multiprocess_enabled():
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            return generate_latest(registry), CONTENT_TYPE_LATEST
+        return generate_latest(self.registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-endpoint request metrics.
+
+    Endpoints are labelled with their route template (``/items/{id}``), so
+    label cardinality stays bounded.
+    """
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metrics = self.metrics
+        status = 500
+        size = 0
+
+        async def send_wrapper(message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        metrics.requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.requests_in_flight.dec()
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            metrics.requests.labels(method, endpoint, str(status)).inc()
+            metrics.request_latency.labels(method, endpoint).observe(elapsed)
+            if metrics.include_response_metrics:
+                metrics.response_size.labels(endpoint).observe(size)
+
+
+def instrument_app(
+    app,
+    metrics: Metrics,
+    endpoint: str = "/metrics",
+    include_request_metrics: bool = True,
+) -> None:
+    """
+    Add the exposition endpoint and, optionally, the request middleware.
+    """
+    from fastapi import Response
+
+    async def metrics_endpoint() -> Response:
+        body, content_type = metrics.render()
+        return Response(content=body, media_type=content_type)
+
+    if include_request_metrics:
+        app.add_middleware(MetricsMiddleware, metrics=metrics)
+    app.add_api_route(endpoint, metrics_endpoint, include_in_schema=False)
+
+
+def mark_worker_exited() -> None:
+    """
+    Drop this process's live gauges from the multiprocess aggregate.
+    """
+    if multiprocess_enabled() and get_metrics() is not None:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def count_attempt() -> None:
+    """
+    Count one attempt of the upstream call running in the current context.
+    """
+    attempts = _upstream_attempts.get()
+    if attempts is not None:
+        attempts[0] += 1
+
+
+_UNSET = object()
+_metrics: "Metrics | None | object" = _UNSET
+
+
+def build_metrics() -> Metrics | None:
+    """
+    Build the collectors described by the ``metrics`` config section.
+    """
+    if not get_setting("metrics.enabled", False):
+        return None
+    return Metrics(
+        include_response_metrics=bool(
+            get_setting("metrics.include_response_metrics", True)
+        )
+    )
+
+
+def get_metrics() -> Metrics | None:
+    """
+    Get the process-wide metrics, or None when metrics are disabled.
+    """
+    global _metrics
+    if _metrics is _UNSET:
+        _metrics = build_metrics()
+    return _metrics  # type: ignore[return-value]
+
+
+def configure_metrics(metrics: Metrics | None) -> None:
+    """
+    Replace the process-wide metrics (None disables them).
+    """
+    global _metrics
+    _metrics = metrics
+
+
+@contextmanager
+def track_upstream(model: str) -> Iterator[None]:
+    """
+    Record latency, outcome and retries of an upstream call, when enabled.
+    """
+    metrics = get_metrics()
+    if metrics is None:
+        yield
+        return
+    with metrics.upstream(model):
+        yield
+
+
+def record_usage(model: str, response: Any) -> None:
+    """
+    Count the prompt, completion and cached prompt tokens reported for a
+    response.
+    """
+    metrics = get_metrics()
+    usage = getattr(response, "usage", None)
+    if metrics is None or usage is None:
+        return
+    prompt = getattr(usage, "input_tokens", None) or 0
+    completion = getattr(usage, "output_tokens", None) or 0
+    if isinstance(prompt, int) and prompt:
+        metrics.tokens.labels(model, "prompt").inc(prompt)
+    if isinstance(completion, int) and completion:
+        metrics.tokens.labels(model, "completion").inc(completion)
+    cached = cached_tokens(usage)
+    if cached:
+        metrics.tokens.labels(model, "cached").inc(cached)
+
+
+def cached_tokens(usage: Any) -> int:
+    """
+    Prompt tokens of a response's usage served from the prompt cache.
+    """
+    details = getattr(usage, "input_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    return cached if isinstance(cached, int) else 0
+
+
+def record_prompt_usage(template: str, response: Any) -> None:
+    """
+    Count the prompt tokens, and how many were cached, of a detection call
+    made with a prompt template.
+    """
+    metrics = get_metrics()
+    usage = getattr(response, "usage", None)
+    if metrics is None or usage is None:
+        return
+    prompt = getattr(usage, "input_tokens", None) or 0
+    if isinstance(prompt, int) and prompt:
+        metrics.prompt_tokens.labels(template, "input").inc(prompt)
+    cached = cached_tokens(usage)
+    if cached:
+        metrics.prompt_tokens.labels(template, "cached").inc(cached)
+
+
+def record_cache(result: str) -> None:
+    """
+    Count a verdict cache lookup (``hit``, ``miss`` or ``deduplicated``).
+    """
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.cache_lookups.labels(result).inc()
+
+
+def observe_stages(timings: dict[str, Any]) -> None:
+    """
+    Record the per-run time of each pipeline stage.
+    """
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    for stage, timing in timings.items():
+        metrics.stage_latency.labels(stage).observe(timing.seconds)
+
+
+def track_coalescer_queue(delta: int) -> None:
+    """
+    Adjust the number of requests waiting in the coalescer.
+    """
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.coalescer_queue_depth.inc(delta)
+
+
+def observe_coalesced_batch(size: int, waits: list[float]) -> None:
+    """
+    Record a dispatched batch and how long each of its requests waited.
+    """
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    metrics.coalescer_batch_size.observe(size)
+    for wait in waits:
+        metrics.coalescer_wait.observe(wait)
+
+
+def record_job(status: str) -> None:
+    """
+    Count a background job submitted or finished with ``status``.
+    """
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.jobs.labels(status).inc()
+
+
+def set_job_queue_depth(depth: Callable[[], int]) -> None:
+    """
+    Record the number of queued jobs, counted only while metrics are on.
+    """
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.job_queue_depth.set(depth())
+
+
+def observe_job_wait(seconds: float) -> None:
+    """
+    Record how long a job waited before a worker started it.
+    """
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.job_wait.observe(seconds)
+
+
+def record_cascade(tier: str, reason: str | None = None) -> None:
+    """
+    Count a model cascade verdict returned by ``tier``, escalated for
+    ``reason``.
+    """
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.cascade_verdicts.labels(tier, reason or "none").inc()
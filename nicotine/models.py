@@ -0,0 +1,95 @@
+from contextvars import ContextVar
+from typing import Any
+import copy
+
+from pydantic import BaseModel, field_validator
+
+# JSON schemas of structured-output models, by model and generation options.
+_schemas: dict[tuple, dict[str, Any]] = {}
+
+
+class StructuredOutput(BaseModel):
+    """
+    Model requested as structured output, with its JSON schema generated once.
+
+    The OpenAI SDK derives the schema it sends from ``model_json_schema`` on
+    every call; generating it dominates the client-side cost of a request.
+    The schema is kept after the first call and a copy is returned, since
+    the SDK rewrites it in place.
+    """
+
+    @classmethod
+    def model_json_schema(cls, *args: Any, **kwargs: Any) -> dict[str, Any]:
+        key = (cls, args, tuple(sorted(kwargs.items())))
+        schema = _schemas.get(key)
+        if schema is None:
+            schema = _schemas[key] = super().model_json_schema(*args, **kwargs)
+        return copy.deepcopy(schema)
+
+
+# Backends that settings validated in the current context may name; None
+# allows any. Set for API requests by ``nicotine.providers``.
+allowed_providers: ContextVar[frozenset[str] | None] = ContextVar(
+    "allowed_providers", default=None
+)
+
+
+class LLMSettings(BaseModel):
+    """
+    Settings for an LLM.
+    """
+
+    model: str = "gpt-4.1"
+    temperature: float = 0.7
+    max_tokens: int = 1000
+    provider: str | None = None  # detector backend; config default when unset
+    prompt_version: str | None = None  # prompt template; config default when unset
+
+    @field_validator("provider")
+    @classmethod
+    def _check_provider(cls, provider: str | None) -> str | None:
+        allowed = allowed_providers.get()
+        if provider is not None and allowed is not None and provider not in allowed:
+            raise ValueError(f"Provider {provider!r} is not available.")
+        return provider
+
+    @field_validator("prompt_version")
+    @classmethod
+    def _check_prompt_version(cls, version: str | None) -> str | None:
+        if version is not None:
+            from .prompts import load_template  # prompts imports this module
+
+            load_template(version)
+        return version
+
+
+class LLMInput(BaseModel):
+    """
+    Input to an LLM.
+    """
+
+    id: str
+    prompt: str
+    settings: LLMSettings
+
+
+class LLMOutput(BaseModel):
+    """
+    Output from an LLM.
+    """
+
+    id: str
+    prompt: str
+    output: str
+    settings: LLMSettings
+
+
+class HallucinationEvaluation(StructuredOutput):
+    """
+    Evaluation of hallucinations in the output.
+    """
+
+    is_hallucination: bool
+    rationale: str
+    delusion_percentage: float
+    error: str | None = None
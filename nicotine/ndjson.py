@@ -0,0 +1,119 @@
+"""
+Bounded-memory NDJSON evaluation streams.
+
+``stream_evaluations`` reads ``LLMOutput`` records line by line from an async
+byte stream and yields a ``StreamedEvaluation`` per record as soon as its
+detection finishes. At most ``concurrency`` records are held at any time,
+in flight or waiting to be consumed, so a slow consumer stops the input
+from being read instead of letting results pile up in memory.
+"""
+
+from typing import AsyncIterable, AsyncIterator
+import asyncio
+
+from pydantic import ValidationError
+
+from .models import HallucinationEvaluation, LLMOutput
+
+# Longest accepted NDJSON line. Guards against a single unterminated record
+# growing the read buffer without bound.
+MAX_LINE_BYTES = 8 * 1024 * 1024
+
+
+class StreamedEvaluation(HallucinationEvaluation):
+    """
+    Evaluation tagged with the id and line number of its input record.
+    """
+
+    id: str | None
+    line: int
+
+
+async def iter_lines(
+    chunks: AsyncIterable[bytes], max_line_bytes: int = MAX_LINE_BYTES
+) -> AsyncIterator[bytes]:
+    """
+    Split an async byte stream into non-empty lines.
+
+    Only the bytes of each new chunk are searched for line ends, so a line
+    arriving in many small chunks is not rescanned or copied for each one.
+    """
+    buffer = bytearray()
+    async for chunk in chunks:
+        scan, start = len(buffer), 0
+        buffer += chunk
+        while (end := buffer.find(b"\n", scan)) != -1:
+            line = bytes(buffer[start:end])
+            if line.strip():
+                yield line
+            start = scan = end + 1
+        del buffer[:start]
+        if len(buffer) > max_line_bytes:
+            raise ValueError(f"NDJSON line exceeds {max_line_bytes} bytes.")
+    if buffer.strip():
+        yield bytes(buffer)
+
+
+async def _evaluate_line(number: int, line: bytes) -> StreamedEvaluation:
+    """
+    Parse one NDJSON record and detect hallucinations in it.
+    """
+    from .system import async_detect_hallucination
+
+    try:
+        output = LLMOutput.model_validate_json(line)
+    except ValidationError as e:
+        return StreamedEvaluation(
+            id=None,
+            line=number,
+            is_hallucination=False,
+            rationale="Invalid LLMOutput record",
+            delusion_percentage=0.0,
+            error=str(e),
+        )
+    evaluation = await async_detect_hallucination(output)
+    return StreamedEvaluation(id=output.id, line=number, **evaluation.model_dump())
+
+
+async def stream_evaluations(
+    chunks: AsyncIterable[bytes], concurrency: int = 16
+) -> AsyncIterator[StreamedEvaluation]:
+    """
+    Evaluate NDJSON ``LLMOutput`` records, yielding results as they finish.
+    """
+    done = object()
+    results: asyncio.Queue = asyncio.Queue()
+    # A slot is held from the moment a line is read until its result has
+    # been taken by the consumer.
+    slots = asyncio.Semaphore(concurrency)
+
+    async def evaluate(number: int, line: bytes) -> None:
+        await results.put(await _evaluate_line(number, line))
+
+    async def produce() -> None:
+        tasks: set[asyncio.Task] = set()
+        try:
+            number = 0
+            async for line in iter_lines(chunks):
+                number += 1
+                await slots.acquire()
+                task = asyncio.create_task(evaluate(number, line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await results.put(done)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await results.get()
+            if item is done:
+                break
+            slots.release()
+            yield item
+        await producer
+    finally:
+        producer.cancel()
@@ -0,0 +1,647 @@
+"""
+Mystic Lake pipeline: staged hallucination detection.
+
+Each stage of the Mystic Lake Protocol is a swappable component with typed
+intermediate results:
+
+1. Evaporation   LLMOutput  -> Vapor        capture the text under scrutiny
+2. Condensation  Vapor      -> Condensate   normalize and split into sentences
+3. Precipitation Condensate -> Claim*       stream out testable claims
+4. Percolation   Claim      -> ClaimVerdict verify each claim
+5. Runoff        verdicts   -> HallucinationEvaluation
+
+Precipitation is an async generator, so verification of early claims starts
+before extraction has finished. Verification fans out under a per-model
+concurrency limit shared by every caller in the process, and stops early
+once an early-termination policy decides the verdict. Every stage is timed
+individually.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, Protocol
+import asyncio
+import re
+import threading
+import time
+
+from pydantic import BaseModel
+
+from .config import get_setting
+from .metrics import observe_stages
+from .models import HallucinationEvaluation, LLMOutput
+from .resilience import acall_upstream
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+class Vapor(BaseModel):
+    """
+    Output captured for scrutiny.
+    """
+
+    output: LLMOutput
+    text: str
+
+
+class Condensate(BaseModel):
+    """
+    Normalized output split into sentences.
+    """
+
+    output: LLMOutput
+    sentences: list[str]
+
+
+class Claim(BaseModel):
+    """
+    A single testable claim extracted from an output.
+    """
+
+    index: int
+    text: str
+
+
+class ClaimVerdict(BaseModel):
+    """
+    Verification result for one claim.
+    """
+
+    claim: Claim
+    supported: bool
+    confidence: float
+    rationale: str
+    source: str
+    error: str | None = None
+    skipped: bool = False
+
+
+class StageTiming(BaseModel):
+    """
+    Time spent inside one stage during a pipeline run.
+
+    Percolation calls overlap, so its ``seconds`` is the sum of per-claim
+    latencies rather than wall time.
+    """
+
+    calls: int = 0
+    seconds: float = 0.0
+
+
+class PipelineResult(BaseModel):
+    """
+    Final evaluation plus the intermediate results that produced it.
+    """
+
+    evaluation: HallucinationEvaluation
+    verdicts: list[ClaimVerdict]
+    timings: dict[str, StageTiming]
+    wall_seconds: float
+    stopped_early: bool = False
+
+
+class EvaporationStage(Protocol):
+    name: str
+
+    async def collect(self, output: LLMOutput) -> Vapor:
+        """Capture the text to scrutinize."""
+
+
+class CondensationStage(Protocol):
+    name: str
+
+    async def condense(self, vapor: Vapor) -> Condensate:
+        """Normalize the text into sentences."""
+
+
+class PrecipitationStage(Protocol):
+    name: str
+
+    def extract(self, condensate: Condensate) -> AsyncIterator[Claim]:
+        """Stream testable claims."""
+
+
+class PercolationStage(Protocol):
+    name: str
+
+    async def verify(self, claim: Claim, condensate: Condensate) -> ClaimVerdict:
+        """Verify one claim."""
+
+
+class RunoffStage(Protocol):
+    name: str
+
+    async def synthesize(
+        self, output: LLMOutput, verdicts: list[ClaimVerdict]
+    ) -> HallucinationEvaluation:
+        """Aggregate claim verdicts into an evaluation."""
+
+
+class Evaporation:
+    """
+    Capture the raw output text.
+    """
+
+    name = "evaporation"
+
+    async def collect(self, output: LLMOutput) -> Vapor:
+        return Vapor(output=output, text=output.output.strip())
+
+
+class Condensation:
+    """
+    Collapse whitespace and split the text on sentence boundaries.
+    """
+
+    name = "condensation"
+
+    async def condense(self, vapor: Vapor) -> Condensate:
+        text = " ".join(vapor.text.split())
+        sentences = [s for s in _SENTENCE_BOUNDARY.split(text) if s]
+        return Condensate(output=vapor.output, sentences=sentences)
+
+
+class SentencePrecipitation:
+    """
+    Treat every declarative sentence as a claim. Local and free.
+    """
+
+    name = "precipitation"
+
+    async def extract(self, condensate: Condensate) -> AsyncIterator[Claim]:
+        index = 0
+        for sentence in condensate.sentences:
+            if sentence.endswith("?"):
+                continue
+            yield Claim(index=index, text=sentence)
+            index += 1
+
+
+class ExtractedClaims(BaseModel):
+    """
+    Claims extracted by the model from a window of sentences.
+    """
+
+    claims: list[str]
+
+
+class LLMPrecipitation:
+    """
+    Extract atomic claims with the model, one window of sentences at a time,
+    so claims from the first window stream out while later ones are pending.
+    """
+
+    name = "precipitation"
+
+    def __init__(self, model: str | None = None, window: int = 5):
+        self.model = model
+        self.window = window
+
+    async def extract(self, condensate: Condensate) -> AsyncIterator[Claim]:
+        settings = condensate.output.settings
+        index = 0
+        for start in range(0, len(condensate.sentences), self.window):
+            end = start + self.window
+            passage = " ".join(condensate.sentences[start:end])
+            model = self.model or settings.model
+            response = await acall_upstream(
+                settings.provider,
+                input=f"""
+    Split the passage into short, self-contained factual claims.
+    Skip opinions, questions and filler.
+
+    Passage: {passage}
+    """,
+                model=model,
+                temperature=0.0,
+                max_output_tokens=settings.max_tokens,
+                text_format=ExtractedClaims,
+            )
+            if response.output_parsed is None:
+                continue
+            for text in response.output_parsed.claims:
+                yield Claim(index=index, text=text)
+                index += 1
+
+
+class ClaimCheck(BaseModel):
+    """
+    Model verdict for a single claim.
+    """
+
+    supported: bool
+    confidence: float
+    rationale: str
+
+
+class LLMPercolation:
+    """
+    Verify each claim with a structured-output model call.
+    """
+
+    name = "percolation"
+
+    def __init__(self, model: str | None = None):
+        self.model = model
+
+    async def verify(self, claim: Claim, condensate: Condensate) -> ClaimVerdict:
+        settings = condensate.output.settings
+        model = self.model or settings.model
+        try:
+            response = await acall_upstream(
+                settings.provider,
+                input=f"""
+    You are a careful fact checker. Decide whether the claim is factually
+    supported, given the question it answers. Report a confidence in [0, 1].
+
+    Question: {condensate.output.prompt}
+    Claim: {claim.text}
+    """,
+                model=model,
+                temperature=0.0,
+                max_output_tokens=settings.max_tokens,
+                text_format=ClaimCheck,
+            )
+        except Exception as e:
+            return ClaimVerdict(
+                claim=claim,
+                supported=True,
+                confidence=0.0,
+                rationale="Error verifying claim",
+                source="llm",
+                error=str(e),
+            )
+        check = response.output_parsed
+        if check is None:
+            return ClaimVerdict(
+                claim=claim,
+                supported=True,
+                confidence=0.0,
+                rationale="Parsing failed (None returned)",
+                source="llm",
+                error="output_parsed was None",
+            )
+        return ClaimVerdict(claim=claim, source="llm", **check.model_dump())
+
+
+class Runoff:
+    """
+    Score the share of unsupported claims against ``delusion_threshold``.
+    """
+
+    name = "runoff"
+
+    def __init__(self, delusion_threshold: float | None = None):
+        self.delusion_threshold = (
+            delusion_threshold
+            if delusion_threshold is not None
+            else float(get_setting("hallucination_detection.delusion_threshold", 50.0))
+        )
+
+    async def synthesize(
+        self, output: LLMOutput, verdicts: list[ClaimVerdict]
+    ) -> HallucinationEvaluation:
+        checked = [v for v in verdicts if v.error is None and not v.skipped]
+        failed = [v for v in verdicts if v.error is not None]
+        skipped = len(verdicts) - len(checked) - len(failed)
+        if not verdicts:
+            return HallucinationEvaluation(
+                is_hallucination=False,
+                rationale="No testable claims found.",
+                delusion_percentage=0.0,
+            )
+        if not checked:
+            return HallucinationEvaluation(
+                is_hallucination=False,
+                rationale="Error detecting hallucinations",
+                delusion_percentage=0.0,
+                error=failed[0].error if failed else "No claims were verified",
+            )
+        unsupported = [v for v in checked if not v.supported]
+        # Skipped claims count as supported, so an early stop reports a lower
+        # bound rather than the share among the claims it happened to check.
+        percentage = 100.0 * len(unsupported) / (len(checked) + skipped)
+        if unsupported:
+            rationale = "Unsupported claims: " + " ".join(
+                f"[{v.claim.index}] {v.claim.text} ({v.rationale})" for v in unsupported
+            )
+        else:
+            rationale = f"All {len(checked)} claims are supported."
+        if failed:
+            rationale += f" {len(failed)} claims could not be verified."
+        if skipped:
+            rationale += (
+                f" Stopped early: {skipped} claims were skipped once the verdict"
+                " was decided; the delusion percentage is a lower bound."
+            )
+        return HallucinationEvaluation(
+            is_hallucination=percentage >= self.delusion_threshold,
+            rationale=rationale,
+            delusion_percentage=percentage,
+        )
+
+
+class EarlyTermination(Protocol):
+    """
+    Decides when the remaining claims no longer need verifying.
+    """
+
+    def should_stop(self, unsupported: int, total: int | None) -> bool:
+        """
+        ``unsupported`` counts failed claims so far; ``total`` is the number
+        of claims, or None while extraction is still running.
+        """
+
+
+class ThresholdStop:
+    """
+    Stop once the unsupported claims alone exceed ``delusion_threshold``,
+    since the remaining claims can no longer change the verdict.
+    """
+
+    def __init__(self, delusion_threshold: float):
+        self.delusion_threshold = delusion_threshold
+
+    def should_stop(self, unsupported: int, total: int | None) -> bool:
+        if total is None or total == 0:
+            return False
+        return 100.0 * unsupported / total >= self.delusion_threshold
+
+
+class MaxUnsupportedStop:
+    """
+    Stop after a fixed number of unsupported claims.
+    """
+
+    def __init__(self, max_unsupported: int):
+        self.max_unsupported = max_unsupported
+
+    def should_stop(self, unsupported: int, total: int | None) -> bool:
+        return unsupported >= self.max_unsupported
+
+
+class VerificationLimiter:
+    """
+    Async semaphore shared by every event loop and thread in the process.
+
+    Blocking callers run the pipeline in an event loop of their own, so a
+    per-loop ``asyncio.Semaphore`` would give each of them a separate limit.
+    A released slot is handed straight to the oldest waiter, on its loop.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+
+    async def __aenter__(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except BaseException:
+            with self._lock:
+                granted = (loop, waiter) not in self._waiters
+                if not granted:
+                    self._waiters.remove((loop, waiter))
+            if granted:  # The slot arrived as the wait was abandoned.
+                self._release()
+            raise
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        self._release()
+
+    def _release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(_grant, waiter)
+                    return
+                except RuntimeError:  # The waiter's loop has closed.
+                    continue
+            self.active -= 1
+
+
+def _grant(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+_verification_limiters: dict[tuple[str, int], VerificationLimiter] = {}
+_verification_limiters_lock = threading.Lock()
+
+
+def get_verification_limiter(model: str) -> VerificationLimiter:
+    """
+    Get the limiter bounding concurrent claim verifications for a model,
+    across every caller in the process.
+
+    The limit is ``verification_concurrency_per_model[model]`` when set, else
+    ``verification_concurrency``.
+    """
+    per_model = get_setting(
+        "hallucination_detection.verification_concurrency_per_model", {}
+    )
+    default = get_setting("hallucination_detection.verification_concurrency", 8)
+    limit = int(per_model.get(model) or default)
+    with _verification_limiters_lock:
+        limiter = _verification_limiters.get((model, limit))
+        if limiter is None:
+            limiter = _verification_limiters[model, limit] = VerificationLimiter(limit)
+        return limiter
+
+
+class MysticLakePipeline:
+    """
+    Run the five Mystic Lake stages as a streaming pipeline.
+    """
+
+    def __init__(
+        self,
+        evaporation: EvaporationStage | None = None,
+        condensation: CondensationStage | None = None,
+        precipitation: PrecipitationStage | None = None,
+        percolation: PercolationStage | None = None,
+        runoff: RunoffStage | None = None,
+        early_termination: EarlyTermination | None = None,
+    ):
+        self.evaporation = evaporation or Evaporation()
+        self.condensation = condensation or Condensation()
+        self.precipitation = precipitation or SentencePrecipitation()
+        self.percolation = percolation or LLMPercolation()
+        self.runoff = runoff or Runoff()
+        if early_termination is None and get_setting(
+            "hallucination_detection.early_termination", False
+        ):
+            early_termination = ThresholdStop(
+                getattr(
+                    self.runoff,
+                    "delusion_threshold",
+                    float(
+                        get_setting("hallucination_detection.delusion_threshold", 50.0)
+                    ),
+                )
+            )
+        self.early_termination = early_termination
+
+    async def run(self, output: LLMOutput) -> PipelineResult:
+        """
+        Run every stage on an output and collect timings.
+        """
+        timings = {
+            stage: StageTiming()
+            for stage in (
+                "evaporation",
+                "condensation",
+                "precipitation",
+                "percolation",
+                "runoff",
+            )
+        }
+        started = time.perf_counter()
+        with _timed(timings["evaporation"]):
+            vapor = await self.evaporation.collect(output)
+        with _timed(timings["condensation"]):
+            condensate = await self.condensation.condense(vapor)
+
+        model = getattr(self.percolation, "model", None) or output.settings.model
+        limiter = get_verification_limiter(model)
+
+        async def percolate(claim: Claim) -> ClaimVerdict:
+            async with limiter:
+                with _timed(timings["percolation"]):
+                    return await self.percolation.verify(claim, condensate)
+
+        claims: list[Claim] = []
+        tasks: list[asyncio.Task] = []
+        stopped_early = False
+        extraction = self.precipitation.extract(condensate).__aiter__()
+        try:
+            while True:
+                if self._should_stop(tasks, None):
+                    stopped_early = True
+                    break
+                with _timed(timings["precipitation"]):
+                    try:
+                        claim = await extraction.__anext__()
+                    except StopAsyncIteration:
+                        break
+                claims.append(claim)
+                tasks.append(asyncio.create_task(percolate(claim)))
+            pending = {task for task in tasks if not task.done()}
+            while pending and not stopped_early:
+                if self._should_stop(tasks, len(tasks)):
+                    stopped_early = True
+                    break
+                _, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+            stopped_early = stopped_early and bool(pending)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            verdicts = [
+                _skipped_verdict(claim) if task.cancelled() else task.result()
+                for claim, task in zip(claims, tasks)
+            ]
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            aclose = getattr(extraction, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+        with _timed(timings["runoff"]):
+            evaluation = await self.runoff.synthesize(output, verdicts)
+        observe_stages(timings)
+        return PipelineResult(
+            evaluation=evaluation,
+            verdicts=verdicts,
+            timings=timings,
+            wall_seconds=time.perf_counter() - started,
+            stopped_early=stopped_early,
+        )
+
+    def _should_stop(self, tasks: list[asyncio.Task], total: int | None) -> bool:
+        """
+        Ask the early-termination policy whether to stop verifying.
+        """
+        if self.early_termination is None:
+            return False
+        unsupported = 0
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                verdict = task.result()
+                if verdict.error is None and not verdict.supported:
+                    unsupported += 1
+        return self.early_termination.should_stop(unsupported, total)
+
+
+def _skipped_verdict(claim: Claim) -> ClaimVerdict:
+    """
+    Placeholder verdict for a claim left unverified by early termination.
+    """
+    return ClaimVerdict(
+        claim=claim,
+        supported=True,
+        confidence=0.0,
+        rationale="Skipped: verdict already decided",
+        source="skipped",
+        skipped=True,
+    )
+
+
+@contextmanager
+def _timed(timing: StageTiming) -> Iterator[None]:
+    """
+    Add the duration of a block to a stage timing.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.calls += 1
+        timing.seconds += time.perf_counter() - start
+
+
+_default_pipeline: MysticLakePipeline | None = None
+
+
+def get_default_pipeline() -> MysticLakePipeline:
+    """
+    Get the pipeline used when ``hallucination_detection.strategy`` is
+    ``pipeline``. Claims are checked against the local reference corpus
+    first when ``references.index_path`` is configured.
+    """
+    global _default_pipeline
+    if _default_pipeline is None:
+        from .references import ReferencePercolation, open_configured_index
+
+        percolation: PercolationStage = LLMPercolation()
+        index = open_configured_index()
+        if index is not None:
+            percolation = ReferencePercolation(
+                index,
+                fallback=percolation,
+                min_coverage=float(get_setting("references.min_coverage", 0.9)),
+                top_k=int(get_setting("references.top_k", 3)),
+            )
+        _default_pipeline = MysticLakePipeline(percolation=percolation)
+    return _default_pipeline
+
+
+def configure_default_pipeline(pipeline: MysticLakePipeline | None) -> None:
+    """
+    Replace the default pipeline (None restores the built-in stages).
+    """
+    global _default_pipeline
+    _default_pipeline = pipeline
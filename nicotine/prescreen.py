@@ -0,0 +1,263 @@
+"""
+Cheap local pre-screen tier in front of the model call.
+
+Many outputs simply restate or extract from their prompt. The pre-screen
+scores how well an output is grounded in its prompt using token overlap,
+bigram overlap and number/entity consistency. When that score clears the
+configured threshold the verdict is returned locally; everything else
+escalates to the model. Lexical grounding can confirm an output but never
+refute one, so the pre-screen only ever returns "not a hallucination".
+"""
+
+from collections import deque
+from typing import Awaitable, Callable
+import re
+import threading
+import time
+
+from pydantic import BaseModel
+
+from .config import get_setting
+from .models import HallucinationEvaluation, LLMOutput
+
+_WORD = re.compile(r"[A-Za-z0-9]+(?:['.,][A-Za-z0-9]+)*")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+_ENTITY = re.compile(r"\b[A-Z][a-zA-Z]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were which with".split()
+)
+
+# Weights of token, bigram and entity overlap in the grounding confidence.
+SIGNAL_WEIGHTS = (0.5, 0.3, 0.2)
+
+# Latency samples kept per tier for percentile reporting.
+LATENCY_WINDOW = 10000
+
+
+class GroundingSignals(BaseModel):
+    """
+    Per-signal grounding scores of an output against its prompt, in [0, 1].
+
+    Token and bigram overlap are None when the output has too few content
+    tokens to score; a one-word answer picked from the prompt is not
+    evidence of grounding.
+    """
+
+    token_overlap: float | None
+    bigram_overlap: float | None
+    entity_overlap: float
+    numbers_grounded: bool
+
+    @property
+    def confidence(self) -> float:
+        """
+        Weighted grounding score; zero when any number is ungrounded or an
+        overlap could not be scored.
+        """
+        if not self.numbers_grounded:
+            return 0.0
+        if self.token_overlap is None or self.bigram_overlap is None:
+            return 0.0
+        overlaps = (self.token_overlap, self.bigram_overlap, self.entity_overlap)
+        return sum(w * o for w, o in zip(SIGNAL_WEIGHTS, overlaps))
+
+
+def _content_tokens(text: str) -> list[str]:
+    return [t for t in _WORD.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _share(items: set, reference: set) -> float | None:
+    return len(items & reference) / len(items) if items else None
+
+
+def score_grounding(prompt: str, output: str) -> GroundingSignals:
+    """
+    Score how much of an output is already present in its prompt.
+    """
+    prompt_tokens = _content_tokens(prompt)
+    output_tokens = _content_tokens(output)
+    # An output naming no entities contradicts none.
+    entity_overlap = _share(set(_ENTITY.findall(output)), set(_ENTITY.findall(prompt)))
+    return GroundingSignals(
+        token_overlap=_share(set(output_tokens), set(prompt_tokens)),
+        bigram_overlap=_share(
+            set(zip(output_tokens, output_tokens[1:])),
+            set(zip(prompt_tokens, prompt_tokens[1:])),
+        ),
+        entity_overlap=1.0 if entity_overlap is None else entity_overlap,
+        numbers_grounded=set(_NUMBER.findall(output)) <= set(_NUMBER.findall(prompt)),
+    )
+
+
+def prescreen(output: LLMOutput, threshold: float) -> HallucinationEvaluation | None:
+    """
+    Return a local verdict when the output is confidently grounded in its
+    prompt, or None when the model should decide.
+    """
+    if not output.output.strip():
+        return HallucinationEvaluation(
+            is_hallucination=False,
+            rationale="Pre-screen: empty output makes no claims.",
+            delusion_percentage=0.0,
+        )
+    signals = score_grounding(output.prompt, output.output)
+    confidence = signals.confidence
+    if confidence < threshold:
+        return None
+    return HallucinationEvaluation(
+        is_hallucination=False,
+        rationale=(
+            "Pre-screen: output is grounded in the prompt "
+            f"(token overlap {signals.token_overlap:.2f}, "
+            f"bigram overlap {signals.bigram_overlap:.2f}, "
+            f"entity overlap {signals.entity_overlap:.2f}, numbers consistent)."
+        ),
+        delusion_percentage=round(100.0 * (1.0 - confidence), 1),
+    )
+
+
+class TierStats(BaseModel):
+    """
+    Share of traffic a tier resolved and its latency percentiles.
+    """
+
+    resolved: int
+    share: float
+    p50_ms: float
+    p99_ms: float
+
+
+class TieredDetectorStats(BaseModel):
+    """
+    Per-tier statistics for the tiered detector.
+    """
+
+    enabled: bool
+    total: int = 0
+    tiers: dict[str, TierStats] = {}
+
+
+def _percentile(samples: list[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class TieredDetector:
+    """
+    Run the local pre-screen first and escalate to the model otherwise.
+    """
+
+    TIERS = ("prescreen", "llm")
+
+    def __init__(self, threshold: float = 0.9):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._counts = {tier: 0 for tier in self.TIERS}
+        self._latencies: dict[str, deque[float]] = {
+            tier: deque(maxlen=LATENCY_WINDOW) for tier in self.TIERS
+        }
+
+    def record(self, tier: str, started: float) -> None:
+        """
+        Count an output resolved by ``tier``, which took since ``started``
+        (``time.perf_counter()``).
+        """
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._counts[tier] += 1
+            self._latencies[tier].append(elapsed)
+
+    def screen(self, output: LLMOutput) -> HallucinationEvaluation | None:
+        """
+        Run only the pre-screen tier, recording it when it resolves.
+        """
+        started = time.perf_counter()
+        evaluation = prescreen(output, self.threshold)
+        if evaluation is not None:
+            self.record("prescreen", started)
+        return evaluation
+
+    def detect(
+        self,
+        output: LLMOutput,
+        escalate: Callable[[LLMOutput], HallucinationEvaluation],
+    ) -> HallucinationEvaluation:
+        """
+        Detect with the pre-screen, escalating unresolved outputs.
+        """
+        evaluation = self.screen(output)
+        if evaluation is not None:
+            return evaluation
+        started = time.perf_counter()
+        try:
+            return escalate(output)
+        finally:
+            self.record("llm", started)
+
+    async def adetect(
+        self,
+        output: LLMOutput,
+        escalate: Callable[[LLMOutput], Awaitable[HallucinationEvaluation]],
+    ) -> HallucinationEvaluation:
+        """
+        Detect with the pre-screen, escalating unresolved outputs.
+        """
+        evaluation = self.screen(output)
+        if evaluation is not None:
+            return evaluation
+        started = time.perf_counter()
+        try:
+            return await escalate(output)
+        finally:
+            self.record("llm", started)
+
+    def stats(self) -> TieredDetectorStats:
+        """
+        Snapshot of per-tier resolution shares and latencies.
+        """
+        with self._lock:
+            total = sum(self._counts.values())
+            return TieredDetectorStats(
+                enabled=True,
+                total=total,
+                tiers={
+                    tier: TierStats(
+                        resolved=self._counts[tier],
+                        share=self._counts[tier] / total if total else 0.0,
+                        p50_ms=_percentile(list(self._latencies[tier]), 50) * 1000,
+                        p99_ms=_percentile(list(self._latencies[tier]), 99) * 1000,
+                    )
+                    for tier in self.TIERS
+                },
+            )
+
+
+_UNSET = object()
+_tiered_detector: "TieredDetector | None | object" = _UNSET
+
+
+def get_tiered_detector() -> TieredDetector | None:
+    """
+    Get the process-wide tiered detector, or None when ``prescreen.enabled``
+    is off.
+    """
+    global _tiered_detector
+    if _tiered_detector is _UNSET:
+        _tiered_detector = (
+            TieredDetector(float(get_setting("prescreen.threshold", 0.9)))
+            if get_setting("prescreen.enabled", False)
+            else None
+        )
+    return _tiered_detector  # type: ignore[return-value]
+
+
+def configure_tiered_detector(detector: TieredDetector | None) -> None:
+    """
+    Replace the process-wide tiered detector (None disables the pre-screen).
+    """
+    global _tiered_detector
+    _tiered_detector = detector
@@ -0,0 +1,88 @@
+"""
+Sampling profiler for slow requests.
+
+While a profiled request runs, a background thread samples the stack of the
+thread that started it every ``interval`` seconds. The samples are folded
+stacks (``outer;inner;leaf count`` per line), the input of ``flamegraph.pl``,
+speedscope and most flame graph viewers. A request served on the event loop
+shares its thread with every other coroutine, so its samples include
+whatever the loop ran meanwhile; time it spent awaiting the upstream shows
+no samples at all.
+
+The thread only runs while at least one request is being profiled.
+"""
+
+from collections import Counter
+from types import FrameType
+import sys
+import threading
+import time
+
+# Frames kept per sample, innermost first; deeper stacks are cut at the root.
+MAX_DEPTH = 128
+
+
+def fold(frame: FrameType | None) -> str:
+    """
+    One stack, outermost frame first, as ``module.function`` names.
+    """
+    names: list[str] = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}.{code.co_qualname}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Samples the threads of the requests being profiled.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._active: dict[str, tuple[int, Counter]] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def start(self, key: str, thread_id: int | None = None) -> None:
+        """
+        Start sampling a thread (the calling one by default) under ``key``.
+        """
+        with self._lock:
+            self._active[key] = (thread_id or threading.get_ident(), Counter())
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="nicotine-profiler", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, key: str) -> Counter:
+        """
+        Stop sampling under ``key`` and return its folded stacks and counts.
+        """
+        with self._lock:
+            _, samples = self._active.pop(key, (0, Counter()))
+        return samples
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for thread_id, samples in self._active.values():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[fold(frame)] += 1
+                del frames
+
+
+def render(samples: Counter) -> str:
+    """
+    Folded stacks, one ``stack count`` line each, most sampled first.
+    """
+    return "\n".join(f"{stack} {count}" for stack, count in samples.most_common())
@@ -0,0 +1,225 @@
+"""
+Versioned prompt templates for detection calls.
+
+A template keeps the static instructions of a detection prompt apart from
+the per-request payload. The instructions are sent as the Responses API
+``instructions``, byte for byte the same on every call of a template
+version, so the provider's prompt cache can serve that prefix instead of
+processing it again (OpenAI caches prefixes from 1024 tokens, response
+schema included, and reports the hits in ``usage.input_tokens_details``).
+Calls also carry the template as ``prompt_cache_key`` so they are routed to
+the same cache, with a key of their own for packed calls, whose instructions
+differ; turn ``prompts.prompt_cache_key`` off for OpenAI-compatible servers
+that reject it.
+
+``LLMSettings.prompt_version`` selects the template per request, falling
+back to ``prompts.version``; settings naming an unknown version fail
+validation:
+
+- ``1``: the original prompt, instructions and content in one input (the
+  default)
+- ``2``: static instructions, then the prompt and output to evaluate
+
+Version ``2``'s instructions and response schema come to about 400
+tokens, under OpenAI's 1024-token caching minimum, so its prefix is only
+cached once a version extends the instructions (with examples, say) past
+it; until then ``1`` stays the default.
+
+More versions are declared under ``prompts.templates`` in the config; their
+fields default to those of version ``2``. Templates are never edited in
+place: a changed prompt is a new version, so verdicts and cached prefixes
+of the old one stay meaningful. Verdict cache keys include the version.
+"""
+
+from dataclasses import dataclass, fields, replace
+import threading
+
+from .config import get_setting
+from .models import LLMOutput, LLMSettings
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    Detection prompt of one template version.
+
+    ``payload`` is formatted with ``prompt`` and ``output``; the payload of a
+    packed batch, ``packed_payload``, with ``items``, each formatted from
+    ``item`` with ``index``, ``prompt`` and ``output``. Without instructions
+    the payload is the whole prompt.
+    """
+
+    version: str
+    payload: str
+    packed_payload: str
+    item: str
+    instructions: str | None = None
+    packed_instructions: str | None = None
+
+    @property
+    def cache_key(self) -> str:
+        return f"nicotine-detect-v{self.version}"
+
+    @property
+    def packed_cache_key(self) -> str:
+        # Packed calls send other instructions, so their prefix is cached apart.
+        return f"{self.cache_key}-packed"
+
+    def request(self, output: LLMOutput) -> dict[str, str]:
+        """
+        Prompt arguments of the upstream call evaluating one output.
+        """
+        payload = self.payload.format(prompt=output.prompt, output=output.output)
+        return self._request(self.instructions, payload, self.cache_key)
+
+    def packed_request(self, outputs: list[LLMOutput]) -> dict[str, str]:
+        """
+        Prompt arguments of one upstream call evaluating several outputs.
+        """
+        items = "\n".join(
+            self.item.format(index=index, prompt=output.prompt, output=output.output)
+            for index, output in enumerate(outputs)
+        )
+        payload = self.packed_payload.format(items=items)
+        return self._request(self.packed_instructions, payload, self.packed_cache_key)
+
+    @staticmethod
+    def _request(
+        instructions: str | None, payload: str, cache_key: str
+    ) -> dict[str, str]:
+        if instructions is None:
+            return {"input": payload}
+        request = {"instructions": instructions, "input": payload}
+        if get_setting("prompts.prompt_cache_key", True):
+            request["prompt_cache_key"] = cache_key
+        return request
+
+
+_INSTRUCTIONS = """\
+You are a hallucination detector. You are given the input a language model \
+received and the output it produced. Decide whether the output contains \
+hallucinations: statements that are factually wrong, that contradict the \
+input or themselves, or that assert specific facts (names, numbers, dates, \
+quotes, sources) which cannot be supported.
+
+Judge only the output, using the input as context:
+- Opinions, hedged statements, advice and creative writing requested by the \
+input are not hallucinations.
+- Omissions and incomplete answers are not hallucinations; wrong details are.
+- Unverifiable but plausible general statements are not hallucinations; \
+unverifiable specific facts presented as true are.
+
+Return:
+- is_hallucination: true if any statement of the output is a hallucination.
+- delusion_percentage: the share of the output, from 0 to 100, made of \
+hallucinated statements.
+- rationale: one or two sentences naming the hallucinated statements and why \
+they are wrong, or why the output holds up."""
+
+_PACKED_INSTRUCTIONS = _INSTRUCTIONS + """
+
+You are given several numbered items, each with its own input and output. \
+Evaluate every item independently and return one evaluation per item, tagged \
+with the item's index."""
+
+BUILTIN_TEMPLATES = {
+    "1": PromptTemplate(
+        version="1",
+        payload="""
+    You are a helpful assistant that detects hallucinations in the input.
+
+    Input: {prompt}
+    Output: {output}
+    """,
+        packed_payload="""
+    You are a helpful assistant that detects hallucinations in the input.
+    Evaluate every item independently and return one evaluation per item,
+    tagged with the item's index.
+    {items}
+    """,
+        item="""
+    Item {index}:
+    Input: {prompt}
+    Output: {output}
+    """,
+    ),
+    "2": PromptTemplate(
+        version="2",
+        instructions=_INSTRUCTIONS,
+        packed_instructions=_PACKED_INSTRUCTIONS,
+        payload="Input: {prompt}\nOutput: {output}",
+        packed_payload="{items}",
+        item="Item {index}:\nInput: {prompt}\nOutput: {output}\n",
+    ),
+}
+
+DEFAULT_VERSION = "1"
+
+# Version whose fields configured templates start from.
+BASE_VERSION = "2"
+
+
+def build_template(version: str, spec: dict) -> PromptTemplate:
+    """
+    Build a template from a ``prompts.templates`` config entry.
+    """
+    names = {field.name for field in fields(PromptTemplate)} - {"version"}
+    unknown = set(spec) - names
+    if unknown:
+        raise ValueError(f"Unknown prompt template fields: {sorted(unknown)}.")
+    return replace(BUILTIN_TEMPLATES[BASE_VERSION], version=version, **spec)
+
+
+_templates: dict[str, PromptTemplate] = {}
+_templates_lock = threading.Lock()
+
+
+def template_version(settings: LLMSettings | None = None) -> str:
+    """
+    Version of the template selected by the settings, or the configured
+    default, whether or not it exists.
+    """
+    version = settings.prompt_version if settings is not None else None
+    return str(version or get_setting("prompts.version", DEFAULT_VERSION))
+
+
+def get_template(settings: LLMSettings | None = None) -> PromptTemplate:
+    """
+    Get the template selected by the settings, or the configured default.
+    """
+    return load_template(template_version(settings))
+
+
+def load_template(version: str) -> PromptTemplate:
+    """
+    Get a template by version, configured or builtin. Raises ``ValueError``
+    for an unknown version.
+    """
+    template = _templates.get(version)
+    if template is not None:
+        return template
+    with _templates_lock:
+        template = _templates.get(version)
+        if template is None:
+            # YAML reads unquoted versions as numbers.
+            specs = get_setting("prompts.templates", {})
+            spec = {str(key): value for key, value in specs.items()}.get(version)
+            if spec is not None:
+                template = build_template(version, spec)
+            elif version in BUILTIN_TEMPLATES:
+                template = BUILTIN_TEMPLATES[version]
+            else:
+                raise ValueError(f"Unknown prompt template version: {version}.")
+            _templates[version] = template
+    return template
+
+
+def configure_template(version: str, template: PromptTemplate | None) -> None:
+    """
+    Register a template under a version (None reverts to the configured one).
+    """
+    with _templates_lock:
+        if template is None:
+            _templates.pop(version, None)
+        else:
+            _templates[version] = template
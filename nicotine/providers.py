@@ -0,0 +1,525 @@
+"""
+Detector backends.
+
+Every upstream model call goes through a ``Provider``: a structured-output
+``parse`` (blocking) and ``aparse`` (async) returning an object with
+``output_parsed`` and ``usage``, like the OpenAI Responses API.
+
+Built-in backends:
+
+- ``openai``: the OpenAI API through the shared, lazily built clients
+
+More backends are declared under ``providers.backends`` in the config, e.g.
+an ``OpenAIProvider`` pointed at a local OpenAI-compatible server or a
+``FakeProvider`` (``type: fake``) with realistic latency and error rates,
+or registered with ``configure_provider``. ``LLMSettings.provider`` picks
+the backend per request; ``providers.default`` applies when it is unset.
+API requests may only name the default and ``providers.api_allowed``.
+"""
+
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Iterable,
+    Protocol,
+    TypeVar,
+    get_args,
+    get_origin,
+)
+import asyncio
+import hashlib
+import math
+import os
+import random
+import re
+import threading
+import time
+import weakref
+
+from pydantic import BaseModel
+
+from .config import get_setting
+from .models import allowed_providers
+from .ratelimit import aobserve_headers, observe_headers
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class Provider(Protocol):
+    """
+    Structured-output model backend.
+
+    ``instructions``, when given, is a static prefix sent ahead of ``input``
+    (see ``nicotine.prompts``). ``parse`` gives up after ``timeout`` seconds;
+    async callers cancel ``aparse`` instead.
+    """
+
+    def parse(
+        self,
+        *,
+        input: str,
+        model: str,
+        temperature: float,
+        max_output_tokens: int,
+        text_format: type[T],
+        instructions: str | None = None,
+        timeout: float | None = None,
+    ) -> Any:
+        """Return a response with ``output_parsed`` and ``usage``."""
+
+    async def aparse(
+        self,
+        *,
+        input: str,
+        model: str,
+        temperature: float,
+        max_output_tokens: int,
+        text_format: type[T],
+        instructions: str | None = None,
+    ) -> Any:
+        """Return a response with ``output_parsed`` and ``usage``."""
+
+
+class ProviderError(Exception):
+    """
+    Upstream failure reported by a backend, with its HTTP status and
+    response headers if any.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status: int | None = None,
+        headers: dict[str, str] | None = None,
+    ):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers
+
+
+class InputTokensDetails(BaseModel):
+    """
+    Breakdown of the input tokens of a response.
+    """
+
+    cached_tokens: int = 0  # served from the prompt cache
+
+
+class Usage(BaseModel):
+    """
+    Token usage of a response.
+    """
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+    input_tokens_details: InputTokensDetails = InputTokensDetails()
+
+
+class ProviderResponse(BaseModel):
+    """
+    Parsed response returned by non-OpenAI backends.
+    """
+
+    output_parsed: Any = None
+    usage: Usage | None = None
+    headers: dict[str, str] | None = None  # rate-limit headers, if any
+
+
+# Connection pool limits for async clients. Detections are long-lived
+# upstream calls, so keep enough keep-alive connections around to avoid
+# re-handshaking under sustained concurrency.
+ASYNC_MAX_CONNECTIONS = 100
+ASYNC_MAX_KEEPALIVE_CONNECTIONS = 20
+
+
+def _observe(response: Any) -> None:
+    observe_headers(response.headers)
+
+
+async def _aobserve(response: Any) -> None:
+    await aobserve_headers(response.headers)
+
+
+def build_client(api_key: str, base_url: str | None = None) -> "OpenAI":
+    """
+    Blocking OpenAI client. Retries are left to the call policy; rate-limit
+    headers feed the rate limiter.
+    """
+    from openai import DefaultHttpxClient, OpenAI
+
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=0,
+        http_client=DefaultHttpxClient(event_hooks={"response": [_observe]}),
+    )
+
+
+def build_async_client(api_key: str, base_url: str | None = None) -> "AsyncOpenAI":
+    """
+    Pooled async OpenAI client. Retries are left to the call policy;
+    rate-limit headers feed the rate limiter.
+    """
+    import httpx
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    # Recent SDKs build their client on httpx2, whose Limits takes the same
+    # fields and accepts httpx's at runtime.
+    limits: Any = httpx.Limits(
+        max_connections=ASYNC_MAX_CONNECTIONS,
+        max_keepalive_connections=ASYNC_MAX_KEEPALIVE_CONNECTIONS,
+    )
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(
+            limits=limits, event_hooks={"response": [_aobserve]}
+        ),
+    )
+
+
+class OpenAIProvider:
+    """
+    OpenAI Responses API, or any server compatible with it.
+
+    Without ``base_url`` and ``api_key`` the shared clients from
+    ``nicotine.system`` are used, so ``configure_client`` applies. Otherwise
+    the provider builds its own clients on first use; local servers usually
+    accept any key.
+    """
+
+    def __init__(self, base_url: str | None = None, api_key: str | None = None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self._client: "OpenAI | None" = None
+        # Pooled connections are bound to the loop that opened them.
+        self._async_clients: (
+            "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]"
+        ) = weakref.WeakKeyDictionary()
+
+    @property
+    def shared(self) -> bool:
+        return self.base_url is None and self.api_key is None
+
+    def _key(self) -> str:
+        return self.api_key or os.getenv("OPENAI_API_KEY") or "unused"
+
+    def client(self) -> "OpenAI":
+        """
+        Blocking client used by this provider.
+        """
+        if self.shared:
+            from .system import get_client
+
+            return get_client()
+        if self._client is None:
+            self._client = build_client(self._key(), self.base_url)
+        return self._client
+
+    def async_client(self) -> "AsyncOpenAI":
+        """
+        Async client used by this provider on the running event loop.
+        """
+        if self.shared:
+            from .system import get_async_client
+
+            return get_async_client()
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = build_async_client(
+                self._key(), self.base_url
+            )
+        return client
+
+    def parse(self, **kwargs) -> Any:
+        return self.client().responses.parse(**kwargs)
+
+    async def aparse(self, **kwargs) -> Any:
+        return await self.async_client().responses.parse(**kwargs)
+
+
+# Status codes raised for each simulated failure kind.
+FAKE_ERROR_STATUS = {"rate_limit": 429, "server_error": 500, "timeout": None}
+
+_ITEM_MARKER = re.compile(r"^\s*Item (\d+):", re.MULTILINE)
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+class FakeProvider:
+    """
+    Deterministic in-process backend for tests, benchmarks and capacity
+    planning without network access.
+
+    Answers are drawn from a generator seeded with ``seed`` and the request,
+    so the same request always gets the same answer. Latencies and failures
+    come from one generator seeded with ``seed``, so a run replays exactly
+    for the same call order while retries of a failed call can still
+    succeed. Latency is log-normal with median ``latency`` seconds and
+    shape ``latency_sigma``. ``errors`` maps failure kinds (``rate_limit``,
+    ``server_error``, ``timeout``) to their probability. ``hallucination_rate``
+    is the share of verdicts flagged as hallucinations.
+
+    Responses are synthesized from ``text_format``: booleans and scores follow
+    ``hallucination_rate``, lists of models with an ``index`` get one item per
+    ``Item N:`` marker of a packed prompt, and lists of strings echo the
+    sentences of the last input line (so claim extraction yields claims).
+    ``instructions`` sent before for the same model count as cached input
+    tokens, like a provider's prompt cache.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        latency_sigma: float = 0.0,
+        errors: dict[str, float] | None = None,
+        hallucination_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        for kind in errors or {}:
+            if kind not in FAKE_ERROR_STATUS:
+                raise ValueError(f"Unknown fake error kind: {kind}.")
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.errors = dict(errors or {})
+        self.hallucination_rate = hallucination_rate
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._sequence = random.Random(seed)
+        self._prefixes: set[tuple[str, str]] = set()
+
+    def _rng(
+        self, input: str, model: str, text_format: type[BaseModel]
+    ) -> random.Random:
+        digest = hashlib.sha256(
+            f"{self.seed}\0{model}\0{text_format.__name__}\0{input}".encode()
+        ).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _plan(
+        self,
+        input: str,
+        model: str,
+        text_format: type[BaseModel],
+        instructions: str | None,
+    ) -> tuple:
+        """
+        Draw the latency, failure and response of a request.
+        """
+        prefix = instructions or ""
+        with self._lock:
+            self.calls += 1
+            spread = self._sequence.gauss(0.0, self.latency_sigma)
+            roll = self._sequence.random()
+            cached = (model, prefix) in self._prefixes
+            self._prefixes.add((model, prefix))
+        delay = self.latency * math.exp(spread)
+        failure = None
+        for kind, probability in self.errors.items():
+            if roll < probability:
+                failure = kind
+                break
+            roll -= probability
+        rng = self._rng(input, model, text_format)
+        parsed = _fake_model(text_format, input, rng, self.hallucination_rate)
+        usage = Usage(
+            input_tokens=(len(prefix) + len(input)) // 4 + 1,
+            output_tokens=len(parsed.model_dump_json()) // 4 + 1,
+            input_tokens_details=InputTokensDetails(
+                cached_tokens=len(prefix) // 4 if cached else 0
+            ),
+        )
+        return delay, failure, ProviderResponse(output_parsed=parsed, usage=usage)
+
+    @staticmethod
+    def _raise(failure: str) -> None:
+        if failure == "timeout":
+            raise TimeoutError("Simulated upstream timeout.")
+        raise ProviderError(
+            f"Simulated {failure.replace('_', ' ')}.", FAKE_ERROR_STATUS[failure]
+        )
+
+    def parse(
+        self,
+        *,
+        input: str,
+        model: str,
+        text_format: type[T],
+        instructions: str | None = None,
+        timeout: float | None = None,
+        **kwargs,
+    ) -> ProviderResponse:
+        delay, failure, response = self._plan(input, model, text_format, instructions)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Upstream call timed out.")
+        time.sleep(delay)
+        if failure is not None:
+            self._raise(failure)
+        return response
+
+    async def aparse(
+        self,
+        *,
+        input: str,
+        model: str,
+        text_format: type[T],
+        instructions: str | None = None,
+        **kwargs,
+    ) -> ProviderResponse:
+        delay, failure, response = self._plan(input, model, text_format, instructions)
+        await asyncio.sleep(delay)
+        if failure is not None:
+            self._raise(failure)
+        return response
+
+
+def _fake_value(
+    name: str,
+    annotation: Any,
+    input: str,
+    rng: random.Random,
+    rate: float,
+    flagged: bool,
+) -> Any:
+    origin = get_origin(annotation)
+    args = get_args(annotation)
+    if origin is list and args:
+        item = args[0]
+        if isinstance(item, type) and issubclass(item, BaseModel):
+            indices = [int(i) for i in _ITEM_MARKER.findall(input)]
+            models = [_fake_model(item, input, rng, rate) for _ in indices]
+            if "index" in item.model_fields:
+                for model, index in zip(models, indices):
+                    setattr(model, "index", index)
+            return models
+        lines = [line for line in input.strip().splitlines() if line.strip()]
+        last = lines[-1].split(":", 1)[-1].strip() if lines else ""
+        return [s for s in _SENTENCE_BOUNDARY.split(last) if s]
+    if type(None) in args:
+        return None
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _fake_model(annotation, input, rng, rate)
+    if annotation is bool:
+        return not flagged if name == "supported" else flagged
+    if annotation is float:
+        if "percentage" in name:
+            return rng.uniform(50.0, 100.0) if flagged else rng.uniform(0.0, 50.0)
+        return round(rng.random(), 3)
+    if annotation is int:
+        return 0
+    if annotation is str:
+        return "Flagged by fake provider." if flagged else "Fake provider verdict."
+    return None
+
+
+def _fake_model(model: type[T], input: str, rng: random.Random, rate: float) -> T:
+    """
+    Deterministic instance of a structured-output model.
+    """
+    flagged = rng.random() < rate
+    return model(
+        **{
+            name: _fake_value(name, field.annotation, input, rng, rate, flagged)
+            for name, field in model.model_fields.items()
+        }
+    )
+
+
+def build_provider(spec: dict) -> Provider:
+    """
+    Build a backend from a ``providers.backends`` config entry.
+    """
+    options = dict(spec)
+    kind = options.pop("type", "openai")
+    if kind == "openai":
+        api_key_env = options.pop("api_key_env", None)
+        if api_key_env:
+            options["api_key"] = os.getenv(api_key_env)
+        return OpenAIProvider(**options)
+    if kind == "fake":
+        return FakeProvider(**options)
+    raise ValueError(f"Unknown provider type: {kind}.")
+
+
+_providers: dict[str, Provider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(name: str | None = None) -> Provider:
+    """
+    Get a backend by name, or the configured default.
+    """
+    name = name or get_setting("providers.default", "openai")
+    provider = _providers.get(name)
+    if provider is not None:
+        return provider
+    with _providers_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            spec = get_setting(f"providers.backends.{name}", None)
+            if spec is not None:
+                provider = build_provider(spec)
+            elif name == "openai":
+                provider = OpenAIProvider()
+            else:
+                raise ValueError(f"Unknown provider: {name}.")
+            _providers[name] = provider
+    return provider
+
+
+def configure_provider(name: str, provider: Provider | None) -> None:
+    """
+    Register a backend under a name (None reverts to the configured one).
+    """
+    with _providers_lock:
+        if provider is None:
+            _providers.pop(name, None)
+        else:
+            _providers[name] = provider
+
+
+_api_providers: frozenset[str] | None = None
+
+
+def api_providers() -> frozenset[str]:
+    """
+    Backends that API requests may name: ``providers.api_allowed`` and the
+    default.
+    """
+    if _api_providers is not None:
+        return _api_providers
+    names = get_setting("providers.api_allowed", ["openai"]) or []
+    return frozenset([*names, get_setting("providers.default", "openai")])
+
+
+def configure_api_providers(names: Iterable[str] | None) -> None:
+    """
+    Replace the backends API requests may name (None restores the
+    configured ones).
+    """
+    global _api_providers
+    _api_providers = None if names is None else frozenset(names)
+
+
+class ProviderAllowlistMiddleware:
+    """
+    ASGI middleware rejecting request bodies whose ``LLMSettings.provider``
+    is not in ``api_providers()``, so callers cannot pick test or internal
+    backends. Validation fails as for any other invalid field.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        token = allowed_providers.set(api_providers())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            allowed_providers.reset(token)
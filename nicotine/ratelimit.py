@@ -0,0 +1,623 @@
+"""
+Requests- and tokens-per-minute scheduling of upstream model calls.
+
+Each provider and model gets a budget of requests and tokens per minute,
+refilled continuously like a token bucket. An attempt reserves one request
+and its estimated token cost (input length plus ``max_output_tokens``)
+before it is sent; the difference is refunded once the actual usage is
+known.
+
+Calls that do not fit wait in a priority queue: interactive API calls go
+ahead of bulk scoring jobs, in arrival order within a priority.
+
+Budgets adapt to the provider's own view of the quota: the
+``x-ratelimit-*`` headers of every response set the limits and remaining
+budget, and a 429's ``retry-after`` pauses the model until then. With the
+``sqlite`` store the budgets live in a local database shared by every
+worker process; priorities are honored within each worker. Its updates may
+wait on other processes' transactions, so async callers run them in a
+worker thread.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterator, Mapping, Protocol, TypeVar
+import asyncio
+import heapq
+import itertools
+import re
+import sqlite3
+import threading
+import time
+
+from .config import get_setting, shared_state
+
+R = TypeVar("R")
+
+# Priorities, lower first.
+INTERACTIVE = 0
+BULK = 10
+
+PRIORITIES = {"interactive": INTERACTIVE, "bulk": BULK}
+
+# Rough characters per token of English text, for cost estimates.
+CHARS_PER_TOKEN = 4
+
+# Longest a waiter sleeps before re-checking the shared budget, so budget
+# freed by other workers is noticed.
+MAX_POLL_INTERVAL = 0.25
+
+_priority: ContextVar[int] = ContextVar("_priority", default=INTERACTIVE)
+
+# Budget key of the upstream call in progress, for header observation.
+_current_key: ContextVar[str | None] = ContextVar("_current_key", default=None)
+
+
+@contextmanager
+def request_priority(priority: int | str) -> Iterator[None]:
+    """
+    Schedule upstream calls made inside the block at ``priority``.
+    """
+    if isinstance(priority, str):
+        priority = PRIORITIES[priority]
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    """
+    Priority of upstream calls made in the current context.
+    """
+    return _priority.get()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate token count of a text.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def estimate_cost(input: str, max_output_tokens: int) -> int:
+    """
+    Tokens an upstream call may consume: its input and the output cap.
+    """
+    return estimate_tokens(input) + max_output_tokens
+
+
+class RateLimited(Exception):
+    """
+    The call could not be scheduled within the time allowed.
+    """
+
+    def __init__(self, key: str, wait: float):
+        super().__init__(f"{key} is over its rate limit for another {wait:.1f}s")
+        self.key = key
+        self.wait = wait
+
+
+@dataclass
+class Budget:
+    """
+    Request and token buckets of one provider and model.
+
+    A limit of None is unlimited. Times are wall-clock so budgets can be
+    shared between processes.
+    """
+
+    rpm: float | None = None
+    tpm: float | None = None
+    requests: float = 0.0
+    tokens: float = 0.0
+    updated: float = 0.0
+    paused_until: float = 0.0
+
+    def refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated)
+        if self.rpm is not None:
+            self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        if self.tpm is not None:
+            self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+        self.updated = now
+
+    def take(self, tokens: int, now: float) -> float:
+        """
+        Reserve a request and ``tokens``, or return the seconds to wait.
+
+        A call larger than the whole token budget goes through once the
+        bucket is full, so oversized requests are slowed down, not stuck.
+        """
+        self.refill(now)
+        if self.paused_until > now:
+            return self.paused_until - now
+        wait = 0.0
+        if self.rpm is not None and self.requests < 1:
+            wait = (1 - self.requests) * 60 / self.rpm
+        if self.tpm is not None:
+            needed = min(tokens, self.tpm)
+            if self.tokens < needed:
+                wait = max(wait, (needed - self.tokens) * 60 / self.tpm)
+        if wait > 0:
+            return wait
+        if self.rpm is not None:
+            self.requests -= 1
+        if self.tpm is not None:
+            self.tokens -= tokens
+        return 0.0
+
+    def refund(self, tokens: int, now: float, requests: int = 0) -> None:
+        self.refill(now)
+        if self.rpm is not None:
+            self.requests = min(self.rpm, self.requests + requests)
+        if self.tpm is not None:
+            self.tokens = min(self.tpm, self.tokens + tokens)
+
+
+class BudgetStore(Protocol):
+    """
+    Storage for budgets.
+    """
+
+    blocking: bool  # updates may wait on other processes
+
+    def update(
+        self, key: str, initial: Callable[[], Budget], change: Callable[[Budget], R]
+    ) -> R:
+        """Apply ``change`` to the stored budget atomically and return its result."""
+
+
+class MemoryBudgetStore:
+    """
+    Budgets of a single process.
+    """
+
+    blocking = False
+
+    def __init__(self) -> None:
+        self._budgets: dict[str, Budget] = {}
+        self._lock = threading.Lock()
+
+    def update(
+        self, key: str, initial: Callable[[], Budget], change: Callable[[Budget], R]
+    ) -> R:
+        with self._lock:
+            budget = self._budgets.get(key)
+            if budget is None:
+                budget = self._budgets[key] = initial()
+            return change(budget)
+
+
+class SQLiteBudgetStore:
+    """
+    Budgets shared by every process using the same database file.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS budgets ("
+            "key TEXT PRIMARY KEY, rpm REAL, tpm REAL, requests REAL NOT NULL, "
+            "tokens REAL NOT NULL, updated REAL NOT NULL, paused_until REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def update(
+        self, key: str, initial: Callable[[], Budget], change: Callable[[Budget], R]
+    ) -> R:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT rpm, tpm, requests, tokens, updated, paused_until "
+                    "FROM budgets WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                budget = initial() if row is None else Budget(*row)
+                result = change(budget)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO budgets VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, *asdict(budget).values()),
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: str) -> float | None:
+    """
+    Seconds of a rate-limit reset such as ``"1s"``, ``"6m0s"`` or ``"20ms"``.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _number(headers: Mapping[str, str], name: str) -> float | None:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def response_headers(obj: Any) -> Mapping[str, str] | None:
+    """
+    Headers carried by a provider response or error, if any.
+    """
+    headers = getattr(obj, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(obj, "response", None), "headers", None)
+    return headers if isinstance(headers, Mapping) else None
+
+
+@dataclass
+class _Ticket:
+    priority: int
+    order: int
+    wake: Callable[[], None]
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.order) < (other.priority, other.order)
+
+
+class RateLimiter:
+    """
+    Per-model RPM/TPM scheduler with priorities.
+
+    ``limits`` maps ``provider/model`` keys, or bare model names, to
+    ``{"rpm": ..., "tpm": ...}``; ``default`` applies to anything else.
+    Limits learned from response headers replace the configured ones.
+    """
+
+    def __init__(
+        self,
+        store: BudgetStore | None = None,
+        limits: dict[str, dict[str, float | None]] | None = None,
+        default: dict[str, float | None] | None = None,
+    ):
+        self.store = store or MemoryBudgetStore()
+        self.limits = dict(limits or {})
+        self.default = dict(default or {})
+        self._queues: dict[str, list[_Ticket]] = {}
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def _initial(self, key: str) -> Callable[[], Budget]:
+        model = key.split("/", 1)[-1]
+        limits = self.limits.get(key) or self.limits.get(model) or self.default
+        rpm, tpm = limits.get("rpm"), limits.get("tpm")
+
+        def initial() -> Budget:
+            return Budget(
+                rpm=rpm,
+                tpm=tpm,
+                requests=rpm or 0.0,
+                tokens=tpm or 0.0,
+                updated=time.time(),
+            )
+
+        return initial
+
+    def _take(self, key: str, tokens: int) -> float:
+        return self.store.update(
+            key, self._initial(key), lambda budget: budget.take(tokens, time.time())
+        )
+
+    async def _offload(self, function: Callable[..., R], *args: Any) -> R:
+        """
+        Call ``function``, in a worker thread when the store may block, so
+        waiting on another process does not stall the event loop.
+        """
+        if self.store.blocking:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    def _enqueue(self, key: str, wake: Callable[[], None]) -> _Ticket:
+        ticket = _Ticket(_priority.get(), next(self._order), wake)
+        with self._lock:
+            queue = self._queues.setdefault(key, [])
+            heapq.heappush(queue, ticket)
+        return ticket
+
+    def _is_head(self, key: str, ticket: _Ticket) -> bool:
+        with self._lock:
+            return self._queues[key][0] is ticket
+
+    def _dequeue(self, key: str, ticket: _Ticket) -> None:
+        with self._lock:
+            queue = self._queues[key]
+            queue.remove(ticket)
+            heapq.heapify(queue)
+            if queue:
+                queue[0].wake()
+            else:
+                del self._queues[key]
+
+    def _next_wait(
+        self,
+        key: str,
+        wait: float | None,
+        started: float,
+        max_wait: float | None,
+    ) -> float:
+        """
+        Seconds to wait before the ticket may try again, given what taking
+        from the budget returned (None when the ticket is not at the head
+        of its queue); 0 once reserved.
+        """
+        if wait == 0:
+            return 0.0
+        wait = MAX_POLL_INTERVAL if wait is None else min(wait, MAX_POLL_INTERVAL)
+        if max_wait is not None:
+            left = max_wait - (time.monotonic() - started)
+            if left <= 0:
+                raise RateLimited(key, wait)
+            wait = min(wait, left)
+        return wait
+
+    def acquire(self, key: str, tokens: int, max_wait: float | None = None) -> None:
+        """
+        Block until a request and ``tokens`` are reserved for ``key``.
+
+        Raises ``RateLimited`` if that takes longer than ``max_wait``.
+        """
+        event = threading.Event()
+        ticket = self._enqueue(key, event.set)
+        started = time.monotonic()
+        try:
+            while True:
+                taken = self._take(key, tokens) if self._is_head(key, ticket) else None
+                wait = self._next_wait(key, taken, started, max_wait)
+                if wait == 0:
+                    return
+                event.wait(wait)
+                event.clear()
+        finally:
+            self._dequeue(key, ticket)
+
+    async def aacquire(
+        self, key: str, tokens: int, max_wait: float | None = None
+    ) -> None:
+        """
+        Async ``acquire``.
+        """
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake() -> None:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # The loop has closed.
+                pass
+
+        ticket = self._enqueue(key, wake)
+        started = time.monotonic()
+        try:
+            while True:
+                taken = None
+                if self._is_head(key, ticket):
+                    taken = await self._offload(self._take, key, tokens)
+                wait = self._next_wait(key, taken, started, max_wait)
+                if wait == 0:
+                    return
+                try:
+                    await asyncio.wait_for(event.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        finally:
+            self._dequeue(key, ticket)
+
+    def try_acquire(self, key: str, tokens: int) -> bool:
+        """
+        Reserve without waiting, only when nobody is queued for ``key``.
+        """
+        with self._lock:
+            if self._queues.get(key):
+                return False
+        return self._take(key, tokens) == 0
+
+    async def atry_acquire(self, key: str, tokens: int) -> bool:
+        """
+        Async ``try_acquire``.
+        """
+        with self._lock:
+            if self._queues.get(key):
+                return False
+        return await self._offload(self._take, key, tokens) == 0
+
+    def settle(self, key: str, reserved: int, used: int | None) -> None:
+        """
+        Refund the part of a reservation the call did not use.
+        """
+        if used is None or used >= reserved:
+            return
+        self.store.update(
+            key,
+            self._initial(key),
+            lambda budget: budget.refund(reserved - used, time.time()),
+        )
+
+    async def asettle(self, key: str, reserved: int, used: int | None) -> None:
+        """
+        Async ``settle``.
+        """
+        if used is not None and used < reserved:
+            await self._offload(self.settle, key, reserved, used)
+
+    def release(self, key: str, tokens: int) -> None:
+        """
+        Give back a whole reservation, request included, of a call that was
+        abandoned before it finished.
+        """
+        self.store.update(
+            key,
+            self._initial(key),
+            lambda budget: budget.refund(tokens, time.time(), requests=1),
+        )
+
+    async def arelease(self, key: str, tokens: int) -> None:
+        """
+        Async ``release``.
+        """
+        await self._offload(self.release, key, tokens)
+
+    def observe(self, key: str, headers: Mapping[str, str]) -> None:
+        """
+        Adapt the budget of ``key`` to rate-limit response headers.
+        """
+        headers = {name.lower(): value for name, value in headers.items()}
+        rpm = _number(headers, "x-ratelimit-limit-requests")
+        tpm = _number(headers, "x-ratelimit-limit-tokens")
+        requests = _number(headers, "x-ratelimit-remaining-requests")
+        tokens = _number(headers, "x-ratelimit-remaining-tokens")
+        retry_after = _number(headers, "retry-after-ms")
+        if retry_after is not None:
+            retry_after /= 1000
+        else:
+            value = headers.get("retry-after")
+            retry_after = parse_duration(value) if value else None
+        if not any(v is not None for v in (rpm, tpm, requests, tokens, retry_after)):
+            return
+
+        def adapt(budget: Budget) -> None:
+            now = time.time()
+            budget.refill(now)
+            # A limit seen for the first time starts from what the provider
+            # says is left (or a full bucket), not from the empty unlimited
+            # bucket; a known limit only ever shrinks to the remaining count.
+            if rpm and budget.rpm is None:
+                budget.requests = rpm if requests is None else requests
+            elif requests is not None and budget.rpm is not None:
+                budget.requests = min(budget.requests, requests)
+            if tpm and budget.tpm is None:
+                budget.tokens = tpm if tokens is None else tokens
+            elif tokens is not None and budget.tpm is not None:
+                budget.tokens = min(budget.tokens, tokens)
+            if rpm:
+                budget.rpm = rpm
+                budget.requests = min(budget.requests, rpm)
+            if tpm:
+                budget.tpm = tpm
+                budget.tokens = min(budget.tokens, tpm)
+            if retry_after:
+                budget.paused_until = max(budget.paused_until, now + retry_after)
+
+        self.store.update(key, self._initial(key), adapt)
+
+    async def aobserve(self, key: str, headers: Mapping[str, str]) -> None:
+        """
+        Async ``observe``.
+        """
+        await self._offload(self.observe, key, headers)
+
+
+@contextmanager
+def bind(key: str) -> Iterator[None]:
+    """
+    Attribute headers seen by ``observe_headers`` inside the block to the
+    budget ``key``.
+    """
+    token = _current_key.set(key)
+    try:
+        yield
+    finally:
+        _current_key.reset(token)
+
+
+def observe_headers(headers: Mapping[str, str]) -> None:
+    """
+    Feed the headers of an upstream HTTP response to the rate limiter.
+
+    Installed as a response hook on the OpenAI clients; headers are
+    attributed to the call bound with ``bind``.
+    """
+    key = _current_key.get()
+    limiter = get_rate_limiter()
+    if key is not None and limiter is not None:
+        limiter.observe(key, headers)
+
+
+async def aobserve_headers(headers: Mapping[str, str]) -> None:
+    """
+    Async ``observe_headers``, installed on the async OpenAI clients.
+    """
+    key = _current_key.get()
+    limiter = get_rate_limiter()
+    if key is not None and limiter is not None:
+        await limiter.aobserve(key, headers)
+
+
+_UNSET = object()
+_rate_limiter: "RateLimiter | None | object" = _UNSET
+
+
+def build_rate_limiter() -> RateLimiter | None:
+    """
+    Build the rate limiter described by the ``rate_limits`` config section.
+    """
+    if not get_setting("rate_limits.enabled", True):
+        return None
+    store_name = get_setting("rate_limits.store", "memory")
+    if store_name == "memory" and shared_state():
+        store_name = "sqlite"  # one set of budgets for every worker on the host
+    store: BudgetStore
+    if store_name == "sqlite":
+        store = SQLiteBudgetStore(
+            get_setting("rate_limits.path", ".nicotine/ratelimit.db")
+        )
+    elif store_name == "memory":
+        store = MemoryBudgetStore()
+    else:
+        raise ValueError(f"Unknown rate limit store: {store_name}.")
+    return RateLimiter(
+        store,
+        limits=get_setting("rate_limits.models", {}),
+        default={
+            "rpm": get_setting("rate_limits.rpm", None),
+            "tpm": get_setting("rate_limits.tpm", None),
+        },
+    )
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """
+    Get the process-wide rate limiter, or None when disabled.
+    """
+    global _rate_limiter
+    if _rate_limiter is _UNSET:
+        _rate_limiter = build_rate_limiter()
+    return _rate_limiter  # type: ignore[return-value]
+
+
+def configure_rate_limiter(limiter: RateLimiter | None) -> None:
+    """
+    Replace the process-wide rate limiter (None disables rate limiting).
+    """
+    global _rate_limiter
+    _rate_limiter = limiter
@@ -0,0 +1,418 @@
+"""
+Local reference corpus for claim verification without model calls.
+
+Passages from JSONL or plain-text files are ingested into an on-disk BM25
+inverted index. Postings, document lengths and passage offsets are flat
+arrays that are memory-mapped when the index is opened, so lookups touch
+only the pages they need and the index can be shared between processes.
+
+Index layout (one directory):
+
+    meta.json          passage count, average length, BM25 parameters
+    terms.json         term -> [postings offset, document frequency]
+    postings.docs      uint32 passage ids, grouped by term
+    postings.tfs       uint32 term frequencies, parallel to postings.docs
+    lengths.bin        uint32 token count per passage
+    passages.jsonl     one {"text", "source"} object per passage
+    offsets.bin        uint64 byte offset of each passage line
+"""
+
+from array import array
+from collections import Counter
+from operator import itemgetter
+from pathlib import Path
+from typing import Iterable, Literal
+import argparse
+import asyncio
+import heapq
+import json
+import math
+import mmap
+import re
+import threading
+
+from pydantic import BaseModel
+
+from .config import get_setting
+from .pipeline import Claim, ClaimVerdict, Condensate, PercolationStage
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9]*")
+
+# Terms are never skipped for being common unless their postings list is at
+# least this long.
+MIN_SKIPPED_DF = 1000
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were which with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercase word tokens with stopwords removed.
+    """
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class ReferenceHit(BaseModel):
+    """
+    A passage returned by a reference lookup.
+    """
+
+    passage_id: int
+    score: float
+    text: str
+    source: str | None = None
+
+
+class ReferenceIndexBuilder:
+    """
+    Bulk-ingest passages and write a BM25 index directory.
+
+    Passage text is streamed to disk as it is added; only postings are held
+    in memory (8 bytes per posting) until ``build`` writes them out.
+    """
+
+    def __init__(self, path: str | Path, k1: float = 1.2, b: float = 0.75):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, tuple[array, array]] = {}
+        self._lengths = array("I")
+        self._offsets = array("Q")
+        self._passages = open(self.path / "passages.jsonl", "wb")
+
+    def add(self, text: str, source: str | None = None) -> int:
+        """
+        Add one passage and return its id.
+        """
+        passage_id = len(self._lengths)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("I"))
+            postings[0].append(passage_id)
+            postings[1].append(tf)
+        self._lengths.append(sum(counts.values()))
+        self._offsets.append(self._passages.tell())
+        line = json.dumps({"text": text, "source": source}, ensure_ascii=False)
+        self._passages.write(line.encode("utf-8") + b"\n")
+        return passage_id
+
+    def add_many(self, passages: Iterable[str], source: str | None = None) -> int:
+        """
+        Add passages from an iterable and return how many were added.
+        """
+        added = 0
+        for text in passages:
+            self.add(text, source)
+            added += 1
+        return added
+
+    def add_jsonl(self, path: str | Path, text_field: str = "text") -> int:
+        """
+        Add one passage per JSONL record, read from ``text_field``.
+        """
+        added = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                text = record.get(text_field)
+                if text:
+                    self.add(text, record.get("source") or str(path))
+                    added += 1
+        return added
+
+    def add_text(self, path: str | Path) -> int:
+        """
+        Add a plain-text file, one passage per blank-line separated paragraph.
+        """
+        with open(path, encoding="utf-8") as f:
+            paragraphs = (" ".join(p.split()) for p in f.read().split("\n\n"))
+            return self.add_many((p for p in paragraphs if p), source=str(path))
+
+    def add_file(self, path: str | Path) -> int:
+        """
+        Add a ``.jsonl`` or plain-text file.
+        """
+        if str(path).endswith(".jsonl"):
+            return self.add_jsonl(path)
+        return self.add_text(path)
+
+    def build(self) -> "ReferenceIndex":
+        """
+        Write postings and metadata, then open the finished index.
+        """
+        self._passages.close()
+        terms: dict[str, list[int]] = {}
+        offset = 0
+        with open(self.path / "postings.docs", "wb") as docs_file, open(
+            self.path / "postings.tfs", "wb"
+        ) as tfs_file:
+            for term in sorted(self._postings):
+                docs, tfs = self._postings[term]
+                docs.tofile(docs_file)
+                tfs.tofile(tfs_file)
+                terms[term] = [offset, len(docs)]
+                offset += len(docs)
+        with open(self.path / "lengths.bin", "wb") as f:
+            self._lengths.tofile(f)
+        with open(self.path / "offsets.bin", "wb") as f:
+            self._offsets.tofile(f)
+        with open(self.path / "terms.json", "w", encoding="utf-8") as f:
+            json.dump(terms, f, separators=(",", ":"))
+        passages = len(self._lengths)
+        with open(self.path / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "passages": passages,
+                    "postings": offset,
+                    "avg_length": sum(self._lengths) / passages if passages else 0.0,
+                    "k1": self.k1,
+                    "b": self.b,
+                },
+                f,
+            )
+        self._postings.clear()
+        return ReferenceIndex(self.path)
+
+
+def _mapped_array(path: Path, typecode: Literal["I", "Q"]) -> memoryview:
+    """
+    Memory-map a flat binary array file read-only.
+    """
+    if path.stat().st_size == 0:
+        return memoryview(array(typecode))
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast(typecode)
+
+
+class ReferenceIndex:
+    """
+    Read-only BM25 index over a memory-mapped reference corpus.
+    """
+
+    def __init__(self, path: str | Path, max_df_ratio: float = 0.05):
+        self.path = Path(path)
+        self.max_df_ratio = max_df_ratio
+        with open(self.path / "meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(self.path / "terms.json", encoding="utf-8") as f:
+            self._terms: dict[str, list[int]] = json.load(f)
+        self.passages = meta["passages"]
+        self.avg_length = meta["avg_length"] or 1.0
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self._docs = _mapped_array(self.path / "postings.docs", "I")
+        self._tfs = _mapped_array(self.path / "postings.tfs", "I")
+        self._lengths = _mapped_array(self.path / "lengths.bin", "I")
+        self._offsets = _mapped_array(self.path / "offsets.bin", "Q")
+        self._passages_file = open(self.path / "passages.jsonl", "rb")
+        self._passages_lock = threading.Lock()  # searches may run in threads
+
+    def __len__(self) -> int:
+        return self.passages
+
+    def passage(self, passage_id: int) -> tuple[str, str | None]:
+        """
+        Read the text and source of a passage.
+        """
+        with self._passages_lock:
+            self._passages_file.seek(self._offsets[passage_id])
+            line = self._passages_file.readline()
+        record = json.loads(line)
+        return record["text"], record.get("source")
+
+    def search(self, query: str, k: int = 5) -> list[ReferenceHit]:
+        """
+        Return the ``k`` best BM25 matches for a query.
+
+        Terms that occur in more than ``max_df_ratio`` of passages carry
+        almost no signal and are skipped to bound query cost (small corpora
+        always score every term).
+        """
+        scores: dict[int, float] = {}
+        max_df = max(MIN_SKIPPED_DF, int(self.passages * self.max_df_ratio))
+        for term in set(tokenize(query)):
+            entry = self._terms.get(term)
+            if entry is None:
+                continue
+            start, df = entry
+            if df > max_df:
+                continue
+            idf = math.log(1 + (self.passages - df + 0.5) / (df + 0.5))
+            k1 = self.k1
+            norm = k1 * (1 - self.b)
+            scale = k1 * self.b / self.avg_length
+            lengths = self._lengths
+            end = start + df
+            docs = self._docs[start:end]
+            tfs = self._tfs[start:end]
+            for doc, tf in zip(docs, tfs):
+                score = idf * tf * (k1 + 1) / (tf + norm + scale * lengths[doc])
+                scores[doc] = scores.get(doc, 0.0) + score
+        best = heapq.nlargest(k, scores.items(), key=itemgetter(1))
+        hits = []
+        for passage_id, score in best:
+            text, source = self.passage(passage_id)
+            hits.append(
+                ReferenceHit(
+                    passage_id=passage_id, score=score, text=text, source=source
+                )
+            )
+        return hits
+
+    def close(self) -> None:
+        self._passages_file.close()
+
+
+def entities(text: str) -> set[str]:
+    """
+    Lowercased capitalized words of a text, its first word excepted.
+    """
+    words = _WORD.findall(text)[1:]
+    return {w.lower() for w in words if w[0].isupper() and w.lower() not in STOPWORDS}
+
+
+def _common_subsequence(claim: list[str], passage: list[str]) -> int:
+    """
+    Length of the longest common subsequence of two token lists.
+    """
+    row = [0] * (len(claim) + 1)
+    for token in passage:
+        diagonal = 0
+        for i, term in enumerate(claim, 1):
+            above = row[i]
+            if term == token:
+                row[i] = diagonal + 1
+            elif row[i - 1] > above:
+                row[i] = row[i - 1]
+            diagonal = above
+    return row[-1]
+
+
+def claim_coverage(claim: str, passage: str) -> float:
+    """
+    Share of a claim's content tokens that a passage contains in the same
+    order.
+
+    Bag-of-words overlap would confirm claims whose entities swap roles
+    ("France is the capital of Paris"), so tokens only count when they form
+    a common subsequence with the passage. Any number or named entity of
+    the claim that is missing from the passage drops coverage to zero, since
+    a single wrong figure or name is the most common hallucination.
+    """
+    if set(_NUMBER.findall(claim)) - set(_NUMBER.findall(passage)):
+        return 0.0
+    passage_tokens = tokenize(passage)
+    if entities(claim) - set(passage_tokens):
+        return 0.0
+    claim_tokens = tokenize(claim)
+    if not claim_tokens:
+        return 0.0
+    return _common_subsequence(claim_tokens, passage_tokens) / len(claim_tokens)
+
+
+class ReferencePercolation:
+    """
+    Verify claims against the local corpus first.
+
+    A claim is resolved locally when a top passage covers at least
+    ``min_coverage`` of its content tokens, in order and with every number
+    and named entity present. Lexical overlap can confirm a claim but cannot
+    refute one, so everything else goes to ``fallback``. Index lookups run
+    in a worker thread to keep the event loop free.
+    """
+
+    name = "percolation"
+
+    def __init__(
+        self,
+        index: ReferenceIndex,
+        fallback: PercolationStage | None = None,
+        min_coverage: float = 0.9,
+        top_k: int = 3,
+    ):
+        self.index = index
+        self.fallback = fallback
+        self.min_coverage = min_coverage
+        self.top_k = top_k
+        self.resolved = 0
+        self.escalated = 0
+
+    @property
+    def model(self) -> str | None:
+        return getattr(self.fallback, "model", None)
+
+    async def verify(self, claim: Claim, condensate: Condensate) -> ClaimVerdict:
+        hits = await asyncio.to_thread(self.index.search, claim.text, self.top_k)
+        for hit in hits:
+            coverage = claim_coverage(claim.text, hit.text)
+            if coverage >= self.min_coverage:
+                self.resolved += 1
+                rationale = f"Matches reference passage {hit.passage_id}"
+                if hit.source:
+                    rationale += f" ({hit.source})"
+                return ClaimVerdict(
+                    claim=claim,
+                    supported=True,
+                    confidence=coverage,
+                    rationale=rationale,
+                    source="reference",
+                )
+        self.escalated += 1
+        if self.fallback is None:
+            return ClaimVerdict(
+                claim=claim,
+                supported=True,
+                confidence=0.0,
+                rationale="No matching reference passage",
+                source="reference",
+                error="unresolved by reference corpus",
+            )
+        return await self.fallback.verify(claim, condensate)
+
+
+def open_configured_index() -> ReferenceIndex | None:
+    """
+    Open the index named by ``references.index_path``, if any.
+    """
+    path = get_setting("references.index_path")
+    return ReferenceIndex(path) if path else None
+
+
+def build_index(path: str | Path, files: Iterable[str | Path]) -> ReferenceIndex:
+    """
+    Build an index directory from JSONL and plain-text files.
+    """
+    builder = ReferenceIndexBuilder(path)
+    for file in files:
+        builder.add_file(file)
+    return builder.build()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nicotine reference corpus")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Build an index from files")
+    build_parser.add_argument("index")
+    build_parser.add_argument("files", nargs="+")
+    search_parser = commands.add_parser("search", help="Query an index")
+    search_parser.add_argument("index")
+    search_parser.add_argument("query")
+    search_parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+    if args.command == "build":
+        index = build_index(args.index, args.files)
+        print(f"Indexed {len(index)} passages into {args.index}.")
+    else:
+        for hit in ReferenceIndex(args.index).search(args.query, args.k):
+            print(f"{hit.score:8.3f}  [{hit.passage_id}] {hit.text}")
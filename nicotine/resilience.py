@@ -0,0 +1,639 @@
+"""
+Call policy for upstream model calls.
+
+Every call made through ``call_upstream``/``acall_upstream`` gets:
+
+- a per-attempt timeout (``openai.timeout``), capped by the caller's
+  deadline; the API sets one per request from ``X-Request-Timeout``
+- bounded retries of transient failures (timeouts, connection errors, 429
+  and 5xx) with full-jitter exponential backoff (``openai.max_retries``)
+- a circuit breaker per provider and model that fails fast while the
+  upstream keeps failing, then lets a probe through after a cool-down
+- optionally, a hedged second attempt once the first has been outstanding
+  longer than the recent p95 latency (async calls only)
+- a reservation of the model's request and token budget before every
+  attempt (see ``nicotine.ratelimit``)
+
+Failures are raised as ``UpstreamError`` subclasses whose message starts
+with the outcome (``timeout``, ``retries_exhausted``, ``circuit_open``,
+``deadline_exceeded``), so ``HallucinationEvaluation.error`` says why a
+verdict is missing instead of looking like a clean pass.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+import asyncio
+import random
+import sys
+import threading
+import time
+
+from .config import get_setting
+from .metrics import count_attempt, record_usage, track_upstream
+from .providers import ProviderError, get_provider
+from .ratelimit import (
+    RateLimited,
+    RateLimiter,
+    bind,
+    estimate_cost,
+    get_rate_limiter,
+    response_headers,
+)
+from .tracing import add_event, span
+
+# Status codes worth retrying: rate limiting and server-side failures.
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Timeout exceptions; ``asyncio.wait_for`` raises its own before Python 3.11.
+TIMEOUT_ERRORS = (TimeoutError, asyncio.TimeoutError)
+
+# Successful latencies kept per provider and model to derive hedge delays.
+LATENCY_WINDOW = 500
+
+# Absolute ``time.monotonic()`` by which the current request must finish.
+_deadline: ContextVar[float | None] = ContextVar("_deadline", default=None)
+
+
+class UpstreamError(Exception):
+    """
+    Upstream call failure, prefixed with its outcome.
+    """
+
+    outcome = "upstream_error"
+
+    def __init__(self, message: str):
+        super().__init__(f"{self.outcome}: {message}")
+
+
+class UpstreamTimeout(UpstreamError):
+    outcome = "timeout"
+
+
+class RetriesExhausted(UpstreamError):
+    outcome = "retries_exhausted"
+
+
+class CircuitOpen(UpstreamError):
+    outcome = "circuit_open"
+
+
+class DeadlineExceeded(UpstreamError):
+    outcome = "deadline_exceeded"
+
+
+@contextmanager
+def deadline(seconds: float | None) -> Iterator[None]:
+    """
+    Bound every upstream call made inside the block to ``seconds`` from now.
+
+    Nested deadlines never extend an outer one.
+    """
+    if seconds is None:
+        yield
+        return
+    current = _deadline.get()
+    target = time.monotonic() + seconds
+    token = _deadline.set(target if current is None else min(current, target))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> float | None:
+    """
+    Seconds left before the current deadline, or None without one.
+    """
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a failure is transient and worth another attempt.
+    """
+    if isinstance(error, (*TIMEOUT_ERRORS, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if isinstance(error, ProviderError) or isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(error, openai.APIConnectionError)
+
+
+def _used_tokens(outcome: Any) -> int | None:
+    """
+    Tokens an upstream response reports using, if it says.
+    """
+    usage = getattr(outcome, "usage", None)
+    input_tokens = getattr(usage, "input_tokens", None)
+    output_tokens = getattr(usage, "output_tokens", None)
+    if isinstance(input_tokens, int) and isinstance(output_tokens, int):
+        return input_tokens + output_tokens
+    return None
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` transient failures in a row the circuit
+    opens and calls fail fast for ``reset_timeout`` seconds. Then one probe
+    is let through: success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> float | None:
+        """
+        Admit a call, or return the seconds left before the next probe.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return None
+            wait = self.opened_at + self.reset_timeout - time.monotonic()
+            if wait > 0:
+                return wait
+            if self._probing:
+                return self.reset_timeout
+            self._probing = True
+            return None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def abandon(self) -> None:
+        """
+        Release the probe slot of a call that ended without reaching the
+        upstream or hearing back from it (cancelled, or out of time).
+        """
+        with self._lock:
+            self._probing = False
+
+
+class LatencyTracker:
+    """
+    Recent successful latencies, for hedge delays.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples: deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CallPolicy:
+    """
+    Timeouts, retries, circuit breaking and hedging for upstream calls.
+    """
+
+    def __init__(
+        self,
+        timeout: float | None = 30.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        backoff_max: float = 8.0,
+        breaker_threshold: int | None = 5,
+        breaker_reset: float = 30.0,
+        hedge_quantile: float | None = None,
+        hedge_min_samples: int = 20,
+    ):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.latencies: dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, key: str) -> CircuitBreaker | None:
+        if self.breaker_threshold is None:
+            return None
+        with self._lock:
+            breaker = self.breakers.get(key)
+            if breaker is None:
+                breaker = self.breakers[key] = CircuitBreaker(
+                    self.breaker_threshold, self.breaker_reset
+                )
+            return breaker
+
+    def tracker(self, key: str) -> LatencyTracker:
+        with self._lock:
+            tracker = self.latencies.get(key)
+            if tracker is None:
+                tracker = self.latencies[key] = LatencyTracker()
+            return tracker
+
+    def hedge_delay(self, key: str) -> float | None:
+        """
+        Seconds to wait before hedging, once enough latencies are known.
+        """
+        if self.hedge_quantile is None:
+            return None
+        tracker = self.tracker(key)
+        if len(tracker.samples) < self.hedge_min_samples:
+            return None
+        return tracker.quantile(self.hedge_quantile)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Full-jitter exponential backoff before retry number ``attempt``.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2**attempt))
+
+    def attempt_timeout(self) -> float | None:
+        """
+        Timeout of the next attempt: the policy timeout capped by the deadline.
+        """
+        left = remaining_time()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded("request deadline passed before the call")
+        if left is None:
+            return self.timeout
+        return left if self.timeout is None else min(self.timeout, left)
+
+    def _admit(self, key: str) -> CircuitBreaker | None:
+        breaker = self.breaker(key)
+        if breaker is not None:
+            wait = breaker.allow()
+            if wait is not None:
+                raise CircuitOpen(f"{key} is failing, retrying in {wait:.1f}s")
+        return breaker
+
+    @staticmethod
+    def _abandon(breaker: CircuitBreaker | None) -> None:
+        """
+        Give back the probe slot of an attempt that never got an outcome, so
+        a half-open circuit admits the next call.
+        """
+        if breaker is not None:
+            breaker.abandon()
+
+    def _settle(
+        self, key: str, breaker: CircuitBreaker | None, error: BaseException | None
+    ) -> None:
+        """
+        Report an attempt to the breaker. Only transient failures count
+        against the upstream; anything else proves it is answering.
+        """
+        if breaker is None:
+            return
+        if error is not None and is_retryable(error):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    def _give_up(self, error: BaseException, attempts: int) -> UpstreamError:
+        """
+        Final error once no attempt is left.
+        """
+        left = remaining_time()
+        if left is not None and left <= 0:
+            return DeadlineExceeded("no response before the request deadline")
+        if isinstance(error, TIMEOUT_ERRORS) and attempts == 1:
+            return UpstreamTimeout(f"no response within {self.timeout}s")
+        message = f"{type(error).__name__}: {error}".rstrip(": ")
+        if attempts == 1:
+            return UpstreamError(message)
+        return RetriesExhausted(f"{message} (after {attempts} attempts)")
+
+    def _sleep_time(self, attempt: int, error: BaseException) -> float:
+        """
+        Backoff before the next retry; raise when it would pass the deadline.
+        """
+        pause = self.backoff_delay(attempt)
+        left = remaining_time()
+        if left is not None and left <= pause:
+            raise DeadlineExceeded(
+                f"{type(error).__name__}: {error} (no time left to retry)"
+            )
+        return pause
+
+    @staticmethod
+    def _cost(kwargs: dict) -> int:
+        input = (kwargs.get("instructions") or "") + kwargs["input"]
+        return estimate_cost(input, kwargs.get("max_output_tokens", 0))
+
+    def _reserve(self, key: str, cost: int) -> RateLimiter | None:
+        """
+        Wait for the rate limiter, within the deadline.
+        """
+        limiter = get_rate_limiter()
+        if limiter is not None:
+            try:
+                with span("ratelimit.wait", tokens=cost):
+                    limiter.acquire(key, cost, remaining_time())
+            except RateLimited as e:
+                raise DeadlineExceeded(str(e)) from e
+        return limiter
+
+    async def _areserve(self, key: str, cost: int) -> RateLimiter | None:
+        limiter = get_rate_limiter()
+        if limiter is not None:
+            try:
+                with span("ratelimit.wait", tokens=cost):
+                    await limiter.aacquire(key, cost, remaining_time())
+            except RateLimited as e:
+                raise DeadlineExceeded(str(e)) from e
+        return limiter
+
+    @staticmethod
+    def _account(
+        limiter: RateLimiter | None, key: str, cost: int, outcome: Any
+    ) -> None:
+        """
+        Feed an attempt's rate-limit headers and actual usage to the limiter.
+        """
+        if limiter is None:
+            return
+        headers = response_headers(outcome)
+        if headers:
+            limiter.observe(key, headers)
+        limiter.settle(key, cost, _used_tokens(outcome))
+
+    @staticmethod
+    async def _aaccount(
+        limiter: RateLimiter | None, key: str, cost: int, outcome: Any
+    ) -> None:
+        """
+        Async ``_account``.
+        """
+        if limiter is None:
+            return
+        headers = response_headers(outcome)
+        if headers:
+            await limiter.aobserve(key, headers)
+        await limiter.asettle(key, cost, _used_tokens(outcome))
+
+    def call(self, provider: str, **kwargs) -> Any:
+        """
+        Blocking upstream call under the policy.
+        """
+        key = f"{provider}/{kwargs['model']}"
+        backend = get_provider(provider)
+        cost = self._cost(kwargs)
+        attempt = 0
+        while True:
+            breaker = self._admit(key)
+            try:
+                limiter = self._reserve(key, cost)
+                timeout = self.attempt_timeout()
+            except BaseException:
+                self._abandon(breaker)
+                raise
+            count_attempt()
+            start = time.monotonic()
+            try:
+                with bind(key), span("upstream.attempt", attempt=attempt):
+                    response = backend.parse(timeout=timeout, **kwargs)
+            except Exception as e:
+                self._account(limiter, key, cost, e)
+                self._settle(key, breaker, e)
+                if not is_retryable(e):
+                    raise
+                if attempt >= self.max_retries:
+                    raise self._give_up(e, attempt + 1) from e
+                pause = self._sleep_time(attempt, e)
+                with span("retry.backoff", seconds=pause):
+                    time.sleep(pause)
+                attempt += 1
+                continue
+            except BaseException:  # interrupted
+                self._abandon(breaker)
+                raise
+            self._account(limiter, key, cost, response)
+            self._settle(key, breaker, None)
+            self.tracker(key).add(time.monotonic() - start)
+            return response
+
+    async def acall(self, provider: str, **kwargs) -> Any:
+        """
+        Async upstream call under the policy.
+        """
+        key = f"{provider}/{kwargs['model']}"
+        backend = get_provider(provider)
+        cost = self._cost(kwargs)
+        attempt = 0
+        while True:
+            breaker = self._admit(key)
+            try:
+                limiter = await self._areserve(key, cost)
+                timeout = self.attempt_timeout()
+            except BaseException:
+                self._abandon(breaker)
+                raise
+            try:
+                with span("upstream.attempt", attempt=attempt):
+                    response = await asyncio.wait_for(
+                        self._hedged(key, backend, kwargs, limiter, cost), timeout
+                    )
+            except Exception as e:
+                self._settle(key, breaker, e)
+                if not is_retryable(e):
+                    raise
+                if attempt >= self.max_retries:
+                    raise self._give_up(e, attempt + 1) from e
+                pause = self._sleep_time(attempt, e)
+                with span("retry.backoff", seconds=pause):
+                    await asyncio.sleep(pause)
+                attempt += 1
+                continue
+            except BaseException:  # cancelled
+                self._abandon(breaker)
+                raise
+            self._settle(key, breaker, None)
+            return response
+
+    async def _hedged(
+        self,
+        key: str,
+        backend: Any,
+        kwargs: dict,
+        limiter: RateLimiter | None,
+        cost: int,
+    ) -> Any:
+        """
+        One attempt, hedged with a second call if the first is slow and the
+        rate limit has room for it.
+        """
+
+        async def attempt() -> Any:
+            count_attempt()
+            start = time.monotonic()
+            try:
+                with bind(key):
+                    response = await backend.aparse(**kwargs)
+            except Exception as e:
+                await self._aaccount(limiter, key, cost, e)
+                raise
+            await self._aaccount(limiter, key, cost, response)
+            self.tracker(key).add(time.monotonic() - start)
+            return response
+
+        delay = self.hedge_delay(key)
+        if delay is None:
+            return await attempt()
+        tasks = [asyncio.ensure_future(attempt())]
+        answered = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and (limiter is None or await limiter.atry_acquire(key, cost)):
+                add_event("hedge", delay=delay)
+                tasks.append(asyncio.ensure_future(attempt()))
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        answered = True
+                        return task.result()
+                if not pending:
+                    raise done.pop().exception()  # type: ignore[misc]
+        finally:
+            losers = [task for task in tasks if not task.done()]
+            for task in losers:
+                task.cancel()
+            # The call that lost the race is never accounted; give its
+            # reservation back so a hedged call is charged once.
+            if answered and limiter is not None:
+                for _ in losers:
+                    await limiter.arelease(key, cost)
+
+
+_UNSET = object()
+_call_policy: "CallPolicy | object" = _UNSET
+
+
+def build_call_policy() -> CallPolicy:
+    """
+    Build the call policy described by the ``openai`` config section.
+    """
+    timeout = get_setting("openai.timeout", 30)
+    breaker = get_setting("openai.circuit_breaker.enabled", True)
+    hedging = get_setting("openai.hedging.enabled", False)
+    return CallPolicy(
+        timeout=float(timeout) if timeout else None,
+        max_retries=int(get_setting("openai.max_retries", 3)),
+        backoff=float(get_setting("openai.retry_backoff", 0.5)),
+        backoff_max=float(get_setting("openai.retry_backoff_max", 8.0)),
+        breaker_threshold=(
+            int(get_setting("openai.circuit_breaker.failure_threshold", 5))
+            if breaker
+            else None
+        ),
+        breaker_reset=float(get_setting("openai.circuit_breaker.reset_timeout", 30)),
+        hedge_quantile=(
+            float(get_setting("openai.hedging.quantile", 0.95)) if hedging else None
+        ),
+        hedge_min_samples=int(get_setting("openai.hedging.min_samples", 20)),
+    )
+
+
+def get_call_policy() -> CallPolicy:
+    """
+    Get the process-wide call policy.
+    """
+    global _call_policy
+    if _call_policy is _UNSET:
+        _call_policy = build_call_policy()
+    return _call_policy  # type: ignore[return-value]
+
+
+def configure_call_policy(policy: CallPolicy | None) -> None:
+    """
+    Replace the process-wide call policy (None rebuilds it from config).
+    """
+    global _call_policy
+    _call_policy = _UNSET if policy is None else policy
+
+
+def _provider_name(provider: str | None) -> str:
+    return provider or get_setting("providers.default", "openai")
+
+
+def call_upstream(provider: str | None, **kwargs) -> Any:
+    """
+    Blocking structured-output call through the call policy, with metrics.
+    """
+    model = kwargs["model"]
+    name = _provider_name(provider)
+    with span("upstream", provider=name, model=model), track_upstream(model):
+        response = get_call_policy().call(name, **kwargs)
+    record_usage(model, response)
+    return response
+
+
+async def acall_upstream(provider: str | None, **kwargs) -> Any:
+    """
+    Async structured-output call through the call policy, with metrics.
+    """
+    model = kwargs["model"]
+    name = _provider_name(provider)
+    with span("upstream", provider=name, model=model), track_upstream(model):
+        response = await get_call_policy().acall(name, **kwargs)
+    record_usage(model, response)
+    return response
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware applying an ``X-Request-Timeout`` header (seconds) as
+    the deadline of every upstream call made for the request.
+    """
+
+    header = b"x-request-timeout"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        seconds = None
+        if scope["type"] == "http":
+            for name, value in scope.get("headers", ()):
+                if name == self.header:
+                    try:
+                        seconds = float(value)
+                    except ValueError:
+                        pass
+                    break
+        with deadline(seconds):
+            await self.app(scope, receive, send)
@@ -0,0 +1,505 @@
+"""
+Offline bulk scoring of logged LLM outputs.
+
+``score_files`` streams ``LLMOutput`` records from JSONL or Parquet files,
+runs them through the detector with bounded concurrency and appends one
+``ScoredEvaluation`` per record, in input order, to a JSONL file. Progress
+is checkpointed next to the output, so an interrupted run resumes after the
+last written record instead of paying for it again. Records whose detection
+failed are checkpointed too; ``--retry-errors`` scores them again once the
+run is complete.
+
+With ``workers`` above one the records are sharded round-robin across
+processes, each scoring into its own part file with its own checkpoint;
+the parts are interleaved back into the output once every shard finishes.
+
+Run it through the CLI::
+
+    nico score logs/*.jsonl -o scores.jsonl --concurrency 32 --workers 4
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+
+from pydantic import BaseModel, ValidationError
+
+from .models import HallucinationEvaluation, LLMOutput
+from .ratelimit import BULK, request_priority
+from .system import DEFAULT_BATCH_CONCURRENCY, async_detect_hallucination
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None  # Parquet input is optional
+
+# Records written between two checkpoints.
+DEFAULT_CHECKPOINT_EVERY = 1000
+
+# Seconds between two progress reports.
+DEFAULT_PROGRESS_INTERVAL = 5.0
+
+# Rows read from a Parquet file at a time.
+PARQUET_BATCH_SIZE = 1024
+
+# Rough characters-per-token ratio used for throughput reporting.
+CHARS_PER_TOKEN = 4
+
+# Rationale of records that are not valid ``LLMOutput``s; retrying them is
+# pointless.
+INVALID_RECORD = "Invalid LLMOutput record"
+
+
+class ScoredEvaluation(HallucinationEvaluation):
+    """
+    Evaluation tagged with the position and id of its input record.
+    """
+
+    record: int
+    id: str | None
+
+
+class Checkpoint(BaseModel):
+    """
+    Resume point of a scoring run.
+
+    ``records`` results have been written to the output, whose first
+    ``offset`` bytes are complete. ``start`` and ``shard`` identify which
+    records a worker owns.
+    """
+
+    inputs: list[str]
+    start: int = 0
+    shard: tuple[int, int] = (0, 1)
+    records: int = 0
+    offset: int = 0
+
+
+class ScoreStats(BaseModel):
+    """
+    Counters and throughput of a scoring run.
+    """
+
+    records: int = 0
+    resumed: int = 0
+    errors: int = 0
+    retried: int = 0
+    recovered: int = 0
+    tokens: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def records_per_sec(self) -> float:
+        return self.records / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def tokens_per_sec(self) -> float:
+        return self.tokens / self.elapsed if self.elapsed else 0.0
+
+
+def estimate_tokens(output: LLMOutput) -> int:
+    """
+    Approximate token count of a record's prompt and output.
+    """
+    return (len(output.prompt) + len(output.output)) // CHARS_PER_TOKEN
+
+
+def iter_records(paths: Iterable[str | Path]) -> Iterator[bytes | dict]:
+    """
+    Stream raw records from JSONL and Parquet files, in order.
+
+    JSONL records are yielded as undecoded lines, Parquet rows as dicts.
+    """
+    for path in map(Path, paths):
+        if path.suffix == ".parquet":
+            if pq is None:
+                raise ImportError("Reading Parquet files requires pyarrow.")
+            for batch in pq.ParquetFile(path).iter_batches(PARQUET_BATCH_SIZE):
+                yield from batch.to_pylist()
+        else:
+            with open(path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        yield line
+
+
+def checkpoint_path(output: str | Path) -> Path:
+    """
+    Path of the checkpoint kept next to an output file.
+    """
+    return Path(f"{output}.checkpoint.json")
+
+
+def _read_checkpoint(path: Path) -> Checkpoint | None:
+    if not path.exists():
+        return None
+    return Checkpoint.model_validate_json(path.read_text())
+
+
+def _write_checkpoint(path: Path, checkpoint: Checkpoint) -> None:
+    """
+    Replace a checkpoint atomically.
+    """
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(checkpoint.model_dump_json())
+    os.replace(tmp, path)
+
+
+def _resume(output: Path, expected: Checkpoint, resume: bool) -> Checkpoint:
+    """
+    Load the checkpoint of ``output`` and truncate it to the last complete
+    record, or start over when resuming is disabled or nothing was written.
+    """
+    checkpoint = _read_checkpoint(checkpoint_path(output)) if resume else None
+    if checkpoint is None:
+        checkpoint = expected
+    elif checkpoint.model_dump(include={"inputs", "start", "shard"}) != (
+        expected.model_dump(include={"inputs", "start", "shard"})
+    ):
+        raise ValueError(
+            f"{checkpoint_path(output)} belongs to a different run; "
+            "pass --no-resume to start over."
+        )
+    with open(output, "ab") as f:
+        f.truncate(checkpoint.offset)
+    return checkpoint
+
+
+async def _score_record(index: int, raw: bytes | dict) -> tuple[ScoredEvaluation, int]:
+    """
+    Parse one record and detect hallucinations in it.
+    """
+    try:
+        if isinstance(raw, dict):
+            output = LLMOutput.model_validate(raw)
+        else:
+            output = LLMOutput.model_validate_json(raw)
+    except ValidationError as e:
+        return (
+            ScoredEvaluation(
+                record=index,
+                id=None,
+                is_hallucination=False,
+                rationale=INVALID_RECORD,
+                delusion_percentage=0.0,
+                error=str(e),
+            ),
+            0,
+        )
+    with request_priority(BULK):
+        evaluation = await async_detect_hallucination(output)
+    scored = ScoredEvaluation(record=index, id=output.id, **evaluation.model_dump())
+    return scored, estimate_tokens(output)
+
+
+async def _score_shard(
+    inputs: list[str],
+    output: Path,
+    start: int = 0,
+    shard: tuple[int, int] = (0, 1),
+    concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+    resume: bool = True,
+    on_progress: Callable[[ScoreStats], Any] | None = None,
+    progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+) -> ScoreStats:
+    """
+    Score the records owned by one shard into ``output``.
+
+    A shard ``(k, n)`` owns the records at positions ``start + k``,
+    ``start + k + n``, ... Results are written in input order; up to
+    ``concurrency`` detections run at once while earlier ones finish.
+    """
+    checkpoint = _resume(
+        output, Checkpoint(inputs=inputs, start=start, shard=shard), resume
+    )
+    stats = ScoreStats(resumed=checkpoint.records)
+    began = last_report = time.monotonic()
+    k, n = shard
+
+    def owned() -> Iterator[tuple[int, bytes | dict]]:
+        seen = 0
+        for index, raw in enumerate(iter_records(inputs)):
+            if index < start or (index - start) % n != k:
+                continue
+            seen += 1
+            if seen > checkpoint.records:
+                yield index, raw
+
+    pending: deque[asyncio.Task] = deque()
+    with open(output, "ab") as f:
+
+        def save() -> None:
+            f.flush()
+            os.fsync(f.fileno())
+            checkpoint.offset = f.tell()
+            _write_checkpoint(checkpoint_path(output), checkpoint)
+
+        async def write_next() -> None:
+            nonlocal last_report
+            scored, tokens = await pending.popleft()
+            f.write(scored.model_dump_json().encode() + b"\n")
+            checkpoint.records += 1
+            stats.records += 1
+            stats.tokens += tokens
+            stats.errors += scored.error is not None
+            if stats.records % checkpoint_every == 0:
+                save()
+            now = time.monotonic()
+            stats.elapsed = now - began
+            if on_progress is not None and now - last_report >= progress_interval:
+                last_report = now
+                on_progress(stats)
+
+        try:
+            for index, raw in owned():
+                if len(pending) >= concurrency:
+                    await write_next()
+                pending.append(asyncio.create_task(_score_record(index, raw)))
+            while pending:
+                await write_next()
+        finally:
+            for task in pending:
+                task.cancel()
+            save()
+    stats.elapsed = time.monotonic() - began
+    return stats
+
+
+def _score_shard_sync(*args, **kwargs) -> ScoreStats:
+    """
+    Process-pool entry point for ``_score_shard``.
+    """
+    return asyncio.run(_score_shard(*args, **kwargs))
+
+
+def _part_path(output: Path, shard: int) -> Path:
+    return Path(f"{output}.part{shard}")
+
+
+def _merge_parts(output: Path, parts: list[Path], checkpoint: Checkpoint) -> None:
+    """
+    Interleave shard outputs back into input order and append them.
+    """
+    files = [open(part, "rb") for part in parts]
+    try:
+        with open(output, "ab") as out:
+            live = list(files)
+            while live:
+                for f in list(live):
+                    line = f.readline()
+                    if not line:
+                        live.remove(f)
+                        continue
+                    out.write(line)
+                    checkpoint.records += 1
+            out.flush()
+            os.fsync(out.fileno())
+            checkpoint.offset = out.tell()
+    finally:
+        for f in files:
+            f.close()
+    _write_checkpoint(checkpoint_path(output), checkpoint)
+    for part in parts:
+        part.unlink()
+        checkpoint_path(part).unlink(missing_ok=True)
+
+
+def _discard_merged_parts(parts: list[Path], checkpoint: Checkpoint) -> None:
+    """
+    Remove parts left behind by a run that stopped after merging them.
+
+    The output checkpoint only moves past a sharded run's records once all
+    of its parts are merged, so parts that started before the checkpoint's
+    position are already in the output.
+    """
+    for part in parts:
+        previous = _read_checkpoint(checkpoint_path(part))
+        if previous is not None and previous.start < checkpoint.records:
+            part.unlink(missing_ok=True)
+            checkpoint_path(part).unlink()
+
+
+async def _retry_errors(
+    inputs: list[str], output: Path, concurrency: int
+) -> tuple[int, int]:
+    """
+    Re-score the records of ``output`` whose detection failed and rewrite
+    it with the new results. Returns how many were retried and recovered.
+    """
+    failed = set()
+    with open(output, "rb") as f:
+        for line in f:
+            scored = ScoredEvaluation.model_validate_json(line)
+            if scored.error is not None and scored.rationale != INVALID_RECORD:
+                failed.add(scored.record)
+    if not failed:
+        return 0, 0
+
+    # Failed records come back in output order, so the rewrite streams
+    # through them with up to ``concurrency`` detections in flight.
+    retries = (
+        (index, raw)
+        for index, raw in enumerate(iter_records(inputs))
+        if index in failed
+    )
+    pending: deque[asyncio.Task] = deque()
+    retried = recovered = 0
+    staging = output.with_name(output.name + ".tmp")
+    try:
+        with open(output, "rb") as src, open(staging, "wb") as dst:
+            for line in src:
+                if json.loads(line)["record"] in failed:
+                    for index, raw in itertools.islice(
+                        retries, concurrency - len(pending)
+                    ):
+                        pending.append(asyncio.create_task(_score_record(index, raw)))
+                    scored, _ = await pending.popleft()
+                    line = scored.model_dump_json().encode() + b"\n"
+                    retried += 1
+                    recovered += scored.error is None
+                dst.write(line)
+            dst.flush()
+            os.fsync(dst.fileno())
+            offset = dst.tell()
+    finally:
+        for task in pending:
+            task.cancel()
+    os.replace(staging, output)
+    checkpoint = _read_checkpoint(checkpoint_path(output))
+    if checkpoint is not None:
+        checkpoint.offset = offset
+        _write_checkpoint(checkpoint_path(output), checkpoint)
+    return retried, recovered
+
+
+def score_files(
+    inputs: Iterable[str | Path],
+    output: str | Path,
+    concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+    workers: int = 1,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+    resume: bool = True,
+    on_progress: Callable[[ScoreStats], Any] | None = None,
+    progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+    retry_errors: bool = False,
+) -> ScoreStats:
+    """
+    Score every record of ``inputs`` into the JSONL file ``output``.
+
+    Each of the ``workers`` processes keeps up to ``concurrency`` detections
+    in flight. Reruns pick up from the last checkpoint unless ``resume`` is
+    false. Records whose detection failed are written and checkpointed like
+    any other; with ``retry_errors`` they are scored again once the run is
+    complete, including failures left by earlier runs. ``on_progress`` is
+    called with running counters every ``progress_interval`` seconds (per
+    worker when sharded).
+    """
+    if concurrency < 1 or workers < 1:
+        raise ValueError("concurrency and workers must be at least 1.")
+    paths = [str(Path(path).resolve()) for path in inputs]
+    output = Path(output)
+    stats = _score_all(
+        paths,
+        output,
+        workers,
+        concurrency=concurrency,
+        checkpoint_every=checkpoint_every,
+        resume=resume,
+        on_progress=on_progress,
+        progress_interval=progress_interval,
+    )
+    if retry_errors:
+        began = time.monotonic()
+        stats.retried, stats.recovered = asyncio.run(
+            _retry_errors(paths, output, concurrency)
+        )
+        stats.elapsed += time.monotonic() - began
+    return stats
+
+
+def _score_all(
+    paths: list[str], output: Path, workers: int, **options: Any
+) -> ScoreStats:
+    """
+    Score ``paths`` into ``output`` in one process or across ``workers``.
+    """
+    if workers == 1:
+        return _score_shard_sync(paths, output, **options)
+
+    began = time.monotonic()
+    checkpoint = _resume(output, Checkpoint(inputs=paths), options["resume"])
+    parts = [_part_path(output, k) for k in range(workers)]
+    _discard_merged_parts(parts, checkpoint)
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(
+                _score_shard_sync,
+                paths,
+                part,
+                start=checkpoint.records,
+                shard=(k, workers),
+                **options,
+            )
+            for k, part in enumerate(parts)
+        ]
+        results = [future.result() for future in futures]
+    _merge_parts(output, parts, checkpoint)
+    return ScoreStats(
+        records=sum(r.records for r in results),
+        resumed=checkpoint.records - sum(r.records for r in results),
+        errors=sum(r.errors for r in results),
+        tokens=sum(r.tokens for r in results),
+        elapsed=time.monotonic() - began,
+    )
+
+
+def _report(stats: ScoreStats, label: str = "") -> None:
+    print(
+        f"{label}{stats.records} records ({stats.resumed} resumed), "
+        f"{stats.errors} errors, {stats.records_per_sec:.1f} records/s, "
+        f"{stats.tokens_per_sec:.0f} tokens/s",
+        file=sys.stderr,
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score logged LLM outputs")
+    parser.add_argument("inputs", nargs="+", help="JSONL or Parquet files")
+    parser.add_argument("-o", "--output", required=True, help="JSONL results")
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=DEFAULT_BATCH_CONCURRENCY
+    )
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument(
+        "--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY
+    )
+    parser.add_argument("--no-resume", action="store_true")
+    parser.add_argument(
+        "--retry-errors",
+        action="store_true",
+        help="score records whose detection failed again once the run is done",
+    )
+    args = parser.parse_args()
+    stats = score_files(
+        args.inputs,
+        args.output,
+        concurrency=args.concurrency,
+        workers=args.workers,
+        checkpoint_every=args.checkpoint_every,
+        resume=not args.no_resume,
+        on_progress=partial(_report, label="... "),
+        retry_errors=args.retry_errors,
+    )
+    _report(stats, label="Done: ")
+    print(json.dumps(stats.model_dump()))
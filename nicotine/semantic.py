@@ -0,0 +1,519 @@
+"""
+Semantic near-duplicate verdict cache.
+
+The verdict cache only reuses verdicts for byte-identical (prompt, output,
+settings) triples. This tier also catches paraphrases: (prompt, output)
+pairs are embedded with a hashed n-gram vectorizer, no model needed, and a
+verdict is reused when a stored pair is similar enough. Prompt and output
+are embedded into separate halves of the vector, and both halves must
+reach ``threshold`` cosine similarity. The output's unnormalized features
+must also lie within ``max_edit`` squared distance of the stored ones
+(an added word is about 2 to 4, a replaced one about 7), so that one changed
+word in a long output is not outweighed by everything else matching.
+
+Outputs that differ in what usually decides a verdict are never
+considered near duplicates, however similar they look. The settings
+(with the resolved prompt template version), the numbers and capitalized
+names in the prompt and the output, and the negations in the output are
+hashed into a guard that must match exactly, so "founded in 1889" can
+never reuse the verdict of "founded in 1899", nor "built by Gustave
+Eiffel" that of "built by Thomas Edison". Outputs recasing a name
+therefore miss the cache.
+
+Candidates are found with random-hyperplane LSH (several tables of sign
+bits, each bucketing the slots by their code in memory) and ranked by
+exact cosine similarity. The index has a fixed capacity; expired entries
+are replaced first, then the least recently used. With a ``path`` every
+array is a NumPy memmap and the verdict log stays open, so the index
+survives restarts, opens without loading it into memory and serves hits
+without opening files (one writing process at a time).
+
+Index layout (one directory):
+
+    meta.json        dimensions, LSH parameters and capacity
+    vectors.npy      float32 embedding per slot
+    norms.npy        float32 norm of the unnormalized output features per slot
+    codes.npy        uint32 LSH bucket per slot and table
+    guards.npy       uint64 guard digest per slot
+    times.npy        float64 stored-at and last-used time per slot (0: free)
+    offsets.npy      uint64 offset and length of each slot's verdict
+    verdicts.jsonl   verdicts, appended and compacted when mostly stale
+
+NumPy is optional and only imported when the cache is built.
+"""
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Awaitable, BinaryIO, Callable
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+from pydantic import BaseModel
+
+from .config import get_setting
+from .models import HallucinationEvaluation, LLMOutput
+from .prescreen import STOPWORDS
+from .prompts import template_version
+
+if TYPE_CHECKING:
+    import numpy as np
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9]*")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+NEGATIONS = frozenset("no not never none nobody nothing neither nor without".split())
+
+# Compact the verdict log once stale records outweigh live ones by this much.
+COMPACT_RATIO = 2.0
+
+
+def _require_numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("The semantic cache requires numpy.")
+    return np
+
+
+class HashingVectorizer:
+    """
+    Signed hashed bag of word unigrams, word bigrams and character
+    trigrams, L2-normalized.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def features(self, text: str) -> list[tuple[str, float]]:
+        words = _TOKEN.findall(text.lower())
+        features = [(f"w:{w}", 1.0) for w in words]
+        features += [(f"b:{a} {b}", 1.0) for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"^{word}$"
+            trigrams = zip(padded, padded[1:], padded[2:])
+            features += [(f"c:{''.join(t)}", 0.25) for t in trigrams]
+        return features
+
+    def counts(self, text: str) -> "np.ndarray":
+        np = _require_numpy()
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self.features(text):
+            h = zlib.crc32(feature.encode())
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        return vector
+
+    def transform(self, text: str) -> "np.ndarray":
+        np = _require_numpy()
+        vector = self.counts(text)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+def names(text: str) -> list[str]:
+    """
+    Lowercased capitalized words of a text, sorted, except those starting a
+    sentence and stopwords.
+    """
+    found: set[str] = set()
+    for sentence in _SENTENCE_END.split(text):
+        words = _WORD.findall(sentence)[1:]
+        found.update(w.lower() for w in words if w[0].isupper())
+    return sorted(found - STOPWORDS)
+
+
+def guard_digest(output: LLMOutput) -> int:
+    """
+    Digest of what must match exactly for a verdict to be reused.
+    """
+    output_words = _TOKEN.findall(output.output.lower())
+    payload = json.dumps(
+        [
+            output.settings.model_dump(exclude_none=True),
+            template_version(output.settings),
+            sorted(_NUMBER.findall(output.prompt)),
+            sorted(_NUMBER.findall(output.output)),
+            names(output.prompt),
+            names(output.output),
+            sorted(w for w in output_words if w in NEGATIONS),
+        ],
+        sort_keys=True,
+    )
+    digest = hashlib.blake2b(payload.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class SemanticCacheStats(BaseModel):
+    """
+    Counters for the semantic cache.
+    """
+
+    enabled: bool
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    entries: int = 0
+    hit_ratio: float = 0.0
+    mean_hit_similarity: float = 0.0
+
+
+class SemanticCache:
+    """
+    Near-duplicate verdict index with LSH candidate search.
+    """
+
+    _mapped: list["np.memmap"]  # arrays backed by files under ``path``
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        capacity: int = 50000,
+        threshold: float = 0.9,
+        max_edit: float = 5.0,
+        ttl: float = 86400.0,
+        dim: int = 256,
+        tables: int = 8,
+        bits: int = 10,
+        seed: int = 0,
+    ):
+        np = _require_numpy()
+        self.path = Path(path) if path is not None else None
+        self.threshold = threshold
+        self.max_edit = max_edit
+        self.ttl = ttl
+        meta = {
+            "capacity": capacity,
+            "dim": dim,
+            "tables": tables,
+            "bits": bits,
+            "seed": seed,
+        }
+        if self.path is not None:
+            meta = self._open_meta(self.path, meta)
+        self.capacity = meta["capacity"]
+        self.vectorizer = HashingVectorizer(meta["dim"])
+        width = 2 * meta["dim"]
+        rng = np.random.default_rng(meta["seed"])
+        self.planes = rng.standard_normal(
+            (meta["tables"] * meta["bits"], width)
+        ).astype(np.float32)
+        self.tables, self.bits = meta["tables"], meta["bits"]
+        self._mapped = []
+        self.vectors = self._array("vectors", (self.capacity, width), np.float32)
+        self.norms = self._array("norms", (self.capacity,), np.float32)
+        self.codes = self._array("codes", (self.capacity, self.tables), np.uint32)
+        self.guards = self._array("guards", (self.capacity,), np.uint64)
+        self.times = self._array("times", (self.capacity, 2), np.float64)
+        self.offsets = self._array("offsets", (self.capacity, 2), np.uint64)
+        # Slots of each LSH code, one dict per table.
+        self._buckets: list[dict[int, set[int]]] = [{} for _ in range(self.tables)]
+        for slot in np.flatnonzero(self.times[:, 0] > 0).tolist():
+            self._index(slot)
+        self._verdicts: list[HallucinationEvaluation | None] = []
+        self._log: BinaryIO | None = None  # verdicts.jsonl, with a path
+        if self.path is None:
+            self._verdicts = [None] * self.capacity
+        else:
+            self._log = open(self.path / "verdicts.jsonl", "a+b")
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._similarity = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _open_meta(path: Path, meta: dict) -> dict:
+        """
+        Load the layout of an existing index, refusing one built with other
+        settings, or record the layout of a new one.
+        """
+        path.mkdir(parents=True, exist_ok=True)
+        meta_path = path / "meta.json"
+        if not meta_path.is_file():
+            meta_path.write_text(json.dumps(meta))
+            return meta
+        stored = json.loads(meta_path.read_text())
+        changed = [
+            f"{k} {stored.get(k)} -> {v}" for k, v in meta.items() if stored.get(k) != v
+        ]
+        if changed:
+            raise ValueError(
+                f"Semantic cache at {path} was built with other settings "
+                f"({', '.join(changed)}); delete it or restore them."
+            )
+        return stored
+
+    def _array(self, name: str, shape: tuple, dtype) -> "np.ndarray":
+        np = _require_numpy()
+        if self.path is None:
+            return np.zeros(shape, dtype=dtype)
+        file = self.path / f"{name}.npy"
+        mode = "r+" if file.is_file() else "w+"
+        array = np.lib.format.open_memmap(file, mode=mode, dtype=dtype, shape=shape)
+        self._mapped.append(array)
+        return array
+
+    def embed(self, output: LLMOutput) -> "np.ndarray":
+        """
+        Unit vector of a (prompt, output) pair, prompt in the first half.
+        """
+        return self._embed(output)[0]
+
+    def _embed(self, output: LLMOutput) -> tuple["np.ndarray", float]:
+        """
+        ``embed`` and the norm of the output's unnormalized features.
+        """
+        np = _require_numpy()
+        counts = self.vectorizer.counts(output.output)
+        norm = float(np.linalg.norm(counts))
+        halves = [
+            self.vectorizer.transform(output.prompt),
+            counts / norm if norm else counts,
+        ]
+        return np.concatenate(halves) * np.float32(0.5**0.5), norm
+
+    def _codes(self, vectors: "np.ndarray") -> "np.ndarray":
+        np = _require_numpy()
+        signs = (vectors @ self.planes.T > 0).reshape(-1, self.tables, self.bits)
+        weights = (1 << np.arange(self.bits, dtype=np.uint32)).astype(np.uint32)
+        return (signs.astype(np.uint32) * weights).sum(axis=2, dtype=np.uint32)
+
+    def _index(self, slot: int) -> None:
+        for table, code in enumerate(self.codes[slot].tolist()):
+            self._buckets[table].setdefault(code, set()).add(slot)
+
+    def _unindex(self, slot: int) -> None:
+        for table, code in enumerate(self.codes[slot].tolist()):
+            bucket = self._buckets[table].get(code)
+            if bucket is not None:
+                bucket.discard(slot)
+                if not bucket:
+                    del self._buckets[table][code]
+
+    def _candidates(self, codes: "np.ndarray") -> "np.ndarray":
+        """
+        Slots sharing a bucket with ``codes`` in at least one table.
+        """
+        np = _require_numpy()
+        slots: set[int] = set()
+        for table, code in enumerate(codes.tolist()):
+            slots.update(self._buckets[table].get(code, ()))
+        return np.fromiter(slots, dtype=np.int64, count=len(slots))
+
+    def _live(self, now: float) -> "np.ndarray":
+        stored = self.times[:, 0]
+        return (stored > 0) & (stored > now - self.ttl)
+
+    def _similarities(self, slots: "np.ndarray", vector: "np.ndarray"):
+        """
+        Cosine similarity of the prompt and output halves to each slot.
+        """
+        np = _require_numpy()
+        dim = self.vectorizer.dim
+        candidates = self.vectors[slots] * np.float32(2**0.5)
+        query = vector * np.float32(2**0.5)
+        prompt = candidates[:, :dim] @ query[:dim]
+        output = candidates[:, dim:] @ query[dim:]
+        return prompt, output
+
+    def lookup(self, output: LLMOutput) -> HallucinationEvaluation | None:
+        """
+        Verdict of a stored near duplicate, or None.
+        """
+        np = _require_numpy()
+        vector, norm = self._embed(output)
+        codes = self._codes(vector[None, :])[0]
+        guard = np.uint64(guard_digest(output))
+        now = time.time()
+        with self._lock:
+            slots = self._candidates(codes)
+            stored = self.times[slots, 0]
+            slots = slots[(stored > 0) & (stored > now - self.ttl)]
+            slots = slots[self.guards[slots] == guard]
+            if slots.size:
+                prompt, out = self._similarities(slots, vector)
+                similarity = np.minimum(prompt, out)
+                # Squared distance of the unnormalized output features.
+                norms = self.norms[slots]
+                edit = norms**2 + norm**2 - 2 * norms * norm * out
+                similarity[edit > self.max_edit] = -1.0
+                best = int(np.argmax(similarity))
+                if similarity[best] >= self.threshold:
+                    slot = int(slots[best])
+                    verdict = self._read_verdict(slot)
+                    if verdict is not None:
+                        self.times[slot, 1] = now
+                        self.hits += 1
+                        self._similarity += float(similarity[best])
+                        return verdict
+            self.misses += 1
+            return None
+
+    def store(self, output: LLMOutput, evaluation: HallucinationEvaluation) -> None:
+        """
+        Index a verdict. Verdicts carrying an ``error`` are never stored.
+        """
+        if evaluation.error is not None:
+            return
+        np = _require_numpy()
+        vector, norm = self._embed(output)
+        codes = self._codes(vector[None, :])[0]
+        now = time.time()
+        with self._lock:
+            live = self._live(now)
+            # Free and expired slots first, then the least recently used.
+            slot = int(np.argmin(np.where(live, self.times[:, 1], 0.0)))
+            self.evictions += bool(live[slot])
+            if self.times[slot, 0] > 0:
+                self._unindex(slot)
+            self.vectors[slot] = vector
+            self.norms[slot] = norm
+            self.codes[slot] = codes
+            self._index(slot)
+            self.guards[slot] = guard_digest(output)
+            self.times[slot] = (now, now)
+            self._write_verdict(slot, evaluation)
+            self.stores += 1
+
+    def _read_verdict(self, slot: int) -> HallucinationEvaluation | None:
+        if self._log is None:
+            return self._verdicts[slot]
+        offset, length = (int(v) for v in self.offsets[slot])
+        if not length:
+            return None
+        line = os.pread(self._log.fileno(), length, offset)
+        return HallucinationEvaluation.model_validate_json(line)
+
+    def _write_verdict(self, slot: int, evaluation: HallucinationEvaluation) -> None:
+        if self._log is None or self.path is None:
+            self._verdicts[slot] = evaluation
+            return
+        line = evaluation.model_dump_json().encode()
+        offset = self._log.seek(0, os.SEEK_END)
+        self._log.write(line + b"\n")
+        self._log.flush()
+        self.offsets[slot] = (offset, len(line))
+        live_bytes = int(self.offsets[:, 1].sum())
+        if offset + len(line) > COMPACT_RATIO * live_bytes + 2**20:
+            self._compact(self.path / "verdicts.jsonl")
+
+    def _compact(self, log: Path) -> None:
+        """
+        Rewrite the verdict log with the verdicts of occupied slots only.
+        """
+        staging = log.with_suffix(".jsonl.tmp")
+        offsets = self.offsets.copy()
+        with open(log, "rb") as src, open(staging, "wb") as dst:
+            for slot in map(int, (self.times[:, 0] > 0).nonzero()[0]):
+                offset, length = (int(v) for v in self.offsets[slot])
+                if not length:
+                    continue
+                src.seek(offset)
+                offsets[slot] = (dst.tell(), length)
+                dst.write(src.read(length) + b"\n")
+        os.replace(staging, log)
+        self.offsets[:] = offsets
+        if self._log is not None:
+            self._log.close()
+        self._log = open(log, "a+b")
+
+    def flush(self) -> None:
+        """
+        Write memory-mapped arrays back to disk.
+        """
+        for array in self._mapped:
+            array.flush()
+
+    def __len__(self) -> int:
+        return int(self._live(time.time()).sum())
+
+    def get_or_compute(
+        self,
+        output: LLMOutput,
+        compute: Callable[[LLMOutput], HallucinationEvaluation],
+    ) -> HallucinationEvaluation:
+        """
+        Reuse a near duplicate's verdict or compute and index a new one.
+        """
+        verdict = self.lookup(output)
+        if verdict is None:
+            verdict = compute(output)
+            self.store(output, verdict)
+        return verdict
+
+    async def aget_or_compute(
+        self,
+        output: LLMOutput,
+        compute: Callable[[LLMOutput], Awaitable[HallucinationEvaluation]],
+    ) -> HallucinationEvaluation:
+        """
+        Async ``get_or_compute``.
+        """
+        verdict = self.lookup(output)
+        if verdict is None:
+            verdict = await compute(output)
+            self.store(output, verdict)
+        return verdict
+
+    def stats(self) -> SemanticCacheStats:
+        """
+        Snapshot of the hit/miss counters.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return SemanticCacheStats(
+                enabled=True,
+                hits=self.hits,
+                misses=self.misses,
+                stores=self.stores,
+                evictions=self.evictions,
+                entries=len(self),
+                hit_ratio=self.hits / lookups if lookups else 0.0,
+                mean_hit_similarity=self._similarity / self.hits if self.hits else 0.0,
+            )
+
+
+_UNSET = object()
+_semantic_cache: "SemanticCache | None | object" = _UNSET
+
+
+def build_semantic_cache() -> SemanticCache | None:
+    """
+    Build the semantic cache described by the ``semantic_cache`` config section.
+    """
+    if not get_setting("semantic_cache.enabled", False):
+        return None
+    return SemanticCache(
+        path=get_setting("semantic_cache.path", None),
+        capacity=int(get_setting("semantic_cache.capacity", 50000)),
+        threshold=float(get_setting("semantic_cache.threshold", 0.9)),
+        max_edit=float(get_setting("semantic_cache.max_edit", 5.0)),
+        ttl=float(get_setting("semantic_cache.ttl", 86400)),
+        dim=int(get_setting("semantic_cache.dim", 256)),
+        tables=int(get_setting("semantic_cache.lsh_tables", 8)),
+        bits=int(get_setting("semantic_cache.lsh_bits", 10)),
+    )
+
+
+def get_semantic_cache() -> SemanticCache | None:
+    """
+    Get the process-wide semantic cache, or None when it is disabled.
+    """
+    global _semantic_cache
+    if _semantic_cache is _UNSET:
+        _semantic_cache = build_semantic_cache()
+    return _semantic_cache  # type: ignore[return-value]
+
+
+def configure_semantic_cache(cache: SemanticCache | None) -> None:
+    """
+    Replace the process-wide semantic cache (None disables it).
+    """
+    global _semantic_cache
+    _semantic_cache = cache
@@ -0,0 +1,82 @@
+"""
+Fast JSON request and response handling for ``nicotine.api``.
+
+With ``api.fast_json`` on, the API's routes use ``FastJSONRoute``: request
+bodies are parsed with orjson and then validated into the endpoint's models
+as usual. The detection endpoints answer with ``ModelResponse``: their
+evaluations are already validated models, so they are serialized straight to
+JSON by pydantic instead of being validated again against
+``response_model``.
+"""
+
+from typing import Any, Callable, Coroutine
+
+import orjson
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+from .tracing import set_attributes, span
+
+
+def loads(data: bytes | str) -> Any:
+    """
+    Parse JSON with orjson.
+
+    Raises ``json.JSONDecodeError`` on malformed input.
+    """
+    return orjson.loads(data)
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode JSON-compatible content to UTF-8 with orjson.
+    """
+    return orjson.dumps(content)
+
+
+class FastJSONRequest(Request):
+    """
+    Request whose JSON body is parsed with ``loads``.
+    """
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            with span("request.decode"):
+                body = await self.body()
+                set_attributes(bytes=len(body))
+                self._json = loads(body)
+        return self._json
+
+
+class FastJSONRoute(APIRoute):
+    """
+    Route that hands its endpoint a ``FastJSONRequest``.
+
+    Set as ``app.router.route_class`` before routes are declared.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(FastJSONRequest(request.scope, request.receive))
+
+        return route_handler
+
+
+class ModelResponse(Response):
+    """
+    JSON response that serializes a pydantic model as it is.
+
+    Returning a ``Response`` skips FastAPI's validation of the result against
+    ``response_model``, which ``response_model`` still documents.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode("utf-8")
+        return dumps(content)
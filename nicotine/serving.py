@@ -0,0 +1,165 @@
+"""
+Production serving of ``nicotine.api`` with several worker processes.
+
+``python -m nicotine.serving`` (``serve.sh --production``) runs the app
+under uvicorn with the worker settings of the ``server`` config section,
+bound to ``api.host`` and ``api.port``.
+
+Worker processes share nothing by default, so every worker would keep its
+own verdict cache, rate-limit budgets and metrics. With more than one
+worker and ``server.shared_state`` on, the supervisor exports the worker
+count in ``NICOTINE_WORKERS`` and per-process state moves to stores every
+worker on the host shares:
+
+- the verdict cache uses the SQLite backend
+  (``hallucination_detection.cache_path``)
+- upstream rate limits use the SQLite budget store (``rate_limits.path``)
+- metrics are written to ``server.metrics_dir`` (as
+  ``PROMETHEUS_MULTIPROC_DIR``, emptied at start), so ``/metrics`` reports
+  every worker whichever answers
+
+The semantic cache, chunk window verdicts, circuit breakers and coalescing
+queues stay per worker. A memory-mapped semantic cache index
+(``semantic_cache.path``) has a single writer, so serving with it and more
+than one worker is refused at startup. Background jobs always queue in
+SQLite (``jobs.path``), and every worker runs its share of them.
+
+Each worker warms up in the app lifespan, before it accepts connections:
+configured caches, limiters and detectors are built, the reference index and
+pipeline are opened, the OpenAI SDK is imported and the response schemas of
+the prompt templates are generated, so the first requests do not pay for
+them. Connections arriving meanwhile wait in the listen backlog or go to
+workers that are already up.
+"""
+
+from pathlib import Path
+from typing import Callable
+import argparse
+import logging
+import os
+import time
+
+from .config import WORKERS_ENV, get_setting, shared_state
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up() -> dict[str, float]:
+    """
+    Build everything the first requests would otherwise build, returning
+    the seconds each step took.
+    """
+    from .cache import get_verdict_cache
+    from .cascade import get_cascade
+    from .chunking import get_chunked_detector
+    from .coalescer import get_coalescer
+    from .jobs import get_job_queue
+    from .prescreen import get_tiered_detector
+    from .prompts import get_template
+    from .ratelimit import get_rate_limiter
+    from .resilience import get_call_policy
+    from .semantic import get_semantic_cache
+    from .tracing import get_tracer
+
+    def load_sdk() -> None:
+        import openai  # noqa: F401 (imported for its import cost)
+
+    def compile_prompts() -> None:
+        from .system import HallucinationEvaluation, PackedHallucinationEvaluations
+
+        get_template()
+        for model in (HallucinationEvaluation, PackedHallucinationEvaluations):
+            model.model_json_schema()
+
+    steps: dict[str, Callable[[], object]] = {
+        "verdict_cache": get_verdict_cache,
+        "semantic_cache": get_semantic_cache,
+        "rate_limiter": get_rate_limiter,
+        "call_policy": get_call_policy,
+        "prescreen": get_tiered_detector,
+        "cascade": get_cascade,
+        "chunking": get_chunked_detector,
+        "coalescer": get_coalescer,
+        "job_queue": get_job_queue,
+        "tracer": get_tracer,
+        "openai_sdk": load_sdk,
+        "prompts": compile_prompts,
+    }
+    if get_setting("hallucination_detection.strategy", "single") == "pipeline":
+        from .pipeline import get_default_pipeline
+
+        steps["pipeline"] = get_default_pipeline
+    timings = {}
+    for name, step in steps.items():
+        start = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - start
+    logger.info(
+        "Worker %d warmed up in %.3f s (%s).",
+        os.getpid(),
+        sum(timings.values()),
+        ", ".join(f"{name} {seconds:.3f} s" for name, seconds in timings.items()),
+    )
+    return timings
+
+
+def prepare_environment(workers: int) -> None:
+    """
+    Export what workers need to share state; call before spawning them.
+
+    Raises ``ValueError`` for settings the workers cannot share.
+    """
+    semantic = get_setting("semantic_cache.enabled", False)
+    if workers > 1 and semantic and get_setting("semantic_cache.path"):
+        raise ValueError(
+            f"semantic_cache.path cannot be written by {workers} workers; "
+            "unset it or run a single worker."
+        )
+    os.environ[WORKERS_ENV] = str(workers)
+    if not shared_state() or not get_setting("metrics.enabled", False):
+        return
+    default = get_setting("server.metrics_dir", ".nicotine/metrics")
+    directory = Path(os.environ.get("PROMETHEUS_MULTIPROC_DIR", default))
+    directory.mkdir(parents=True, exist_ok=True)
+    # Samples of a previous run would be aggregated with this one's.
+    for stale in directory.glob("*.db"):
+        stale.unlink()
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(directory)
+
+
+def serve(
+    host: str | None = None, port: int | None = None, workers: int | None = None
+) -> None:
+    """
+    Run the service with the ``server`` config section.
+    """
+    import uvicorn
+
+    workers = workers or int(get_setting("server.workers", 4))
+    prepare_environment(workers)
+    limit = get_setting("server.limit_concurrency", None)
+    max_requests = get_setting("server.limit_max_requests", None)
+    uvicorn.run(
+        "nicotine.api:app",
+        host=host or get_setting("api.host", "0.0.0.0"),
+        port=port or int(get_setting("api.port", 8000)),
+        workers=workers,
+        backlog=int(get_setting("server.backlog", 2048)),
+        timeout_keep_alive=int(get_setting("server.timeout_keep_alive", 5)),
+        timeout_graceful_shutdown=int(
+            get_setting("server.timeout_graceful_shutdown", 30)
+        ),
+        limit_concurrency=None if limit is None else int(limit),
+        limit_max_requests=None if max_requests is None else int(max_requests),
+        log_level=str(get_setting("server.log_level", "warning")).lower(),
+        access_log=bool(get_setting("server.access_log", False)),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the Nicotine API")
+    parser.add_argument("--host")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("-w", "--workers", type=int)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
@@ -1,97 +1,560 @@
-from pydantic import BaseModel
-from openai import OpenAI
+from typing import TYPE_CHECKING, Callable
+import asyncio
 import os
+import time
+import weakref
 
+from .cache import get_verdict_cache
+from .cascade import get_cascade, record_tier_usage
+from .chunking import get_chunked_detector
+from .semantic import get_semantic_cache
+from .config import get_setting
+from .prescreen import get_tiered_detector
+from .providers import (  # noqa: F401 (re-exported)
+    ASYNC_MAX_CONNECTIONS,
+    ASYNC_MAX_KEEPALIVE_CONNECTIONS,
+    build_async_client,
+    build_client,
+)
+from .resilience import acall_upstream, call_upstream
+from .metrics import record_prompt_usage
+from .prompts import get_template
+from .tracing import add_event, span
+from .models import (  # noqa: F401 (re-exported)
+    StructuredOutput,
+    LLMSettings,
+    LLMInput,
+    LLMOutput,
+    HallucinationEvaluation,
+)
 
-# Add these lines BEFORE anything that reads OPENAI_API_KEY:
-try:
-    from dotenv import load_dotenv
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
 
-    load_dotenv()
-except ImportError:
-    pass  # dotenv is optional, ignore if not installed
+# Clients are built on first use, so importing the package neither needs an
+# API key nor pays for importing the OpenAI SDK.
+_client: "OpenAI | None" = None
+_async_client: "AsyncOpenAI | None" = None
 
-api_key = os.getenv("OPENAI_API_KEY")
+# One async client per event loop: pooled connections are bound to the loop
+# that opened them and cannot be reused once that loop is closed.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
 
-if not api_key:
-    raise ValueError("OPENAI_API_KEY is not set.")
 
-client = OpenAI(api_key=api_key)
+def _get_api_key() -> str:
+    """
+    Read ``OPENAI_API_KEY``, loading ``.env`` first when python-dotenv is
+    installed.
+    """
+    try:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+    except ImportError:
+        pass  # dotenv is optional, ignore if not installed
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY is not set.")
+    return api_key
+
+
+def get_client() -> "OpenAI":
+    """
+    Get the blocking OpenAI client, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        _client = build_client(_get_api_key())
+    return _client
+
+
+def configure_client(client: "OpenAI | None") -> None:
+    """
+    Replace the blocking client (None restores the lazily built default).
+    """
+    global _client
+    _client = client
 
 
-class LLMSettings(BaseModel):
+def get_async_client() -> "AsyncOpenAI":
     """
-    Settings for an LLM.
+    Get the pooled async OpenAI client for the running event loop.
     """
+    if _async_client is not None:
+        return _async_client
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = _async_clients[loop] = build_async_client(_get_api_key())
+    return async_client
+
 
-    model: str = "gpt-4.1"
-    temperature: float = 0.7
-    max_tokens: int = 1000
+def configure_async_client(client: "AsyncOpenAI | None") -> None:
+    """
+    Use one async client for every event loop (None restores the default
+    per-loop clients).
+    """
+    global _async_client
+    _async_client = client
 
 
-class LLMInput(BaseModel):
+class PackedHallucinationEvaluation(HallucinationEvaluation):
     """
-    Input to an LLM.
+    Evaluation of one item inside a packed batch request.
     """
 
-    id: str
-    prompt: str
-    settings: LLMSettings
+    index: int
 
 
-class LLMOutput(BaseModel):
+class PackedHallucinationEvaluations(StructuredOutput):
     """
-    Output from an LLM.
+    Evaluations returned for a packed batch request.
     """
 
-    id: str
-    prompt: str
-    output: str
-    settings: LLMSettings
+    evaluations: list[PackedHallucinationEvaluation]
 
 
-class HallucinationEvaluation(BaseModel):
+def _to_evaluation(response) -> HallucinationEvaluation:
     """
-    Evaluation of hallucinations in the output.
+    Convert a parsed upstream response into an evaluation.
     """
+    if response.output_parsed is None:
+        return HallucinationEvaluation(
+            is_hallucination=False,
+            rationale="Parsing failed (None returned)",
+            delusion_percentage=0.0,
+            error="output_parsed was None",
+        )
+    return response.output_parsed
+
+
+def _span_attributes(output: LLMOutput) -> dict:
+    """
+    Trace attributes of a detection: identifiers and sizes, never content.
+    """
+    return {
+        "id": output.id,
+        "model": output.settings.model,
+        "output_chars": len(output.output),
+    }
 
-    is_hallucination: bool
-    rationale: str
-    delusion_percentage: float
-    error: str | None = None
+
+def _error_evaluation(e: Exception) -> HallucinationEvaluation:
+    """
+    Build the default evaluation returned when detection fails.
+    """
+    print(f"Error detecting hallucinations: {e}. Returning default values.")
+    return HallucinationEvaluation(
+        is_hallucination=False,
+        rationale="Error detecting hallucinations",
+        delusion_percentage=0.0,
+        error=str(e),
+    )
 
 
 def detect_hallucination(output: LLMOutput) -> HallucinationEvaluation:
     """
     Detect hallucinations in the input using the references.
     """
-    hallucination_prompt = f"""
-    You are a helpful assistant that detects hallucinations in the input.
+    with span("detect", **_span_attributes(output)):
+        tiered = get_tiered_detector()
+        if tiered is not None:
+            return tiered.detect(output, _detect_hallucination_cached)
+        return _detect_hallucination_cached(output)
+
+
+def _detect_hallucination_cached(output: LLMOutput) -> HallucinationEvaluation:
+    """
+    Detect hallucinations through the verdict cache, when enabled.
+    """
+    cache = get_verdict_cache()
+    if cache is not None:
+        with span("cache.verdict"):
+            return cache.get_or_compute(output, _detect_hallucination_uncached)
+    return _detect_hallucination_uncached(output)
+
+
+def _use_pipeline() -> bool:
+    """
+    Whether detection should run the staged Mystic Lake pipeline.
+    """
+    return get_setting("hallucination_detection.strategy", "single") == "pipeline"
+
+
+async def _run_pipeline(output: LLMOutput) -> HallucinationEvaluation:
+    """
+    Detect hallucinations with the default Mystic Lake pipeline.
+    """
+    from .pipeline import get_default_pipeline
+
+    try:
+        with span("pipeline"):
+            return (await get_default_pipeline().run(output)).evaluation
+    except Exception as e:
+        return _error_evaluation(e)
+
+
+def _detect_hallucination_uncached(output: LLMOutput) -> HallucinationEvaluation:
+    """
+    Detect hallucinations, reusing the verdict of a near duplicate when the
+    semantic cache is enabled.
+    """
+    semantic = get_semantic_cache()
+    if semantic is not None:
+        with span("cache.semantic"):
+            return semantic.get_or_compute(output, _detect_hallucination_fresh)
+    return _detect_hallucination_fresh(output)
+
+
+def _detect_hallucination_fresh(output: LLMOutput) -> HallucinationEvaluation:
+    """
+    Detect hallucinations with blocking upstream calls, window by window for
+    long outputs when chunking is enabled.
+    """
+    chunked = get_chunked_detector()
+    if chunked is not None and chunked.applies(output):
+        with span("chunking"):
+            return chunked.detect(output, _detect_hallucination_single).evaluation
+    return _detect_hallucination_single(output)
+
+
+def _detect_hallucination_single(output: LLMOutput) -> HallucinationEvaluation:
+    """
+    Detect hallucinations with a blocking upstream call, through the model
+    cascade when enabled.
+    """
+    if _use_pipeline():
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(_run_pipeline(output))
+        return _error_evaluation(
+            RuntimeError(
+                "The pipeline strategy cannot run blocking inside an event loop;"
+                " use async_detect_hallucination."
+            )
+        )
+    cascade = get_cascade()
+    if cascade is not None and cascade.applies(output.settings):
+        return cascade.detect(output, _detect_hallucination_call)
+    return _detect_hallucination_call(output)
 
-    Input: {output.prompt}
-    Output: {output.output}
+
+def _detect_hallucination_call(output: LLMOutput) -> HallucinationEvaluation:
+    """
+    Detect hallucinations with one blocking upstream call to the model in
+    the output's settings.
     """
     try:
-        response = client.responses.parse(
-            input=hallucination_prompt,
+        template = get_template(output.settings)
+        response = call_upstream(
+            output.settings.provider,
+            **template.request(output),
             model=output.settings.model,
             temperature=output.settings.temperature,
             max_output_tokens=output.settings.max_tokens,
             text_format=HallucinationEvaluation,
         )
-        if response.output_parsed is None:
-            return HallucinationEvaluation(
-                is_hallucination=False,
-                rationale="Parsing failed (None returned)",
-                delusion_percentage=0.0,
-                error="output_parsed was None",
+        record_prompt_usage(template.version, response)
+        record_tier_usage(response)
+        return _to_evaluation(response)
+    except Exception as e:
+        return _error_evaluation(e)
+
+
+async def async_detect_hallucination(output: LLMOutput) -> HallucinationEvaluation:
+    """
+    Detect hallucinations without blocking the event loop.
+    """
+    with span("detect", **_span_attributes(output)):
+        tiered = get_tiered_detector()
+        if tiered is not None:
+            return await tiered.adetect(output, _async_detect_hallucination_cached)
+        return await _async_detect_hallucination_cached(output)
+
+
+async def _async_detect_hallucination_cached(
+    output: LLMOutput,
+) -> HallucinationEvaluation:
+    """
+    Detect hallucinations through the verdict cache, when enabled.
+    """
+    cache = get_verdict_cache()
+    if cache is not None:
+        with span("cache.verdict"):
+            return await cache.aget_or_compute(
+                output, _async_detect_hallucination_uncached
+            )
+    return await _async_detect_hallucination_uncached(output)
+
+
+async def _async_detect_hallucination_uncached(
+    output: LLMOutput,
+) -> HallucinationEvaluation:
+    """
+    Detect hallucinations, reusing the verdict of a near duplicate when the
+    semantic cache is enabled.
+    """
+    semantic = get_semantic_cache()
+    if semantic is not None:
+        with span("cache.semantic"):
+            return await semantic.aget_or_compute(
+                output, _async_detect_hallucination_fresh
             )
-        return response.output_parsed
+    return await _async_detect_hallucination_fresh(output)
+
+
+async def _async_detect_hallucination_fresh(
+    output: LLMOutput,
+) -> HallucinationEvaluation:
+    """
+    Detect hallucinations with non-blocking upstream calls, window by window
+    for long outputs when chunking is enabled.
+    """
+    chunked = get_chunked_detector()
+    if chunked is not None and chunked.applies(output):
+        with span("chunking"):
+            return (
+                await chunked.adetect(output, _async_detect_hallucination_single)
+            ).evaluation
+    return await _async_detect_hallucination_single(output)
+
+
+async def _async_detect_hallucination_single(
+    output: LLMOutput,
+) -> HallucinationEvaluation:
+    """
+    Detect hallucinations with a non-blocking upstream call, through the
+    model cascade when enabled.
+    """
+    if _use_pipeline():
+        return await _run_pipeline(output)
+    cascade = get_cascade()
+    if cascade is not None and cascade.applies(output.settings):
+        return await cascade.adetect(output, _async_detect_hallucination_call)
+    return await _async_detect_hallucination_call(output)
+
+
+async def _async_detect_hallucination_call(
+    output: LLMOutput,
+) -> HallucinationEvaluation:
+    """
+    Detect hallucinations with one non-blocking upstream call to the model
+    in the output's settings.
+    """
+    try:
+        template = get_template(output.settings)
+        response = await acall_upstream(
+            output.settings.provider,
+            **template.request(output),
+            model=output.settings.model,
+            temperature=output.settings.temperature,
+            max_output_tokens=output.settings.max_tokens,
+            text_format=HallucinationEvaluation,
+        )
+        record_prompt_usage(template.version, response)
+        record_tier_usage(response)
+        return _to_evaluation(response)
     except Exception as e:
-        print(f"Error detecting hallucinations: {e}. Returning default values.")
-        return HallucinationEvaluation(
-            is_hallucination=False,
-            rationale="Error detecting hallucinations",
-            delusion_percentage=0.0,
-            error=str(e),
+        return _error_evaluation(e)
+
+
+# Defaults for batch detection. Packing groups short items that share the
+# same settings into a single structured-output request.
+DEFAULT_BATCH_CONCURRENCY = 16
+DEFAULT_PACK_MAX_CHARS = 2000
+
+
+def _plan_batches(
+    outputs: list[LLMOutput],
+    pack_size: int,
+    pack_max_chars: int,
+    packable: Callable[[LLMOutput], bool] | None = None,
+) -> list[list[int]]:
+    """
+    Group output indices into upstream calls.
+
+    Items are packed together only when they are short, ``packable`` and
+    share the same settings; everything else gets its own call.
+    """
+    if pack_size <= 1:
+        return [[index] for index in range(len(outputs))]
+    groups: list[list[int]] = []
+    open_groups: dict[tuple, list[int]] = {}
+    for index, output in enumerate(outputs):
+        if len(output.prompt) + len(output.output) > pack_max_chars or (
+            packable is not None and not packable(output)
+        ):
+            groups.append([index])
+            continue
+        key = tuple(output.settings.model_dump().items())
+        group = open_groups.setdefault(key, [])
+        group.append(index)
+        if len(group) == pack_size:
+            groups.append(group)
+            del open_groups[key]
+    groups.extend(open_groups.values())
+    return groups
+
+
+async def _async_detect_packed(
+    outputs: list[LLMOutput],
+) -> list[HallucinationEvaluation]:
+    """
+    Detect hallucinations for several outputs in one upstream call, through
+    the model cascade when enabled.
+    """
+    cascade = get_cascade()
+    if cascade is not None and cascade.applies(outputs[0].settings):
+        return await cascade.adetect_packed(
+            outputs, _async_detect_packed_call, _async_detect_hallucination_call
         )
+    return await _async_detect_packed_call(outputs)
+
+
+async def _async_detect_packed_call(
+    outputs: list[LLMOutput],
+) -> list[HallucinationEvaluation]:
+    """
+    Detect hallucinations for several outputs in one upstream call.
+
+    Items missing from the packed answer are retried individually.
+    """
+    settings = outputs[0].settings
+    try:
+        template = get_template(settings)
+        response = await acall_upstream(
+            settings.provider,
+            **template.packed_request(outputs),
+            model=settings.model,
+            temperature=settings.temperature,
+            max_output_tokens=settings.max_tokens * len(outputs),
+            text_format=PackedHallucinationEvaluations,
+        )
+    except Exception as e:
+        return [_error_evaluation(e) for _ in outputs]
+    record_prompt_usage(template.version, response)
+    record_tier_usage(response)
+    parsed = response.output_parsed
+    by_index = {e.index: e for e in parsed.evaluations} if parsed else {}
+    results = []
+    for index, output in enumerate(outputs):
+        packed = by_index.get(index)
+        if packed is None:
+            results.append(await _async_detect_hallucination_single(output))
+        else:
+            results.append(
+                HallucinationEvaluation(**packed.model_dump(exclude={"index"}))
+            )
+    return results
+
+
+async def async_detect_hallucinations(
+    outputs: list[LLMOutput],
+    concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+    pack_size: int = 1,
+    pack_max_chars: int = DEFAULT_PACK_MAX_CHARS,
+) -> list[HallucinationEvaluation]:
+    """
+    Detect hallucinations in many outputs concurrently.
+
+    At most ``concurrency`` upstream calls are in flight at once. With
+    ``pack_size`` above one, short items sharing the same settings are packed
+    into a single structured-output request; the pipeline strategy checks
+    claims one output at a time, and outputs long enough to be chunked are
+    never packed. Results are returned in input order; failures are reported
+    per item through ``error``.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1.")
+    if _use_pipeline():
+        pack_size = 1
+    semaphore = asyncio.Semaphore(concurrency)
+    results: list[HallucinationEvaluation | None] = [None] * len(outputs)
+    pending = list(range(len(outputs)))
+
+    # Packed requests bypass the per-item detection path, so run the
+    # pre-screen and caches up front and store fresh verdicts afterwards.
+    tiered = get_tiered_detector() if pack_size > 1 else None
+    cache = get_verdict_cache() if pack_size > 1 else None
+    semantic = get_semantic_cache() if pack_size > 1 else None
+    chunked = get_chunked_detector() if pack_size > 1 else None
+    resolve_up_front = tiered is not None or cache is not None or semantic is not None
+    escalated: dict[int, float] = {}  # index -> when the pre-screen passed it on
+
+    def resolved(index: int, evaluation: HallucinationEvaluation) -> None:
+        results[index] = evaluation
+        if tiered is not None and index in escalated:
+            tiered.record("llm", escalated[index])
+
+    if resolve_up_front:
+        pending = []
+        for index, output in enumerate(outputs):
+            local = tiered.screen(output) if tiered is not None else None
+            if local is not None:
+                results[index] = local
+                continue
+            escalated[index] = time.perf_counter()
+            if cache is not None:
+                local = await cache.aget(output)
+            if local is None and semantic is not None:
+                local = semantic.lookup(output)
+            if local is None:
+                pending.append(index)
+            else:
+                resolved(index, local)
+
+    async def run(group: list[int]) -> None:
+        with span("detect.group", items=len(group)):
+            async with semaphore:
+                add_event("started")
+                if len(group) == 1 and not resolve_up_front:
+                    evaluations = [await async_detect_hallucination(outputs[group[0]])]
+                elif len(group) == 1:
+                    evaluations = [
+                        await _async_detect_hallucination_fresh(outputs[group[0]])
+                    ]
+                else:
+                    evaluations = await _async_detect_packed(
+                        [outputs[i] for i in group]
+                    )
+        for index, evaluation in zip(group, evaluations):
+            resolved(index, evaluation)
+            if cache is not None:
+                await cache.aset(outputs[index], evaluation)
+            if semantic is not None:
+                semantic.store(outputs[index], evaluation)
+
+    groups = _plan_batches(
+        [outputs[i] for i in pending],
+        pack_size,
+        pack_max_chars,
+        packable=None if chunked is None else lambda o: not chunked.applies(o),
+    )
+    with span("detect.batch", items=len(outputs), groups=len(groups)):
+        await asyncio.gather(*(run([pending[i] for i in group]) for group in groups))
+    ordered: list[HallucinationEvaluation] = []
+    for result in results:
+        assert result is not None, "every output is resolved or detected"
+        ordered.append(result)
+    return ordered
+
+
+def detect_hallucinations(
+    outputs: list[LLMOutput],
+    concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+    pack_size: int = 1,
+    pack_max_chars: int = DEFAULT_PACK_MAX_CHARS,
+) -> list[HallucinationEvaluation]:
+    """
+    Detect hallucinations in many outputs concurrently.
+
+    Synchronous wrapper around ``async_detect_hallucinations``; must not be
+    called from a running event loop.
+    """
+    return asyncio.run(
+        async_detect_hallucinations(outputs, concurrency, pack_size, pack_max_chars)
+    )
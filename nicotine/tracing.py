@@ -0,0 +1,577 @@
+"""
+Per-request tracing for the detection service.
+
+Collected when ``tracing.enabled`` is set. Each HTTP request is a trace, and
+the work done for it nests as spans:
+
+- ``<METHOD> <route>``: the whole request, continuing an incoming W3C
+  ``traceparent``; the trace id is returned in ``X-Trace-Id``
+- ``request.decode``: reading and parsing the JSON body (``api.fast_json``);
+  the gap until ``detect`` is model validation
+- ``detect``: detection of one output; an ``escalated`` event marks verdicts
+  the model cascade escalated
+- ``detect.batch``: a batch, with a ``detect.group`` per upstream call (one
+  item or a packed group), whose ``started`` event ends its wait for a slot
+- ``coalescer.submit``: a request waiting for its coalesced batch, which
+  runs as a trace of its own (``coalescer.batch``)
+- ``job``: a background job, a trace of its own, around its ``detect``
+- ``cache.verdict`` / ``cache.semantic`` / ``chunking`` / ``pipeline``
+- ``upstream``: one model call under the call policy, with its
+  ``ratelimit.wait``, ``upstream.attempt`` (hedges included) and
+  ``retry.backoff`` spans
+
+Spans follow the OpenTelemetry model (trace and span ids, parent, start and
+end in epoch nanoseconds, attributes, events, status), so the ``otel``
+exporter hands them to the OpenTelemetry API and whichever SDK and exporter
+the application configured. ``log`` logs a breakdown of traces slower than
+``tracing.slow_threshold``, ``memory`` keeps finished spans in process and
+``none`` drops them, for hooks only.
+
+Hooks (``add_hook``) are called as every span starts and ends, for custom
+timers or exporters. Code can time its own steps with ``span(name)``. Call
+sites use the module-level helpers, which do nothing while tracing is
+disabled.
+
+With ``tracing.profiler.enabled``, requests are also sampled by
+``nicotine.profiler``; those slower than ``tracing.profiler.threshold`` get
+a flame graph snapshot (folded stacks) in their root span's
+``profile.folded`` attribute, also written to ``tracing.profiler.directory``
+if set.
+"""
+
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Iterator, Protocol
+import logging
+import random
+import threading
+import time
+
+from .config import get_setting
+from .profiler import SamplingProfiler, render
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    """
+    A timed operation of a trace.
+    """
+
+    name: str
+    trace_id: str  # 32 hex digits
+    span_id: str  # 16 hex digits
+    parent_id: str | None  # remote for a continued trace
+    start_time: int  # epoch nanoseconds
+    end_time: int | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    events: list[tuple[str, int, dict[str, Any]]] = field(default_factory=list)
+    status: str = "unset"  # unset, ok or error
+    error: str | None = None
+    parent: "Span | None" = field(default=None, repr=False)
+    thread_id: int = 0
+
+    @property
+    def is_root(self) -> bool:
+        """
+        Whether the span is the first of its trace in this process.
+        """
+        return self.parent is None
+
+    @property
+    def duration(self) -> float:
+        """
+        Seconds from start to end, or until now while the span is open.
+        """
+        end = self.end_time if self.end_time is not None else time.time_ns()
+        return (end - self.start_time) / 1e9
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        self.events.append((name, time.time_ns(), attributes))
+
+
+class TraceHook(Protocol):
+    """
+    Called as spans start and end, in the task or thread running them.
+    """
+
+    def on_start(self, span: Span) -> None:
+        """Called once the span is current; its attributes may still change."""
+
+    def on_end(self, span: Span) -> None:
+        """Called once the span has ended."""
+
+
+# Context of a request that was not sampled: nothing below it is traced.
+_UNSAMPLED = object()
+
+_current: ContextVar[Any] = ContextVar("_current_span", default=None)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Tracer:
+    """
+    Creates spans and passes them to its hooks.
+
+    ``sample_rate`` is the share of traces recorded, decided at their root.
+    With a ``profiler``, root spans are sampled and those slower than
+    ``profile_threshold`` seconds get their folded stacks attached.
+    """
+
+    def __init__(
+        self,
+        hooks: list[TraceHook] | None = None,
+        sample_rate: float = 1.0,
+        profiler: SamplingProfiler | None = None,
+        profile_threshold: float = 1.0,
+        profile_directory: str | None = None,
+    ):
+        self.hooks = list(hooks or [])
+        self.sample_rate = sample_rate
+        self.profiler = profiler
+        self.profile_threshold = profile_threshold
+        self.profile_directory = profile_directory
+
+    def add_hook(self, hook: TraceHook) -> None:
+        self.hooks = [*self.hooks, hook]
+
+    def remove_hook(self, hook: TraceHook) -> None:
+        self.hooks = [h for h in self.hooks if h is not hook]
+
+    @contextmanager
+    def span(
+        self, name: str, remote: tuple[str, str] | None = None, **attributes: Any
+    ) -> Iterator[Span | None]:
+        """
+        Time the enclosed block as a child of the current span.
+
+        A new trace starts when there is none, continuing ``remote`` (trace
+        id, parent span id) if given. Yields None when the trace is not
+        sampled.
+        """
+        parent = _current.get()
+        if parent is _UNSAMPLED:
+            yield None
+            return
+        if parent is None and random.random() >= self.sample_rate:
+            token = _current.set(_UNSAMPLED)
+            try:
+                yield None
+            finally:
+                _current.reset(token)
+            return
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        elif remote is not None:
+            trace_id, parent_id = remote
+        else:
+            trace_id, parent_id = _new_id(128), None
+        span = Span(
+            name=name,
+            trace_id=trace_id,
+            span_id=_new_id(64),
+            parent_id=parent_id,
+            start_time=time.time_ns(),
+            attributes=attributes,
+            parent=parent,
+            thread_id=threading.get_ident(),
+        )
+        token = _current.set(span)
+        self._call("on_start", span)
+        profiler = self.profiler if span.is_root else None
+        if profiler is not None:
+            profiler.start(span.span_id, span.thread_id)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_time = time.time_ns()
+            _current.reset(token)
+            if span.status == "unset":
+                span.status = "ok"
+            if profiler is not None:
+                self._attach_profile(span, profiler.stop(span.span_id))
+            self._call("on_end", span)
+
+    def _call(self, method: str, span: Span) -> None:
+        for hook in self.hooks:
+            try:
+                getattr(hook, method)(span)
+            except Exception:
+                logger.exception("Trace hook %r failed.", hook)
+
+    def _attach_profile(self, span: Span, samples) -> None:
+        if span.duration < self.profile_threshold or not samples:
+            return
+        folded = render(samples)
+        span.set_attribute("profile.folded", folded)
+        span.set_attribute("profile.samples", sum(samples.values()))
+        if self.profile_directory:
+            directory = Path(self.profile_directory)
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"{span.trace_id}-{span.span_id}.folded"
+            path.write_text(folded + "\n")
+            span.set_attribute("profile.path", str(path))
+
+
+class MemoryExporter:
+    """
+    Keeps the last ``capacity`` finished spans, for tests and debugging.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self._spans: deque[Span] = deque(maxlen=capacity)
+
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def on_end(self, span: Span) -> None:
+        self._spans.append(span)
+
+    def spans(self, trace_id: str | None = None) -> list[Span]:
+        """
+        Finished spans in the order they ended, of one trace if given.
+        """
+        return [s for s in self._spans if trace_id in (None, s.trace_id)]
+
+    def clear(self) -> None:
+        self._spans.clear()
+
+
+class LogExporter:
+    """
+    Logs a breakdown of every trace slower than ``threshold`` seconds.
+    """
+
+    def __init__(self, threshold: float = 0.0):
+        self.threshold = threshold
+        self._traces: dict[str, list[Span]] = {}
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def on_end(self, span: Span) -> None:
+        with self._lock:
+            spans = self._traces.setdefault(span.trace_id, [])
+            spans.append(span)
+            if not span.is_root:
+                return
+            del self._traces[span.trace_id]
+        if span.duration >= self.threshold:
+            logger.info(
+                "Trace %s took %.3f s:\n%s",
+                span.trace_id,
+                span.duration,
+                format_trace(spans),
+            )
+
+
+def format_trace(spans: list[Span]) -> str:
+    """
+    Spans of a trace as an indented tree of offsets and durations.
+    """
+    children: dict[str | None, list[Span]] = {}
+    ids = {span.span_id for span in spans}
+    for span in spans:
+        parent = span.parent_id if span.parent_id in ids else None
+        children.setdefault(parent, []).append(span)
+    roots = children.get(None, [])
+    origin = min((span.start_time for span in roots), default=0)
+    lines = []
+
+    def visit(span: Span, depth: int) -> None:
+        offset = (span.start_time - origin) / 1e6
+        attributes = " ".join(
+            f"{key}={value}"
+            for key, value in span.attributes.items()
+            if key != "profile.folded"
+        )
+        error = f" error={span.error}" if span.error else ""
+        lines.append(
+            f"{'  ' * depth}{span.name} +{offset:.1f} ms {span.duration * 1000:.1f} ms"
+            f"{' ' + attributes if attributes else ''}{error}"
+        )
+        for child in sorted(children.get(span.span_id, []), key=lambda s: s.start_time):
+            visit(child, depth + 1)
+
+    for root in sorted(roots, key=lambda s: s.start_time):
+        visit(root, 0)
+    return "\n".join(lines)
+
+
+class _RootTraceIds:
+    """
+    Id generator of an OpenTelemetry SDK tracer that hands the next root
+    span started on this thread a given trace id.
+    """
+
+    def __init__(self, generator: Any):
+        self.generator = generator
+        self.pending = threading.local()
+
+    def generate_trace_id(self) -> int:
+        trace_id = getattr(self.pending, "trace_id", None)
+        self.pending.trace_id = None
+        return self.generator.generate_trace_id() if trace_id is None else trace_id
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.generator, name)
+
+
+class OpenTelemetryExporter:
+    """
+    Re-creates spans through the OpenTelemetry API, for the SDK and
+    exporters the application configured.
+
+    Span ids are assigned by the SDK and spans are renamed as they end.
+    Roots keep their trace id: a continued trace is parented on its remote
+    span, and a new one is started with its id through the SDK tracer's id
+    generator. Tracers without one (an SDK configured after the exporter was
+    built) start new roots with a trace id of their own, linked to ours.
+    """
+
+    def __init__(self, name: str = "nicotine", tracer_provider: Any = None):
+        # opentelemetry-api is optional and only imported for this exporter.
+        try:
+            from opentelemetry import context, trace
+        except ImportError:
+            raise ImportError("The otel exporter requires opentelemetry-api.")
+        self._context = context
+        self._trace = trace
+        self._tracer = trace.get_tracer(name, tracer_provider=tracer_provider)
+        self._ids: _RootTraceIds | None = None
+        generator = getattr(self._tracer, "id_generator", None)
+        if generator is not None:
+            self._ids = _RootTraceIds(generator)
+            setattr(self._tracer, "id_generator", self._ids)
+        self._open: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span) -> None:
+        trace = self._trace
+        with self._lock:
+            parent = self._open.get(span.parent_id or "")
+        links = []
+        if parent is None and span.parent_id is not None:
+            parent = trace.NonRecordingSpan(self._span_context(span, span.parent_id))
+        if parent is not None:
+            context = trace.set_span_in_context(parent)
+        else:
+            context = self._context.Context()
+            if self._ids is not None:
+                self._ids.pending.trace_id = int(span.trace_id, 16)
+            else:
+                links.append(trace.Link(self._span_context(span, span.span_id)))
+        try:
+            otel_span = self._tracer.start_span(
+                span.name, context=context, links=links, start_time=span.start_time
+            )
+        finally:
+            if self._ids is not None:
+                self._ids.pending.trace_id = None
+        with self._lock:
+            self._open[span.span_id] = otel_span
+
+    def _span_context(self, span: Span, span_id: str) -> Any:
+        trace = self._trace
+        return trace.SpanContext(
+            trace_id=int(span.trace_id, 16),
+            span_id=int(span_id, 16),
+            is_remote=True,
+            trace_flags=trace.TraceFlags(trace.TraceFlags.SAMPLED),
+        )
+
+    def on_end(self, span: Span) -> None:
+        with self._lock:
+            otel_span = self._open.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        otel_span.update_name(span.name)  # e.g. a request named after its route
+        for key, value in span.attributes.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(key, value)
+        for name, timestamp, attributes in span.events:
+            otel_span.add_event(name, attributes, timestamp)
+        if span.status == "error":
+            otel_span.set_status(
+                self._trace.Status(self._trace.StatusCode.ERROR, span.error)
+            )
+        otel_span.end(end_time=span.end_time)
+
+
+EXPORTERS: dict[str, Callable[[], TraceHook | None]] = {
+    "none": lambda: None,
+    "memory": MemoryExporter,
+    "log": lambda: LogExporter(float(get_setting("tracing.slow_threshold", 0.0))),
+    "otel": OpenTelemetryExporter,
+}
+
+
+def build_tracer() -> Tracer | None:
+    """
+    Build the tracer described by the ``tracing`` config section.
+    """
+    if not get_setting("tracing.enabled", False):
+        return None
+    name = get_setting("tracing.exporter", "log")
+    if name not in EXPORTERS:
+        raise ValueError(f"Unknown tracing exporter: {name}.")
+    exporter = EXPORTERS[name]()
+    profiler = None
+    if get_setting("tracing.profiler.enabled", False):
+        profiler = SamplingProfiler(
+            float(get_setting("tracing.profiler.interval", 0.005))
+        )
+    return Tracer(
+        hooks=[exporter] if exporter is not None else [],
+        sample_rate=float(get_setting("tracing.sample_rate", 1.0)),
+        profiler=profiler,
+        profile_threshold=float(get_setting("tracing.profiler.threshold", 1.0)),
+        profile_directory=get_setting("tracing.profiler.directory", None),
+    )
+
+
+_UNSET = object()
+_tracer: "Tracer | None | object" = _UNSET
+
+
+def get_tracer() -> Tracer | None:
+    """
+    Get the process-wide tracer, or None when tracing is disabled.
+    """
+    global _tracer
+    if _tracer is _UNSET:
+        _tracer = build_tracer()
+    return _tracer  # type: ignore[return-value]
+
+
+def configure_tracer(tracer: Tracer | None) -> None:
+    """
+    Replace the process-wide tracer (None disables tracing).
+    """
+    global _tracer
+    _tracer = tracer
+
+
+_NO_SPAN = nullcontext()
+
+
+def span(name: str, **attributes: Any) -> ContextManager[Span | None]:
+    """
+    Time the enclosed block as a span of the current trace.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.span(name, **attributes)
+
+
+def current_span() -> Span | None:
+    """
+    The innermost open span of the running task or thread, if traced.
+    """
+    current = _current.get()
+    return None if current is _UNSAMPLED else current
+
+
+def set_attributes(**attributes: Any) -> None:
+    """
+    Set attributes on the current span, if any.
+    """
+    current = current_span()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def add_event(name: str, **attributes: Any) -> None:
+    """
+    Record a point in time on the current span, if any.
+    """
+    current = current_span()
+    if current is not None:
+        current.add_event(name, **attributes)
+
+
+def add_hook(hook: TraceHook) -> None:
+    """
+    Call ``hook`` for every span of the process-wide tracer, if enabled.
+    """
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.add_hook(hook)
+
+
+def parse_traceparent(value: str) -> tuple[str, str] | None:
+    """
+    Trace id and parent span id of a W3C ``traceparent`` header.
+    """
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    trace_id, parent_id = parts[1].lower(), parts[2].lower()
+    try:
+        int(trace_id, 16), int(parent_id, 16)
+    except ValueError:
+        return None
+    if not int(trace_id, 16) or not int(parent_id, 16):
+        return None
+    return trace_id, parent_id
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware tracing every HTTP request as a root span.
+
+    The span is named after the route template once routing is done, so
+    names stay bounded like metric labels.
+    """
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        remote = None
+        for name, value in scope.get("headers", ()):
+            if name == b"traceparent":
+                remote = parse_traceparent(value.decode("latin-1"))
+                break
+        method = scope["method"]
+        attributes = {"http.method": method, "http.target": scope["path"]}
+        with self.tracer.span(
+            f"{method} {scope['path']}", remote=remote, **attributes
+        ) as request_span:
+            if request_span is None:
+                await self.app(scope, receive, send)
+                return
+            header = (b"x-trace-id", request_span.trace_id.encode())
+
+            async def send_wrapper(message) -> None:
+                if message["type"] == "http.response.start":
+                    request_span.set_attribute("http.status_code", message["status"])
+                    message["headers"] = [*message.get("headers", ()), header]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route is not None:
+                    request_span.name = f"{method} {route}"
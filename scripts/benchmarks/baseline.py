@@ -0,0 +1,106 @@
+"""
+Stored baselines for benchmark results.
+
+A baseline is ``baselines/<name>.json`` next to this file: the metrics of a
+reference run, each with the direction that counts as better, plus the
+machine it was recorded on. ``--save-baseline`` records the current run;
+``--compare`` fails the run when any metric is worse than its baseline by
+more than ``--tolerance`` (a fraction of the baseline value). Baselines are
+only comparable on the machine that recorded them, so record them again
+on the reference machine before comparing in CI.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import AbstractSet
+
+BASELINES = Path(__file__).resolve().parent / "baselines"
+
+
+def add_baseline_args(parser: argparse.ArgumentParser, tolerance: float) -> None:
+    group = parser.add_argument_group("baselines")
+    group.add_argument(
+        "--save-baseline", action="store_true", help="Record this run as baseline"
+    )
+    group.add_argument(
+        "--compare", action="store_true", help="Fail on regressions vs baseline"
+    )
+    group.add_argument(
+        "--tolerance",
+        type=float,
+        default=tolerance,
+        help="Allowed regression as a fraction of the baseline value",
+    )
+    group.add_argument("--baseline-dir", type=Path, default=BASELINES)
+
+
+def save_baseline(
+    path: Path, metrics: dict[str, float], higher_is_better: set[str]
+) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    record = {
+        "recorded": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": f"{platform.machine()} {platform.processor() or platform.system()}",
+        "python": platform.python_version(),
+        "metrics": {
+            name: {
+                "value": round(value, 6),
+                "better": "higher" if name in higher_is_better else "lower",
+            }
+            for name, value in sorted(metrics.items())
+        },
+    }
+    path.write_text(json.dumps(record, indent=2) + "\n")
+
+
+def compare_baseline(
+    path: Path, metrics: dict[str, float], tolerance: float
+) -> list[str]:
+    """
+    Regressions of ``metrics`` against the baseline at ``path``.
+
+    Metrics missing from either side are ignored.
+    """
+    baseline = json.loads(path.read_text())["metrics"]
+    regressions = []
+    for name, value in sorted(metrics.items()):
+        if name not in baseline:
+            continue
+        reference = baseline[name]["value"]
+        if baseline[name]["better"] == "higher":
+            worse = value < reference * (1 - tolerance)
+        else:
+            worse = value > reference * (1 + tolerance)
+        if worse:
+            regressions.append(f"{name}: {value:.4g} (baseline {reference:.4g})")
+    return regressions
+
+
+def check_baseline(
+    args: argparse.Namespace,
+    name: str,
+    metrics: dict[str, float],
+    higher_is_better: AbstractSet[str] = frozenset(),
+) -> None:
+    """
+    Save or compare a run as requested on the command line; exits with
+    status 1 on regressions.
+    """
+    path = args.baseline_dir / f"{name}.json"
+    if args.save_baseline:
+        save_baseline(path, metrics, set(higher_is_better))
+        print(f"baseline saved to {path}")
+    if args.compare:
+        if not path.is_file():
+            sys.exit(f"No baseline at {path}; record one with --save-baseline.")
+        regressions = compare_baseline(path, metrics, args.tolerance)
+        if regressions:
+            print(f"regressions beyond {args.tolerance:.0%} of baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} of baseline")
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Model cascade tuning: accuracy, escalation rate and cost per band.
+
+Evaluates every record of a labeled JSONL file (one object per line with
+``prompt``, ``output`` and ``is_hallucination``) once with the cheap model
+and once with the strong model, then replays the cascade for each candidate
+``--band``: the cheap verdict is kept unless the cascade would escalate it,
+in which case the strong verdict counts and both calls are paid for.
+
+- accuracy: share of final verdicts matching the label
+- escalated: share of records sent to the strong model
+- cost: USD per 1000 records, from ``cascade.prices`` (n/a without prices)
+- latency: mean seconds per record, the escalation call included
+
+The strong-only and cheap-only rows are the cascade's bounds. Calls go to
+``--provider`` (default: ``providers.default``); use ``--provider fake`` for
+a dry run without network access. Fails when the accuracy at the
+configured band falls more than ``--max-accuracy-drop`` below strong-only.
+
+Usage:
+    python scripts/benchmarks/bench_cascade.py --data labeled.jsonl
+    python scripts/benchmarks/bench_cascade.py --data labeled.jsonl --band 10 90 --sweep 20:80 30:70
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+
+def parse_band(value: str) -> tuple[float, float]:
+    low, high = value.split(":")
+    return float(low), float(high)
+
+
+def parse_args() -> argparse.Namespace:
+    from nicotine.config import get_setting
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--data", type=Path, required=True, help="labeled JSONL")
+    parser.add_argument("--model", default="gpt-4.1", help="strong model")
+    parser.add_argument(
+        "--cheap-model", default=get_setting("cascade.model", "gpt-4.1-mini")
+    )
+    parser.add_argument("--provider", default=None)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--band",
+        type=float,
+        nargs=2,
+        default=get_setting("cascade.band", [20.0, 80.0]),
+        help="band checked against --max-accuracy-drop",
+    )
+    parser.add_argument(
+        "--sweep",
+        type=parse_band,
+        nargs="*",
+        default=[(10, 90), (30, 70), (40, 60), (50, 50)],
+        help="more bands to report, as low:high",
+    )
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.02)
+    return parser.parse_args()
+
+
+def load_records(path: Path) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def evaluate(
+    records: list[dict], model: str, provider: str | None, concurrency: int
+) -> list[dict]:
+    """
+    Evaluate every record with one model, keeping its verdict, tokens and
+    latency.
+    """
+    from nicotine import LLMOutput, LLMSettings, async_detect_hallucination
+    from nicotine.cascade import track_usage
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int, record: dict) -> dict:
+        output = LLMOutput(
+            id=str(record.get("id", index)),
+            prompt=record["prompt"],
+            output=record["output"],
+            settings=LLMSettings(model=model, provider=provider),
+        )
+        async with semaphore:
+            start = time.perf_counter()
+            with track_usage() as tokens:
+                evaluation = await async_detect_hallucination(output)
+            return {
+                "evaluation": evaluation,
+                "tokens": tokens,
+                "seconds": time.perf_counter() - start,
+            }
+
+    return list(await asyncio.gather(*(one(i, r) for i, r in enumerate(records))))
+
+
+def score(
+    records: list[dict],
+    runs: dict,
+    prices: dict,
+    route: Callable[[int], list[str]],
+) -> dict:
+    """
+    Score a routing policy. ``route(index)`` names the runs whose calls are
+    made for a record; the verdict of the last one is returned.
+    """
+    correct = escalated = 0
+    seconds = cost = 0.0
+    priced = True
+    for index, record in enumerate(records):
+        names = route(index)
+        escalated += len(names) > 1
+        final = runs[names[-1]]["results"][index]["evaluation"]
+        correct += final.is_hallucination == bool(record["is_hallucination"])
+        for name in names:
+            call = runs[name]["results"][index]
+            seconds += call["seconds"]
+            price = prices.get(runs[name]["model"])
+            if price is None:
+                priced = False
+            else:
+                cost += price.cost(call["tokens"])
+    n = len(records)
+    return {
+        "accuracy": correct / n,
+        "escalated": escalated / n,
+        "cost_per_1k": cost / n * 1000 if priced else None,
+        "latency": seconds / n,
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    logging.disable(logging.INFO)
+    from nicotine.cascade import ModelCascade, Price, configure_cascade
+    from nicotine.config import get_setting
+    from nicotine.providers import FakeProvider, configure_provider
+
+    configure_cascade(None)  # evaluate each model on its own
+    if args.provider == "fake" and not get_setting("providers.backends.fake"):
+        configure_provider("fake", FakeProvider())
+    records = load_records(args.data)
+    runs = {}
+    for tier, model in (("cheap", args.cheap_model), ("strong", args.model)):
+        results = asyncio.run(evaluate(records, model, args.provider, args.concurrency))
+        runs[tier] = {"model": model, "results": results}
+        failed = sum(r["evaluation"].error is not None for r in results)
+        print(f"{tier}: {model}, {len(records)} records, {failed} failed")
+    prices = {
+        model: Price(**price)
+        for model, price in get_setting("cascade.prices", {}).items()
+    }
+
+    def cascaded(cascade: ModelCascade) -> Callable[[int], list[str]]:
+        def route(index: int) -> list[str]:
+            evaluation = runs["cheap"]["results"][index]["evaluation"]
+            if cascade.escalation(evaluation) is not None:
+                return ["cheap", "strong"]
+            return ["cheap"]
+
+        return route
+
+    selected = (float(args.band[0]), float(args.band[1]))
+    policies: dict[str, Callable[[int], list[str]]] = {
+        "strong only": lambda index: ["strong"],
+        "cheap only": lambda index: ["cheap"],
+    }
+    for band in sorted({selected, *args.sweep}):
+        cascade = ModelCascade(args.cheap_model, band=band)
+        policies[f"band {band[0]:g}-{band[1]:g}"] = cascaded(cascade)
+    scores = {}
+    for name, route in policies.items():
+        result = scores[name] = score(records, runs, prices, route)
+        cost = result["cost_per_1k"]
+        print(
+            f"{name:<14} accuracy {result['accuracy']:.1%} | escalated "
+            f"{result['escalated']:.1%} | cost "
+            f"{'n/a' if cost is None else f'${cost:.4f}'} per 1k | latency "
+            f"{result['latency']:.3f} s"
+        )
+    configured = scores[f"band {selected[0]:g}-{selected[1]:g}"]
+    if scores["strong only"]["accuracy"] - configured["accuracy"] > (
+        args.max_accuracy_drop
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
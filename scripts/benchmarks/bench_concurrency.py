@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the async detection path.
+
+Starts a local mock upstream with a fixed latency, then fires N detections
+through ``async_detect_hallucination`` and through the FastAPI endpoint. If
+requests overlap, wall time stays close to one upstream latency instead of
+N of them, and ``/health`` keeps answering while detections are in flight.
+
+Usage:
+    python scripts/benchmarks/bench_concurrency.py -n 50 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+from mock_upstream import running_mock_upstream
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--requests", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--port", type=int, default=8765)
+    return parser.parse_args()
+
+
+async def bench_library(n: int) -> float:
+    from nicotine import LLMOutput, LLMSettings, async_detect_hallucination
+
+    outputs = [
+        LLMOutput(
+            id=str(i),
+            prompt="What is the capital of France?",
+            output="Paris",
+            settings=LLMSettings(),
+        )
+        for i in range(n)
+    ]
+    start = time.perf_counter()
+    results = await asyncio.gather(*(async_detect_hallucination(o) for o in outputs))
+    elapsed = time.perf_counter() - start
+    errors = [r.error for r in results if r.error]
+    if errors:
+        raise RuntimeError(f"{len(errors)} detections failed: {errors[0]}")
+    return elapsed
+
+
+async def bench_endpoint(n: int) -> tuple[float, float]:
+    import httpx
+
+    from nicotine.api import app
+
+    payload = {
+        "id": "bench",
+        "prompt": "What is the capital of France?",
+        "output": "Paris",
+        "settings": {"model": "gpt-4.1", "temperature": 0.7, "max_tokens": 1000},
+    }
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as ac:
+        start = time.perf_counter()
+        detections = asyncio.gather(
+            *(ac.post("/api/v1/detect-hallucination", json=payload) for _ in range(n))
+        )
+        await asyncio.sleep(0.01)
+        health_start = time.perf_counter()
+        health = await ac.get("/health")
+        health_latency = time.perf_counter() - health_start
+        responses = await detections
+        elapsed = time.perf_counter() - start
+    assert health.status_code == 200
+    assert all(r.status_code == 200 for r in responses)
+    return elapsed, health_latency
+
+
+def main() -> None:
+    args = parse_args()
+    logging.disable(logging.INFO)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+
+    with running_mock_upstream(latency=args.latency, port=args.port) as upstream:
+        serial = args.requests * args.latency
+        library = asyncio.run(bench_library(args.requests))
+        library_peak = upstream.state.peak_in_flight
+        upstream.state.peak_in_flight = 0
+        endpoint, health = asyncio.run(bench_endpoint(args.requests))
+        endpoint_peak = upstream.state.peak_in_flight
+
+    print(f"requests:            {args.requests}")
+    print(f"upstream latency:    {args.latency * 1000:.0f} ms")
+    print(f"serial lower bound:  {serial:.2f} s")
+    print(
+        f"library (async):     {library:.2f} s  "
+        f"speedup x{serial / library:.1f}  peak in-flight {library_peak}"
+    )
+    print(
+        f"endpoint (async):    {endpoint:.2f} s  "
+        f"speedup x{serial / endpoint:.1f}  peak in-flight {endpoint_peak}"
+    )
+    print(f"/health under load:  {health * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
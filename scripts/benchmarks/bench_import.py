@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark: ``from nicotine import detect_hallucination``.
+
+Times the import in fresh interpreters, without an API key in the
+environment, and fails when the median exceeds the budget or when a heavy
+module (OpenAI SDK, FastAPI, uvicorn, ...) is imported eagerly.
+
+Usage:
+    python scripts/benchmarks/bench_import.py --runs 10 --budget-ms 250
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# Modules that must only be imported once a client or the service is used.
+LAZY_MODULES = (
+    "openai",
+    "httpx",
+    "fastapi",
+    "starlette",
+    "uvicorn",
+    "yaml",
+    "prometheus_client",
+    "numpy",
+    "nicotine.api",
+    "nicotine.pipeline",
+)
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from nicotine import detect_hallucination
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--budget-ms", type=float, default=250.0, help="Maximum median import time"
+    )
+    return parser.parse_args()
+
+
+def probe() -> dict:
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(result.stdout)
+
+
+def main() -> None:
+    args = parse_args()
+    probe()  # Warm the bytecode cache.
+    samples = [probe() for _ in range(args.runs)]
+    times = [sample["seconds"] * 1000 for sample in samples]
+    median = statistics.median(times)
+    eager = sorted(
+        lazy
+        for lazy in LAZY_MODULES
+        if any(m == lazy or m.startswith(lazy + ".") for m in samples[0]["modules"])
+    )
+
+    print(f"runs:            {args.runs}")
+    print(f"import median:   {median:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"import min/max:  {min(times):.1f} / {max(times):.1f} ms")
+    print(f"eager imports:   {', '.join(eager) or 'none'}")
+    if median > args.budget_ms or eager:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Load test of the detection service at rising concurrency.
+
+Starts the mock upstream and one ``nicotine.api:app`` worker under uvicorn
+in their own processes, so the load generator does not compete with them
+for the GIL. Then, for each concurrency level, keeps that many requests in
+flight against ``POST /api/v1/detect-hallucination`` for ``--duration``
+seconds (closed loop: each client sends its next request when the last
+one returns). Every request carries a distinct output, so caches do not
+answer for the upstream. Reports throughput and p50/p95/p99 latency per
+level. Pass ``--url`` to load an already running service instead.
+
+Each client holds one keep-alive HTTP/1.1 connection written directly on
+asyncio streams: a pooled httpx client stops scaling at a few dozen
+requests in flight and would measure itself rather than the service.
+
+Usage:
+    python scripts/benchmarks/bench_load.py --latency 0.1 --concurrency 1 8 32 128
+    python scripts/benchmarks/bench_load.py --compare
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Iterator
+from urllib.parse import urlsplit
+
+from baseline import add_baseline_args, check_baseline
+
+ROOT = Path(__file__).resolve().parents[2]
+HERE = Path(__file__).resolve().parent
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--latency-sigma", type=float, default=0.0)
+    parser.add_argument("--url", help="Load a running service instead")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--upstream-port", type=int, default=8765)
+    add_baseline_args(parser, tolerance=0.25)
+    return parser.parse_args()
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process on port {port} exited early.")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout:.0f} s.")
+
+
+@contextmanager
+def running(command: list[str], port: int, env: dict) -> Iterator[None]:
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    try:
+        wait_for_port(port, process)
+        yield
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def payload(n: int) -> dict:
+    return {
+        "id": f"load-{n}",
+        "prompt": "Summarize the history of the Eiffel Tower in one sentence.",
+        "output": f"The Eiffel Tower was completed in 1889 (request {n}).",
+        "settings": {"model": "gpt-4.1", "temperature": 0.7, "max_tokens": 1000},
+    }
+
+
+class Connection:
+    """
+    Minimal keep-alive HTTP/1.1 client for JSON requests.
+    """
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+
+    async def post(self, path: str, payload: dict) -> tuple[int, dict]:
+        if self.reader is None or self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        body = json.dumps(payload).encode()
+        head = (
+            f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        )
+        self.writer.write(head.encode() + body)
+        await self.writer.drain()
+        status_line, *headers = (
+            (await self.reader.readuntil(b"\r\n\r\n")).decode().split("\r\n")
+        )
+        fields = dict(line.lower().split(":", 1) for line in headers if ":" in line)
+        content = await self.reader.readexactly(int(fields["content-length"]))
+        if fields.get("connection", "").strip() == "close":
+            self.close()
+        return int(status_line.split()[1]), json.loads(content)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def run_level(url: str, concurrency: int, duration: float, warmup: float):
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(sys.maxsize))
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop = measure_from + duration
+
+    async def client() -> None:
+        nonlocal errors
+        connection = Connection(url)
+        while time.perf_counter() < stop:
+            sent = time.perf_counter()
+            try:
+                status, body = await connection.post(
+                    "/api/v1/detect-hallucination", payload(next(counter))
+                )
+                ok = status == 200 and body["error"] is None
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                connection.close()
+                ok = False
+            done = time.perf_counter()
+            if sent >= measure_from and done <= stop:
+                latencies.append(done - sent)
+                errors += not ok
+        connection.close()
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    latencies.sort()
+
+    def quantile(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+    return {
+        "rps": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": quantile(0.95),
+        "p99_ms": quantile(0.99),
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    logging.disable(logging.INFO)
+    url = args.url or f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ)
+    env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.upstream_port}/v1"
+    env.setdefault("OPENAI_API_KEY", "mock-key")
+
+    metrics: dict[str, float] = {}
+    higher_is_better = set()
+    with ExitStack() as stack:
+        if not args.url:
+            upstream = [
+                sys.executable,
+                str(HERE / "mock_upstream.py"),
+                f"--port={args.upstream_port}",
+                f"--latency={args.latency}",
+                f"--latency-sigma={args.latency_sigma}",
+            ]
+            service = [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "nicotine.api:app",
+                f"--port={args.port}",
+                "--log-level=warning",
+                "--no-access-log",
+            ]
+            stack.enter_context(running(upstream, args.upstream_port, env))
+            stack.enter_context(running(service, args.port, env))
+        print(f"upstream latency: {args.latency * 1000:.0f} ms")
+        print("concurrency      req/s    p50 ms    p95 ms    p99 ms  errors")
+        for concurrency in args.concurrency:
+            result = asyncio.run(
+                run_level(url, concurrency, args.duration, args.warmup)
+            )
+            print(
+                f"{concurrency:>11}  {result['rps']:9.1f}  {result['p50_ms']:8.1f}  "
+                f"{result['p95_ms']:8.1f}  {result['p99_ms']:8.1f}  {result['errors']:6}"
+            )
+            for name in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+                metrics[f"c{concurrency}_{name}"] = result[name]
+            higher_is_better.add(f"c{concurrency}_rps")
+            if result["errors"]:
+                sys.exit(f"{result['errors']} requests failed at {concurrency}.")
+    check_baseline(args, "load", metrics, higher_is_better)
+
+
+if __name__ == "__main__":
+    main()
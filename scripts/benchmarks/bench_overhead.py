@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks of the per-call overhead of ``detect_hallucination``.
+
+Times the local work around an upstream call, with no network involved:
+building the detection prompt, validating ``LLMOutput`` payloads, parsing
+and serializing ``HallucinationEvaluation``, and a whole
+``detect_hallucination`` call through the OpenAI SDK against an in-memory
+transport that answers instantly (request building, call policy, response
+parsing). Each figure is the best of ``--repeat`` runs, in microseconds
+per call.
+
+Usage:
+    python scripts/benchmarks/bench_overhead.py
+    python scripts/benchmarks/bench_overhead.py --compare
+"""
+
+import argparse
+import json
+import logging
+import sys
+import timeit
+from pathlib import Path
+
+from baseline import add_baseline_args, check_baseline
+from mock_upstream import mock_response
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+PAYLOAD = {
+    "id": "bench",
+    "prompt": "Summarize the history of the Eiffel Tower in two sentences.",
+    "output": (
+        "The Eiffel Tower was built for the 1889 World's Fair in Paris. "
+        "Designed by Gustave Eiffel's company, it was the tallest man-made "
+        "structure in the world until 1930."
+    ),
+    "settings": {"model": "gpt-4.1", "temperature": 0.7, "max_tokens": 1000},
+}
+
+EVALUATION = json.dumps(
+    {
+        "is_hallucination": False,
+        "rationale": "Both sentences match the historical record.",
+        "delusion_percentage": 3.5,
+        "error": None,
+    }
+)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    add_baseline_args(parser, tolerance=0.5)
+    return parser.parse_args()
+
+
+def per_call_us(func, repeat: int) -> float:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e6
+
+
+def mock_client():
+    """
+    OpenAI client whose transport answers every request in memory.
+    """
+    import httpx
+    from openai import OpenAI
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json=mock_response(json.loads(request.content)))
+
+    http_client = httpx.Client(transport=httpx.MockTransport(handler))
+    return OpenAI(api_key="bench", base_url="http://mock/v1", http_client=http_client)
+
+
+def run(repeat: int) -> dict[str, float]:
+    from nicotine import LLMOutput, detect_hallucination
+    from nicotine.models import HallucinationEvaluation
+    from nicotine.prompts import get_template
+    from nicotine.system import configure_client
+
+    payload_json = json.dumps(PAYLOAD)
+    output = LLMOutput.model_validate(PAYLOAD)
+    evaluation = HallucinationEvaluation.model_validate_json(EVALUATION)
+    configure_client(mock_client())
+    try:
+        if detect_hallucination(output).error is not None:
+            raise RuntimeError("detect_hallucination failed against the mock.")
+        return {
+            "build_prompt_us": per_call_us(
+                lambda: get_template(output.settings).request(output), repeat
+            ),
+            "validate_output_us": per_call_us(
+                lambda: LLMOutput.model_validate(PAYLOAD), repeat
+            ),
+            "validate_output_json_us": per_call_us(
+                lambda: LLMOutput.model_validate_json(payload_json), repeat
+            ),
+            "parse_evaluation_us": per_call_us(
+                lambda: HallucinationEvaluation.model_validate_json(EVALUATION),
+                repeat,
+            ),
+            "dump_evaluation_us": per_call_us(evaluation.model_dump_json, repeat),
+            "detect_hallucination_us": per_call_us(
+                lambda: detect_hallucination(output), repeat
+            ),
+        }
+    finally:
+        configure_client(None)
+
+
+def main() -> None:
+    args = parse_args()
+    logging.disable(logging.INFO)
+    metrics = run(args.repeat)
+    width = max(map(len, metrics))
+    for name, value in metrics.items():
+        print(f"{name:<{width}}  {value:10.2f} us")
+    check_baseline(args, "overhead", metrics)
+
+
+if __name__ == "__main__":
+    main()
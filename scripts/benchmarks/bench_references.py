@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Reference corpus benchmark: index build time and query latency.
+
+Generates a synthetic corpus with a Zipf-distributed vocabulary, builds the
+on-disk BM25 index and measures open time and query latency percentiles.
+
+Usage:
+    python scripts/benchmarks/bench_references.py --passages 1000000
+"""
+
+import argparse
+import itertools
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from nicotine.references import ReferenceIndex, ReferenceIndexBuilder  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--passages", type=int, default=1_000_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--length", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--index", help="Index directory (default: temporary)")
+    return parser.parse_args()
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def main() -> None:
+    args = parse_args()
+    rng = random.Random(args.seed)
+    words = [f"w{i}" for i in range(args.vocabulary)]
+    cum_weights = list(
+        itertools.accumulate(1 / (rank + 1) for rank in range(args.vocabulary))
+    )
+
+    def sample(k: int) -> str:
+        return " ".join(rng.choices(words, cum_weights=cum_weights, k=k))
+
+    def sentence() -> str:
+        return sample(args.length) + "."
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(args.index or tmp) / "index"
+        start = time.perf_counter()
+        builder = ReferenceIndexBuilder(path)
+        for _ in range(args.passages):
+            builder.add(sentence())
+        ingested = time.perf_counter() - start
+        builder.build().close()
+        built = time.perf_counter() - start
+        size = sum(f.stat().st_size for f in path.iterdir())
+
+        start = time.perf_counter()
+        index = ReferenceIndex(path)
+        opened = time.perf_counter() - start
+
+        latencies = []
+        for _ in range(args.queries):
+            query = sample(8)
+            start = time.perf_counter()
+            index.search(query, k=5)
+            latencies.append(time.perf_counter() - start)
+        index.close()
+
+    print(f"passages:        {args.passages:,}")
+    print(
+        f"ingest:          {ingested:.1f} s ({args.passages / ingested:,.0f} passages/s)"
+    )
+    print(f"build total:     {built:.1f} s")
+    print(f"index size:      {size / 1e6:.1f} MB")
+    print(f"open:            {opened * 1000:.0f} ms")
+    print(f"query p50:       {percentile(latencies, 50) * 1000:.2f} ms")
+    print(f"query p99:       {percentile(latencies, 99) * 1000:.2f} ms")
+    print(f"query mean:      {statistics.mean(latencies) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
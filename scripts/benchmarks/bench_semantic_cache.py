@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Semantic cache benchmark: reuse rate, false-reuse rate and lookup latency.
+
+Builds a labeled set of (prompt, output) groups. Outputs are a few
+sentences long: when the institution was founded, then who started it and
+where. Each group has a stored original, variants that keep its verdict
+(surface edits of the output: casing, punctuation, filler; rewordings of
+the prompt and of the first sentence) and perturbations that change it
+(another year, institution, predicate, founder or city, a negation),
+each a small edit of an otherwise identical passage. The originals are
+stored with their labels, then every variant is looked up.
+
+- reuse rate: share of each kind of variant answered from the cache
+- false-reuse rate: reused verdicts whose label differs from the variant's
+
+Pass ``--data`` to use a labeled JSONL file instead, one object per line
+with ``group``, ``prompt``, ``output`` and ``is_hallucination``; the first
+line of each group is stored and the rest are looked up. Fails when the
+false-reuse rate at ``--threshold`` and ``--max-edit`` exceeds
+``--max-false-reuse``.
+
+Usage:
+    python scripts/benchmarks/bench_semantic_cache.py --groups 2000
+    python scripts/benchmarks/bench_semantic_cache.py --data labeled.jsonl
+"""
+
+import argparse
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+ENTITIES = [
+    "Amberfield University",
+    "the Northgate Observatory",
+    "Riverton Hospital",
+    "the Saltmarsh Museum",
+    "Cobalt Rail",
+    "the Harbor Opera",
+    "Elmstead Library",
+    "the Crescent Bridge",
+    "Juniper Labs",
+    "the Granite Theatre",
+]
+
+FOUNDERS = [
+    "Gustave Eiffel",
+    "Thomas Edison",
+    "Marie Curie",
+    "Ada Lovelace",
+    "Nikola Tesla",
+    "Florence Nightingale",
+]
+
+CITIES = ["Paris", "London", "Vienna", "Lisbon", "Boston", "Madrid"]
+
+# Follows the founding sentence in every output.
+CONTEXT = (
+    " It was started by {founder} in {city}. Today it is one of the best "
+    "known institutions of its kind and welcomes visitors every year."
+)
+
+PROMPTS = [
+    "When was {entity} founded?",
+    "In what year was {entity} founded?",
+    "What year was {entity} established?",
+]
+
+PARAPHRASES = [
+    "{Entity} was founded in {year}.",
+    "{Entity} was established in {year}.",
+    "{Entity} was founded in the year {year}.",
+    "It was founded in {year}, {entity}.",
+    "{Entity} was first founded in {year}.",
+]
+
+SURFACE_EDITS = [
+    lambda text: text.lower(),
+    lambda text: text.rstrip(".") + "!",
+    lambda text: "Indeed, " + text[0].lower() + text[1:],
+    lambda text: text.replace(" in ", " in  ").rstrip(".") + " .",
+]
+
+FOUNDED = "{Entity} was founded in {year}."
+
+PERTURBATIONS = [
+    ("entity", "{Other} was founded in {year}." + CONTEXT),
+    ("predicate", "{Entity} was closed in {year}." + CONTEXT),
+    ("negation", "{Entity} was not founded in {year}." + CONTEXT),
+    ("year", "{Entity} was founded in {other_year}." + CONTEXT),
+    ("founder", FOUNDED + CONTEXT.replace("{founder}", "{other_founder}")),
+    ("city", FOUNDED + CONTEXT.replace("{city}", "{other_city}")),
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--groups", type=int, default=2000)
+    parser.add_argument("--data", type=Path, help="Labeled JSONL set")
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument(
+        "--sweep", type=float, nargs="*", default=[0.8, 0.85, 0.9, 0.95]
+    )
+    parser.add_argument("--max-edit", type=float, default=5.0)
+    parser.add_argument("--max-false-reuse", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def synthetic_groups(count: int, seed: int) -> list[list[dict]]:
+    """
+    Groups of an original followed by its labeled variants.
+    """
+    rng = random.Random(seed)
+    groups = []
+    for g in range(count):
+        entity, other = rng.sample(ENTITIES, 2)
+        entity = f"{entity} {g}"
+        other = f"{other} {g}"
+        founder, other_founder = rng.sample(FOUNDERS, 2)
+        city, other_city = rng.sample(CITIES, 2)
+        true_year = rng.randint(1800, 2000)
+        year = true_year if rng.random() < 0.7 else true_year + rng.randint(1, 30)
+        fields = {
+            "entity": entity,
+            "Entity": entity[0].upper() + entity[1:],
+            "Other": other[0].upper() + other[1:],
+            "year": year,
+            "other_year": year + rng.choice([-10, -1, 1, 10]),
+            "founder": founder,
+            "other_founder": other_founder,
+            "city": city,
+            "other_city": other_city,
+        }
+        label = year != true_year
+
+        def record(prompt: str, output: str, kind: str, is_hallucination: bool):
+            return {
+                "group": g,
+                "kind": kind,
+                "prompt": prompt.format(**fields),
+                "output": output.format(**fields),
+                "is_hallucination": is_hallucination,
+            }
+
+        prompts = rng.sample(PROMPTS, len(PROMPTS))
+        outputs = [p + CONTEXT for p in rng.sample(PARAPHRASES, len(PARAPHRASES))]
+        group = [record(prompts[0], outputs[0], "original", label)]
+        for edit in SURFACE_EDITS:
+            group.append(record(prompts[0], edit(outputs[0]), "surface", label))
+        for prompt, output in zip(prompts[1:] + prompts[:1], outputs[1:]):
+            group.append(record(prompt, output, "paraphrase", label))
+        for kind, output in PERTURBATIONS:
+            flipped = (fields["other_year"] != true_year) if kind == "year" else True
+            group.append(record(prompts[0], output, kind, flipped))
+        groups.append(group)
+    return groups
+
+
+def load_groups(path: Path) -> list[list[dict]]:
+    groups: dict = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                record.setdefault("kind", "variant")
+                groups[record["group"]].append(record)
+    for group in groups.values():
+        group[0]["kind"] = "original"
+    return list(groups.values())
+
+
+def run(groups: list[list[dict]], threshold: float, max_edit: float) -> dict:
+    from nicotine import LLMOutput, LLMSettings
+    from nicotine.models import HallucinationEvaluation
+    from nicotine.semantic import SemanticCache
+
+    def output(record: dict) -> LLMOutput:
+        return LLMOutput(
+            id=str(record["group"]),
+            prompt=record["prompt"],
+            output=record["output"],
+            settings=LLMSettings(),
+        )
+
+    cache = SemanticCache(
+        capacity=len(groups) * 2, threshold=threshold, max_edit=max_edit
+    )
+    for group in groups:
+        original = group[0]
+        cache.store(
+            output(original),
+            HallucinationEvaluation(
+                is_hallucination=original["is_hallucination"],
+                rationale="labeled",
+                delusion_percentage=0.0,
+            ),
+        )
+    reused: dict = defaultdict(int)
+    totals: dict = defaultdict(int)
+    wrong = 0
+    latencies = []
+    for group in groups:
+        for record in group[1:]:
+            start = time.perf_counter()
+            verdict = cache.lookup(output(record))
+            latencies.append(time.perf_counter() - start)
+            totals[record["kind"]] += 1
+            if verdict is not None:
+                reused[record["kind"]] += 1
+                wrong += verdict.is_hallucination != record["is_hallucination"]
+    hits = sum(reused.values())
+    latencies.sort()
+    end = int(0.99 * len(latencies))
+    return {
+        "threshold": threshold,
+        "reused": {kind: reused[kind] / totals[kind] for kind in totals},
+        "hits": hits,
+        "false_reuse_rate": wrong / hits if hits else 0.0,
+        "lookup_p50_ms": statistics.median(latencies) * 1000,
+        "lookup_p99_ms": latencies[end] * 1000,
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    logging.disable(logging.INFO)
+    groups = (
+        load_groups(args.data)
+        if args.data
+        else synthetic_groups(args.groups, args.seed)
+    )
+    print(f"groups: {len(groups)}, lookups: {sum(len(g) - 1 for g in groups)}")
+    results = {}
+    for threshold in sorted(set(args.sweep) | {args.threshold}):
+        result = results[threshold] = run(groups, threshold, args.max_edit)
+        rates = ", ".join(f"{k} {v:.1%}" for k, v in sorted(result["reused"].items()))
+        print(
+            f"threshold {threshold:.2f}: false reuse {result['false_reuse_rate']:.2%} "
+            f"of {result['hits']} hits | reused: {rates} | lookup p50 "
+            f"{result['lookup_p50_ms']:.2f} ms, p99 {result['lookup_p99_ms']:.2f} ms"
+        )
+    if results[args.threshold]["false_reuse_rate"] > args.max_false_reuse:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Serialization benchmark of the detection endpoints, before and after.
+
+Calls ``nicotine.api:app`` directly as an ASGI app, with a zero-latency
+fake provider behind it, so the figures are the server-side CPU cost of
+one request: decoding and validating the body, running the endpoint and
+encoding the response. Each mode runs in its own interpreter with
+``api.fast_json`` switched off (FastAPI's default path) or on.
+
+- single: one ``LLMOutput`` with a large ``output``
+- batch: ``/batch`` with many medium-sized outputs
+
+Usage:
+    python scripts/benchmarks/bench_serialization.py --output-kb 200 --batch 100
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output-kb", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--batch-output-kb", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--mode", choices=["default", "fast"], help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def make_output(n: int, kb: int) -> dict:
+    sentence = "The Eiffel Tower was completed in 1889 for the World's Fair. "
+    return {
+        "id": f"bench-{n}",
+        "prompt": "Summarize the history of the Eiffel Tower.",
+        "output": sentence * (kb * 1024 // len(sentence) + 1),
+        "settings": {"model": "gpt-4.1", "provider": "bench"},
+    }
+
+
+async def post(app, path: str, body: bytes) -> tuple[int, bytes]:
+    """
+    One request straight through the ASGI app.
+    """
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status = 0
+    chunks = []
+
+    async def receive() -> dict:
+        return messages.pop() if messages else {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+async def measure(app, path: str, body: bytes, requests: int) -> float:
+    status, content = await post(app, path, body)
+    if status != 200:
+        raise RuntimeError(f"{path} answered {status}: {content[:200]!r}")
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await post(app, path, body)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6
+
+
+def run_mode(args: argparse.Namespace) -> dict:
+    logging.disable(logging.INFO)
+    from nicotine.api import app
+    from nicotine.providers import FakeProvider, configure_api_providers
+    from nicotine.providers import configure_provider
+
+    configure_provider("bench", FakeProvider())
+    configure_api_providers(["bench"])
+    single = json.dumps(make_output(0, args.output_kb)).encode()
+    batch = json.dumps(
+        {"outputs": [make_output(i, args.batch_output_kb) for i in range(args.batch)]}
+    ).encode()
+
+    async def main() -> dict:
+        return {
+            "single_us": await measure(
+                app, "/api/v1/detect-hallucination", single, args.requests
+            ),
+            "batch_us": await measure(
+                app,
+                "/api/v1/detect-hallucination/batch",
+                batch,
+                max(1, args.requests // 10),
+            ),
+        }
+
+    return asyncio.run(main())
+
+
+def spawn(mode: str, argv: list[str]) -> dict:
+    import yaml
+
+    from nicotine.config import load_config
+
+    config = load_config()
+    config.setdefault("api", {})["fast_json"] = mode == "fast"
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as f:
+        yaml.safe_dump(config, f)
+    try:
+        env = dict(os.environ, NICOTINE_CONFIG=f.name)
+        env.setdefault("OPENAI_API_KEY", "unused")
+        result = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, *argv],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    finally:
+        os.unlink(f.name)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    args = parse_args()
+    if args.mode:
+        print(json.dumps(run_mode(args)))
+        return
+    argv = [
+        f"--output-kb={args.output_kb}",
+        f"--batch={args.batch}",
+        f"--batch-output-kb={args.batch_output_kb}",
+        f"--requests={args.requests}",
+    ]
+    default, fast = spawn("default", argv), spawn("fast", argv)
+    print(
+        f"single: 1 output of {args.output_kb} KB; "
+        f"batch: {args.batch} outputs of {args.batch_output_kb} KB"
+    )
+    print("            default us   fast_json us   speedup")
+    for name in ("single_us", "batch_us"):
+        print(
+            f"{name.removesuffix('_us'):<10}  {default[name]:10.1f}   "
+            f"{fast[name]:12.1f}   x{default[name] / fast[name]:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
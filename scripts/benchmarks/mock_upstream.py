@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Local mock of the OpenAI Responses API for benchmarks.
+
+Every request to ``POST /v1/responses`` sleeps for a configurable latency and
+then answers with a well-formed structured-output response, so the real
+OpenAI SDK can be pointed at it through ``OPENAI_BASE_URL``.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import threading
+import time
+from typing import Iterator
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+
+def mock_response(body: dict) -> dict:
+    """Well-formed Responses API answer carrying a clean verdict."""
+    evaluation = {
+        "is_hallucination": False,
+        "rationale": "Mock upstream verdict.",
+        "delusion_percentage": 0.0,
+        "error": None,
+    }
+    prompt = (body.get("instructions") or "") + str(body.get("input", ""))
+    input_tokens = len(prompt) // 4
+    return {
+        "id": "resp_mock",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model", "mock"),
+        "status": "completed",
+        "output": [
+            {
+                "type": "message",
+                "id": "msg_mock",
+                "status": "completed",
+                "role": "assistant",
+                "content": [
+                    {
+                        "type": "output_text",
+                        "text": json.dumps(evaluation),
+                        "annotations": [],
+                    }
+                ],
+            }
+        ],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": 32,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + 32,
+        },
+    }
+
+
+def create_mock_app(latency: float = 0.2, latency_sigma: float = 0.0) -> FastAPI:
+    """
+    Create a mock upstream app that answers after ``latency`` seconds, or
+    after a log-normal delay with median ``latency`` and shape
+    ``latency_sigma``.
+    """
+    mock_app = FastAPI(title="Nicotine Mock Upstream")
+    mock_app.state.latency = latency
+    mock_app.state.latency_sigma = latency_sigma
+    mock_app.state.in_flight = 0
+    mock_app.state.peak_in_flight = 0
+
+    @mock_app.post("/v1/responses")
+    async def responses(request: Request) -> dict:
+        body = await request.json()
+        state = request.app.state
+        state.in_flight += 1
+        state.peak_in_flight = max(state.peak_in_flight, state.in_flight)
+        try:
+            delay = state.latency
+            if state.latency_sigma:
+                delay *= random.lognormvariate(0.0, state.latency_sigma)
+            await asyncio.sleep(delay)
+        finally:
+            state.in_flight -= 1
+        return mock_response(body)
+
+    return mock_app
+
+
+@contextlib.contextmanager
+def running_mock_upstream(
+    latency: float = 0.2, host: str = "127.0.0.1", port: int = 8765
+) -> Iterator[FastAPI]:
+    """Run the mock upstream in a background thread for the duration of a block."""
+    mock_app = create_mock_app(latency)
+    server = uvicorn.Server(
+        uvicorn.Config(mock_app, host=host, port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield mock_app
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--latency-sigma", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(
+        create_mock_app(args.latency, args.latency_sigma),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
@@ -0,0 +1,5 @@
+#!/bin/bash
+# Build or query a local reference corpus, e.g.
+#   nico index build refs/ corpus.jsonl notes.txt
+#   nico index search refs/ "Paris is the capital of France"
+python -m nicotine.references "$@"
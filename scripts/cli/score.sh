@@ -0,0 +1,4 @@
+#!/bin/bash
+# Score logged LLM outputs offline, resuming from the last checkpoint, e.g.
+#   nico score logs/*.jsonl -o scores.jsonl --concurrency 32 --workers 4
+python -m nicotine.scoring "$@"
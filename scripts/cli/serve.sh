@@ -144,9 +144,10 @@ FASTAPI_CMD="$FASTAPI_CMD nicotine/api.py"
 FASTAPI_CMD="$FASTAPI_CMD --host $HOST"
 FASTAPI_CMD="$FASTAPI_CMD --port $PORT"
 
-# Add production-specific arguments
+# Several workers run under nicotine.serving, which shares the verdict cache,
+# rate limits and metrics between them and warms each one up (config: server)
 if [ "$RELOAD" = false ] && [ "$WORKERS" -gt 1 ]; then
-    FASTAPI_CMD="$FASTAPI_CMD --workers $WORKERS"
+    FASTAPI_CMD="python -m nicotine.serving --host $HOST --port $PORT --workers $WORKERS"
 fi
 
 echo -e "${GREEN}🔧 Configuration:${NC}"
@@ -16,6 +16,7 @@ setup(
         "fastapi",
         "uvicorn",
         "python-dotenv",
+        "orjson",
     ],
     python_requires=">=3.9",
     include_package_data=True,
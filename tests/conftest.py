@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import pytest
+
+from nicotine.providers import FakeProvider, configure_provider
+from nicotine.resilience import CallPolicy, configure_call_policy
+from nicotine.system import configure_client
+
+
+@pytest.fixture
+def fake_provider():
+    """
+    Register FakeProviders for one test: ``fake_provider(name, **options)``
+    returns the provider registered as ``name``. With ``fast_retries`` the
+    call policy also retries without backoff and never opens its breaker.
+    """
+    names = []
+    policy = False
+
+    def register(name, fast_retries=False, **options):
+        nonlocal policy
+        provider = FakeProvider(**options)
+        configure_provider(name, provider)
+        names.append(name)
+        if fast_retries:
+            configure_call_policy(CallPolicy(backoff=0.0, breaker_threshold=None))
+            policy = True
+        return provider
+
+    yield register
+    for name in names:
+        configure_provider(name, None)
+    if policy:
+        configure_call_policy(None)
+
+
+@pytest.fixture
+def fake_client():
+    """
+    Inject a blocking OpenAI client for one test, so no API key is needed:
+    ``fake_client(parse)`` answers every ``responses.parse`` with ``parse``.
+    """
+
+    def inject(parse):
+        configure_client(SimpleNamespace(responses=SimpleNamespace(parse=parse)))
+
+    yield inject
+    configure_client(None)
@@ -66,7 +66,7 @@ class TestNicotineAPIIntegration:
         assert data["status"] == "healthy"
         assert data["message"] == "Service is running."
 
-    @patch("nicotine.api.detect_hallucination")
+    @patch("nicotine.api.async_detect_hallucination")
     def test_detect_hallucination_endpoint_success(
         self, mock_detect, client, sample_llm_output, mock_hallucination_evaluation
     ):
@@ -86,7 +86,7 @@ class TestNicotineAPIIntegration:
 
         mock_detect.assert_called_once()
 
-    @patch("nicotine.api.detect_hallucination")
+    @patch("nicotine.api.async_detect_hallucination")
     def test_detect_hallucination_endpoint_with_hallucination(
         self, mock_detect, client, sample_llm_output
     ):
@@ -109,7 +109,7 @@ class TestNicotineAPIIntegration:
         assert data["rationale"] == "The response contains factual errors"
         assert data["delusion_percentage"] == 75.5
 
-    @patch("nicotine.api.detect_hallucination")
+    @patch("nicotine.api.async_detect_hallucination")
     def test_detect_hallucination_endpoint_error(
         self, mock_detect, client, sample_llm_output
     ):
@@ -124,6 +124,48 @@ class TestNicotineAPIIntegration:
         data = response.json()
         assert "Error processing hallucination detection" in data["detail"]
 
+    @patch("nicotine.api.async_detect_hallucinations")
+    def test_detect_hallucination_batch_endpoint(
+        self, mock_detect, client, sample_llm_output, mock_hallucination_evaluation
+    ):
+        """Test batch detection returns one result per output, in order."""
+        mock_detect.return_value = [
+            mock_hallucination_evaluation,
+            HallucinationEvaluation(
+                is_hallucination=False,
+                rationale="Error detecting hallucinations",
+                delusion_percentage=0.0,
+                error="upstream down",
+            ),
+        ]
+
+        response = client.post(
+            "/api/v1/detect-hallucination/batch",
+            json={
+                "outputs": [sample_llm_output.model_dump()] * 2,
+                "concurrency": 4,
+                "pack_size": 2,
+            },
+        )
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert len(results) == 2
+        assert results[0]["error"] is None
+        assert results[1]["error"] == "upstream down"
+        assert mock_detect.call_args.kwargs == {"concurrency": 4, "pack_size": 2}
+
+    def test_detect_hallucination_batch_rejects_bad_concurrency(
+        self, client, sample_llm_output
+    ):
+        """Test batch options are validated."""
+        response = client.post(
+            "/api/v1/detect-hallucination/batch",
+            json={"outputs": [sample_llm_output.model_dump()], "concurrency": 0},
+        )
+
+        assert response.status_code == 422
+
     def test_detect_hallucination_invalid_payload(self, client):
         """Test invalid payload handling."""
         invalid_payload = {
@@ -135,6 +177,40 @@ class TestNicotineAPIIntegration:
 
         assert response.status_code == 422  # Validation error
 
+    @patch("nicotine.system.async_detect_hallucination")
+    def test_detect_hallucination_stream_endpoint(
+        self, mock_detect, client, sample_llm_output, mock_hallucination_evaluation
+    ):
+        """Test NDJSON records stream back as tagged NDJSON evaluations."""
+        import json
+
+        mock_detect.return_value = mock_hallucination_evaluation
+        records = [
+            sample_llm_output.model_copy(update={"id": f"s{i}"}).model_dump_json()
+            for i in range(3)
+        ]
+
+        response = client.post(
+            "/api/v1/detect-hallucination/stream?concurrency=2",
+            content="\n".join(records) + "\n",
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(line["id"] for line in lines) == ["s0", "s1", "s2"]
+        assert all(
+            line["rationale"] == "The response is factually correct" for line in lines
+        )
+
+    def test_cache_stats_endpoint_when_disabled(self, client):
+        """Test cache stats report a disabled cache by default."""
+        response = client.get("/api/v1/cache/stats")
+
+        assert response.status_code == 200
+        assert response.json()["enabled"] is False
+
     def test_openapi_docs_endpoint(self, client):
         """Test that OpenAPI docs are accessible."""
         response = client.get("/docs")
@@ -157,7 +233,7 @@ class TestNicotineAPIIntegration:
             "settings": {"model": "gpt-4", "temperature": 0.7, "max_tokens": 100},
         }
 
-        with patch("nicotine.api.detect_hallucination") as mock_detect:
+        with patch("nicotine.api.async_detect_hallucination") as mock_detect:
             from nicotine.system import HallucinationEvaluation
 
             mock_detect.return_value = HallucinationEvaluation(
@@ -177,7 +253,7 @@ class TestNicotineAPIIntegration:
         self, sample_llm_output, mock_hallucination_evaluation
     ):
         """Test the API using async client."""
-        with patch("nicotine.api.detect_hallucination") as mock_detect:
+        with patch("nicotine.api.async_detect_hallucination") as mock_detect:
             mock_detect.return_value = mock_hallucination_evaluation
 
             async with AsyncClient(base_url="http://test") as ac:
@@ -198,7 +274,7 @@ class TestNicotineAPIIntegration:
 
     def test_endpoint_content_types(self, client, sample_llm_output):
         """Test that endpoints handle content types correctly."""
-        with patch("nicotine.api.detect_hallucination") as mock_detect:
+        with patch("nicotine.api.async_detect_hallucination") as mock_detect:
             mock_detect.return_value = HallucinationEvaluation(
                 is_hallucination=False, rationale="Test", delusion_percentage=0.0
             )
@@ -221,7 +297,7 @@ class TestNicotineAPIIntegration:
             settings=sample_llm_settings,
         )
 
-        with patch("nicotine.api.detect_hallucination") as mock_detect:
+        with patch("nicotine.api.async_detect_hallucination") as mock_detect:
             mock_detect.return_value = HallucinationEvaluation(
                 is_hallucination=False, rationale="Test", delusion_percentage=0.0
             )
@@ -253,7 +329,7 @@ class TestAPIPerformance:
     @pytest.mark.asyncio
     async def test_concurrent_requests(self, sample_llm_output):
         """Test handling of concurrent requests."""
-        with patch("nicotine.api.detect_hallucination") as mock_detect:
+        with patch("nicotine.api.async_detect_hallucination") as mock_detect:
             mock_detect.return_value = HallucinationEvaluation(
                 is_hallucination=False,
                 rationale="Concurrent test",
@@ -0,0 +1,206 @@
+import asyncio
+import copy
+import threading
+import time
+
+import pytest
+
+import nicotine.config
+import nicotine.system
+from nicotine import (
+    HallucinationEvaluation,
+    LLMOutput,
+    LLMSettings,
+    async_detect_hallucination,
+    detect_hallucination,
+)
+from nicotine.cache import (
+    MemoryCacheBackend,
+    SQLiteCacheBackend,
+    VerdictCache,
+    cache_key,
+    configure_verdict_cache,
+)
+from nicotine.config import load_config
+from nicotine.semantic import guard_digest
+
+VERDICT = HallucinationEvaluation(
+    is_hallucination=False, rationale="Correct answer.", delusion_percentage=0.0
+)
+
+
+def make_output(id="1", output="Paris", temperature=0.7):
+    return LLMOutput(
+        id=id,
+        prompt="What is the capital of France?",
+        output=output,
+        settings=LLMSettings(temperature=temperature),
+    )
+
+
+@pytest.fixture
+def verdict_cache():
+    cache = VerdictCache(MemoryCacheBackend())
+    configure_verdict_cache(cache)
+    yield cache
+    configure_verdict_cache(None)
+
+
+def test_cache_key_ignores_id_but_not_settings():
+    assert cache_key(make_output(id="1")) == cache_key(make_output(id="2"))
+    assert cache_key(make_output()) != cache_key(make_output(temperature=0.0))
+    assert cache_key(make_output()) != cache_key(make_output(output="Lyon"))
+
+
+def test_keys_follow_the_configured_prompt_version(monkeypatch):
+    config = copy.deepcopy(load_config())
+    monkeypatch.setattr(nicotine.config, "load_config", lambda path=None: config)
+    key, guard = cache_key(make_output()), guard_digest(make_output())
+
+    config["prompts"]["version"] = "2"
+
+    assert cache_key(make_output()) != key
+    assert guard_digest(make_output()) != guard
+
+
+def test_memory_backend_lru_and_ttl():
+    backend = MemoryCacheBackend(max_entries=2, ttl=60)
+    backend.set("a", VERDICT)
+    backend.set("b", VERDICT)
+    backend.get("a")
+    backend.set("c", VERDICT)
+    assert backend.get("b") is None
+    assert backend.get("a") == VERDICT
+
+    expiring = MemoryCacheBackend(ttl=0.01)
+    expiring.set("a", VERDICT)
+    time.sleep(0.02)
+    assert expiring.get("a") is None
+
+
+def test_sqlite_backend_survives_reopen(tmp_path):
+    path = tmp_path / "cache.db"
+    SQLiteCacheBackend(path).set("a", VERDICT)
+    assert SQLiteCacheBackend(path).get("a") == VERDICT
+
+    expiring = SQLiteCacheBackend(path, ttl=-1)
+    expiring.set("b", VERDICT)
+    assert expiring.get("b") is None
+
+
+def test_get_or_compute_single_flight_across_threads():
+    cache = VerdictCache(MemoryCacheBackend())
+    calls = []
+    release = threading.Event()
+
+    def compute(output):
+        calls.append(output.id)
+        release.wait(1)
+        return VERDICT
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda i=i: results.append(
+                cache.get_or_compute(make_output(id=str(i)), compute)
+            )
+        )
+        for i in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [VERDICT] * 5
+    stats = cache.stats()
+    assert (stats.misses, stats.deduplicated) == (1, 4)
+    cache.get_or_compute(make_output(), compute)
+    assert cache.stats().hits == 1
+
+
+@pytest.mark.asyncio
+async def test_aget_or_compute_single_flight_and_skips_errors():
+    cache = VerdictCache(MemoryCacheBackend())
+    calls = []
+
+    async def compute(output):
+        calls.append(output.id)
+        await asyncio.sleep(0.01)
+        return VERDICT
+
+    results = await asyncio.gather(
+        *(cache.aget_or_compute(make_output(id=str(i)), compute) for i in range(5))
+    )
+    assert results == [VERDICT] * 5
+    assert len(calls) == 1
+
+    async def failing(output):
+        return HallucinationEvaluation(
+            is_hallucination=False, rationale="x", delusion_percentage=0.0, error="boom"
+        )
+
+    other = make_output(output="Lyon")
+    await cache.aget_or_compute(other, failing)
+    assert cache.backend.get(cache_key(other)) is None
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_is_used_off_the_event_loop(tmp_path):
+    threads = []
+
+    class RecordingBackend(SQLiteCacheBackend):
+        def get(self, key):
+            threads.append(threading.get_ident())
+            return super().get(key)
+
+        def set(self, key, value):
+            threads.append(threading.get_ident())
+            super().set(key, value)
+
+    cache = VerdictCache(RecordingBackend(tmp_path / "cache.db"))
+
+    async def compute(output):
+        return VERDICT
+
+    assert await cache.aget_or_compute(make_output(), compute) == VERDICT
+    assert await cache.aget(make_output()) == VERDICT
+    await cache.aset(make_output(output="Lyon"), VERDICT)
+
+    assert len(threads) == 4
+    assert threading.get_ident() not in threads
+    assert (cache.stats().hits, cache.stats().misses) == (1, 1)
+
+
+def test_detect_hallucination_uses_cache(fake_client, verdict_cache):
+    calls = []
+
+    def mock_parse(*args, **kwargs):
+        calls.append(kwargs)
+
+        class MockResponse:
+            output_parsed = VERDICT
+
+        return MockResponse()
+
+    fake_client(mock_parse)
+
+    assert detect_hallucination(make_output(id="1")) == VERDICT
+    assert detect_hallucination(make_output(id="2")) == VERDICT
+    assert len(calls) == 1
+    assert verdict_cache.stats().hit_ratio == 0.5
+
+
+@pytest.mark.asyncio
+async def test_async_detect_hallucination_uses_cache(monkeypatch, verdict_cache):
+    verdict_cache.set(make_output(), VERDICT)
+
+    def fail():
+        raise AssertionError("upstream should not be called")
+
+    monkeypatch.setattr(nicotine.system, "get_async_client", fail)
+
+    assert await async_detect_hallucination(make_output(id="9")) == VERDICT
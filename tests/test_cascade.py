@@ -0,0 +1,209 @@
+import copy
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+import nicotine.config
+from nicotine import LLMOutput, LLMSettings, async_detect_hallucinations
+from nicotine import detect_hallucination
+from nicotine.cascade import ModelCascade, Price, build_cascade, configure_cascade
+from nicotine.config import load_config
+from nicotine.metrics import Metrics, configure_metrics
+from nicotine.models import HallucinationEvaluation
+from nicotine.providers import InputTokensDetails, ProviderResponse, Usage
+from nicotine.providers import configure_provider
+from nicotine.resilience import CallPolicy, configure_call_policy
+
+CHEAP, STRONG = "cheap-model", "strong-model"
+
+
+class Verdicts:
+    """Answers with a fixed delusion percentage per model and output."""
+
+    def __init__(self, cheap, strong=90.0):
+        self.cheap = cheap  # output text -> percentage, or an exception
+        self.strong = strong
+        self.models = []
+
+    def _verdict(self, model, text):
+        percentage = self.cheap[text] if model == CHEAP else self.strong
+        if isinstance(percentage, Exception):
+            raise percentage
+        return dict(
+            is_hallucination=percentage > 50,
+            rationale=model,
+            delusion_percentage=percentage,
+        )
+
+    def parse(self, *, input, model, text_format, **kwargs):
+        self.models.append(model)
+        usage = Usage(
+            input_tokens=1000,
+            output_tokens=100,
+            input_tokens_details=InputTokensDetails(cached_tokens=400),
+        )
+        if "evaluations" in text_format.model_fields:
+            texts = re.findall(r"Output: (.*)", input)
+            items = [
+                dict(index=i, **self._verdict(model, text.strip()))
+                for i, text in enumerate(texts)
+            ]
+            parsed = text_format(evaluations=items)
+        else:
+            text = input.split("Output: ")[-1].strip()
+            parsed = text_format(**self._verdict(model, text))
+        return ProviderResponse(output_parsed=parsed, usage=usage)
+
+    async def aparse(self, **kwargs):
+        return self.parse(**kwargs)
+
+
+@pytest.fixture
+def cascade():
+    cascade = ModelCascade(
+        CHEAP,
+        band=(20.0, 80.0),
+        prices={
+            CHEAP: Price(input=0.4, cached=0.1, output=1.6),
+            STRONG: Price(input=2.0, output=8.0),
+        },
+    )
+    configure_cascade(cascade)
+    configure_call_policy(CallPolicy(backoff=0.0, max_retries=0))
+    yield cascade
+    configure_cascade(None)
+    configure_call_policy(None)
+    configure_provider("cascade", None)
+
+
+def install(provider):
+    configure_provider("cascade", provider)
+    return provider
+
+
+def output(text, n=0):
+    return LLMOutput(
+        id=f"c{n}",
+        prompt="Where is the Eiffel Tower?",
+        output=text,
+        settings=LLMSettings(provider="cascade", model=STRONG),
+    )
+
+
+def test_confident_verdicts_stay_with_the_cheap_model(cascade):
+    provider = install(Verdicts({"clear.": 5.0, "false.": 95.0}))
+
+    assert detect_hallucination(output("clear.")).rationale == CHEAP
+    assert detect_hallucination(output("false.")).rationale == CHEAP
+    assert provider.models == [CHEAP, CHEAP]
+    stats = cascade.stats()
+    assert (stats.total, stats.escalation_rate) == (2, 0.0)
+    assert stats.tiers["cheap"].resolved == 2
+
+
+def test_uncertain_verdicts_escalate_to_the_requested_model(cascade):
+    metrics = Metrics()
+    configure_metrics(metrics)
+    provider = install(
+        Verdicts({"maybe.": 50.0, "broken.": ValueError("bad"), "clear.": 5.0})
+    )
+    try:
+        verdicts = [
+            detect_hallucination(output(text))
+            for text in ("maybe.", "broken.", "clear.")
+        ]
+    finally:
+        configure_metrics(None)
+
+    assert [v.rationale for v in verdicts] == [STRONG, STRONG, CHEAP]
+    assert provider.models == [CHEAP, STRONG, CHEAP, STRONG, CHEAP]
+    stats = cascade.stats()
+    assert stats.reasons == {"ambiguous": 1, "error": 1}
+    assert stats.escalation_rate == pytest.approx(2 / 3)
+    assert (stats.tiers["cheap"].calls, stats.tiers["strong"].calls) == (3, 2)
+    sample = metrics.registry.get_sample_value
+    labels = {"tier": "strong", "reason": "ambiguous"}
+    assert sample("nicotine_cascade_verdicts_total", labels) == 1
+    labels = {"tier": "cheap", "reason": "none"}
+    assert sample("nicotine_cascade_verdicts_total", labels) == 1
+
+
+def test_inconsistent_verdicts_escalate(cascade):
+    evaluation = HallucinationEvaluation(
+        is_hallucination=True, rationale="", delusion_percentage=5.0
+    )
+
+    assert cascade.escalation(evaluation) == "inconsistent"
+    assert cascade.escalation(evaluation.model_copy(update={"error": "x"})) == "error"
+    evaluation = evaluation.model_copy(update={"delusion_percentage": 95.0})
+    assert cascade.escalation(evaluation) is None
+
+
+def test_tier_usage_and_cost_are_reported(cascade):
+    install(Verdicts({"maybe.": 50.0, "clear.": 5.0}))
+
+    detect_hallucination(output("maybe."))
+    detect_hallucination(output("clear."))
+
+    cheap, strong = cascade.stats().tiers["cheap"], cascade.stats().tiers["strong"]
+    assert (cheap.input_tokens, cheap.cached_tokens, cheap.output_tokens) == (
+        2000,
+        800,
+        200,
+    )
+    assert cheap.cost_usd == pytest.approx(
+        2 * (600 * 0.4 + 400 * 0.1 + 100 * 1.6) / 1e6
+    )
+    assert strong.cost_usd == pytest.approx((1000 * 2.0 + 100 * 8.0) / 1e6)
+    assert cheap.p50_ms >= 0 and strong.calls == 1
+
+
+def test_requests_for_the_cheap_model_skip_the_cascade(cascade):
+    provider = install(Verdicts({"maybe.": 50.0}))
+    cheap = output("maybe.")
+    cheap.settings.model = CHEAP
+
+    assert detect_hallucination(cheap).rationale == CHEAP
+    assert provider.models == [CHEAP]
+    assert cascade.stats().total == 0
+
+
+@pytest.mark.asyncio
+async def test_packed_batches_escalate_only_uncertain_items(cascade):
+    provider = install(Verdicts({"a.": 5.0, "b.": 50.0, "c.": 95.0, "d.": 30.0}))
+    outputs = [output(text, n) for n, text in enumerate(("a.", "b.", "c.", "d."))]
+
+    verdicts = await async_detect_hallucinations(outputs, pack_size=4)
+
+    assert [v.rationale for v in verdicts] == [CHEAP, STRONG, CHEAP, STRONG]
+    assert provider.models == [CHEAP, STRONG, STRONG]
+    stats = cascade.stats()
+    assert (stats.tiers["cheap"].calls, stats.tiers["strong"].calls) == (4, 2)
+
+
+def test_cascade_is_built_from_config(monkeypatch):
+    config = copy.deepcopy(load_config())
+    monkeypatch.setattr(nicotine.config, "load_config", lambda path=None: config)
+    assert build_cascade() is None
+
+    config["cascade"]["enabled"] = True
+    config["cascade"]["band"] = [30, 70]
+    cascade = build_cascade()
+
+    assert (cascade.model, cascade.band) == ("gpt-4.1-mini", (30.0, 70.0))
+    assert cascade.prices["gpt-4.1"].cached == 0.5
+    with pytest.raises(ValueError):
+        ModelCascade(CHEAP, band=(80.0, 20.0))
+
+
+def test_stats_endpoint(cascade):
+    from nicotine.api import app
+
+    install(Verdicts({"clear.": 5.0}))
+    detect_hallucination(output("clear."))
+
+    stats = TestClient(app).get("/api/v1/cascade/stats").json()
+    assert stats["enabled"] is True and stats["tiers"]["cheap"]["resolved"] == 1
+    configure_cascade(None)
+    assert TestClient(app).get("/api/v1/cascade/stats").json()["enabled"] is False
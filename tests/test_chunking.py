@@ -0,0 +1,133 @@
+import random
+
+import pytest
+
+from nicotine import LLMOutput, LLMSettings, async_detect_hallucination
+from nicotine import async_detect_hallucinations, detect_hallucination
+from nicotine.chunking import (
+    ChunkedDetector,
+    ChunkVerdict,
+    chunk_text,
+    configure_chunked_detector,
+    merge_verdicts,
+)
+from nicotine.models import HallucinationEvaluation
+
+
+def make_text(sentences=200, seed=0):
+    rng = random.Random(seed)
+    words = ["river", "stone", "lake", "mist", "north", "amber", "tide", "ridge"]
+    lines = []
+    for i in range(sentences):
+        line = " ".join(rng.choice(words) for _ in range(rng.randint(6, 14)))
+        lines.append(f"{line.capitalize()} {i}.")
+    return " ".join(lines)
+
+
+def verdict(index, start, end, percentage, flagged=False, error=None):
+    return ChunkVerdict(
+        index=index,
+        start=start,
+        end=end,
+        evaluation=HallucinationEvaluation(
+            is_hallucination=flagged,
+            rationale=f"rationale {index}",
+            delusion_percentage=percentage,
+            error=error,
+        ),
+    )
+
+
+def test_chunks_cover_the_text_on_sentence_boundaries():
+    text = make_text()
+    chunks = chunk_text(text, max_chars=800, overlap_sentences=1)
+
+    assert len(chunks) > 5
+    assert chunks[0].start == 0 and chunks[-1].end == len(text)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        gap = text[slice(previous.end, chunk.start)]
+        body = text[slice(chunk.start, chunk.end)]
+        overlap = chunk.window.removesuffix(body).strip()
+        assert gap.isspace()
+        assert len(body) <= 800
+        assert chunk.window.endswith(body)
+        assert overlap.count(".") == 1
+        assert text[: previous.end].endswith(overlap)
+
+
+def test_edits_only_move_nearby_boundaries():
+    text = make_text()
+    edited = text.replace(" 100.", " 100, and one more clause was added here.")
+
+    before = {c.window for c in chunk_text(text, max_chars=800)}
+    after = {c.window for c in chunk_text(edited, max_chars=800)}
+
+    assert len(after - before) <= 3
+
+
+def test_verdicts_merge_by_chunk_length():
+    merged = merge_verdicts(
+        [
+            verdict(0, 0, 300, 10.0),
+            verdict(1, 300, 400, 90.0, flagged=True),
+            verdict(2, 400, 500, 0.0, error="timeout: no response"),
+        ]
+    )
+
+    assert merged.is_hallucination
+    assert merged.delusion_percentage == pytest.approx(30.0)
+    assert merged.rationale == "Chunk 2 (chars 300-400): rationale 1"
+    assert merged.error == "1 of 3 chunks failed: timeout: no response"
+
+
+@pytest.fixture
+def provider(fake_provider):
+    configure_chunked_detector(ChunkedDetector(threshold_chars=2000, max_chars=800))
+    yield fake_provider("chunks")
+    configure_chunked_detector(None)
+
+
+def make_output(text):
+    return LLMOutput(
+        id="long",
+        prompt="Describe the lake.",
+        output=text,
+        settings=LLMSettings(provider="chunks"),
+    )
+
+
+@pytest.mark.asyncio
+async def test_resubmitted_edits_rescore_only_changed_windows(provider):
+    text = make_text()
+    chunks = len(chunk_text(text, max_chars=800))
+
+    evaluation = await async_detect_hallucination(make_output(text))
+    assert evaluation.error is None
+    assert provider.calls == chunks
+
+    edited = text.replace(" 100.", " 100, and one more clause was added here.")
+    await async_detect_hallucination(make_output(edited))
+    assert provider.calls - chunks <= 3
+
+
+def test_blocking_detection_is_chunked_too(provider):
+    text = make_text(sentences=100)
+
+    evaluation = detect_hallucination(make_output(text))
+
+    assert evaluation.error is None
+    assert evaluation.rationale.startswith("No hallucinations found in")
+    assert provider.calls == len(chunk_text(text, max_chars=800))
+
+
+@pytest.mark.asyncio
+async def test_long_outputs_are_chunked_rather_than_packed(provider):
+    text = make_text(sentences=100)
+    outputs = [make_output(text), make_output("Short."), make_output("Brief.")]
+
+    evaluations = await async_detect_hallucinations(
+        outputs, pack_size=4, pack_max_chars=10**6
+    )
+
+    assert evaluations[0].rationale.startswith("No hallucinations found in")
+    assert provider.calls == len(chunk_text(text, max_chars=800)) + 1
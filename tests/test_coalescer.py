@@ -0,0 +1,190 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from nicotine import LLMOutput, LLMSettings
+from nicotine.coalescer import RequestCoalescer, configure_coalescer
+from nicotine.metrics import Metrics, configure_metrics
+from nicotine.pipeline import (
+    ClaimVerdict,
+    MysticLakePipeline,
+    configure_default_pipeline,
+)
+from nicotine.providers import configure_api_providers
+from nicotine.ratelimit import current_priority, request_priority
+from nicotine.resilience import DeadlineExceeded, deadline, remaining_time
+
+
+def make_output(i):
+    return LLMOutput(
+        id=str(i),
+        prompt=f"Question {i}?",
+        output=f"Answer {i}.",
+        settings=LLMSettings(provider="coalesce"),
+    )
+
+
+@pytest.fixture
+def provider(fake_provider):
+    return fake_provider("coalesce", latency=0.01)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_upstream_call(provider):
+    coalescer = RequestCoalescer(window=0.02, max_batch_size=16)
+
+    evaluations = await asyncio.gather(
+        *(coalescer.submit(make_output(i)) for i in range(8))
+    )
+
+    assert [e.error for e in evaluations] == [None] * 8
+    assert provider.calls == 1
+    stats = coalescer.stats()
+    assert (stats.requests, stats.batches, stats.batch_sizes) == (8, 1, {8: 1})
+    assert stats.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_full_batches_are_dispatched_without_waiting(provider):
+    coalescer = RequestCoalescer(window=10.0, max_batch_size=4, pack_size=1)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(coalescer.submit(make_output(i)) for i in range(4)))
+
+    assert time.perf_counter() - start < 1.0
+    assert provider.calls == 4
+    assert coalescer.stats().batch_sizes == {4: 1}
+
+
+@pytest.mark.asyncio
+async def test_cancelled_requests_do_not_affect_their_batch(provider):
+    coalescer = RequestCoalescer(window=0.02)
+    abandoned = asyncio.ensure_future(coalescer.submit(make_output(0)))
+    kept = asyncio.ensure_future(coalescer.submit(make_output(1)))
+    await asyncio.sleep(0)
+    abandoned.cancel()
+
+    evaluation = await kept
+
+    assert evaluation.error is None
+    assert abandoned.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_batches_run_under_the_earliest_deadline_and_top_priority(
+    provider, monkeypatch
+):
+    import nicotine.coalescer
+
+    seen = {}
+    detect = nicotine.coalescer.async_detect_hallucinations
+
+    async def recording(outputs, **kwargs):
+        seen["remaining"], seen["priority"] = remaining_time(), current_priority()
+        return await detect(outputs, **kwargs)
+
+    monkeypatch.setattr(nicotine.coalescer, "async_detect_hallucinations", recording)
+    coalescer = RequestCoalescer(window=0.02)
+
+    async def submit(i, seconds, priority):
+        with deadline(seconds), request_priority(priority):
+            return await coalescer.submit(make_output(i))
+
+    await asyncio.gather(submit(0, None, 5), submit(1, 30.0, 2), submit(2, 60.0, 9))
+
+    assert 29.0 < seen["remaining"] <= 30.0
+    assert seen["priority"] == 2
+
+
+@pytest.mark.asyncio
+async def test_requests_stop_waiting_at_their_deadline(fake_provider):
+    fake_provider("coalesce", latency=5.0)
+    coalescer = RequestCoalescer(window=0.01)
+    start = time.perf_counter()
+    with deadline(0.1), pytest.raises(DeadlineExceeded):
+        await coalescer.submit(make_output(0))
+    with deadline(0.0), pytest.raises(DeadlineExceeded):
+        await coalescer.submit(make_output(1))
+
+    assert time.perf_counter() - start < 2.0
+    assert coalescer.stats().queue_depth == 0
+
+
+class RecordingPercolation:
+    """Local verifier recording the claims it checks."""
+
+    name = "percolation"
+
+    def __init__(self):
+        self.claims = []
+
+    async def verify(self, claim, condensate):
+        self.claims.append(claim.text)
+        return ClaimVerdict(
+            claim=claim,
+            supported="3" not in claim.text,
+            confidence=1.0,
+            rationale="recorded",
+            source="local",
+        )
+
+
+@pytest.mark.asyncio
+async def test_coalesced_requests_still_run_the_pipeline(provider, monkeypatch):
+    import nicotine.system
+
+    percolation = RecordingPercolation()
+    configure_default_pipeline(MysticLakePipeline(percolation=percolation))
+    monkeypatch.setattr(nicotine.system, "_use_pipeline", lambda: True)
+    try:
+        coalescer = RequestCoalescer(window=0.02, max_batch_size=16)
+        evaluations = await asyncio.gather(
+            *(coalescer.submit(make_output(i)) for i in range(4))
+        )
+    finally:
+        configure_default_pipeline(None)
+
+    assert provider.calls == 0
+    assert sorted(percolation.claims) == [f"Answer {i}." for i in range(4)]
+    assert [e.is_hallucination for e in evaluations] == [False, False, False, True]
+
+
+@pytest.mark.asyncio
+async def test_batches_are_recorded_in_metrics(provider):
+    metrics = Metrics()
+    configure_metrics(metrics)
+    try:
+        coalescer = RequestCoalescer(window=0.01)
+        await asyncio.gather(*(coalescer.submit(make_output(i)) for i in range(3)))
+    finally:
+        configure_metrics(None)
+
+    registry = metrics.registry
+    assert registry.get_sample_value("nicotine_coalescer_batch_size_sum") == 3
+    assert registry.get_sample_value("nicotine_coalescer_wait_seconds_count") == 3
+    assert registry.get_sample_value("nicotine_coalescer_queue_depth") == 0
+
+
+def test_api_routes_single_requests_through_the_coalescer(provider):
+    from nicotine.api import app
+
+    coalescer = RequestCoalescer(window=0.001)
+    configure_coalescer(coalescer)
+    configure_api_providers(["coalesce"])
+    try:
+        client = TestClient(app)
+        response = client.post(
+            "/api/v1/detect-hallucination", json=make_output(1).model_dump()
+        )
+        stats = client.get("/api/v1/coalescer/stats").json()
+    finally:
+        configure_coalescer(None)
+        configure_api_providers(None)
+
+    assert response.status_code == 200
+    assert response.json()["error"] is None
+    assert stats["requests"] == 1
+    assert stats["batch_sizes"] == {"1": 1}
+    assert TestClient(app).get("/api/v1/coalescer/stats").json()["enabled"] is False
@@ -1,14 +1,20 @@
 import pytest
 from nicotine import (
     detect_hallucination,
+    async_detect_hallucination,
+    async_detect_hallucinations,
     LLMOutput,
     LLMSettings,
     HallucinationEvaluation,
 )
+from nicotine.system import (
+    PackedHallucinationEvaluation,
+    PackedHallucinationEvaluations,
+)
 import nicotine.system  # adjust import if needed
 
 
-def test_detect_hallucination_basic(monkeypatch):
+def test_detect_hallucination_basic(fake_client):
     # Arrange: fake return value for the parse function
     expected = HallucinationEvaluation(
         is_hallucination=False,
@@ -23,7 +29,7 @@ def test_detect_hallucination_basic(monkeypatch):
 
         return MockResponse()
 
-    monkeypatch.setattr(nicotine.system.client.responses, "parse", mock_parse)
+    fake_client(mock_parse)
 
     settings = LLMSettings(model="gpt-4.1", temperature=0.8, max_tokens=1000)
     output = LLMOutput(
@@ -41,3 +47,160 @@ def test_detect_hallucination_basic(monkeypatch):
     assert evaluation.rationale == "Correct answer."
     assert evaluation.delusion_percentage == 0.0
     assert evaluation.error is None
+
+
+@pytest.mark.asyncio
+async def test_async_detect_hallucination_basic(monkeypatch):
+    expected = HallucinationEvaluation(
+        is_hallucination=True,
+        rationale="Wrong capital.",
+        delusion_percentage=90.0,
+        error=None,
+    )
+
+    class MockResponses:
+        async def parse(self, *args, **kwargs):
+            class MockResponse:
+                output_parsed = expected
+
+            return MockResponse()
+
+    class MockAsyncClient:
+        responses = MockResponses()
+
+    monkeypatch.setattr(nicotine.system, "get_async_client", lambda: MockAsyncClient())
+
+    settings = LLMSettings(model="gpt-4.1", temperature=0.8, max_tokens=1000)
+    output = LLMOutput(
+        id="2",
+        prompt="What is the capital of France?",
+        output="Lyon",
+        settings=settings,
+    )
+
+    evaluation = await async_detect_hallucination(output)
+
+    assert evaluation.is_hallucination is True
+    assert evaluation.delusion_percentage == 90.0
+
+
+@pytest.mark.asyncio
+async def test_async_detect_hallucination_error(monkeypatch):
+    class FailingResponses:
+        async def parse(self, *args, **kwargs):
+            raise RuntimeError("upstream down")
+
+    class MockAsyncClient:
+        responses = FailingResponses()
+
+    monkeypatch.setattr(nicotine.system, "get_async_client", lambda: MockAsyncClient())
+
+    output = LLMOutput(id="3", prompt="p", output="o", settings=LLMSettings())
+
+    evaluation = await async_detect_hallucination(output)
+
+    assert evaluation.is_hallucination is False
+    assert evaluation.error == "upstream down"
+
+
+class RecordingAsyncClient:
+    """Fake async client that answers from the prompt and records calls."""
+
+    def __init__(self, drop_index=None):
+        self.calls = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.drop_index = drop_index
+        self.responses = self
+
+    async def parse(self, *args, **kwargs):
+        import asyncio
+
+        self.calls.append(kwargs)
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        prompt = kwargs["input"]
+        if "boom" in prompt and kwargs["text_format"] is HallucinationEvaluation:
+            raise RuntimeError("upstream down")
+
+        class MockResponse:
+            pass
+
+        response = MockResponse()
+        if kwargs["text_format"] is PackedHallucinationEvaluations:
+            count = prompt.count("Item ")
+            response.output_parsed = PackedHallucinationEvaluations(
+                evaluations=[
+                    PackedHallucinationEvaluation(
+                        index=i,
+                        is_hallucination=False,
+                        rationale="packed",
+                        delusion_percentage=float(i),
+                    )
+                    for i in range(count)
+                    if i != self.drop_index
+                ]
+            )
+        else:
+            response.output_parsed = HallucinationEvaluation(
+                is_hallucination=False,
+                rationale=prompt.split("Output: ")[1].strip(),
+                delusion_percentage=0.0,
+            )
+        return response
+
+
+def make_outputs(texts):
+    return [
+        LLMOutput(id=str(i), prompt="p", output=text, settings=LLMSettings())
+        for i, text in enumerate(texts)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_async_detect_hallucinations_preserves_order_and_limit(monkeypatch):
+    fake = RecordingAsyncClient()
+    monkeypatch.setattr(nicotine.system, "get_async_client", lambda: fake)
+    texts = [f"answer {i}" for i in range(20)]
+
+    evaluations = await async_detect_hallucinations(make_outputs(texts), concurrency=4)
+
+    assert [e.rationale for e in evaluations] == texts
+    assert fake.peak_in_flight == 4
+
+
+@pytest.mark.asyncio
+async def test_async_detect_hallucinations_reports_per_item_errors(monkeypatch):
+    fake = RecordingAsyncClient()
+    monkeypatch.setattr(nicotine.system, "get_async_client", lambda: fake)
+
+    evaluations = await async_detect_hallucinations(make_outputs(["ok", "boom", "ok"]))
+
+    assert [e.error for e in evaluations] == [None, "upstream down", None]
+
+
+@pytest.mark.asyncio
+async def test_async_detect_hallucinations_packs_short_items(monkeypatch):
+    fake = RecordingAsyncClient(drop_index=1)
+    monkeypatch.setattr(nicotine.system, "get_async_client", lambda: fake)
+    outputs = make_outputs(["a", "b", "c", "d", "x" * 100])
+
+    evaluations = await async_detect_hallucinations(
+        outputs, pack_size=4, pack_max_chars=50
+    )
+
+    packed_calls = [
+        c for c in fake.calls if c["text_format"] is PackedHallucinationEvaluations
+    ]
+    assert len(packed_calls) == 1
+    # Item 1 was missing from the packed answer and was retried on its own.
+    assert [e.rationale for e in evaluations] == [
+        "packed",
+        "b",
+        "packed",
+        "packed",
+        "x" * 100,
+    ]
+    assert evaluations[3].delusion_percentage == 3.0
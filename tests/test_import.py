@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+from nicotine.system import configure_client, get_client
+
+
+def run_python(code):
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    return subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(code)],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_import_needs_no_api_key_and_stays_lazy():
+    result = run_python("""
+        import sys
+        from nicotine import detect_hallucination
+        heavy = ["openai", "fastapi", "uvicorn", "nicotine.api"]
+        print([m for m in heavy if m in sys.modules])
+        """)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def test_api_is_loaded_on_first_access():
+    result = run_python("""
+        import nicotine
+        print(type(nicotine.app).__name__, nicotine.create_app() is nicotine.app)
+        """)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "FastAPI True"
+
+
+def test_configure_client_injects_a_client():
+    sentinel = object()
+    configure_client(sentinel)
+    try:
+        assert get_client() is sentinel
+    finally:
+        configure_client(None)
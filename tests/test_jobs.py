@@ -0,0 +1,272 @@
+import asyncio
+import json
+import os
+import socket
+import time
+
+import pytest
+import respx
+from fastapi.testclient import TestClient
+from httpx import Response
+
+from nicotine import LLMOutput, LLMSettings
+from nicotine.jobs import JobQueue, JobStore, configure_job_queue, worker_token
+from nicotine.metrics import Metrics, configure_metrics
+from nicotine.providers import configure_api_providers
+
+
+@pytest.fixture
+def provider(fake_provider):
+    return fake_provider("jobs", latency=0.01, fast_retries=True)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(tmp_path / "jobs.db")
+
+
+def output(n=0):
+    return LLMOutput(
+        id=f"j{n}",
+        prompt=f"Question {n}?",
+        output=f"Answer {n}.",
+        settings=LLMSettings(provider="jobs"),
+    )
+
+
+async def finished(queue, job_id, timeout=5.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        job = await queue.get(job_id)
+        if job.status in ("succeeded", "failed", "cancelled"):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish.")
+
+
+@pytest.mark.asyncio
+async def test_jobs_run_by_priority_then_submission_order(provider, store):
+    queue = JobQueue(store, concurrency=1, poll_interval=0.01)
+    later = await queue.submit(output(0))
+    first = await queue.submit(output(1), priority=-5)
+    last = await queue.submit(output(2), priority=5)
+
+    queue.start()
+    try:
+        jobs = [await finished(queue, job.id) for job in (first, later, last)]
+    finally:
+        await queue.stop()
+
+    assert [job.status for job in jobs] == ["succeeded"] * 3
+    assert jobs[0].started_at < jobs[1].started_at < jobs[2].started_at
+    assert all(job.result.error is None for job in jobs)
+    stats = await queue.stats()
+    assert (stats.queued, stats.succeeded, stats.workers) == (0, 3, 0)
+    assert stats.mean_wait_seconds > 0
+
+
+@pytest.mark.asyncio
+async def test_queued_jobs_survive_restarts(provider, store, tmp_path):
+    job = store.add(output(0))
+    store.claim()  # picked up by a worker process that then died
+    boot, pid, started = worker_token().split("/")
+    reused = f"{boot}/{pid}/{int(started) + 1}"  # its pid now belongs to this one
+    with store._lock:
+        store._conn.execute("UPDATE jobs SET worker = ?", (reused,))
+
+    queue = JobQueue(JobStore(tmp_path / "jobs.db"), poll_interval=0.01)
+    assert (await queue.get(job.id)).status == "running"
+    queue.start()
+    try:
+        job = await finished(queue, job.id)
+    finally:
+        await queue.stop()
+
+    assert job.status == "succeeded"
+    assert provider.calls == 1
+
+
+def test_jobs_of_live_workers_stay_running(store, tmp_path):
+    jobs = [store.add(output(n)) for n in range(3)]
+    for worker in (worker_token(), os.getpid(), 2**22 + 1):
+        store.claim()
+        with store._lock:
+            store._conn.execute(
+                "UPDATE jobs SET worker = ? WHERE worker = ?", (worker, store.worker)
+            )
+
+    JobStore(tmp_path / "jobs.db").recover()
+
+    statuses = [store.get(job.id).status for job in jobs]
+    assert statuses == ["running", "running", "queued"]
+
+
+@pytest.mark.asyncio
+async def test_stopping_requeues_running_jobs(fake_provider, store):
+    fake_provider("jobs", latency=10.0)
+    queue = JobQueue(store, poll_interval=0.01)
+    job = await queue.submit(output(0))
+    queue.start()
+    while (await queue.get(job.id)).status != "running":
+        await asyncio.sleep(0.01)
+    await queue.stop()
+
+    assert (await queue.get(job.id)).status == "queued"
+    assert store.recover() == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_jobs_stop_and_keep_their_status(fake_provider, store):
+    fake_provider("jobs", latency=10.0)
+    queue = JobQueue(store, concurrency=1, poll_interval=0.01)
+    running = await queue.submit(output(0))
+    queued = await queue.submit(output(1))
+    queue.start()
+    while (await queue.get(running.id)).status != "running":
+        await asyncio.sleep(0.01)
+    cancelled = [await queue.cancel(running.id), await queue.cancel(queued.id)]
+    await asyncio.sleep(0.05)
+    jobs = [await queue.get(running.id), await queue.get(queued.id)]
+    await queue.stop()
+
+    assert [job.status for job in cancelled] == ["cancelled", "cancelled"]
+    assert [job.status for job in jobs] == ["cancelled", "cancelled"]
+    assert jobs[0].result is None and jobs[1].started_at is None
+    assert await queue.cancel("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_failed_detections_fail_their_job(provider, store):
+    provider.errors = {"server_error": 1.0}
+    metrics = Metrics()
+    configure_metrics(metrics)
+    queue = JobQueue(store, poll_interval=0.01)
+    try:
+        job = await queue.submit(output(0))
+        queue.start()
+        job = await finished(queue, job.id)
+        await queue.stop()
+    finally:
+        configure_metrics(None)
+
+    assert job.status == "failed"
+    assert job.error.startswith("retries_exhausted:")
+    assert job.result.error == job.error
+    registry = metrics.registry
+    assert registry.get_sample_value("nicotine_jobs_total", {"status": "failed"}) == 1
+    assert registry.get_sample_value("nicotine_job_wait_seconds_count") == 1
+    assert registry.get_sample_value("nicotine_job_queue_depth") == 0
+
+
+@pytest.mark.asyncio
+async def test_finished_jobs_are_posted_to_their_callback(provider, store):
+    queue = JobQueue(store, poll_interval=0.01, callback_hosts=["Client.test"])
+    with respx.mock:
+        route = respx.post("http://client.test/done").mock(return_value=Response(204))
+        job = await queue.submit(output(0), callback_url="http://client.test/done")
+        queue.start()
+        await finished(queue, job.id)
+        await queue.stop()
+
+    assert route.call_count == 1
+    body = json.loads(route.calls.last.request.content)
+    assert (body["id"], body["status"]) == (job.id, "succeeded")
+    assert body["result"]["is_hallucination"] is False
+
+
+@pytest.mark.asyncio
+async def test_callbacks_only_reach_allowed_public_hosts(provider, store):
+    allowlisted = JobQueue(store, callback_hosts=["client.test"])
+    with pytest.raises(ValueError):
+        await allowlisted.submit(output(0), callback_url="http://other.test/done")
+
+    queue = JobQueue(store, poll_interval=0.01)
+    for url in ("http://127.0.0.1/", "http://10.0.0.8:8080/", "http://[::1]/"):
+        with pytest.raises(ValueError):
+            await queue.submit(output(0), callback_url=url)
+    with respx.mock:
+        route = respx.post("http://localhost/done").mock(return_value=Response(204))
+        job = await queue.submit(output(0), callback_url="http://localhost/done")
+        queue.start()
+        await finished(queue, job.id)
+        await queue.stop()
+
+    assert route.call_count == 0  # resolves to a loopback address
+
+
+@pytest.mark.asyncio
+async def test_callbacks_connect_to_the_checked_address(provider, store, monkeypatch):
+    answers = iter(["93.184.216.34", "127.0.0.1"])  # a rebinding DNS server
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (next(answers), port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    queue = JobQueue(store, poll_interval=0.01)
+    with respx.mock:
+        route = respx.post("http://93.184.216.34:8080/done").mock(
+            return_value=Response(204)
+        )
+        job = await queue.submit(output(0), callback_url="http://client.test:8080/done")
+        queue.start()
+        await finished(queue, job.id)
+        await queue.stop()
+
+    assert route.call_count == 1
+    assert route.calls.last.request.headers["host"] == "client.test:8080"
+
+
+def test_expired_jobs_are_purged(store):
+    job = store.add(output(0))
+    store.cancel(job.id)
+
+    assert store.purge(time.time() - 60) == 0
+    assert store.purge(time.time() + 1) == 1
+    assert store.get(job.id) is None
+
+
+def test_api_runs_jobs_in_the_background(provider, store):
+    from nicotine.api import app
+
+    configure_job_queue(JobQueue(store, poll_interval=0.01))
+    configure_api_providers(["jobs"])
+    try:
+        with TestClient(app) as client:
+            response = client.post(
+                "/api/v1/jobs",
+                json={"output": output(0).model_dump(), "priority": 3},
+            )
+            job_id = response.json()["id"]
+            for _ in range(500):
+                job = client.get(f"/api/v1/jobs/{job_id}").json()
+                if job["status"] == "succeeded":
+                    break
+                time.sleep(0.01)
+            stats = client.get("/api/v1/jobs/stats").json()
+            conflict = client.delete(f"/api/v1/jobs/{job_id}")
+            missing = client.get("/api/v1/jobs/missing")
+            metadata = "http://169.254.169.254/latest"
+            rejected = client.post(
+                "/api/v1/jobs",
+                json={"output": output(0).model_dump(), "callback_url": metadata},
+            )
+    finally:
+        configure_job_queue(None)
+        configure_api_providers(None)
+
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    assert job["status"] == "succeeded" and job["priority"] == 3
+    assert job["result"]["error"] is None
+    assert stats["succeeded"] == 1 and stats["workers"] == 4
+    assert conflict.status_code == 409
+    assert missing.status_code == 404
+    assert rejected.status_code == 422 and "not public" in rejected.text
+
+    client = TestClient(app)
+    body = {"output": output(0).model_dump()}
+    assert client.post("/api/v1/jobs", json=body).status_code == 422
+    body["output"]["settings"]["provider"] = None
+    disabled = client.post("/api/v1/jobs", json=body)
+    assert disabled.status_code == 503
+    assert client.get("/api/v1/jobs/stats").json()["enabled"] is False
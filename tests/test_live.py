@@ -0,0 +1,155 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from nicotine.live import GenerationDelta, GenerationStream, LiveSession
+from nicotine.models import HallucinationEvaluation
+from nicotine.providers import FakeProvider, configure_api_providers
+from nicotine.providers import configure_provider
+
+
+class Recorder:
+    """Flags windows mentioning the moon and records every window seen."""
+
+    def __init__(self):
+        self.windows = []
+
+    async def __call__(self, output):
+        self.windows.append(output.output)
+        await asyncio.sleep(0)
+        flagged = "moon" in output.output.split(". ")[-1]
+        return HallucinationEvaluation(
+            is_hallucination=flagged,
+            rationale="mentions the moon" if flagged else "fine",
+            delusion_percentage=100.0 if flagged else 0.0,
+        )
+
+
+async def drain(stream):
+    return [update async for update in stream.updates()]
+
+
+@pytest.mark.asyncio
+async def test_sentences_are_evaluated_while_generating():
+    evaluate = Recorder()
+    stream = GenerationStream("g", "Tell me about Paris.", evaluate=evaluate)
+
+    stream.feed("Paris is in Fra")
+    stream.feed("nce. It is 3.")
+    await asyncio.sleep(0.01)
+    assert evaluate.windows == ["Paris is in France."]
+
+    stream.feed("5 km from the moon. The")
+    await asyncio.sleep(0.01)
+    assert evaluate.windows[1] == "Paris is in France. It is 3.5 km from the moon."
+
+    stream.feed(" end")
+    stream.close()
+    updates = await drain(stream)
+
+    assert [u.final for u in updates] == [False, False, False, True]
+    assert updates[0].evaluation.is_hallucination is False
+    assert updates[0].evaluated_chars == len("Paris is in France.")
+    final = updates[-1]
+    assert final.evaluation.is_hallucination
+    assert "mentions the moon" in final.evaluation.rationale
+    assert final.evaluated_chars == len(stream.text)
+
+
+@pytest.mark.asyncio
+async def test_short_sentences_can_be_grouped():
+    evaluate = Recorder()
+    stream = GenerationStream("g", "p", min_chars=30, evaluate=evaluate)
+
+    stream.feed("One. Two. Three. Four is a longer sentence. ")
+    stream.close()
+    await drain(stream)
+
+    assert evaluate.windows == ["One. Two. Three. Four is a longer sentence."]
+
+
+@pytest.mark.asyncio
+async def test_session_multiplexes_generations():
+    session = LiveSession(evaluate=Recorder())
+    with pytest.raises(ValueError, match="needs a prompt"):
+        session.handle(GenerationDelta(id="a", delta="Hi."))
+
+    session.handle(GenerationDelta(id="a", prompt="p", delta="Sky is blue. "))
+    session.handle(GenerationDelta(id="b", prompt="p", delta="The moon is cheese. "))
+    session.handle(GenerationDelta(id="a", done=True))
+    session.close()
+    updates = [update async for update in session.updates()]
+
+    finals = {u.id: u.evaluation.is_hallucination for u in updates if u.final}
+    assert finals == {"a": False, "b": True}
+
+
+@pytest.mark.asyncio
+async def test_session_stops_reading_while_updates_pile_up():
+    session = LiveSession(evaluate=Recorder(), max_pending=2)
+    session.handle(GenerationDelta(id="a", prompt="p", delta="One. "))
+    for sentence in ("Two. ", "Three. ", "Four. "):
+        session.handle(GenerationDelta(id="a", delta=sentence))
+    drained = asyncio.ensure_future(session.drain())
+    await asyncio.sleep(0.01)
+    assert not drained.done()
+
+    updates = session.updates()
+    first = await updates.__anext__()
+    await asyncio.wait_for(drained, 1.0)
+
+    assert first.segment.index == 0
+    session.close()
+    assert len([u async for u in updates]) == 4
+
+
+@pytest.fixture
+def client():
+    from nicotine.api import app
+
+    configure_provider("live", FakeProvider())
+    configure_api_providers(["live"])
+    yield TestClient(app)
+    configure_api_providers(None)
+    configure_provider("live", None)
+
+
+def test_websocket_pushes_partial_verdicts(client):
+    settings = {"provider": "live"}
+    with client.websocket_connect("/api/v1/detect-hallucination/live") as ws:
+        ws.send_text(json.dumps({"id": "x", "delta": "No prompt."}))
+        assert json.loads(ws.receive_text())["error"] == "Invalid message"
+
+        first = {"id": "x", "prompt": "p", "settings": settings, "delta": "One. Tw"}
+        ws.send_text(json.dumps(first))
+        update = json.loads(ws.receive_text())
+        assert update["segment"]["end"] == len("One.")
+
+        ws.send_text(json.dumps({"id": "x", "delta": "o.", "done": True}))
+        updates = [json.loads(ws.receive_text()) for _ in range(2)]
+
+    assert updates[-1]["final"] is True
+    assert updates[-1]["evaluated_chars"] == len("One. Two.")
+
+
+def test_sse_streams_updates_for_an_ndjson_body(client):
+    settings = {"provider": "live"}
+    body = "\n".join(
+        json.dumps(message)
+        for message in [
+            {"id": "y", "prompt": "p", "settings": settings, "delta": "A. B"},
+            {"id": "y", "delta": ". C.", "done": True},
+        ]
+    )
+
+    response = client.post(
+        "/api/v1/detect-hallucination/live/sse", content=body.encode()
+    )
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [e for e in response.text.split("\n\n") if e]
+    assert all(e.startswith("event: update\ndata: ") for e in events)
+    updates = [json.loads(e.split("data: ", 1)[1]) for e in events]
+    assert [u["final"] for u in updates] == [False] * 3 + [True]
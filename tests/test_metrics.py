@@ -0,0 +1,127 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from nicotine.metrics import (
+    Metrics,
+    configure_metrics,
+    count_attempt,
+    instrument_app,
+    record_cache,
+    record_usage,
+    track_upstream,
+)
+
+
+@pytest.fixture
+def metrics():
+    metrics = Metrics()
+    configure_metrics(metrics)
+    yield metrics
+    configure_metrics(None)
+
+
+def sample(metrics, name, labels=None):
+    return metrics.registry.get_sample_value(name, labels or {})
+
+
+def test_middleware_records_requests_by_route_template(metrics):
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    instrument_app(app, metrics)
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/missing")
+
+    labels = {"method": "GET", "endpoint": "/items/{item_id}", "status": "200"}
+    assert sample(metrics, "nicotine_http_requests_total", labels) == 2
+    route = {"method": "GET", "endpoint": "/items/{item_id}"}
+    count = sample(metrics, "nicotine_http_request_duration_seconds_count", route)
+    assert count == 2
+    unmatched = {"method": "GET", "endpoint": "unmatched", "status": "404"}
+    assert sample(metrics, "nicotine_http_requests_total", unmatched) == 1
+    assert sample(metrics, "nicotine_http_requests_in_flight") == 0
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "nicotine_http_requests_total" in response.text
+
+
+def test_track_upstream_records_outcomes_and_retries(metrics):
+    with track_upstream("gpt-4"):
+        count_attempt()
+        count_attempt()
+        count_attempt()
+    with pytest.raises(TimeoutError):
+        with track_upstream("gpt-4"):
+            count_attempt()
+            raise TimeoutError()
+
+    ok = {"model": "gpt-4", "outcome": "ok"}
+    failed = {"model": "gpt-4", "outcome": "TimeoutError"}
+    assert sample(metrics, "nicotine_upstream_calls_total", ok) == 1
+    assert sample(metrics, "nicotine_upstream_calls_total", failed) == 1
+    model = {"model": "gpt-4"}
+    assert sample(metrics, "nicotine_upstream_retries_total", model) == 2
+    assert sample(metrics, "nicotine_upstream_calls_in_flight", model) == 0
+
+
+def test_usage_and_cache_counters(metrics):
+    class Usage:
+        input_tokens = 120
+        output_tokens = 30
+
+    class Response:
+        usage = Usage()
+
+    record_usage("gpt-4", Response())
+    record_cache("hit")
+    record_cache("miss")
+    record_cache("hit")
+
+    prompt = {"model": "gpt-4", "kind": "prompt"}
+    completion = {"model": "gpt-4", "kind": "completion"}
+    assert sample(metrics, "nicotine_tokens_total", prompt) == 120
+    assert sample(metrics, "nicotine_tokens_total", completion) == 30
+    assert sample(metrics, "nicotine_cache_lookups_total", {"result": "hit"}) == 2
+
+
+def test_helpers_are_no_ops_when_disabled():
+    configure_metrics(None)
+    with track_upstream("gpt-4"):
+        count_attempt()
+    record_cache("hit")
+
+
+def test_multiprocess_mode_aggregates_workers(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    worker = textwrap.dedent("""
+        from nicotine.metrics import Metrics, configure_metrics, record_cache
+        configure_metrics(Metrics())
+        record_cache("hit")
+        """)
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", worker], env=env, check=True)
+    render = textwrap.dedent("""
+        from nicotine.metrics import Metrics
+        print(Metrics().render()[0].decode())
+        """)
+    result = subprocess.run(
+        [sys.executable, "-c", render],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+    assert 'nicotine_cache_lookups_total{result="hit"} 2.0' in result.stdout
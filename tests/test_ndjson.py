@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+
+import nicotine.system
+from nicotine import HallucinationEvaluation
+from nicotine.ndjson import iter_lines, stream_evaluations
+
+
+def record(i):
+    return json.dumps(
+        {"id": f"r{i:04d}", "prompt": "p", "output": f"o{i:04d}", "settings": {}}
+    ).encode()
+
+
+async def chunked(data, size, read_log=None):
+    for start in range(0, len(data), size):
+        end = start + size
+        if read_log is not None:
+            read_log.append(end)
+        yield data[start:end]
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_iter_lines_reassembles_split_records():
+    data = b"a\n\nbc\nd"
+    lines = [line async for line in iter_lines(chunked(data, 2))]
+
+    assert lines == [b"a", b"bc", b"d"]
+
+
+@pytest.mark.asyncio
+async def test_iter_lines_handles_long_lines_in_small_chunks():
+    long = b"x" * 200_000
+    data = b"a\nb\n" + long + b"\nc\n"
+    lines = [line async for line in iter_lines(chunked(data, 7))]
+
+    assert lines == [b"a", b"b", long, b"c"]
+
+
+@pytest.mark.asyncio
+async def test_iter_lines_rejects_oversized_lines():
+    with pytest.raises(ValueError):
+        [line async for line in iter_lines(chunked(b"x" * 100, 10), 50)]
+
+
+@pytest.mark.asyncio
+async def test_stream_evaluations_tags_results_and_reports_bad_lines(monkeypatch):
+    async def fake_detect(output):
+        await asyncio.sleep(0.01 if output.id == "r0000" else 0)
+        return HallucinationEvaluation(
+            is_hallucination=False, rationale=output.output, delusion_percentage=0.0
+        )
+
+    monkeypatch.setattr(nicotine.system, "async_detect_hallucination", fake_detect)
+    data = b"\n".join([record(0), b"{not json", record(2)])
+
+    results = [r async for r in stream_evaluations(chunked(data, 7), concurrency=4)]
+
+    by_line = {r.line: r for r in results}
+    assert by_line[1].id == "r0000" and by_line[1].rationale == "o0000"
+    assert by_line[2].id is None and by_line[2].error
+    assert by_line[3].id == "r0002"
+    # Faster records are emitted first.
+    assert results[-1].id == "r0000"
+
+
+@pytest.mark.asyncio
+async def test_stream_evaluations_applies_backpressure(monkeypatch):
+    in_flight = 0
+    peak = 0
+
+    async def fake_detect(output):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        return HallucinationEvaluation(
+            is_hallucination=False, rationale="ok", delusion_percentage=0.0
+        )
+
+    monkeypatch.setattr(nicotine.system, "async_detect_hallucination", fake_detect)
+    lines = [record(i) for i in range(200)]
+    read_log = []
+    data = b"\n".join(lines) + b"\n"
+    line_size = len(lines[0]) + 1
+
+    consumed = 0
+    async for _ in stream_evaluations(
+        chunked(data, line_size, read_log), concurrency=3
+    ):
+        consumed += 1
+        await asyncio.sleep(0.001)  # Slow consumer.
+        # Reading never runs more than the buffer ahead of consumption.
+        assert read_log[-1] // line_size <= consumed + 3 + 1
+
+    assert consumed == 200
+    assert peak <= 3
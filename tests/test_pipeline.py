@@ -0,0 +1,270 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import nicotine.pipeline
+import nicotine.system
+from nicotine import (
+    LLMOutput,
+    LLMSettings,
+    async_detect_hallucination,
+    detect_hallucination,
+)
+from nicotine.pipeline import (
+    Claim,
+    ClaimVerdict,
+    Condensation,
+    Condensate,
+    MaxUnsupportedStop,
+    MysticLakePipeline,
+    Runoff,
+    SentencePrecipitation,
+    ThresholdStop,
+    Vapor,
+    configure_default_pipeline,
+)
+
+
+def make_output(text):
+    return LLMOutput(
+        id="1",
+        prompt="Tell me about Paris.",
+        output=text,
+        settings=LLMSettings(),
+    )
+
+
+class KeywordPercolation:
+    """Local verifier: claims mentioning 'Lyon' are unsupported."""
+
+    name = "percolation"
+
+    def __init__(self):
+        self.started = []
+
+    async def verify(self, claim, condensate):
+        self.started.append(claim.index)
+        await asyncio.sleep(0.01)
+        supported = "Lyon" not in claim.text
+        return ClaimVerdict(
+            claim=claim,
+            supported=supported,
+            confidence=1.0,
+            rationale="keyword",
+            source="local",
+        )
+
+
+@pytest.mark.asyncio
+async def test_condensation_and_sentence_precipitation():
+    vapor = Vapor(output=make_output(""), text="Paris is  big.\nIs it old? It is old.")
+    condensate = await Condensation().condense(vapor)
+
+    assert condensate.sentences == ["Paris is big.", "Is it old?", "It is old."]
+    claims = [c async for c in SentencePrecipitation().extract(condensate)]
+    assert [c.text for c in claims] == ["Paris is big.", "It is old."]
+
+
+@pytest.mark.asyncio
+async def test_runoff_applies_threshold():
+    claims = [Claim(index=i, text=str(i)) for i in range(4)]
+    verdicts = [
+        ClaimVerdict(
+            claim=c, supported=c.index != 0, confidence=1.0, rationale="", source="x"
+        )
+        for c in claims
+    ]
+    output = make_output("")
+
+    strict = await Runoff(delusion_threshold=20.0).synthesize(output, verdicts)
+    lenient = await Runoff(delusion_threshold=50.0).synthesize(output, verdicts)
+
+    assert strict.delusion_percentage == 25.0
+    assert strict.is_hallucination is True
+    assert lenient.is_hallucination is False
+    assert "[0] 0" in strict.rationale
+
+
+@pytest.mark.asyncio
+async def test_pipeline_runs_swapped_stages_and_times_them():
+    pipeline = MysticLakePipeline(
+        percolation=KeywordPercolation(), runoff=Runoff(delusion_threshold=50.0)
+    )
+
+    result = await pipeline.run(
+        make_output("Paris is in France. The capital is Lyon. Paris has the Louvre.")
+    )
+
+    assert result.evaluation.delusion_percentage == pytest.approx(100 / 3)
+    assert result.evaluation.is_hallucination is False
+    assert [v.supported for v in result.verdicts] == [True, False, True]
+    assert result.timings["percolation"].calls == 3
+    assert all(t.calls >= 1 for t in result.timings.values())
+
+
+@pytest.mark.asyncio
+async def test_pipeline_verifies_while_extraction_streams():
+    percolation = KeywordPercolation()
+    observed = []
+
+    class SlowPrecipitation:
+        name = "precipitation"
+
+        async def extract(self, condensate: Condensate):
+            for index, sentence in enumerate(condensate.sentences):
+                yield Claim(index=index, text=sentence)
+                await asyncio.sleep(0.05)
+                observed.append(list(percolation.started))
+
+    pipeline = MysticLakePipeline(
+        precipitation=SlowPrecipitation(), percolation=percolation
+    )
+    await pipeline.run(make_output("One. Two. Three."))
+
+    # Verification of claim 0 began before extraction of claim 1 finished.
+    assert observed[0] == [0]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_reports_error_when_no_claim_verified():
+    class FailingPercolation:
+        name = "percolation"
+
+        async def verify(self, claim, condensate):
+            return ClaimVerdict(
+                claim=claim,
+                supported=True,
+                confidence=0.0,
+                rationale="Error verifying claim",
+                source="llm",
+                error="upstream down",
+            )
+
+    result = await MysticLakePipeline(percolation=FailingPercolation()).run(
+        make_output("Paris is in France.")
+    )
+
+    assert result.evaluation.error == "upstream down"
+
+
+@pytest.mark.asyncio
+async def test_async_detect_hallucination_pipeline_strategy(monkeypatch):
+    configure_default_pipeline(MysticLakePipeline(percolation=KeywordPercolation()))
+    monkeypatch.setattr(nicotine.system, "_use_pipeline", lambda: True)
+    try:
+        evaluation = await async_detect_hallucination(make_output("It is Lyon."))
+    finally:
+        configure_default_pipeline(None)
+
+    assert evaluation.is_hallucination is True
+    assert evaluation.delusion_percentage == 100.0
+
+
+class TrackingPercolation:
+    """Verifier that records peak concurrency; 'Lyon' claims fail fast."""
+
+    name = "percolation"
+    model = "tracked-model"
+
+    def __init__(self, slow=0.02):
+        self.in_flight = 0
+        self.peak = 0
+        self.slow = slow
+
+    async def verify(self, claim, condensate):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            failing = "Lyon" in claim.text
+            await asyncio.sleep(0.01 if failing else self.slow)
+        finally:
+            self.in_flight -= 1
+        return ClaimVerdict(
+            claim=claim,
+            supported=not failing,
+            confidence=1.0,
+            rationale="tracked",
+            source="local",
+        )
+
+
+@pytest.mark.asyncio
+async def test_verification_concurrency_is_bounded_per_model(monkeypatch):
+    settings = {
+        "hallucination_detection.verification_concurrency": 8,
+        "hallucination_detection.verification_concurrency_per_model": {
+            "tracked-model": 2
+        },
+    }
+    monkeypatch.setattr(
+        nicotine.pipeline,
+        "get_setting",
+        lambda key, default=None: settings.get(key, default),
+    )
+    percolation = TrackingPercolation()
+    pipeline = MysticLakePipeline(percolation=percolation, early_termination=None)
+
+    result = await pipeline.run(make_output(" ".join(f"Fact {i}." for i in range(10))))
+
+    assert len(result.verdicts) == 10
+    assert percolation.peak == 2
+
+
+def test_verification_concurrency_is_shared_by_blocking_callers(monkeypatch):
+    settings = {
+        "hallucination_detection.verification_concurrency_per_model": {
+            "shared-model": 2
+        },
+    }
+    monkeypatch.setattr(
+        nicotine.pipeline,
+        "get_setting",
+        lambda key, default=None: settings.get(key, default),
+    )
+    percolation = TrackingPercolation(slow=0.05)
+    percolation.model = "shared-model"
+    pipeline = MysticLakePipeline(percolation=percolation, early_termination=None)
+    output = make_output(" ".join(f"Fact {i}." for i in range(4)))
+
+    with ThreadPoolExecutor(3) as pool:
+        results = list(pool.map(lambda _: asyncio.run(pipeline.run(output)), range(3)))
+
+    assert all(len(r.verdicts) == 4 for r in results)
+    assert percolation.peak == 2
+
+
+@pytest.mark.asyncio
+async def test_blocking_pipeline_is_refused_inside_an_event_loop(monkeypatch):
+    monkeypatch.setattr(nicotine.system, "_use_pipeline", lambda: True)
+
+    evaluation = detect_hallucination(make_output("It is Lyon."))
+
+    assert "use async_detect_hallucination" in evaluation.error
+
+
+@pytest.mark.asyncio
+async def test_threshold_stop_skips_remaining_claims():
+    percolation = TrackingPercolation(slow=5.0)
+    pipeline = MysticLakePipeline(
+        percolation=percolation,
+        runoff=Runoff(delusion_threshold=50.0),
+        early_termination=ThresholdStop(50.0),
+    )
+
+    result = await asyncio.wait_for(
+        pipeline.run(make_output("Lyon one. Lyon two. Paris three. Paris four.")), 2
+    )
+
+    assert result.stopped_early is True
+    assert [v.skipped for v in result.verdicts] == [False, False, True, True]
+    assert result.evaluation.is_hallucination is True
+    assert result.evaluation.delusion_percentage == 50.0
+    assert "Stopped early" in result.evaluation.rationale
+
+
+def test_early_termination_policies():
+    assert ThresholdStop(50.0).should_stop(2, None) is False
+    assert ThresholdStop(50.0).should_stop(2, 4) is True
+    assert ThresholdStop(50.0).should_stop(1, 4) is False
+    assert MaxUnsupportedStop(3).should_stop(3, None) is True
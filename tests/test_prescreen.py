@@ -0,0 +1,133 @@
+import pytest
+
+import nicotine.system
+from nicotine import (
+    HallucinationEvaluation,
+    LLMOutput,
+    LLMSettings,
+    async_detect_hallucination,
+    async_detect_hallucinations,
+    detect_hallucination,
+)
+from nicotine.prescreen import (
+    TieredDetector,
+    configure_tiered_detector,
+    prescreen,
+    score_grounding,
+)
+
+CONTEXT = (
+    "Context: The Eiffel Tower was completed in 1889 and is 330 metres tall. "
+    "Question: When was the Eiffel Tower completed?"
+)
+
+
+def make_output(prompt, output):
+    return LLMOutput(id="1", prompt=prompt, output=output, settings=LLMSettings())
+
+
+@pytest.fixture
+def tiered():
+    detector = TieredDetector(threshold=0.9)
+    configure_tiered_detector(detector)
+    yield detector
+    configure_tiered_detector(None)
+
+
+def test_score_grounding_extractive_output():
+    signals = score_grounding(CONTEXT, "The Eiffel Tower was completed in 1889.")
+
+    assert signals.token_overlap == 1.0
+    assert signals.numbers_grounded is True
+    assert signals.confidence == pytest.approx(1.0)
+
+
+def test_score_grounding_flags_ungrounded_numbers():
+    signals = score_grounding(CONTEXT, "The Eiffel Tower was completed in 1899.")
+
+    assert signals.numbers_grounded is False
+    assert signals.confidence == 0.0
+
+
+def test_prescreen_escalates_unsupported_outputs():
+    assert prescreen(make_output(CONTEXT, "It opened in 1889."), 0.9) is None
+    assert (
+        prescreen(make_output("What is the capital of France?", "Paris"), 0.9) is None
+    )
+    assert prescreen(make_output(CONTEXT, "   "), 0.9).is_hallucination is False
+
+
+def test_prescreen_escalates_short_answers_picked_from_the_prompt():
+    assert score_grounding("Paris or Lyon?", "Lyon.").bigram_overlap is None
+    assert prescreen(make_output("Paris or Lyon?", "Lyon."), 0.9) is None
+    assert prescreen(make_output("2 or 3?", "3"), 0.9) is None
+
+
+def test_detect_hallucination_resolves_locally_and_reports_tiers(fake_client, tiered):
+    calls = []
+
+    def mock_parse(*args, **kwargs):
+        calls.append(kwargs)
+
+        class MockResponse:
+            output_parsed = HallucinationEvaluation(
+                is_hallucination=True, rationale="llm", delusion_percentage=80.0
+            )
+
+        return MockResponse()
+
+    fake_client(mock_parse)
+
+    grounded = detect_hallucination(
+        make_output(CONTEXT, "The Eiffel Tower was completed in 1889.")
+    )
+    escalated = detect_hallucination(make_output(CONTEXT, "It is 500 metres tall."))
+
+    assert grounded.rationale.startswith("Pre-screen")
+    assert escalated.rationale == "llm"
+    assert len(calls) == 1
+    stats = tiered.stats()
+    assert stats.total == 2
+    assert stats.tiers["prescreen"].share == 0.5
+    assert stats.tiers["llm"].resolved == 1
+    assert stats.tiers["llm"].p99_ms >= stats.tiers["llm"].p50_ms
+
+
+@pytest.mark.asyncio
+async def test_async_detect_hallucination_skips_model_when_grounded(
+    monkeypatch, tiered
+):
+    def fail():
+        raise AssertionError("upstream should not be called")
+
+    monkeypatch.setattr(nicotine.system, "get_async_client", fail)
+
+    evaluation = await async_detect_hallucination(
+        make_output(CONTEXT, "The Eiffel Tower is 330 metres tall.")
+    )
+
+    assert evaluation.is_hallucination is False
+    assert tiered.stats().tiers["prescreen"].resolved == 1
+
+
+@pytest.mark.asyncio
+async def test_packed_batches_report_the_llm_tier(fake_provider, tiered):
+    fake_provider("prescreen")
+    settings = LLMSettings(provider="prescreen")
+    outputs = [
+        LLMOutput(id=str(n), prompt=CONTEXT, output=output, settings=settings)
+        for n, output in enumerate(
+            [
+                "The Eiffel Tower was completed in 1889.",
+                "It is 500 metres tall.",
+                "It was built in Lyon.",
+            ]
+        )
+    ]
+    await async_detect_hallucinations(outputs, pack_size=2)
+
+    stats = tiered.stats()
+    assert stats.total == 3
+    assert stats.tiers["prescreen"].resolved == 1
+    assert stats.tiers["llm"].resolved == 2
+    assert stats.tiers["llm"].p50_ms > 0
@@ -0,0 +1,129 @@
+import copy
+
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+import nicotine.config
+from nicotine import LLMOutput, LLMSettings, detect_hallucination
+from nicotine.config import load_config
+from nicotine.metrics import Metrics, configure_metrics
+from nicotine.models import HallucinationEvaluation
+from nicotine.prompts import configure_template, get_template
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    config = copy.deepcopy(load_config())
+    monkeypatch.setattr(nicotine.config, "load_config", lambda path=None: config)
+    yield config
+    for version in ("1", "2", "3"):
+        configure_template(version, None)
+
+
+@pytest.fixture
+def provider(fake_provider):
+    return fake_provider("prompts")
+
+
+def output(n, version=None):
+    return LLMOutput(
+        id=f"o{n}",
+        prompt=f"Question {n}?",
+        output=f"Answer {n}.",
+        settings=LLMSettings(provider="prompts", prompt_version=version),
+    )
+
+
+def test_version_1_sends_the_original_prompt(settings):
+    request = get_template().request(output(1))
+
+    assert request == {
+        "input": "\n    You are a helpful assistant that detects hallucinations in the "
+        "input.\n\n    Input: Question 1?\n    Output: Answer 1.\n    "
+    }
+
+
+def test_version_2_keeps_the_instructions_static(settings):
+    template = get_template(LLMSettings(prompt_version="2"))
+    first, second = template.request(output(1)), template.request(output(2))
+
+    assert template.version == "2"
+    assert first["instructions"] == second["instructions"]
+    assert "Answer" not in first["instructions"]
+    assert first["input"] == "Input: Question 1?\nOutput: Answer 1."
+    assert first["prompt_cache_key"] == "nicotine-detect-v2"
+
+    packed = template.packed_request([output(1), output(2)])
+    assert packed["input"].count("Item ") == 2
+    assert packed["prompt_cache_key"] == "nicotine-detect-v2-packed"
+
+    settings["prompts"]["prompt_cache_key"] = False
+    assert "prompt_cache_key" not in template.request(output(1))
+
+
+def test_configured_versions_default_to_version_2(settings):
+    settings["prompts"]["templates"] = {3: {"payload": "Q: {prompt}\nA: {output}"}}
+
+    template = get_template(LLMSettings(prompt_version="3"))
+    base = get_template(LLMSettings(prompt_version="2"))
+
+    assert template.request(output(1))["input"] == "Q: Question 1?\nA: Answer 1."
+    assert template.instructions == base.instructions
+    assert template.cache_key == "nicotine-detect-v3"
+
+
+def test_unknown_versions_fail_validation(settings, provider):
+    with pytest.raises(ValidationError, match="Unknown prompt template version: 9"):
+        output(1, version="9")
+
+    settings["prompts"]["version"] = "9"
+    evaluation = detect_hallucination(output(1))
+
+    assert evaluation.error == "Unknown prompt template version: 9."
+    assert provider.calls == 0
+
+
+def test_api_rejects_unknown_versions(settings):
+    from nicotine.api import app
+
+    body = output(1).model_dump()
+    body["settings"].update(provider=None, prompt_version="9")
+    response = TestClient(app).post("/api/v1/detect-hallucination", json=body)
+
+    assert response.status_code == 422
+    assert "Unknown prompt template version" in response.text
+
+
+def test_cached_prefix_tokens_are_recorded(settings, provider):
+    metrics = Metrics()
+    configure_metrics(metrics)
+    try:
+        detect_hallucination(output(1, version="2"))
+        detect_hallucination(output(2, version="2"))
+        detect_hallucination(output(3))
+    finally:
+        configure_metrics(None)
+
+    def sample(name, labels):
+        return metrics.registry.get_sample_value(name, labels)
+
+    cached = sample("nicotine_prompt_tokens_total", {"template": "2", "kind": "cached"})
+    prompt = sample("nicotine_prompt_tokens_total", {"template": "2", "kind": "input"})
+    assert 0 < cached < prompt
+    assert (
+        sample("nicotine_prompt_tokens_total", {"template": "1", "kind": "cached"})
+        is None
+    )
+    model = {"model": "gpt-4.1", "kind": "cached"}
+    assert sample("nicotine_tokens_total", model) == cached
+
+
+def test_response_schema_is_generated_once():
+    schema = HallucinationEvaluation.model_json_schema()
+    schema["properties"].clear()
+
+    assert HallucinationEvaluation.model_json_schema()["properties"]
+    assert HallucinationEvaluation.model_json_schema() is not (
+        HallucinationEvaluation.model_json_schema()
+    )
@@ -0,0 +1,139 @@
+import time
+
+import pytest
+
+from nicotine import (
+    HallucinationEvaluation,
+    LLMOutput,
+    LLMSettings,
+    async_detect_hallucination,
+    async_detect_hallucinations,
+    detect_hallucination,
+)
+from nicotine.pipeline import LLMPercolation, LLMPrecipitation, MysticLakePipeline
+from nicotine.resilience import CallPolicy, configure_call_policy
+from nicotine.providers import (
+    FakeProvider,
+    OpenAIProvider,
+    ProviderError,
+    api_providers,
+    build_provider,
+    configure_provider,
+    get_provider,
+)
+
+
+def make_output(text, provider="fake"):
+    return LLMOutput(
+        id="1",
+        prompt="Tell me about Paris.",
+        output=text,
+        settings=LLMSettings(provider=provider),
+    )
+
+
+@pytest.fixture
+def fake():
+    configure_call_policy(CallPolicy(max_retries=0, breaker_threshold=None))
+
+    def install(**options):
+        provider = FakeProvider(**options)
+        configure_provider("fake", provider)
+        return provider
+
+    yield install
+    configure_provider("fake", None)
+    configure_call_policy(None)
+
+
+def test_fake_provider_is_deterministic(fake):
+    fake(hallucination_rate=0.5, seed=3)
+    outputs = [make_output(f"Paris has {i} bridges.") for i in range(20)]
+
+    first = [detect_hallucination(output) for output in outputs]
+    second = [detect_hallucination(output) for output in outputs]
+
+    assert first == second
+    assert all(e.error is None for e in first)
+    flagged = [e for e in first if e.is_hallucination]
+    assert 0 < len(flagged) < len(first)
+    assert all(e.delusion_percentage >= 50 for e in flagged)
+
+
+@pytest.mark.asyncio
+async def test_fake_provider_simulates_latency_and_errors(fake):
+    fake(latency=0.05)
+    start = time.perf_counter()
+    await async_detect_hallucination(make_output("Paris is in France."))
+    assert time.perf_counter() - start >= 0.05
+
+    fake(errors={"rate_limit": 1.0})
+    evaluation = await async_detect_hallucination(make_output("Paris is big."))
+    assert evaluation.error == "upstream_error: ProviderError: Simulated rate limit."
+    with pytest.raises(ProviderError) as raised:
+        await get_provider("fake").aparse(
+            input="x", model="m", text_format=HallucinationEvaluation
+        )
+    assert raised.value.status == 429
+
+
+@pytest.mark.asyncio
+async def test_fake_provider_answers_packed_requests(fake):
+    provider = fake()
+    outputs = [make_output(f"Fact {i}.") for i in range(4)]
+
+    results = await async_detect_hallucinations(outputs, pack_size=4)
+
+    assert len(results) == 4
+    assert all(r.error is None for r in results)
+    assert provider.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_fake_provider_drives_the_model_pipeline(fake):
+    fake()
+    pipeline = MysticLakePipeline(
+        precipitation=LLMPrecipitation(), percolation=LLMPercolation()
+    )
+
+    result = await pipeline.run(make_output("Paris is big. It is old."))
+
+    assert [v.claim.text for v in result.verdicts] == ["Paris is big.", "It is old."]
+    assert all(v.supported for v in result.verdicts)
+
+
+def test_provider_selection(monkeypatch):
+    assert isinstance(get_provider("openai"), OpenAIProvider)
+    assert get_provider("openai").shared
+    for name in ("missing", "fake"):  # fakes are only built when configured
+        with pytest.raises(ValueError):
+            get_provider(name)
+
+    monkeypatch.setenv("LOCAL_KEY", "secret")
+    local = build_provider(
+        {
+            "type": "openai",
+            "base_url": "http://localhost:8080/v1",
+            "api_key_env": "LOCAL_KEY",
+        }
+    )
+    assert (local.base_url, local.api_key) == ("http://localhost:8080/v1", "secret")
+    assert not local.shared
+    slow = build_provider({"type": "fake", "latency": 0.2, "errors": {"timeout": 0.1}})
+    assert (slow.latency, slow.errors) == (0.2, {"timeout": 0.1})
+
+
+def test_api_requests_only_name_allowed_providers(fake):
+    from fastapi.testclient import TestClient
+
+    from nicotine.api import app
+
+    fake()
+    client = TestClient(app)
+    body = make_output("Paris is in France.").model_dump()
+    rejected = client.post("/api/v1/detect-hallucination", json=body)
+
+    assert api_providers() == {"openai"}
+    assert rejected.status_code == 422
+    assert "'fake' is not available" in rejected.text
+    assert make_output("Paris is in France.").settings.provider == "fake"
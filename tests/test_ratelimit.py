@@ -0,0 +1,243 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from nicotine.models import HallucinationEvaluation
+from nicotine.providers import FakeProvider, ProviderError, configure_provider
+from nicotine.ratelimit import (
+    BULK,
+    Budget,
+    RateLimited,
+    RateLimiter,
+    SQLiteBudgetStore,
+    bind,
+    configure_rate_limiter,
+    get_rate_limiter,
+    observe_headers,
+    parse_duration,
+    request_priority,
+)
+from nicotine.resilience import (
+    CallPolicy,
+    DeadlineExceeded,
+    acall_upstream,
+    configure_call_policy,
+    deadline,
+    get_call_policy,
+)
+
+
+def drain(limiter, key):
+    limiter.store.update(key, limiter._initial(key), _empty)
+
+
+def _empty(budget):
+    budget.requests = 0.0
+    budget.tokens = 0.0
+    budget.updated = time.time()
+
+
+def snapshot(limiter, key):
+    return limiter.store.update(key, limiter._initial(key), lambda b: Budget(**vars(b)))
+
+
+@pytest.fixture
+def limiter():
+    previous = get_rate_limiter()
+    limiter = RateLimiter(default={"rpm": 600, "tpm": 10000})
+    configure_rate_limiter(limiter)
+    yield limiter
+    configure_rate_limiter(previous)
+
+
+def test_budget_refills_per_minute():
+    budget = Budget(rpm=60, tpm=1000, requests=1, tokens=1000, updated=0.0)
+
+    assert budget.take(400, now=0.0) == 0
+    assert budget.take(400, now=0.0) == pytest.approx(1.0)
+    assert budget.take(400, now=1.0) == 0
+    assert budget.tokens == pytest.approx(1000 - 800 + 1000 / 60)
+    # A call larger than the whole budget waits for a full bucket.
+    assert budget.take(5000, now=1.0) > 0
+    assert budget.take(5000, now=120.0) == 0
+
+
+def test_unused_tokens_are_refunded(limiter):
+    limiter.acquire("s/m", 4000)
+    limiter.settle("s/m", 4000, used=500)
+
+    assert snapshot(limiter, "s/m").tokens == pytest.approx(9500, abs=5)
+
+
+@pytest.mark.asyncio
+async def test_interactive_calls_go_ahead_of_bulk(limiter):
+    drain(limiter, "s/m")
+    served = []
+
+    async def call(name, priority):
+        with request_priority(priority):
+            await limiter.aacquire("s/m", 1)
+        served.append(name)
+
+    bulk = [asyncio.create_task(call(f"bulk{i}", BULK)) for i in range(2)]
+    await asyncio.sleep(0.01)
+    interactive = asyncio.create_task(call("interactive", "interactive"))
+    await asyncio.gather(*bulk, interactive)
+
+    assert served == ["interactive", "bulk0", "bulk1"]
+
+
+def test_waiting_is_bounded(limiter):
+    drain(limiter, "s/m")
+
+    with pytest.raises(RateLimited):
+        limiter.acquire("s/m", 1, max_wait=0.02)
+
+
+def test_limits_adapt_to_response_headers(limiter):
+    with bind("s/m"):
+        observe_headers(
+            {
+                "x-ratelimit-limit-requests": "60",
+                "x-ratelimit-limit-tokens": "2000",
+                "x-ratelimit-remaining-requests": "10",
+                "x-ratelimit-remaining-tokens": "150",
+            }
+        )
+    budget = snapshot(limiter, "s/m")
+    assert (budget.rpm, budget.tpm) == (60, 2000)
+    assert budget.requests == pytest.approx(10, abs=0.1)
+    assert budget.tokens == pytest.approx(150, abs=1)
+
+    limiter.observe("s/m", {"Retry-After": "2"})
+    assert limiter._take("s/m", 1) == pytest.approx(2, abs=0.1)
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == pytest.approx(0.02)
+
+
+def test_limits_learned_on_an_unlimited_budget_start_from_remaining():
+    limiter = RateLimiter()
+    limiter.acquire("s/m", 1200)
+    limiter.observe(
+        "s/m",
+        {
+            "x-ratelimit-limit-requests": "500",
+            "x-ratelimit-limit-tokens": "30000",
+            "x-ratelimit-remaining-requests": "499",
+            "x-ratelimit-remaining-tokens": "28800",
+        },
+    )
+
+    started = time.monotonic()
+    limiter.acquire("s/m", 1200, max_wait=0.5)
+
+    assert time.monotonic() - started < 0.1
+    assert snapshot(limiter, "s/m").tokens == pytest.approx(27600, abs=10)
+
+
+def test_sqlite_store_is_shared_between_limiters(tmp_path):
+    path = tmp_path / "ratelimit.db"
+    first = RateLimiter(SQLiteBudgetStore(path), default={"rpm": 2})
+    second = RateLimiter(SQLiteBudgetStore(path), default={"rpm": 2})
+
+    first.acquire("s/m", 1)
+    second.acquire("s/m", 1)
+
+    with pytest.raises(RateLimited):
+        first.acquire("s/m", 1, max_wait=0.01)
+
+
+@pytest.mark.asyncio
+async def test_sqlite_lock_waits_leave_the_event_loop_running(tmp_path):
+    path = tmp_path / "ratelimit.db"
+    limiter = RateLimiter(SQLiteBudgetStore(path), default={"rpm": 2})
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")  # another worker holds the write lock
+
+    acquiring = asyncio.create_task(limiter.aacquire("s/m", 1))
+    start = time.perf_counter()
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+    assert time.perf_counter() - start < 1.0
+    assert not acquiring.done()
+
+    other.execute("COMMIT")
+    await asyncio.wait_for(acquiring, 5.0)
+
+
+class RateLimitedProvider(FakeProvider):
+    """Answers the first call with a 429 asking to retry after 200 ms."""
+
+    async def aparse(self, **kwargs):
+        if self.calls == 0:
+            self.calls += 1
+            raise ProviderError("slow down", 429, {"retry-after-ms": "200"})
+        return await super().aparse(**kwargs)
+
+
+@pytest.fixture
+def upstream(limiter):
+    configure_call_policy(CallPolicy(backoff=0.0, breaker_threshold=None))
+    configure_provider("s", RateLimitedProvider())
+    yield
+    configure_provider("s", None)
+    configure_call_policy(None)
+
+
+@pytest.mark.asyncio
+async def test_upstream_calls_honor_retry_after(upstream):
+    kwargs = dict(input="x", model="m", text_format=HallucinationEvaluation)
+
+    start = time.perf_counter()
+    response = await acall_upstream("s", **kwargs)
+
+    assert response.output_parsed is not None
+    assert time.perf_counter() - start >= 0.2
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_wait_respects_the_deadline(upstream, limiter):
+    drain(limiter, "s/m")
+    kwargs = dict(input="x", model="m", text_format=HallucinationEvaluation)
+
+    with deadline(0.02), pytest.raises(DeadlineExceeded):
+        await acall_upstream("s", **kwargs)
+
+
+class SlowFirstProvider(FakeProvider):
+    """Answers the first call after 500 ms and later ones at once."""
+
+    started = 0
+
+    async def aparse(self, **kwargs):
+        self.started += 1
+        if self.started == 1:
+            await asyncio.sleep(0.5)
+        return await super().aparse(**kwargs)
+
+
+@pytest.mark.asyncio
+async def test_hedged_calls_are_charged_once(limiter):
+    configure_call_policy(CallPolicy(hedge_quantile=0.95, hedge_min_samples=1))
+    provider = SlowFirstProvider()
+    configure_provider("s", provider)
+    try:
+        get_call_policy().tracker("s/m").add(0.02)
+        response = await acall_upstream(
+            "s",
+            input="x" * 400,
+            model="m",
+            max_output_tokens=1000,
+            text_format=HallucinationEvaluation,
+        )
+    finally:
+        configure_provider("s", None)
+        configure_call_policy(None)
+
+    assert provider.started == 2
+    used = response.usage.input_tokens + response.usage.output_tokens
+    budget = snapshot(limiter, "s/m")
+    assert budget.requests == pytest.approx(599, abs=0.5)
+    assert budget.tokens == pytest.approx(10000 - used, abs=20)
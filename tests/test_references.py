@@ -0,0 +1,139 @@
+import json
+
+import pytest
+
+from nicotine import LLMOutput, LLMSettings
+from nicotine.pipeline import Claim, ClaimVerdict, Condensate
+from nicotine.references import (
+    ReferenceIndex,
+    ReferenceIndexBuilder,
+    ReferencePercolation,
+    build_index,
+    claim_coverage,
+    tokenize,
+)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    jsonl = tmp_path / "facts.jsonl"
+    jsonl.write_text(
+        "\n".join(
+            json.dumps({"text": text, "source": "atlas"})
+            for text in [
+                "Paris is the capital and largest city of France.",
+                "The Eiffel Tower was completed in 1889 in Paris.",
+                "Berlin is the capital of Germany.",
+            ]
+        )
+    )
+    notes = tmp_path / "notes.txt"
+    notes.write_text("Lyon is a city in France.\n\nMadrid is the capital of Spain.")
+    return build_index(tmp_path / "index", [jsonl, notes])
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("The capital of France is Paris.") == ["capital", "france", "paris"]
+
+
+def test_index_ingests_jsonl_and_text(corpus):
+    assert len(corpus) == 5
+    assert corpus.passage(4) == (
+        "Madrid is the capital of Spain.",
+        str(corpus.path.parent / "notes.txt"),
+    )
+
+
+def test_search_ranks_best_passage_first(corpus):
+    hits = corpus.search("When was the Eiffel Tower completed?", k=2)
+
+    assert hits[0].passage_id == 1
+    assert hits[0].source == "atlas"
+    assert hits[0].score > (hits[1].score if len(hits) > 1 else 0)
+
+
+def test_index_reopens_from_disk(corpus):
+    reopened = ReferenceIndex(corpus.path)
+
+    assert reopened.search("capital Germany", k=1)[0].text.startswith("Berlin")
+
+
+def test_empty_index(tmp_path):
+    index = ReferenceIndexBuilder(tmp_path / "empty").build()
+
+    assert index.search("anything") == []
+
+
+def test_claim_coverage_rejects_wrong_numbers():
+    passage = "The Eiffel Tower was completed in 1889 in Paris."
+
+    assert claim_coverage("The Eiffel Tower was completed in 1889.", passage) == 1.0
+    assert claim_coverage("The Eiffel Tower was completed in 1899.", passage) == 0.0
+
+
+def test_claim_coverage_requires_order_and_entities():
+    passage = "Paris is the capital and largest city of France."
+
+    assert claim_coverage("Paris is the capital of France.", passage) == 1.0
+    assert claim_coverage("France is the capital of Paris.", passage) < 0.9
+    assert claim_coverage("The largest city of Spain is Paris.", passage) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_reference_percolation_resolves_locally_or_escalates(corpus):
+    escalated = []
+
+    class Fallback:
+        name = "percolation"
+        model = "gpt-4.1"
+
+        async def verify(self, claim, condensate):
+            escalated.append(claim.text)
+            return ClaimVerdict(
+                claim=claim,
+                supported=False,
+                confidence=1.0,
+                rationale="llm",
+                source="llm",
+            )
+
+    percolation = ReferencePercolation(corpus, fallback=Fallback())
+    condensate = Condensate(
+        output=LLMOutput(id="1", prompt="p", output="o", settings=LLMSettings()),
+        sentences=[],
+    )
+
+    local = await percolation.verify(
+        Claim(index=0, text="Paris is the capital of France."), condensate
+    )
+    remote = await percolation.verify(
+        Claim(index=1, text="Paris is the capital of Italy."), condensate
+    )
+
+    assert local.source == "reference" and local.supported
+    assert remote.source == "llm"
+    assert escalated == ["Paris is the capital of Italy."]
+    assert (percolation.resolved, percolation.escalated) == (1, 1)
+    assert percolation.model == "gpt-4.1"
+
+
+def test_default_pipeline_opens_the_configured_index(corpus, monkeypatch):
+    import nicotine.pipeline
+    import nicotine.references
+
+    settings = {"references.index_path": str(corpus.path), "references.top_k": 2}
+
+    def get_setting(key, default=None):
+        return settings.get(key, default)
+
+    monkeypatch.setattr(nicotine.pipeline, "get_setting", get_setting)
+    monkeypatch.setattr(nicotine.references, "get_setting", get_setting)
+    nicotine.pipeline.configure_default_pipeline(None)
+    try:
+        percolation = nicotine.pipeline.get_default_pipeline().percolation
+    finally:
+        nicotine.pipeline.configure_default_pipeline(None)
+
+    assert isinstance(percolation, ReferencePercolation)
+    assert percolation.index.path == corpus.path
+    assert percolation.top_k == 2
@@ -0,0 +1,227 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from nicotine import (
+    LLMOutput,
+    LLMSettings,
+    async_detect_hallucination,
+    detect_hallucination,
+)
+from nicotine.models import HallucinationEvaluation
+from nicotine.providers import FakeProvider, ProviderError, configure_provider
+from nicotine.resilience import (
+    CallPolicy,
+    CircuitOpen,
+    DeadlineExceeded,
+    DeadlineMiddleware,
+    UpstreamTimeout,
+    acall_upstream,
+    call_upstream,
+    configure_call_policy,
+    deadline,
+    get_call_policy,
+    remaining_time,
+)
+
+
+class ScriptedProvider:
+    """Replays a script of delays and failures, one entry per call."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self.fallback = FakeProvider()
+
+    async def aparse(self, **kwargs):
+        step = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        delay, error = step if isinstance(step, tuple) else (0.0, step)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return await self.fallback.aparse(**kwargs)
+
+
+def make_output(text="Paris is in France."):
+    return LLMOutput(
+        id="1",
+        prompt="Where is Paris?",
+        output=text,
+        settings=LLMSettings(provider="s"),
+    )
+
+
+def request(model="m"):
+    return dict(input="x", model=model, text_format=HallucinationEvaluation)
+
+
+@pytest.fixture
+def install():
+    def install(provider, **policy):
+        policy.setdefault("backoff", 0.0)
+        configure_call_policy(CallPolicy(**policy))
+        configure_provider("s", provider)
+        return provider
+
+    yield install
+    configure_provider("s", None)
+    configure_call_policy(None)
+
+
+@pytest.mark.asyncio
+async def test_transient_failures_are_retried(install):
+    provider = install(
+        ScriptedProvider(ProviderError("busy", 503), TimeoutError(), None)
+    )
+
+    evaluation = await async_detect_hallucination(make_output())
+
+    assert evaluation.error is None
+    assert provider.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_outcomes_are_surfaced_in_error(install):
+    provider = install(ScriptedProvider(ProviderError("bad request", 400)))
+    evaluation = await async_detect_hallucination(make_output("a"))
+    assert evaluation.error == "bad request"
+    assert provider.calls == 1
+
+    install(ScriptedProvider(ProviderError("busy", 503)), max_retries=2)
+    evaluation = await async_detect_hallucination(make_output("b"))
+    assert evaluation.error == (
+        "retries_exhausted: ProviderError: busy (after 3 attempts)"
+    )
+
+    install(ScriptedProvider((1.0, None)), timeout=0.05, max_retries=0)
+    evaluation = await async_detect_hallucination(make_output("c"))
+    assert evaluation.error == "timeout: no response within 0.05s"
+
+
+@pytest.mark.asyncio
+async def test_async_attempt_timeouts_are_retried_and_trip_the_breaker(install):
+    provider = install(
+        ScriptedProvider((1.0, None), (0.0, None)),
+        timeout=0.05,
+        max_retries=1,
+    )
+
+    response = await acall_upstream("s", **request())
+
+    assert response.output_parsed is not None
+    assert provider.calls == 2
+
+    install(
+        ScriptedProvider((1.0, None)),
+        timeout=0.05,
+        max_retries=0,
+        breaker_threshold=1,
+        breaker_reset=10.0,
+    )
+    with pytest.raises(UpstreamTimeout):
+        await acall_upstream("s", **request())
+    assert get_call_policy().breakers["s/m"].state == "open"
+
+
+@pytest.mark.asyncio
+async def test_deadline_caps_attempts(install):
+    install(ScriptedProvider((1.0, None)), timeout=10.0, backoff=0.01)
+
+    start = time.perf_counter()
+    with deadline(0.1):
+        evaluation = await async_detect_hallucination(make_output())
+
+    assert evaluation.error.startswith("deadline_exceeded:")
+    assert time.perf_counter() - start < 0.5
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_fails_fast_then_probes(install):
+    provider = install(
+        ScriptedProvider(ProviderError("down", 503), ProviderError("down", 503), None),
+        max_retries=0,
+        breaker_threshold=2,
+        breaker_reset=0.1,
+    )
+    for _ in range(2):
+        with pytest.raises(Exception):
+            await acall_upstream("s", **request())
+
+    with pytest.raises(CircuitOpen):
+        await acall_upstream("s", **request())
+    assert provider.calls == 2
+    other = await acall_upstream("s", **request(model="other"))
+    assert other.output_parsed is not None
+
+    await asyncio.sleep(0.1)
+    await acall_upstream("s", **request())
+    await acall_upstream("s", **request())
+    assert provider.calls == 5
+
+
+@pytest.mark.asyncio
+async def test_probes_out_of_time_do_not_keep_the_circuit_open(install):
+    provider = install(
+        ScriptedProvider(ProviderError("down", 503), None),
+        max_retries=0,
+        breaker_threshold=1,
+        breaker_reset=0.05,
+    )
+    with pytest.raises(Exception):
+        await acall_upstream("s", **request())
+    await asyncio.sleep(0.05)
+
+    for _ in range(2):
+        with deadline(0.0), pytest.raises(DeadlineExceeded):
+            await acall_upstream("s", **request())
+        with deadline(0.0), pytest.raises(DeadlineExceeded):
+            call_upstream("s", **request())
+
+    assert (await acall_upstream("s", **request())).output_parsed is not None
+    assert provider.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_slow_calls_are_hedged(install):
+    provider = install(
+        ScriptedProvider((0.5, None), (0.0, None)),
+        hedge_quantile=0.95,
+        hedge_min_samples=1,
+    )
+    get_call_policy().tracker("s/m").add(0.02)
+
+    start = time.perf_counter()
+    response = await acall_upstream("s", **request())
+
+    assert response.output_parsed is not None
+    assert provider.calls == 2
+    assert time.perf_counter() - start < 0.3
+
+
+def test_blocking_calls_honor_the_timeout(install):
+    install(FakeProvider(latency=1.0), timeout=0.05, max_retries=0)
+
+    start = time.perf_counter()
+    evaluation = detect_hallucination(make_output())
+
+    assert evaluation.error == "timeout: no response within 0.05s"
+    assert time.perf_counter() - start < 0.5
+
+
+def test_deadline_middleware_reads_request_timeout_header():
+    app = FastAPI()
+
+    @app.get("/left")
+    async def left():
+        return {"left": remaining_time()}
+
+    app.add_middleware(DeadlineMiddleware)
+    client = TestClient(app)
+
+    assert client.get("/left").json() == {"left": None}
+    budget = client.get("/left", headers={"X-Request-Timeout": "2.5"}).json()["left"]
+    assert 0 < budget <= 2.5
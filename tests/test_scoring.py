@@ -0,0 +1,203 @@
+import asyncio
+import json
+
+import pytest
+
+import nicotine.scoring
+from nicotine import HallucinationEvaluation
+from nicotine.scoring import checkpoint_path, score_files
+
+
+def write_jsonl(path, count, invalid_at=None):
+    with open(path, "w") as f:
+        for i in range(count):
+            if i == invalid_at:
+                f.write("not json\n")
+                continue
+            record = {"id": f"r{i}", "prompt": "p", "output": "o" * 8, "settings": {}}
+            f.write(json.dumps(record) + "\n")
+
+
+def read_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    seen = []
+
+    async def fake_detect(output):
+        seen.append(output.id)
+        return HallucinationEvaluation(
+            is_hallucination=False, rationale=output.id, delusion_percentage=0.0
+        )
+
+    monkeypatch.setattr(nicotine.scoring, "async_detect_hallucination", fake_detect)
+    return seen
+
+
+def test_score_files_writes_results_in_input_order(tmp_path, calls):
+    source = tmp_path / "in.jsonl"
+    write_jsonl(source, 20, invalid_at=3)
+
+    stats = score_files([source], tmp_path / "out.jsonl", concurrency=4)
+
+    results = read_results(tmp_path / "out.jsonl")
+    assert [r["record"] for r in results] == list(range(20))
+    assert results[3]["error"] is not None
+    assert results[4]["id"] == "r4"
+    assert stats.records == 20
+    assert stats.errors == 1
+    assert stats.tokens == 19 * 2
+
+
+def test_score_files_resumes_after_a_crash(tmp_path, calls, monkeypatch):
+    source = tmp_path / "in.jsonl"
+    output = tmp_path / "out.jsonl"
+    write_jsonl(source, 10)
+
+    async def crash_after_five(output):
+        if len(calls) == 5:
+            raise RuntimeError("worker died")
+        calls.append(output.id)
+        return HallucinationEvaluation(
+            is_hallucination=False, rationale=output.id, delusion_percentage=0.0
+        )
+
+    monkeypatch.setattr(
+        nicotine.scoring, "async_detect_hallucination", crash_after_five
+    )
+    with pytest.raises(RuntimeError):
+        score_files([source], output, concurrency=1, checkpoint_every=2)
+    checkpoint = json.loads(checkpoint_path(output).read_text())
+    assert checkpoint["records"] == 5
+    # A torn write past the checkpoint is discarded on resume.
+    with open(output, "a") as f:
+        f.write('{"record": 5, "trunc')
+
+    calls.clear()
+    monkeypatch.undo()
+    resumed = []
+
+    async def fake_detect(output):
+        resumed.append(output.id)
+        return HallucinationEvaluation(
+            is_hallucination=False, rationale=output.id, delusion_percentage=0.0
+        )
+
+    monkeypatch.setattr(nicotine.scoring, "async_detect_hallucination", fake_detect)
+    stats = score_files([source], output, concurrency=1)
+
+    assert resumed == [f"r{i}" for i in range(5, 10)]
+    assert stats.resumed == 5
+    assert [r["record"] for r in read_results(output)] == list(range(10))
+
+
+def test_score_files_retries_failed_records(tmp_path, monkeypatch):
+    source = tmp_path / "in.jsonl"
+    output = tmp_path / "out.jsonl"
+    write_jsonl(source, 6, invalid_at=1)
+    attempts = []
+
+    async def flaky(output):
+        attempts.append(output.id)
+        failing = output.id in {"r2", "r4"} and attempts.count(output.id) == 1
+        return HallucinationEvaluation(
+            is_hallucination=False,
+            rationale=output.id,
+            delusion_percentage=0.0,
+            error="timeout: no response" if failing else None,
+        )
+
+    monkeypatch.setattr(nicotine.scoring, "async_detect_hallucination", flaky)
+    score_files([source], output)
+    stats = score_files([source], output, retry_errors=True)
+
+    assert (stats.resumed, stats.retried, stats.recovered) == (6, 2, 2)
+    assert sorted(attempts) == ["r0", "r2", "r2", "r3", "r4", "r4", "r5"]
+    results = read_results(output)
+    assert [r["record"] for r in results] == list(range(6))
+    assert [r["record"] for r in results if r["error"]] == [1]
+    checkpoint = json.loads(checkpoint_path(output).read_text())
+    assert checkpoint["offset"] == output.stat().st_size
+
+
+def test_retries_keep_concurrency_bounded(tmp_path, monkeypatch):
+    source = tmp_path / "in.jsonl"
+    output = tmp_path / "out.jsonl"
+    write_jsonl(source, 8)
+    in_flight, peak, retrying = 0, 0, False
+
+    async def failing_once(output):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight) if retrying else peak
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return HallucinationEvaluation(
+            is_hallucination=False,
+            rationale=output.id,
+            delusion_percentage=0.0,
+            error=None if retrying else "timeout: no response",
+        )
+
+    monkeypatch.setattr(nicotine.scoring, "async_detect_hallucination", failing_once)
+    score_files([source], output)
+    retrying = True
+    stats = score_files([source], output, concurrency=2, retry_errors=True)
+
+    assert (stats.retried, stats.recovered, peak) == (8, 8, 2)
+    assert [r["record"] for r in read_results(output)] == list(range(8))
+
+
+def test_score_files_rejects_checkpoint_of_other_inputs(tmp_path, calls):
+    first, second = tmp_path / "a.jsonl", tmp_path / "b.jsonl"
+    write_jsonl(first, 2)
+    write_jsonl(second, 2)
+    score_files([first], tmp_path / "out.jsonl")
+
+    with pytest.raises(ValueError):
+        score_files([second], tmp_path / "out.jsonl")
+    score_files([second], tmp_path / "out.jsonl", resume=False)
+    assert len(read_results(tmp_path / "out.jsonl")) == 2
+
+
+def test_score_files_merges_worker_shards_in_order(tmp_path, calls):
+    source = tmp_path / "in.jsonl"
+    output = tmp_path / "out.jsonl"
+    write_jsonl(source, 11)
+
+    stats = score_files([source], output, workers=3, concurrency=2)
+
+    assert stats.records == 11
+    assert [r["id"] for r in read_results(output)] == [f"r{i}" for i in range(11)]
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "in.jsonl",
+        "out.jsonl",
+        "out.jsonl.checkpoint.json",
+    ]
+
+
+def test_score_files_discards_parts_merged_before_a_crash(tmp_path, calls, monkeypatch):
+    source = tmp_path / "in.jsonl"
+    output = tmp_path / "out.jsonl"
+    write_jsonl(source, 6)
+    unlink = type(output).unlink
+
+    def crash_on_parts(path, missing_ok=False):
+        if ".part" in path.name:
+            raise RuntimeError("killed")
+        unlink(path, missing_ok=missing_ok)
+
+    monkeypatch.setattr(type(output), "unlink", crash_on_parts)
+    with pytest.raises(RuntimeError):
+        score_files([source], output, workers=2)
+    monkeypatch.setattr(type(output), "unlink", unlink)
+    write_jsonl(source, 9)
+
+    stats = score_files([source], output, workers=2)
+
+    assert stats.records == 3
+    assert [r["rationale"] for r in read_results(output)] == [f"r{i}" for i in range(9)]
+    assert not list(tmp_path.glob("*.part*"))
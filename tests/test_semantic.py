@@ -0,0 +1,213 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from nicotine import (
+    LLMOutput,
+    LLMSettings,
+    async_detect_hallucination,
+    async_detect_hallucinations,
+)
+from nicotine.models import HallucinationEvaluation
+from nicotine.semantic import SemanticCache, configure_semantic_cache
+
+pytest.importorskip("numpy")
+
+
+def make_output(output, prompt="When was Amberfield University founded?", **settings):
+    return LLMOutput(
+        id="semantic",
+        prompt=prompt,
+        output=output,
+        settings=LLMSettings(**settings),
+    )
+
+
+def verdict(flagged=False, error=None):
+    return HallucinationEvaluation(
+        is_hallucination=flagged,
+        rationale="stored",
+        delusion_percentage=80.0 if flagged else 0.0,
+        error=error,
+    )
+
+
+ORIGINAL = "Amberfield University was founded in 1889 by the city council."
+
+
+def test_near_duplicates_reuse_the_verdict():
+    cache = SemanticCache(capacity=16)
+    cache.store(make_output(ORIGINAL), verdict(flagged=True))
+
+    reused = cache.lookup(
+        make_output(ORIGINAL.replace(" by", ",  by").rstrip(".") + "!")
+    )
+
+    assert reused is not None and reused.is_hallucination
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (1, 0, 1)
+    assert stats.mean_hit_similarity >= 0.9
+
+
+@pytest.mark.parametrize(
+    "output, settings",
+    [
+        (ORIGINAL.replace("1889", "1899"), {}),
+        (ORIGINAL.replace("was founded", "was not founded"), {}),
+        (ORIGINAL.replace("Amberfield", "Riverton"), {}),
+        (ORIGINAL + " Its first dean was Ada Byron.", {}),
+        ("The observatory opened its doors to the public in 1889.", {}),
+        (ORIGINAL, {"model": "gpt-4o-mini"}),
+    ],
+)
+def test_verdict_changing_differences_are_not_reused(output, settings):
+    cache = SemanticCache(capacity=16)
+    cache.store(make_output(ORIGINAL), verdict())
+
+    assert cache.lookup(make_output(output, **settings)) is None
+
+
+def test_long_outputs_naming_someone_else_are_not_reused():
+    prompt = "Who designed the tower in Paris?"
+    original = (
+        "The tower in Paris was designed by Gustave Eiffel's company. "
+        "It was completed in 1889 for the world's fair and is made of "
+        "wrought iron. It remains one of the most visited monuments."
+    )
+    cache = SemanticCache(capacity=16)
+    cache.store(make_output(original, prompt=prompt), verdict())
+
+    swapped = original.replace("Gustave Eiffel", "Thomas Edison")
+    assert cache.lookup(make_output(swapped, prompt=prompt)) is None
+    moved = original.replace("Paris", "London")
+    assert cache.lookup(make_output(moved, prompt=prompt)) is None
+    rebuilt = original.replace("completed", "demolished")
+    assert cache.lookup(make_output(rebuilt, prompt=prompt)) is None
+    assert cache.lookup(make_output(original + " ", prompt=prompt)) is not None
+
+
+def test_errors_are_not_stored_and_threshold_is_respected():
+    cache = SemanticCache(capacity=16, threshold=1.01)
+    cache.store(make_output(ORIGINAL), verdict(error="timeout"))
+    assert len(cache) == 0
+
+    cache.store(make_output(ORIGINAL), verdict())
+    assert len(cache) == 1
+    assert cache.lookup(make_output(ORIGINAL)) is None
+
+
+def test_least_recently_used_and_expired_entries_are_replaced():
+    cache = SemanticCache(capacity=2, ttl=3600)
+    first = make_output(ORIGINAL)
+    second = make_output("Riverton Hospital opened in 1921.", prompt="Riverton?")
+    third = make_output("Cobalt Rail ran its first train in 1950.", prompt="Cobalt?")
+    cache.store(first, verdict())
+    cache.store(second, verdict())
+    assert cache.lookup(first) is not None  # second is now least recently used
+
+    cache.store(third, verdict())
+
+    assert cache.lookup(second) is None
+    assert cache.lookup(first) is not None and cache.lookup(third) is not None
+    assert cache.stats().evictions == 1
+
+    cache.ttl = 0.01
+    time.sleep(0.02)
+    assert len(cache) == 0 and cache.lookup(first) is None
+
+
+def test_memory_mapped_index_survives_reopening(tmp_path):
+    cache = SemanticCache(path=tmp_path, capacity=8)
+    cache.store(make_output(ORIGINAL), verdict(flagged=True))
+    cache.flush()
+
+    reopened = SemanticCache(path=tmp_path, capacity=8)
+
+    reused = reopened.lookup(make_output(ORIGINAL + " "))
+    assert reused is not None and reused.is_hallucination
+    with pytest.raises(ValueError, match="capacity 8 -> 1000"):
+        SemanticCache(path=tmp_path, capacity=1000)
+
+
+def test_hits_read_the_open_verdict_log(tmp_path, monkeypatch):
+    cache = SemanticCache(path=tmp_path, capacity=8)
+    cache.store(make_output("Stale answer."), verdict())
+    cache.store(make_output(ORIGINAL), verdict(flagged=True))
+    cache.times[0] = 0  # expired and left out of the compacted log
+    cache._compact(tmp_path / "verdicts.jsonl")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("a hit should not open files")
+
+    monkeypatch.setattr("builtins.open", fail)
+    reused = cache.lookup(make_output(ORIGINAL + " "))
+    assert reused is not None and reused.is_hallucination
+
+
+@pytest.fixture
+def provider(fake_provider):
+    configure_semantic_cache(SemanticCache(capacity=64))
+    yield fake_provider("semantic")
+    configure_semantic_cache(None)
+
+
+@pytest.mark.asyncio
+async def test_paraphrased_requests_skip_the_provider(provider):
+    await async_detect_hallucination(make_output(ORIGINAL, provider="semantic"))
+    assert provider.calls == 1
+
+    await async_detect_hallucination(
+        make_output(
+            "Amberfield University was founded in 1889, by the city council!",
+            provider="semantic",
+        )
+    )
+    assert provider.calls == 1
+
+    await async_detect_hallucination(
+        make_output(ORIGINAL.replace("1889", "1890"), provider="semantic")
+    )
+    assert provider.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_packed_batches_consult_and_fill_the_cache(provider):
+    await async_detect_hallucination(make_output(ORIGINAL, provider="semantic"))
+    paraphrase = "Amberfield University was founded in 1889, by the city council!"
+    others = [
+        make_output(
+            f"Amberfield University was founded in {year}.", provider="semantic"
+        )
+        for year in (1901, 1902)
+    ]
+
+    evaluations = await async_detect_hallucinations(
+        [make_output(paraphrase, provider="semantic"), *others], pack_size=4
+    )
+
+    assert len(evaluations) == 3
+    assert provider.calls == 2  # the two new outputs, packed together
+    for output in others:
+        await async_detect_hallucination(output)
+    assert provider.calls == 2
+
+
+def test_stats_endpoint(provider):
+    from nicotine.api import app
+
+    client = TestClient(app)
+    stats = client.get("/api/v1/semantic-cache/stats").json()
+    assert stats["enabled"] is True and stats["entries"] == 0
+
+    configure_semantic_cache(None)
+    assert client.get("/api/v1/semantic-cache/stats").json() == {
+        "enabled": False,
+        "hits": 0,
+        "misses": 0,
+        "stores": 0,
+        "evictions": 0,
+        "entries": 0,
+        "hit_ratio": 0.0,
+        "mean_hit_similarity": 0.0,
+    }
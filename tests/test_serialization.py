@@ -0,0 +1,93 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import nicotine.api
+from nicotine import HallucinationEvaluation, LLMOutput
+from nicotine.serialization import FastJSONRoute, ModelResponse, dumps, loads
+
+
+def evaluation(output):
+    return HallucinationEvaluation(
+        is_hallucination=True,
+        rationale=f'{output.id}: élève "quoted"',
+        delusion_percentage=12.5,
+    )
+
+
+def echo_app(route_class=None):
+    app = FastAPI()
+    if route_class is not None:
+        app.router.route_class = route_class
+
+    @app.post("/echo")
+    async def echo(output: LLMOutput) -> LLMOutput:
+        return output
+
+    return app
+
+
+def test_loads_and_dumps_round_trip():
+    content = {"a": [1, 2.5, None, True], "b": "é中"}
+
+    assert loads(dumps(content)) == content
+    assert loads(dumps(content).decode()) == content
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b'{"id": "x", "prompt": "p", "output": "o"',
+        b'{"id": "x", "prompt": "p"}',
+        b'{"id": 1, "prompt": "p", "output": "o", "settings": []}',
+    ],
+)
+def test_fast_routes_reject_bodies_like_fastapi(body):
+    headers = {"content-type": "application/json"}
+    expected = TestClient(echo_app()).post("/echo", content=body, headers=headers)
+    response = TestClient(echo_app(FastJSONRoute)).post(
+        "/echo", content=body, headers=headers
+    )
+
+    def errors(response):
+        # The decode error message in ctx is the parser's own.
+        return [
+            {k: v for k, v in e.items() if k != "ctx"}
+            for e in response.json()["detail"]
+        ]
+
+    assert response.status_code == expected.status_code == 422
+    assert errors(response) == errors(expected)
+
+
+def test_model_response_matches_response_model_encoding():
+    result = evaluation(LLMOutput(id="x", prompt="p", output="o", settings={}))
+
+    response = ModelResponse(result)
+
+    assert response.headers["content-type"] == "application/json"
+    assert loads(response.body) == result.model_dump(mode="json")
+
+
+@pytest.mark.parametrize("fast_json", [False, True])
+def test_detection_endpoints_answer_the_same_with_fast_json(monkeypatch, fast_json):
+    async def fake_detect(output):
+        return evaluation(output)
+
+    async def fake_detect_many(outputs, concurrency, pack_size):
+        return [evaluation(output) for output in outputs]
+
+    monkeypatch.setattr(nicotine.api, "FAST_JSON", fast_json)
+    monkeypatch.setattr(nicotine.api, "async_detect_hallucination", fake_detect)
+    monkeypatch.setattr(nicotine.api, "async_detect_hallucinations", fake_detect_many)
+    client = TestClient(nicotine.api.app)
+    output = {"id": "x", "prompt": "p", "output": "o", "settings": {}}
+
+    single = client.post("/api/v1/detect-hallucination", json=output)
+    batch = client.post(
+        "/api/v1/detect-hallucination/batch", json={"outputs": [output] * 3}
+    )
+
+    expected = evaluation(LLMOutput(**output)).model_dump(mode="json")
+    assert single.status_code == 200 and single.json() == expected
+    assert batch.status_code == 200 and batch.json() == {"results": [expected] * 3}
@@ -0,0 +1,94 @@
+import copy
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import nicotine.api
+import nicotine.config
+from nicotine.cache import MemoryCacheBackend, SQLiteCacheBackend, build_verdict_cache
+from nicotine.config import WORKERS_ENV, load_config
+from nicotine.pipeline import configure_default_pipeline, get_default_pipeline
+from nicotine.ratelimit import MemoryBudgetStore, SQLiteBudgetStore, build_rate_limiter
+from nicotine.references import ReferencePercolation, build_index
+from nicotine.serving import prepare_environment, warm_up
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    """
+    The default config, editable per test.
+    """
+    config = copy.deepcopy(load_config())
+    monkeypatch.setattr(nicotine.config, "load_config", lambda path=None: config)
+    return config
+
+
+def test_state_is_shared_only_with_several_workers(settings, monkeypatch, tmp_path):
+    settings["hallucination_detection"]["enable_caching"] = True
+    settings["hallucination_detection"]["cache_path"] = str(tmp_path / "cache.db")
+    settings["rate_limits"]["path"] = str(tmp_path / "ratelimit.db")
+
+    monkeypatch.setenv(WORKERS_ENV, "1")
+    assert isinstance(build_verdict_cache().backend, MemoryCacheBackend)
+    assert isinstance(build_rate_limiter().store, MemoryBudgetStore)
+
+    monkeypatch.setenv(WORKERS_ENV, "4")
+    assert isinstance(build_verdict_cache().backend, SQLiteCacheBackend)
+    assert isinstance(build_rate_limiter().store, SQLiteBudgetStore)
+
+    settings["server"]["shared_state"] = False
+    assert isinstance(build_verdict_cache().backend, MemoryCacheBackend)
+
+
+def test_metrics_directory_is_emptied_for_a_new_run(settings, monkeypatch, tmp_path):
+    settings["metrics"]["enabled"] = True
+    directory = tmp_path / "metrics"
+    directory.mkdir()
+    (directory / "counter_123.db").write_bytes(b"stale")
+    monkeypatch.setenv(WORKERS_ENV, "1")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(directory))
+
+    prepare_environment(workers=3)
+
+    assert not list(directory.iterdir())
+    assert nicotine.config.worker_count() == 3
+
+
+def test_a_semantic_cache_file_needs_a_single_worker(settings, monkeypatch, tmp_path):
+    settings["semantic_cache"]["enabled"] = True
+    settings["semantic_cache"]["path"] = str(tmp_path / "semantic")
+    monkeypatch.setenv(WORKERS_ENV, "1")
+
+    with pytest.raises(ValueError, match="semantic_cache.path"):
+        prepare_environment(workers=2)
+
+    prepare_environment(workers=1)
+    settings["semantic_cache"]["path"] = None
+    prepare_environment(workers=2)
+
+
+def test_warm_up_opens_the_reference_index(settings, tmp_path):
+    corpus = tmp_path / "corpus.jsonl"
+    corpus.write_text(json.dumps({"text": "Paris is the capital of France."}))
+    build_index(tmp_path / "refs", [corpus])
+    settings["hallucination_detection"]["strategy"] = "pipeline"
+    settings["references"]["index_path"] = str(tmp_path / "refs")
+    configure_default_pipeline(None)
+    try:
+        timings = warm_up()
+
+        assert {"verdict_cache", "rate_limiter", "pipeline"} <= set(timings)
+        percolation = get_default_pipeline().percolation
+        assert isinstance(percolation, ReferencePercolation)
+    finally:
+        configure_default_pipeline(None)
+
+
+def test_workers_warm_up_before_serving(monkeypatch):
+    calls = []
+    monkeypatch.setattr(nicotine.api, "warm_up", lambda: calls.append("warm_up"))
+
+    with TestClient(nicotine.api.app) as client:
+        assert calls == ["warm_up"]
+        assert client.get("/health").status_code == 200
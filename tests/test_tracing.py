@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from nicotine import LLMOutput, LLMSettings, async_detect_hallucination
+from nicotine.profiler import SamplingProfiler
+from nicotine.tracing import (
+    LogExporter,
+    MemoryExporter,
+    Tracer,
+    TracingMiddleware,
+    configure_tracer,
+    parse_traceparent,
+    span,
+)
+
+
+@pytest.fixture
+def exporter():
+    exporter = MemoryExporter()
+    configure_tracer(Tracer(hooks=[exporter]))
+    yield exporter
+    configure_tracer(None)
+
+
+@pytest.fixture
+def provider(fake_provider):
+    return fake_provider("traced", fast_retries=True)
+
+
+def output(n=0):
+    return LLMOutput(
+        id=f"t{n}",
+        prompt="Where is the Eiffel Tower?",
+        output="In Paris.",
+        settings=LLMSettings(provider="traced"),
+    )
+
+
+def by_name(spans):
+    return {span.name: span for span in spans}
+
+
+@pytest.mark.asyncio
+async def test_detection_spans_nest_down_to_upstream_attempts(exporter, provider):
+    with span("request") as root:
+        await async_detect_hallucination(output())
+
+    spans = by_name(exporter.spans())
+    assert {s.trace_id for s in spans.values()} == {root.trace_id}
+    assert spans["detect"].parent_id == root.span_id
+    assert spans["upstream"].parent_id == spans["detect"].span_id
+    assert spans["upstream.attempt"].parent_id == spans["upstream"].span_id
+    assert spans["detect"].attributes["id"] == "t0"
+    assert spans["upstream"].attributes["provider"] == "traced"
+    assert all(s.status == "ok" and s.end_time >= s.start_time for s in spans.values())
+
+
+@pytest.mark.asyncio
+async def test_retries_show_as_failed_attempts_and_backoff(exporter, provider):
+    provider.errors = {"server_error": 1.0}
+
+    evaluation = await async_detect_hallucination(output())
+
+    assert evaluation.error is not None
+    names = [s.name for s in exporter.spans()]
+    assert names.count("upstream.attempt") == 4
+    assert names.count("retry.backoff") == 3
+    attempts = [s for s in exporter.spans() if s.name == "upstream.attempt"]
+    assert [s.attributes["attempt"] for s in attempts] == [0, 1, 2, 3]
+    assert all(s.status == "error" and "server error" in s.error for s in attempts)
+
+
+@pytest.mark.asyncio
+async def test_unsampled_traces_record_nothing(provider):
+    exporter = MemoryExporter()
+    configure_tracer(Tracer(hooks=[exporter], sample_rate=0.0))
+    try:
+        with span("request") as root:
+            await async_detect_hallucination(output())
+    finally:
+        configure_tracer(None)
+
+    assert root is None
+    assert exporter.spans() == []
+
+
+def test_hooks_time_spans_and_cannot_break_requests(exporter, caplog):
+    class Timer:
+        def __init__(self):
+            self.started = {}
+            self.durations = {}
+
+        def on_start(self, span):
+            self.started[span.span_id] = time.perf_counter()
+
+        def on_end(self, span):
+            elapsed = time.perf_counter() - self.started.pop(span.span_id)
+            self.durations[span.name] = elapsed
+
+    class Broken:
+        def on_start(self, span):
+            raise RuntimeError("hook bug")
+
+        on_end = on_start
+
+    timer = Timer()
+    tracer = Tracer(hooks=[Broken(), timer])
+    with tracer.span("outer"):
+        with tracer.span("inner"):
+            time.sleep(0.01)
+
+    assert timer.durations["inner"] >= 0.01
+    assert set(timer.durations) == {"outer", "inner"}
+    assert "hook bug" in caplog.text
+
+
+def test_log_exporter_logs_slow_traces_as_a_tree(caplog):
+    tracer = Tracer(hooks=[LogExporter(threshold=0.005)])
+    with caplog.at_level(logging.INFO, logger="nicotine.tracing"):
+        with tracer.span("fast"):
+            pass
+        with tracer.span("slow", route="/x"):
+            with tracer.span("upstream"):
+                time.sleep(0.01)
+
+    assert len(caplog.records) == 1
+    lines = caplog.records[0].getMessage().splitlines()
+    assert lines[1].startswith("slow +0.0 ms") and "route=/x" in lines[1]
+    assert lines[2].startswith("  upstream +")
+
+
+def test_slow_requests_get_a_flame_graph_snapshot(tmp_path):
+    exporter = MemoryExporter()
+    tracer = Tracer(
+        hooks=[exporter],
+        profiler=SamplingProfiler(interval=0.001),
+        profile_threshold=0.05,
+        profile_directory=str(tmp_path),
+    )
+
+    def busy(seconds):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    with tracer.span("quick"):
+        busy(0.001)
+    with tracer.span("slow"):
+        busy(0.1)
+
+    quick, slow = exporter.spans()
+    assert "profile.folded" not in quick.attributes
+    folded = slow.attributes["profile.folded"]
+    assert "get_a_flame_graph_snapshot.<locals>.busy" in folded
+    stack, count = folded.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0 and ";" in stack
+    assert (tmp_path / f"{slow.trace_id}-{slow.span_id}.folded").exists()
+
+
+def test_middleware_continues_incoming_traces():
+    exporter = MemoryExporter()
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        with span("lookup"):
+            await asyncio.sleep(0)
+        return {"id": item_id}
+
+    tracer = Tracer(hooks=[exporter])
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+    configure_tracer(tracer)
+    try:
+        trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+        response = TestClient(app).get(
+            "/items/1", headers={"traceparent": f"00-{trace_id}-{parent_id}-01"}
+        )
+    finally:
+        configure_tracer(None)
+
+    assert response.headers["x-trace-id"] == trace_id
+    spans = by_name(exporter.spans())
+    request = spans["GET /items/{item_id}"]
+    assert request.parent_id == parent_id
+    assert request.attributes["http.status_code"] == 200
+    assert spans["lookup"].parent_id == request.span_id
+
+
+def test_parse_traceparent_rejects_malformed_headers():
+    valid = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+    assert parse_traceparent(valid) == (
+        "4bf92f3577b34da6a3ce929d0e0e4736",
+        "00f067aa0ba902b7",
+    )
+    assert parse_traceparent("00-xyz-00f067aa0ba902b7-01") is None
+    assert parse_traceparent(f"00-{'0' * 32}-00f067aa0ba902b7-01") is None
+
+
+def test_otel_exporter_runs_against_the_api_alone():
+    pytest.importorskip("opentelemetry")
+    from nicotine.tracing import OpenTelemetryExporter
+
+    exporter = OpenTelemetryExporter()
+    tracer = Tracer(hooks=[exporter])
+    with tracer.span("outer", route="/x"):
+        with pytest.raises(ValueError):
+            with tracer.span("inner"):
+                raise ValueError("boom")
+
+    assert exporter._open == {}
+
+
+def test_otel_exporter_keeps_names_trace_ids_and_parents():
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+
+    from nicotine.tracing import OpenTelemetryExporter
+
+    spans = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(spans))
+    tracer = Tracer(hooks=[OpenTelemetryExporter(tracer_provider=provider)])
+    with tracer.span("GET /items/1") as root:
+        with tracer.span("detect"):
+            pass
+        root.name = "GET /items/{id}"
+    remote = ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7")
+    with tracer.span("POST /jobs", remote=remote):
+        pass
+
+    child, exported, continued = spans.get_finished_spans()
+    assert exported.name == "GET /items/{id}"
+    assert exported.parent is None
+    assert exported.context.trace_id == int(root.trace_id, 16)
+    assert child.parent.span_id == exported.context.span_id
+    assert child.context.trace_id == exported.context.trace_id
+    assert continued.parent.span_id == int(remote[1], 16)
+    assert continued.context.trace_id == int(remote[0], 16)